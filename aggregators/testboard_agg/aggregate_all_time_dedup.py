@@ -1,5 +1,13 @@
 import psycopg2
-from psycopg2.extras import execute_values
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from streaming import stream_batches, upsert_stream
+from summary_views import is_materialized, refresh_summary_view
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -25,7 +33,7 @@ CREATE TABLE IF NOT EXISTS testboard_station_performance_daily (
 
 AGGREGATE_SQL = '''
 SELECT
-    DATE(history_station_end_time) AS end_date,
+    end_date,
     model,
     work_station_process,
     workstation_name,
@@ -55,22 +63,31 @@ ON CONFLICT (end_date, model, work_station_process, workstation_name) DO UPDATE
 
 def main():
     conn = psycopg2.connect(**DB_CONFIG)
+    if is_materialized(conn, 'testboard_station_performance_daily'):
+        print("testboard_station_performance_daily is a materialized view, refreshing it instead of upserting...")
+        try:
+            refresh_summary_view(conn, 'testboard_station_performance_daily')
+        finally:
+            conn.close()
+        return
+    run = PipelineRun("aggregate_all_time_dedup")
     try:
         with conn.cursor() as cur:
             print("Creating summary table with primary key if not exists...")
             cur.execute(CREATE_TABLE_SQL)
             conn.commit()
 
+            require_date_columns(conn, 'testboard_master_log')
             print("Aggregating all historical data from testboard_master_log...")
-            cur.execute(AGGREGATE_SQL)
-            rows = cur.fetchall()
-            print(f"Aggregated {len(rows)} rows.")
+            # Streamed and upserted batch by batch; one commit at the end
+            with run.span("aggregate_upsert") as span:
+                span.rows_out = upsert_stream(
+                    conn, INSERT_SQL, stream_batches(conn, AGGREGATE_SQL, name="testboard_all_time"),
+                    values=lambda r: (r[0], r[1], r[2], r[3], r[5], r[6], r[4], r[7]))
+            print(f"Aggregated {span.rows_out} rows.")
 
-            if rows:
-                values = [(
-                    r[0], r[1], r[2], r[3], r[5], r[6], r[4], r[7]
-                ) for r in rows]
-                execute_values(cur, INSERT_SQL, values)
+            if span.rows_out:
+                notify_summary_updated(cur, 'testboard_station_performance_daily')
                 conn.commit()
                 print("Aggregation complete, data deduplicated and upserted.")
             else:
@@ -78,8 +95,10 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         conn.rollback()
+        run.fail(e)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
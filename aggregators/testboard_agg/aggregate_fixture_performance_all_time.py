@@ -1,6 +1,14 @@
 
 import psycopg2
-from psycopg2.extras import execute_values
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from streaming import stream_batches, upsert_stream
+from summary_views import is_materialized, refresh_summary_view
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -26,7 +34,7 @@ CREATE TABLE IF NOT EXISTS fixture_performance_daily (
 
 AGGREGATE_SQL = '''
 SELECT
-    DATE(history_station_end_time) AS day,
+    end_date AS day,
     fixture_no,
     model,
     pn,
@@ -52,22 +60,31 @@ ON CONFLICT (day, fixture_no, model, pn, workstation_name) DO UPDATE SET
 
 def main():
     conn = psycopg2.connect(**DB_CONFIG)
+    if is_materialized(conn, 'fixture_performance_daily'):
+        print("fixture_performance_daily is a materialized view, refreshing it instead of upserting...")
+        try:
+            refresh_summary_view(conn, 'fixture_performance_daily')
+        finally:
+            conn.close()
+        return
+    run = PipelineRun("aggregate_fixture_performance_all_time")
     try:
         with conn.cursor() as cur:
             print("Creating fixture_performance_daily table if not exists...")
             cur.execute(CREATE_TABLE_SQL)
             conn.commit()
 
+            require_date_columns(conn, 'testboard_master_log')
             print("Aggregating fixture performance data from testboard_master_log...")
-            cur.execute(AGGREGATE_SQL)
-            rows = cur.fetchall()
-            print(f"Aggregated {len(rows)} rows.")
+            # Streamed and upserted batch by batch; one commit at the end
+            with run.span("aggregate_upsert") as span:
+                span.rows_out = upsert_stream(
+                    conn, INSERT_SQL, stream_batches(conn, AGGREGATE_SQL, name="fixture_all_time"),
+                    values=lambda r: (r[0], r[1], r[2], r[3], r[4], r[6], r[7], r[5]))
+            print(f"Aggregated {span.rows_out} rows.")
 
-            if rows:
-                values = [(
-                    r[0], r[1], r[2], r[3], r[4], r[6], r[7], r[5]
-                ) for r in rows]
-                execute_values(cur, INSERT_SQL, values)
+            if span.rows_out:
+                notify_summary_updated(cur, 'fixture_performance_daily')
                 conn.commit()
                 print(" Fixture performance aggregation complete and upserted.")
             else:
@@ -75,8 +92,10 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         conn.rollback()
+        run.fail(e)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+All-time testboard station and fixture performance from one scan.
+
+aggregate_all_time_dedup.py and aggregate_fixture_performance_all_time.py
+each scan all of testboard_master_log; they only group it differently.
+This fills both of their tables (testboard_station_performance_daily and
+fixture_performance_daily) from one GROUPING SETS scan (fused_metrics.py),
+with the same rows and one commit at the end. A table that has been turned
+into a materialized view (summary_views.py) is refreshed instead, as the
+two scripts do.
+
+Usage:
+    python aggregate_testboard_fused.py
+    python aggregate_testboard_fused.py --sql     # print the fused scan
+"""
+import argparse
+import os
+import sys
+from decimal import Decimal, ROUND_HALF_UP
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from aggregate_all_time_dedup import CREATE_TABLE_SQL as CREATE_STATION_SQL, INSERT_SQL as INSERT_STATION_SQL
+from aggregate_fixture_performance_all_time import (
+    CREATE_TABLE_SQL as CREATE_FIXTURE_SQL,
+    INSERT_SQL as INSERT_FIXTURE_SQL,
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from fused_metrics import iter_metric_rows, print_sql
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from summary_views import is_materialized, refresh_summary_view
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+# metric -> (summary table, create SQL, insert SQL)
+TARGETS = {
+    "testboard_station_daily": ("testboard_station_performance_daily", CREATE_STATION_SQL, INSERT_STATION_SQL),
+    "testboard_fixture_daily": ("fixture_performance_daily", CREATE_FIXTURE_SQL, INSERT_FIXTURE_SQL),
+}
+
+def failure_rate(fail, total):
+    """ROUND(fail::numeric / total, 3), as aggregate_all_time_dedup computes it"""
+    return (Decimal(fail) / Decimal(total)).quantize(Decimal("0.001"), rounding=ROUND_HALF_UP)
+
+def station_values(row):
+    end_date, model, process, station, total, passed, failed = row
+    return (end_date, model, process, station, passed, failed, total, failure_rate(failed, total))
+
+def fixture_values(row):
+    day, fixture_no, model, pn, station, total, passed, failed = row
+    return (day, fixture_no, model, pn, station, passed, failed, total)
+
+VALUES = {"testboard_station_daily": station_values, "testboard_fixture_daily": fixture_values}
+
+def main():
+    conn = psycopg2.connect(**DB_CONFIG)
+    run = PipelineRun("aggregate_testboard_fused")
+    try:
+        metrics = []
+        for name, (table, create_sql, _) in TARGETS.items():
+            if is_materialized(conn, table):
+                print(f"{table} is a materialized view, refreshing it instead of upserting...")
+                refresh_summary_view(conn, table)
+            else:
+                metrics.append(name)
+        if not metrics:
+            return
+
+        with conn.cursor() as cur:
+            print("Creating summary tables with primary keys if not exist...")
+            for name in metrics:
+                cur.execute(TARGETS[name][1])
+            conn.commit()
+
+            require_date_columns(conn, 'testboard_master_log')
+            print(f"Aggregating {', '.join(TARGETS[name][0] for name in metrics)} in one scan of testboard_master_log...")
+            written = dict.fromkeys(metrics, 0)
+            # Streamed and upserted batch by batch; one commit at the end
+            with run.span("aggregate_upsert") as span:
+                for name, rows in iter_metric_rows(conn, metrics):
+                    execute_values(cur, TARGETS[name][2], [VALUES[name](row) for row in rows], page_size=1000)
+                    written[name] += len(rows)
+                span.rows_out = sum(written.values())
+            for name in metrics:
+                print(f"Aggregated {written[name]} rows into {TARGETS[name][0]}.")
+
+            updated = [TARGETS[name][0] for name in metrics if written[name]]
+            if updated:
+                notify_summary_updated(cur, *updated)
+                conn.commit()
+                print("Aggregation complete, data deduplicated and upserted.")
+            else:
+                print("No data to aggregate.")
+    except Exception as e:
+        print(f"Error: {e}")
+        conn.rollback()
+        run.fail(e)
+    finally:
+        conn.close()
+        run.finish()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Testboard station and fixture performance from one scan")
+    parser.add_argument('--sql', action='store_true', help="Print the fused scan and exit")
+    args = parser.parse_args()
+    if args.sql:
+        print_sql(list(TARGETS))
+    else:
+        main()
@@ -1,6 +1,14 @@
 import psycopg2
 from psycopg2.extras import execute_values
 from datetime import datetime, timedelta
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from summary_views import is_materialized, refresh_summary_view
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -22,11 +30,7 @@ CREATE TABLE IF NOT EXISTS packing_daily_summary (
 
 AGGREGATE_SQL = '''
 SELECT
-    CASE
-        WHEN EXTRACT(DOW FROM history_station_end_time) = 6 THEN DATE(history_station_end_time) - INTERVAL '1 day'  -- Saturday to Friday
-        WHEN EXTRACT(DOW FROM history_station_end_time) = 0 THEN DATE(history_station_end_time) - INTERVAL '2 days'  -- Sunday to Friday
-        ELSE DATE(history_station_end_time)
-    END AS pack_date,
+    factory_date AS pack_date,  -- Saturday/Sunday count toward Friday
     model,
     pn AS part_number,
     COUNT(*) AS packed_count
@@ -49,6 +53,14 @@ ON CONFLICT (pack_date, model, part_number) DO UPDATE SET
 
 def main():
     conn = psycopg2.connect(**DB_CONFIG)
+    if is_materialized(conn, 'packing_daily_summary'):
+        print("packing_daily_summary is a materialized view, refreshing it instead of upserting...")
+        try:
+            refresh_summary_view(conn, 'packing_daily_summary')
+        finally:
+            conn.close()
+        return
+    run = PipelineRun("aggregate_packing_weekly_dedup")
     try:
         with conn.cursor() as cur:
             print("Creating packing_daily_summary table with primary key if not exists...")
@@ -61,24 +73,31 @@ def main():
             end_date = today + timedelta(days=1)  # exclusive upper bound
             print(f"Aggregating packing data from {start_date} to {end_date - timedelta(days=1)} (inclusive)...")
 
-            cur.execute(AGGREGATE_SQL, (start_date, end_date))
-            rows = cur.fetchall()
+            require_date_columns(conn, 'workstation_master_log')
+            with run.span("aggregate") as span:
+                cur.execute(AGGREGATE_SQL, (start_date, end_date))
+                rows = cur.fetchall()
+                span.rows_out = len(rows)
             print(f"Aggregated {len(rows)} rows.")
 
             if rows:
                 values = [(
                     r[0], r[1], r[2], r[3]
                 ) for r in rows]
-                execute_values(cur, INSERT_SQL, values)
-                conn.commit()
+                with run.span("upsert", rows_in=len(values)):
+                    execute_values(cur, INSERT_SQL, values)
+                    notify_summary_updated(cur, 'packing_daily_summary')
+                    conn.commit()
                 print("Weekly packing aggregation complete, data deduplicated and upserted.")
             else:
                 print("No data to aggregate.")
     except Exception as e:
         print(f"Error: {e}")
         conn.rollback()
+        run.fail(e)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
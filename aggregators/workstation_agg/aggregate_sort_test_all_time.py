@@ -1,5 +1,12 @@
 import psycopg2
 from datetime import datetime, timedelta
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from pipeline_metrics import PipelineRun
+from streaming import stream_batches
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -16,11 +23,7 @@ SELECT
     WHEN model = 'Tesla SXM5' THEN '520'
     ELSE NULL
   END AS sort_code,
-  CASE
-    WHEN EXTRACT(DOW FROM history_station_end_time) = 6 THEN DATE(history_station_end_time) - INTERVAL '1 day'
-    WHEN EXTRACT(DOW FROM history_station_end_time) = 0 THEN DATE(history_station_end_time) - INTERVAL '2 days'
-    ELSE DATE(history_station_end_time)
-  END AS test_date,
+  factory_date AS test_date,
   COUNT(*) AS test_count
 FROM workstation_master_log
 WHERE workstation_name = 'TEST'
@@ -31,24 +34,28 @@ ORDER BY sort_code, test_date;
 '''
 
 def main():
+    run = PipelineRun("aggregate_sort_test_all_time")
     conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
             print("Aggregating all historical TEST data...")
 
-            cur.execute(AGGREGATE_SQL)
-            rows = cur.fetchall()
-            print(f"Aggregated {len(rows)} rows.")
-
+            require_date_columns(conn, 'workstation_master_log')
             sort_data = {'506': {}, '520': {}}
-            for sort_code, test_date, test_count in rows:
-                if sort_code in sort_data:
-                    date_str = f"{test_date.month}/{test_date.day}/{test_date.year}"
-                    sort_data[sort_code][date_str] = test_count
+            with run.span("aggregate") as span:
+                span.rows_out = 0
+                for rows in stream_batches(conn, AGGREGATE_SQL, name="sort_test_all_time"):
+                    for sort_code, test_date, test_count in rows:
+                        if sort_code in sort_data:
+                            date_str = f"{test_date.month}/{test_date.day}/{test_date.year}"
+                            sort_data[sort_code][date_str] = test_count
+                    span.rows_out += len(rows)
+            print(f"Aggregated {span.rows_out} rows.")
             print("\nSORT data for frontend:")
             print(sort_data)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,5 +1,11 @@
 import psycopg2
 from datetime import datetime, timedelta
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from pipeline_metrics import PipelineRun
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -16,11 +22,7 @@ SELECT
     WHEN model = 'Tesla SXM5' THEN '520'
     ELSE NULL
   END AS sort_code,
-  CASE
-    WHEN EXTRACT(DOW FROM history_station_end_time) = 6 THEN DATE(history_station_end_time) - INTERVAL '1 day'
-    WHEN EXTRACT(DOW FROM history_station_end_time) = 0 THEN DATE(history_station_end_time) - INTERVAL '2 days'
-    ELSE DATE(history_station_end_time)
-  END AS test_date,
+  factory_date AS test_date,
   COUNT(*) AS test_count
 FROM workstation_master_log
 WHERE workstation_name = 'TEST'
@@ -33,6 +35,7 @@ ORDER BY sort_code, test_date;
 '''
 
 def main():
+    run = PipelineRun("aggregate_sort_test_weekly_dedup")
     conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
@@ -41,8 +44,11 @@ def main():
             end_date = today + timedelta(days=1)  
             print(f"Aggregating TEST data from {start_date} to {end_date - timedelta(days=1)} (inclusive)...")
 
-            cur.execute(AGGREGATE_SQL, (start_date, end_date))
-            rows = cur.fetchall()
+            require_date_columns(conn, 'workstation_master_log')
+            with run.span("aggregate") as span:
+                cur.execute(AGGREGATE_SQL, (start_date, end_date))
+                rows = cur.fetchall()
+                span.rows_out = len(rows)
             print(f"Aggregated {len(rows)} rows.")
 
             sort_data = {'506': {}, '520': {}}
@@ -54,6 +60,7 @@ def main():
             print(sort_data)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
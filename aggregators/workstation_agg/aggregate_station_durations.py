@@ -0,0 +1,286 @@
+"""
+Daily cycle-time and queue-time distributions per station and model.
+
+station_duration_daily holds one quantile sketch (quantile_sketch.py) per
+day, model, station and kind:
+
+- cycle: history_station_end_time - history_station_start_time of each
+  event;
+- queue: the wait before a station, the event's start minus the end of the
+  part's previous event (per sn and model, in start time order). A part's
+  first event has none; overlapping events count as 0.
+
+Both are filed under the event's end_date. The day's p50/p90/p99 are stored
+next to the sketch. Longer periods are read by merging the days' sketches,
+not by rescanning workstation_master_log: --report week|month prints the
+merged percentiles.
+
+The scan buckets the durations in SQL and returns one row per bucket, so
+only counts cross the wire. Days are recomputed whole (delete, then insert,
+in one transaction). The scan starts QUEUE_LOOKBACK_DAYS before the first
+day, so most previous events come from the same scan; a part's first event
+in it looks its previous event up by sn instead.
+
+Usage:
+    python aggregate_station_durations.py                    # the latest 3 days with data
+    python aggregate_station_durations.py --mode all
+    python aggregate_station_durations.py --start 2025-06-01 --end 2025-06-30
+    python aggregate_station_durations.py --report week --kind queue --model "Tesla SXM5"
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from factory_calendar import week_bounds, week_id
+from pipeline_metrics import PipelineRun
+from quantile_sketch import QuantileSketch, bucket_sql
+from read_api import notify_summary_updated
+from streaming import stream_batches
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+KINDS = ('cycle', 'queue')
+QUANTILES = (0.5, 0.9, 0.99)
+RECENT_DAYS = 3
+QUEUE_LOOKBACK_DAYS = 7
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS station_duration_daily (
+    day DATE NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    workstation_name VARCHAR(255) NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    samples INTEGER NOT NULL,
+    zero_count INTEGER NOT NULL,
+    sum_seconds DOUBLE PRECISION NOT NULL,
+    min_seconds DOUBLE PRECISION NOT NULL,
+    max_seconds DOUBLE PRECISION NOT NULL,
+    p50_seconds DOUBLE PRECISION NOT NULL,
+    p90_seconds DOUBLE PRECISION NOT NULL,
+    p99_seconds DOUBLE PRECISION NOT NULL,
+    buckets JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, model, workstation_name, kind)
+)
+"""
+
+# One row per (day, model, station, kind, bucket), ordered so each sketch's buckets are contiguous
+BUCKETS_SQL = f"""
+WITH events AS (
+    SELECT
+        end_date AS day,
+        sn,
+        COALESCE(model, '') AS model,
+        workstation_name,
+        id,
+        history_station_start_time AS started,
+        history_station_end_time AS ended,
+        LAG(history_station_end_time) OVER (
+            PARTITION BY sn, COALESCE(model, '')
+            ORDER BY history_station_start_time, history_station_end_time, id
+        ) AS previous_end
+    FROM workstation_master_log
+    WHERE history_station_end_time >= %(start)s::date - {QUEUE_LOOKBACK_DAYS}
+        AND history_station_end_time < %(end)s::date + 1
+),
+durations AS (
+    SELECT
+        e.day, e.model, e.workstation_name,
+        EXTRACT(EPOCH FROM e.ended - e.started)::float8 AS cycle,
+        EXTRACT(EPOCH FROM e.started - COALESCE(e.previous_end, earlier.ended))::float8 AS queue
+    FROM events e
+    -- The part's first event in the window: its predecessor, if any, is older
+    LEFT JOIN LATERAL (
+        SELECT history_station_end_time AS ended
+        FROM workstation_master_log w
+        WHERE e.previous_end IS NULL AND w.sn = e.sn AND COALESCE(w.model, '') = e.model
+            AND (w.history_station_start_time, w.history_station_end_time, w.id) < (e.started, e.ended, e.id)
+        ORDER BY history_station_start_time DESC, history_station_end_time DESC, id DESC
+        LIMIT 1
+    ) earlier ON TRUE
+    WHERE e.day >= %(start)s
+),
+samples AS (
+    SELECT day, model, workstation_name, 'cycle' AS kind, GREATEST(cycle, 0) AS seconds FROM durations
+    UNION ALL
+    SELECT day, model, workstation_name, 'queue', GREATEST(queue, 0) FROM durations WHERE queue IS NOT NULL
+)
+SELECT day, model, workstation_name, kind, {bucket_sql('seconds')} AS bucket,
+       COUNT(*), SUM(seconds), MIN(seconds), MAX(seconds)
+FROM samples
+GROUP BY 1, 2, 3, 4, 5
+ORDER BY 1, 2, 3, 4
+"""
+
+INSERT_SQL = """
+INSERT INTO station_duration_daily (
+    day, model, workstation_name, kind, samples, zero_count, sum_seconds, min_seconds, max_seconds,
+    p50_seconds, p90_seconds, p99_seconds, buckets
+) VALUES %s
+"""
+
+def create_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(CREATE_TABLE_SQL)
+    conn.commit()
+
+def daily_sketches(conn, start, end):
+    """Yield ((day, model, station, kind), sketch) for the days in [start, end]"""
+    key, sketch = None, None
+    for rows in stream_batches(conn, BUCKETS_SQL, {"start": start, "end": end}, name="station_durations"):
+        for day, model, station, kind, bucket, n, total, low, high in rows:
+            if (day, model, station, kind) != key:
+                if key is not None:
+                    yield key, sketch
+                key, sketch = (day, model, station, kind), QuantileSketch()
+            sketch.add_bucket(bucket, n, total, low, high)
+    if key is not None:
+        yield key, sketch
+
+def sketch_values(key, sketch):
+    return (*key, sketch.count, sketch.zero_count, sketch.total, sketch.min, sketch.max,
+            *(sketch.quantile(q) for q in QUANTILES), sketch.to_json())
+
+def aggregate_station_durations(start, end):
+    """Recompute station_duration_daily for the days in [start, end]; returns rows written"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    run = PipelineRun("aggregate_station_durations")
+    try:
+        create_table(conn)
+        require_date_columns(conn, 'workstation_master_log')
+        print(f"Computing cycle and queue time sketches for {start} .. {end}...")
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM station_duration_daily WHERE day BETWEEN %s AND %s", (start, end))
+            # Streamed and inserted batch by batch; one commit at the end
+            with run.span("sketch_insert") as span:
+                batch, written = [], 0
+                for key, sketch in daily_sketches(conn, start, end):
+                    batch.append(sketch_values(key, sketch))
+                    if len(batch) >= 1000:
+                        execute_values(cur, INSERT_SQL, batch, page_size=1000)
+                        written += len(batch)
+                        batch = []
+                if batch:
+                    execute_values(cur, INSERT_SQL, batch, page_size=1000)
+                    written += len(batch)
+                span.rows_out = written
+            notify_summary_updated(cur, 'station_duration_daily')
+        conn.commit()
+        print(f"Wrote {written:,} daily sketches into station_duration_daily.")
+        return written
+    except Exception as e:
+        conn.rollback()
+        run.fail(e)
+        raise
+    finally:
+        conn.close()
+        run.finish()
+
+def period_of(day, period):
+    """(label, first day) of the week or month containing day"""
+    if period == 'week':
+        return week_id(day), week_bounds(day)[0]
+    return day.strftime('%Y-%m'), day.replace(day=1)
+
+def merged_sketches(conn, start, end, period, kind, model=None, station=None):
+    """{(period label, model, station): sketch} merged from the daily sketches of [start, end]"""
+    sql = """
+        SELECT day, model, workstation_name, samples, zero_count, sum_seconds, min_seconds, max_seconds, buckets
+        FROM station_duration_daily
+        WHERE day BETWEEN %(start)s AND %(end)s AND kind = %(kind)s
+    """
+    params = {"start": start, "end": end, "kind": kind}
+    if model is not None:
+        sql += " AND model = %(model)s"
+        params["model"] = model
+    if station is not None:
+        sql += " AND workstation_name = %(station)s"
+        params["station"] = station
+    merged = {}
+    for rows in stream_batches(conn, sql, params, name="duration_sketches"):
+        for day, row_model, row_station, samples, zero_count, total, low, high, buckets in rows:
+            key = (period_of(day, period)[0], row_model, row_station)
+            sketch = QuantileSketch.from_json(buckets, zero_count, samples, total, low, high)
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = sketch
+    return merged
+
+def print_report(period, periods, kind, model=None, station=None):
+    """p50/p90/p99 per station for the latest periods, from merged daily sketches"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(day) FROM station_duration_daily")
+            last_day = cur.fetchone()[0]
+        if last_day is None:
+            print("station_duration_daily is empty; run the aggregation first")
+            return
+        start = period_of(last_day, period)[1]
+        for _ in range(periods - 1):
+            start = period_of(start - timedelta(days=1), period)[1]
+        merged = merged_sketches(conn, start, last_day, period, kind, model, station)
+    finally:
+        conn.close()
+
+    print(f"{kind.capitalize()} time in seconds by {period}, {start} .. {last_day}")
+    print(f"{'Period':<9} {'Model':<14} {'Station':<16} {'Samples':>8} {'p50':>9} {'p90':>9} {'p99':>9}")
+    print("-" * 80)
+    for (label, row_model, row_station), sketch in sorted(merged.items()):
+        p50, p90, p99 = (sketch.quantile(q) for q in QUANTILES)
+        print(f"{label:<9} {row_model:<14} {row_station:<16} {sketch.count:>8,} {p50:>9,.0f} {p90:>9,.0f} {p99:>9,.0f}")
+
+def days_to_process(mode):
+    """(first, last) day for --mode: every day with workstation history, or the latest RECENT_DAYS"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(history_station_end_time)::date, MAX(history_station_end_time)::date "
+                        "FROM workstation_master_log")
+            first, last = cur.fetchone()
+    finally:
+        conn.close()
+    if last is None or mode == 'all':
+        return first, last
+    return max(first, last - timedelta(days=RECENT_DAYS - 1)), last
+
+if __name__ == "__main__":
+    parse_day = lambda s: datetime.strptime(s, '%Y-%m-%d').date()
+    parser = argparse.ArgumentParser(description="Station cycle and queue time sketches")
+    parser.add_argument('--mode', choices=['all', 'recent'], default='recent',
+                        help=f"'all' recomputes every day, 'recent' the latest {RECENT_DAYS} days with data (default: recent)")
+    parser.add_argument('--start', type=parse_day, help="First day to recompute (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_day, help="Last day to recompute, inclusive")
+    parser.add_argument('--report', choices=['week', 'month'], help="Print merged percentiles instead of aggregating")
+    parser.add_argument('--periods', type=int, default=4, help="Periods to report (default: 4)")
+    parser.add_argument('--kind', choices=KINDS, default='cycle', help="Duration to report (default: cycle)")
+    parser.add_argument('--model', help="Report one model")
+    parser.add_argument('--station', help="Report one station")
+    args = parser.parse_args()
+
+    if args.report:
+        print_report(args.report, args.periods, args.kind, args.model, args.station)
+        sys.exit(0)
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end go together")
+    if args.start is not None:
+        start, end = args.start, args.end
+    else:
+        start, end = days_to_process(args.mode)
+    if start is None:
+        print("No workstation history yet")
+    else:
+        aggregate_station_durations(start, end)
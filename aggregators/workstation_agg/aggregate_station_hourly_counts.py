@@ -1,6 +1,16 @@
+import os
+import sys
 import psycopg2
+from psycopg2.extras import execute_values
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from streaming import stream_batches
+from summary_views import is_materialized, refresh_summary_view
+
 DB_CONFIG = {
     'host': 'localhost',
     'database': 'fox_db',
@@ -9,6 +19,31 @@ DB_CONFIG = {
     'port': '5432'
 }
 
+AGGREGATE_SQL = """
+    SELECT
+        end_date AS date,
+        end_hour::int AS hour,
+        workstation_name,
+        COUNT(*) AS part_count
+    FROM
+        workstation_master_log
+    WHERE
+        history_station_end_time IS NOT NULL
+    GROUP BY
+        end_date,
+        end_hour,
+        workstation_name
+    ORDER BY
+        date, hour, workstation_name;
+"""
+
+UPSERT_SQL = """
+    INSERT INTO station_hourly_summary (date, hour, workstation_name, part_count)
+    VALUES %s
+    ON CONFLICT (date, hour, workstation_name)
+    DO UPDATE SET part_count = EXCLUDED.part_count;
+"""
+
 def create_summary_table(conn):
     with conn.cursor() as cur:
         cur.execute("""
@@ -24,41 +59,37 @@ def create_summary_table(conn):
 
 def aggregate_station_hourly_counts():
     conn = psycopg2.connect(**DB_CONFIG)
+    if is_materialized(conn, 'station_hourly_summary'):
+        print("station_hourly_summary is a materialized view, refreshing it instead of upserting...")
+        try:
+            refresh_summary_view(conn, 'station_hourly_summary')
+        finally:
+            conn.close()
+        return
+    run = PipelineRun("aggregate_station_hourly_counts")
     try:
         create_summary_table(conn)
+        require_date_columns(conn, 'workstation_master_log')
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    DATE(history_station_end_time) AS date,
-                    EXTRACT(HOUR FROM history_station_end_time)::int AS hour,
-                    workstation_name,
-                    COUNT(*) AS part_count
-                FROM
-                    workstation_master_log
-                WHERE
-                    history_station_end_time IS NOT NULL
-                GROUP BY
-                    DATE(history_station_end_time),
-                    EXTRACT(HOUR FROM history_station_end_time),
-                    workstation_name
-                ORDER BY
-                    date, hour, workstation_name;
-            """)
-            results = cur.fetchall()
-            print(f"{'Date':<12} {'Hour':<4} {'Station':<16} {'Count':<6}")
-            print("-" * 40)
-            for date, hour, station, count in results:
-                print(f"{date} {hour:>2}   {station:<16} {count:<6}")
-                cur.execute("""
-                    INSERT INTO station_hourly_summary (date, hour, workstation_name, part_count)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (date, hour, workstation_name)
-                    DO UPDATE SET part_count = EXCLUDED.part_count;
-                """, (date, hour, station, count))
-        conn.commit()
+            # Streamed and upserted batch by batch; one commit at the end
+            with run.span("aggregate_upsert") as span:
+                print(f"{'Date':<12} {'Hour':<4} {'Station':<16} {'Count':<6}")
+                print("-" * 40)
+                span.rows_out = 0
+                for rows in stream_batches(conn, AGGREGATE_SQL, name="station_hourly"):
+                    for date, hour, station, count in rows:
+                        print(f"{date} {hour:>2}   {station:<16} {count:<6}")
+                    execute_values(cur, UPSERT_SQL, rows, page_size=1000)
+                    span.rows_out += len(rows)
+                notify_summary_updated(cur, 'station_hourly_summary')
+                conn.commit()
         print("\nAggregated data has been saved to station_hourly_summary table.")
+    except Exception as e:
+        run.fail(e)
+        raise
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     aggregate_station_hourly_counts() 
\ No newline at end of file
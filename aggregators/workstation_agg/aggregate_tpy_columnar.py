@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+"""
+Columnar in-memory TPY engine.
+
+Loads the columns the TPY aggregators need from workstation_master_log once,
+dictionary-encodes the strings as integer codes, stores end times as int64
+microseconds and computes daily/weekly FPY, station throughput yield and
+hardcoded/dynamic TPY with NumPy group-bys. Results are written to the same
+daily_tpy_metrics / weekly_tpy_metrics tables as the SQL aggregators.
+
+Usage:
+    python aggregate_tpy_columnar.py                      # all dates and weeks
+    python aggregate_tpy_columnar.py --start 2025-06-01 --end 2025-06-30
+    python aggregate_tpy_columnar.py --dry-run            # compute only, no writes
+    python aggregate_tpy_columnar.py --benchmark 10000000 # synthetic engine benchmark
+    python aggregate_tpy_columnar.py --benchmark 1000000 --compare-sql  # and the SQL path, same rows
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+from aggregate_tpy_weekly import (
+    calculate_dynamic_tpy,
+    calculate_hardcoded_tpy,
+    calculate_model_specific_throughput_yields,
+    calculate_weekly_first_pass_yield_from_raw,
+    get_iso_week_id,
+    upsert_weekly_route_metrics,
+    upsert_weekly_tpy_metrics,
+)
+from tpy_routes import DEFAULT_ROUTES, load_tpy_routes, route_models
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from archive import archived_batches
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+ETL_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+US_PER_DAY = 86_400_000_000
+EPOCH = date(1970, 1, 1)
+# 1970-01-01 is a Thursday, so day 4 (1970-01-05) is the first Monday
+FIRST_MONDAY_DAY = 4
+
+LOAD_SQL = """
+    SELECT
+        sn,
+        model,
+        workstation_name,
+        history_station_passing_status,
+        history_station_end_time
+    FROM workstation_master_log
+    WHERE service_flow NOT IN ('NC Sort', 'RO')
+        AND service_flow IS NOT NULL
+        AND history_station_end_time IS NOT NULL
+"""
+# LOAD_SQL's columns and filter, applied to months moved to the Parquet archive (archive.py)
+ARCHIVE_COLUMNS = ['sn', 'model', 'workstation_name', 'history_station_passing_status',
+                   'history_station_end_time', 'service_flow']
+EXCLUDED_SERVICE_FLOWS = ('NC Sort', 'RO')
+
+UPSERT_DAILY_SQL = """
+    INSERT INTO daily_tpy_metrics
+        (date_id, model, workstation_name, total_parts, passed_parts, failed_parts, throughput_yield,
+         week_id, week_start, week_end, total_starters)
+    VALUES %s
+    ON CONFLICT (date_id, model, workstation_name)
+    DO UPDATE SET
+        total_parts = EXCLUDED.total_parts,
+        passed_parts = EXCLUDED.passed_parts,
+        failed_parts = EXCLUDED.failed_parts,
+        throughput_yield = EXCLUDED.throughput_yield,
+        week_id = EXCLUDED.week_id,
+        week_start = EXCLUDED.week_start,
+        week_end = EXCLUDED.week_end,
+        total_starters = EXCLUDED.total_starters,
+        created_at = NOW();
+"""
+
+
+class StringDictionary:
+    """Maps strings to dense int32 codes; code -> value lookup via .values"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, items):
+        codes = self.codes
+        values = self.values
+        out = np.empty(len(items), dtype=np.int32)
+        for i, item in enumerate(items):
+            code = codes.get(item)
+            if code is None:
+                code = len(values)
+                codes[item] = code
+                values.append(item)
+            out[i] = code
+        return out
+
+    def code_of(self, item):
+        """Code for item, or -1 if the value never occurs"""
+        return self.codes.get(item, -1)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ColumnarWorkstationLog:
+    """Column arrays for the TPY-relevant slice of workstation_master_log"""
+
+    def __init__(self):
+        self.sn_dict = StringDictionary()
+        self.model_dict = StringDictionary()
+        self.station_dict = StringDictionary()
+        self.status_dict = StringDictionary()
+        self.sn = np.empty(0, dtype=np.int32)
+        self.model = np.empty(0, dtype=np.int32)
+        self.station = np.empty(0, dtype=np.int32)
+        self.status = np.empty(0, dtype=np.int32)
+        self.end_us = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_database(cls, conn, itersize=200_000, include_archive=True):
+        """Stream LOAD_SQL through a named cursor and encode it chunk by chunk
+
+        Archived months are read from their Parquet files first, so week
+        starters and all-time totals still count them.
+        """
+        log = cls()
+        sn_chunks, model_chunks, station_chunks, status_chunks, end_chunks = [], [], [], [], []
+
+        def add(rows):
+            sns, models, stations, statuses, end_times = zip(*rows)
+            sn_chunks.append(log.sn_dict.encode(sns))
+            model_chunks.append(log.model_dict.encode(models))
+            station_chunks.append(log.station_dict.encode(stations))
+            status_chunks.append(log.status_dict.encode(statuses))
+            end_chunks.append(np.array(end_times, dtype='datetime64[us]').view(np.int64))
+
+        if include_archive:
+            for batch in archived_batches('workstation_master_log', ARCHIVE_COLUMNS, batch_size=itersize):
+                rows = [row[:5] for row in zip(*(column.to_pylist() for column in batch.columns))
+                        if row[5] is not None and row[5] not in EXCLUDED_SERVICE_FLOWS and row[4] is not None]
+                if rows:
+                    add(rows)
+        with conn.cursor(name='tpy_columnar_load') as cur:
+            cur.itersize = itersize
+            cur.execute(LOAD_SQL)
+            while True:
+                rows = cur.fetchmany(itersize)
+                if not rows:
+                    break
+                add(rows)
+        if sn_chunks:
+            log.sn = np.concatenate(sn_chunks)
+            log.model = np.concatenate(model_chunks)
+            log.station = np.concatenate(station_chunks)
+            log.status = np.concatenate(status_chunks)
+            log.end_us = np.concatenate(end_chunks)
+        return log
+
+    def __len__(self):
+        return len(self.end_us)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.sn, self.model, self.station, self.status, self.end_us))
+
+    def day_index(self):
+        return self.end_us // US_PER_DAY
+
+    def model_codes(self, models):
+        return np.array([c for c in (self.model_dict.code_of(m) for m in models) if c >= 0], dtype=np.int32)
+
+
+def day_to_date(day):
+    return EPOCH + timedelta(days=int(day))
+
+def date_to_day(value):
+    return (value - EPOCH).days
+
+def week_of_day(days):
+    """Monday-based week number (ISO weeks start on Monday)"""
+    return (days - FIRST_MONDAY_DAY) // 7
+
+def week_bounds(week):
+    week_start = day_to_date(int(week) * 7 + FIRST_MONDAY_DAY)
+    return week_start, week_start + timedelta(days=6)
+
+def group_keys(*columns):
+    """Dense group ids for the row-wise tuple of integer columns.
+
+    Returns (inverse, unique_columns) where inverse[i] is the group of row i and
+    unique_columns are the key columns for each group, sorted lexicographically.
+    """
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    bases = []
+    for col in columns:
+        col = col.astype(np.int64)
+        low = col.min() if len(col) else 0
+        base = (col.max() - low + 1) if len(col) else 1
+        key = key * base + (col - low)
+        bases.append((low, base))
+    unique_key, inverse = np.unique(key, return_inverse=True)
+    unique_columns = []
+    remainder = unique_key
+    for low, base in reversed(bases):
+        unique_columns.append(remainder % base + low)
+        remainder = remainder // base
+    unique_columns.reverse()
+    return inverse, unique_columns
+
+def grouped_any(inverse, n_groups, flags):
+    return np.bincount(inverse, weights=flags, minlength=n_groups) > 0
+
+
+class TpyColumnarEngine:
+    """Vectorized equivalent of aggregate_tpy_daily.py / aggregate_tpy_weekly.py"""
+
+    def __init__(self, log, routes):
+        self.log = log
+        self.tpy_models = route_models(routes)
+        self.days = log.day_index()
+        self.weeks = week_of_day(self.days)
+        pass_code = log.status_dict.code_of('Pass')
+        null_code = log.status_dict.code_of(None)
+        self.is_pass = log.status == pass_code
+        # SQL "status != 'Pass'" is NULL (not counted) for NULL statuses
+        self.is_fail = ~self.is_pass & (log.status != null_code)
+        self.is_packing = log.station == log.station_dict.code_of('PACKING')
+        self.in_tpy_models = np.isin(log.model, log.model_codes(self.tpy_models))
+
+    def weekly_starters(self):
+        """Parts (sn, model) by the week of their first activity.
+
+        Returns ({week: {"totalStarters": n, "byModel": {...}}}, starter_sn_week_keys)
+        """
+        log = self.log
+        inverse, (part_sn, part_model) = group_keys(log.sn, log.model)
+        first_us = np.full(len(part_sn), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first_us, inverse, log.end_us)
+        first_week = week_of_day(first_us // US_PER_DAY)
+
+        starters = {}
+        counts_inverse, (weeks, models) = group_keys(first_week, part_model)
+        counts = np.bincount(counts_inverse, minlength=len(weeks))
+        for week, model, count in zip(weeks.tolist(), models.tolist(), counts.tolist()):
+            entry = starters.setdefault(week, {"totalStarters": 0, "byModel": {}})
+            entry["totalStarters"] += count
+            entry["byModel"][log.model_dict.values[model]] = count
+
+        # the SQL path matches starters with sn = ANY(...), i.e. on sn alone
+        n_weeks_span = int(first_week.max() - first_week.min() + 1) if len(first_week) else 1
+        week_base = int(first_week.min()) if len(first_week) else 0
+        starter_keys = np.unique(part_sn.astype(np.int64) * n_weeks_span + (first_week - week_base))
+        return starters, (starter_keys, n_weeks_span, week_base)
+
+    def daily_completions(self, starter_index):
+        """Of each week's starters, how many completed (reached PACKING) on each day"""
+        log = self.log
+        starter_keys, n_weeks_span, week_base = starter_index
+        offset = self.weeks - week_base
+        in_span = (offset >= 0) & (offset < n_weeks_span)
+        row_keys = log.sn.astype(np.int64) * n_weeks_span + offset
+        mask = in_span & np.isin(row_keys, starter_keys)
+
+        completions = {}
+        if not mask.any():
+            return completions
+        inverse, (days, _, models) = group_keys(self.days[mask], log.sn[mask], log.model[mask])
+        n_groups = len(days)
+        reached = grouped_any(inverse, n_groups, self.is_packing[mask])
+        failed = grouped_any(inverse, n_groups, self.is_fail[mask])
+        first_pass = reached & ~failed
+
+        day_inverse, (completed_days, completed_models) = group_keys(days[reached], models[reached])
+        completed = np.bincount(day_inverse, minlength=len(completed_days))
+        passed = np.bincount(day_inverse, weights=first_pass[reached], minlength=len(completed_days))
+        for day, model, done, ok in zip(completed_days.tolist(), completed_models.tolist(),
+                                        completed.tolist(), passed.tolist()):
+            entry = completions.setdefault(day, {"completedToday": 0, "firstPassToday": 0, "byModel": {}})
+            entry["completedToday"] += done
+            entry["firstPassToday"] += int(ok)
+            entry["byModel"][log.model_dict.values[model]] = {"completed": done, "firstPass": int(ok)}
+        for entry in completions.values():
+            completed_today = entry["completedToday"]
+            fpy = (entry["firstPassToday"] / completed_today * 100) if completed_today > 0 else 0
+            entry["dailyFPY"] = round(fpy, 2)
+        return completions
+
+    def station_yields(self, period):
+        """(period, model, station) -> total/passed/failed for the TPY models"""
+        log = self.log
+        mask = self.in_tpy_models
+        if not mask.any():
+            return {}
+        inverse, (periods, models, stations) = group_keys(period[mask], log.model[mask], log.station[mask])
+        n_groups = len(periods)
+        total = np.bincount(inverse, minlength=n_groups)
+        passed = np.bincount(inverse, weights=self.is_pass[mask], minlength=n_groups).astype(np.int64)
+        failed = np.bincount(inverse, weights=self.is_fail[mask], minlength=n_groups).astype(np.int64)
+        results = {}
+        for p, m, s, t, ok, bad in zip(periods.tolist(), models.tolist(), stations.tolist(),
+                                        total.tolist(), passed.tolist(), failed.tolist()):
+            results.setdefault(p, []).append((log.model_dict.values[m], log.station_dict.values[s], t, ok, bad))
+        return results
+
+    def weekly_first_pass_yield(self):
+        """Per-week FPY with the same breakdown as calculate_weekly_first_pass_yield_from_raw"""
+        log = self.log
+        inverse, (weeks, _, _) = group_keys(self.weeks, log.sn, log.model)
+        n_groups = len(weeks)
+        reached = grouped_any(inverse, n_groups, self.is_packing)
+        failed = grouped_any(inverse, n_groups, self.is_fail)
+
+        week_inverse, (unique_weeks,) = group_keys(weeks)
+        n_weeks = len(unique_weeks)
+        started = np.bincount(week_inverse, minlength=n_weeks)
+        first_pass = np.bincount(week_inverse, weights=reached & ~failed, minlength=n_weeks).astype(np.int64)
+        completed = np.bincount(week_inverse, weights=reached, minlength=n_weeks).astype(np.int64)
+        failed_parts = np.bincount(week_inverse, weights=failed, minlength=n_weeks).astype(np.int64)
+        limbo = np.bincount(week_inverse, weights=~reached & ~failed, minlength=n_weeks).astype(np.int64)
+
+        results = {}
+        for week, n, fp, done, bad, stuck in zip(unique_weeks.tolist(), started.tolist(), first_pass.tolist(),
+                                                  completed.tolist(), failed_parts.tolist(), limbo.tolist()):
+            active = done + bad
+            results[week] = {
+                "traditional": {
+                    "partsStarted": n,
+                    "firstPassSuccess": fp,
+                    "firstPassYield": round((fp / n * 100) if n > 0 else 0, 2)
+                },
+                "completedOnly": {
+                    "activeParts": active,
+                    "firstPassSuccess": fp,
+                    "firstPassYield": round((fp / active * 100) if active > 0 else 0, 2)
+                },
+                "breakdown": {
+                    "partsCompleted": done,
+                    "partsFailed": bad,
+                    "partsStuckInLimbo": stuck,
+                    "totalParts": n
+                }
+            }
+        return results
+
+    def model_specific_yields(self, weekly_station_rows):
+        """Shape one week's station rows like calculate_model_specific_throughput_yields"""
+        model_specific_yields = {model: {} for model in self.tpy_models}
+        model_specific_yields["overall"] = {}
+        overall_aggregates = {}
+        for model, station, total, passed, failed in weekly_station_rows:
+            throughput_yield = (passed / total * 100) if total > 0 else 0
+            model_specific_yields[model][station] = {
+                "totalParts": total,
+                "passedParts": passed,
+                "failedParts": failed,
+                "throughputYield": round(throughput_yield, 2)
+            }
+            totals = overall_aggregates.setdefault(station, {'totalParts': 0, 'passedParts': 0, 'failedParts': 0})
+            totals['totalParts'] += total
+            totals['passedParts'] += passed
+            totals['failedParts'] += failed
+        for station, totals in overall_aggregates.items():
+            throughput_yield = (totals['passedParts'] / totals['totalParts'] * 100) if totals['totalParts'] > 0 else 0
+            model_specific_yields["overall"][station] = {
+                "totalParts": totals['totalParts'],
+                "passedParts": totals['passedParts'],
+                "failedParts": totals['failedParts'],
+                "throughputYield": round(throughput_yield, 2)
+            }
+        return model_specific_yields
+
+    def run(self, start_date=None, end_date=None):
+        """Compute every day and week (optionally limited to [start_date, end_date])"""
+        starters, starter_index = self.weekly_starters()
+        completions = self.daily_completions(starter_index)
+        daily_stations = self.station_yields(self.days)
+        weekly_stations = self.station_yields(self.weeks)
+        weekly_fpy = self.weekly_first_pass_yield()
+
+        first_day = date_to_day(start_date) if start_date else None
+        last_day = date_to_day(end_date) if end_date else None
+
+        daily = {}
+        for day in np.unique(self.days).tolist():
+            if (first_day is not None and day < first_day) or (last_day is not None and day > last_day):
+                continue
+            week = int(week_of_day(day))
+            week_start, week_end = week_bounds(week)
+            daily[day_to_date(day)] = {
+                "weekId": get_iso_week_id(week_start),
+                "weekStart": week_start,
+                "weekEnd": week_end,
+                "totalStarters": starters.get(week, {}).get("totalStarters", 0),
+                "completions": completions.get(day, {"completedToday": 0, "firstPassToday": 0,
+                                                     "dailyFPY": 0.0, "byModel": {}}),
+                "stations": daily_stations.get(day, []),
+            }
+
+        weekly = {}
+        for week, fpy in weekly_fpy.items():
+            week_start, week_end = week_bounds(week)
+            if (start_date and week_end < start_date) or (end_date and week_start > end_date):
+                continue
+            station_rows = weekly_stations.get(week, [])
+            model_yields = self.model_specific_yields(station_rows)
+            # the SQL path sums daily_tpy_metrics over the week, i.e. the same station rows
+            total_parts = sum(row[2] for row in station_rows)
+            passed_parts = sum(row[3] for row in station_rows)
+            weekly[get_iso_week_id(week_start)] = {
+                "weekStart": week_start,
+                "weekEnd": week_end,
+                "firstPassYield": fpy,
+                "modelSpecificYields": model_yields,
+                "totalPartsOverall": total_parts,
+                "totalPassedParts": passed_parts,
+            }
+        return daily, weekly
+
+
+def write_results(conn, daily, weekly, routes):
+    """Upsert engine results into daily_tpy_metrics and the weekly TPY tables"""
+    daily_values = []
+    for date_id, info in daily.items():
+        for model, station, total, passed, failed in info["stations"]:
+            throughput_yield = (passed / total * 100) if total > 0 else 0
+            daily_values.append((date_id, model, station, total, passed, failed, round(throughput_yield, 2),
+                                 info["weekId"], info["weekStart"], info["weekEnd"], info["totalStarters"]))
+
+    with conn.cursor() as cur:
+        if daily_values:
+            execute_values(cur, UPSERT_DAILY_SQL, daily_values, page_size=1000)
+        for week_id, info in sorted(weekly.items()):
+            model_yields = info["modelSpecificYields"]
+            hardcoded_tpy = calculate_hardcoded_tpy(model_yields, routes)
+            dynamic_tpy = calculate_dynamic_tpy(model_yields, routes)
+            upsert_weekly_tpy_metrics(
+                cur, week_id, info["weekStart"], info["weekEnd"], info["firstPassYield"],
+                model_yields, hardcoded_tpy, dynamic_tpy,
+                info["totalPartsOverall"], info["totalPassedParts"]
+            )
+            upsert_weekly_route_metrics(cur, week_id, routes, hardcoded_tpy, dynamic_tpy)
+        notify_summary_updated(cur, 'daily_tpy_metrics', 'weekly_tpy_metrics', 'weekly_tpy_route_metrics')
+    conn.commit()
+    return len(daily_values), len(weekly)
+
+def aggregate_tpy_columnar(start_date=None, end_date=None, dry_run=False):
+    """Load once, compute all periods in memory, write the TPY tables"""
+    print("COLUMNAR TPY ENGINE")
+    print("=" * 50)
+
+    run = PipelineRun("aggregate_tpy_columnar", source=f"{start_date or 'earliest'}..{end_date or 'latest'}")
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        routes = load_tpy_routes(conn=conn)
+        t0 = time.perf_counter()
+        with run.span("load") as span:
+            log = ColumnarWorkstationLog.from_database(conn)
+            span.rows_out = len(log)
+        t1 = time.perf_counter()
+        print(f"Loaded {len(log):,} rows ({log.nbytes / 1e6:.1f} MB columnar, "
+              f"{len(log.sn_dict):,} serials, {len(log.station_dict)} stations) in {t1 - t0:.2f}s")
+        if len(log) == 0:
+            print("No data to aggregate.")
+            return
+
+        with run.span("compute", rows_in=len(log)) as span:
+            daily, weekly = TpyColumnarEngine(log, routes).run(start_date, end_date)
+            span.rows_out = len(daily) + len(weekly)
+        t2 = time.perf_counter()
+        print(f"Computed {len(daily)} days and {len(weekly)} weeks in {t2 - t1:.2f}s")
+
+        for date_id, info in sorted(daily.items()):
+            print(f"  {date_id}: {len(info['stations'])} station-model rows, "
+                  f"Daily FPY {info['completions']['dailyFPY']:.1f}%")
+
+        if dry_run:
+            print("\nDry run: nothing written.")
+            return
+
+        with run.span("write") as span:
+            daily_rows, weekly_rows = write_results(conn, daily, weekly, routes)
+            span.rows_out = daily_rows + weekly_rows
+        t3 = time.perf_counter()
+        print(f"\nWrote {daily_rows} daily rows and {weekly_rows} weekly rows in {t3 - t2:.2f}s")
+    finally:
+        conn.close()
+        run.finish()
+
+
+def synthetic_log(rows, serials=None, seed=7):
+    """Build a ColumnarWorkstationLog of random but plausible events"""
+    rng = np.random.default_rng(seed)
+    serials = serials or max(rows // 12, 1)
+    stations = ['VI1', 'BBD', 'VI2', 'ASSY2', 'FI', 'FQC', 'TEST', 'PACKING']
+    models = [route["model"] for route in DEFAULT_ROUTES] + ['Tesla H100']
+    statuses = ['Pass', 'Fail', None]
+
+    log = ColumnarWorkstationLog()
+    log.sn_dict.encode([f"SYN{i:09d}" for i in range(serials)])
+    log.model_dict.encode(models)
+    log.station_dict.encode(stations)
+    log.status_dict.encode(statuses)
+
+    log.sn = rng.integers(0, serials, rows, dtype=np.int32)
+    log.model = (log.sn % len(models)).astype(np.int32)
+    log.station = rng.integers(0, len(stations), rows, dtype=np.int32)
+    log.status = rng.choice(np.array([0, 1, 2], dtype=np.int32), rows, p=[0.93, 0.06, 0.01])
+    start_us = np.int64(date_to_day(date(2025, 1, 6))) * US_PER_DAY
+    log.end_us = start_us + rng.integers(0, 180 * US_PER_DAY, rows, dtype=np.int64)
+    return log
+
+def run_benchmark(rows, compare_sql=False):
+    """Time the engine on synthetic data, optionally against the SQL path on the same rows"""
+    print(f"COLUMNAR TPY ENGINE BENCHMARK: {rows:,} synthetic rows")
+    print("=" * 50)
+    t0 = time.perf_counter()
+    log = synthetic_log(rows)
+    t1 = time.perf_counter()
+    daily, weekly = TpyColumnarEngine(log, DEFAULT_ROUTES).run()
+    t2 = time.perf_counter()
+    print(f"Synthesized in {t1 - t0:.2f}s ({log.nbytes / 1e6:.1f} MB columnar)")
+    print(f"Engine: {len(daily)} days + {len(weekly)} weeks in {t2 - t1:.2f}s "
+          f"({rows / (t2 - t1):,.0f} rows/s)")
+
+    if compare_sql:
+        compare_with_sql(rows)
+
+def compare_with_sql(rows):
+    """Load synthetic rows into a scratch database and time the engine and the SQL path on them"""
+    sys.path.insert(0, os.path.join(ETL_DIR, "benchmarks"))
+    from generate_synthetic_logs import SyntheticFactory, load_into_postgres
+    from run_benchmarks import create_bench_database, drop_bench_database, point_etl_modules_at
+
+    db_name = f"fox_tpy_bench_{rows}"
+    print(f"\nComparing against the SQL path on {rows:,} synthetic rows in {db_name}...")
+    bench_config = create_bench_database(db_name)
+    try:
+        workstation, testboard, snfn = SyntheticFactory(date(2025, 1, 6), 180, seed=7).generate(rows)
+        conn = psycopg2.connect(**bench_config)
+        try:
+            load_into_postgres({"workstation": workstation, "testboard": testboard, "snfn": snfn}, conn)
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE")
+            conn.commit()
+            # The SQL aggregators (and tpy_routes) connect through their own DB_CONFIG
+            point_etl_modules_at(bench_config)
+            routes = load_tpy_routes(conn=conn)
+            t0 = time.perf_counter()
+            bench_log = ColumnarWorkstationLog.from_database(conn, include_archive=False)
+            _, bench_weekly = TpyColumnarEngine(bench_log, routes).run()
+            engine_seconds = time.perf_counter() - t0
+        finally:
+            conn.close()
+
+        t0 = time.perf_counter()
+        for info in bench_weekly.values():
+            calculate_weekly_first_pass_yield_from_raw(info["weekStart"], info["weekEnd"])
+            calculate_model_specific_throughput_yields(info["weekStart"], info["weekEnd"], routes)
+        sql_seconds = time.perf_counter() - t0
+    finally:
+        drop_bench_database(db_name)
+
+    print(f"\n{len(bench_log):,} rows, {len(bench_weekly)} weeks")
+    print(f"  Engine (load + all periods): {engine_seconds:.2f}s")
+    print(f"  SQL weekly FPY + station yields: {sql_seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar in-memory TPY engine")
+    parser.add_argument('--start', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help="First date to write (YYYY-MM-DD, default: earliest)")
+    parser.add_argument('--end', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help="Last date to write (YYYY-MM-DD, default: latest)")
+    parser.add_argument('--dry-run', action='store_true', help="Compute and print without writing")
+    parser.add_argument('--benchmark', type=int, metavar='ROWS',
+                        help="Benchmark the engine on ROWS synthetic rows instead of aggregating")
+    parser.add_argument('--compare-sql', action='store_true',
+                        help="With --benchmark, also time the SQL path on the same rows in a scratch database")
+    args = parser.parse_args()
+    if args.benchmark:
+        run_benchmark(args.benchmark, compare_sql=args.compare_sql)
+    else:
+        aggregate_tpy_columnar(args.start, args.end, dry_run=args.dry_run)
@@ -2,6 +2,17 @@ import psycopg2
 import json
 from datetime import datetime, timedelta
 import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from date_columns import require_date_columns
+from factory_calendar import week_bounds, week_id as calendar_week_id
+from part_state import ensure_part_state
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from snapshots import SnapshotCoordinator
+from tpy_routes import load_tpy_routes, route_models
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -13,49 +24,39 @@ DB_CONFIG = {
 
 def get_week_bounds(target_date):
     """Get the Monday (start) and Sunday (end) of the week containing target_date"""
-    days_since_monday = target_date.weekday()
-    week_start = target_date - timedelta(days=days_since_monday)
-    week_end = week_start + timedelta(days=6)
-    return week_start, week_end
+    return week_bounds(target_date)
 
 def get_week_id(target_date):
     """Generate week ID like '2025-W22' for the week containing target_date"""
-    year, week_num, _ = target_date.isocalendar()
-    return f"{year}-W{week_num:02d}"
+    return calendar_week_id(target_date)
 
-def calculate_weekly_starters_for_date(target_date):
-    """Get all parts that STARTED during the week containing target_date"""
+def calculate_weekly_starters_for_date(target_date, conn=None):
+    """Get all parts that STARTED during the week containing target_date (part_state must exist)"""
     week_start, week_end = get_week_bounds(target_date)
     week_id = get_week_id(target_date)
     
     print(f"Week {week_id}: {week_start.strftime('%Y-%m-%d')} to {week_end.strftime('%Y-%m-%d')}")
     
-    conn = psycopg2.connect(**DB_CONFIG)
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
             start_date = week_start
             end_date = week_end + timedelta(days=1)  
             
+            # part_state.first_seen is each part's first TPY-flow event; unlike
+            # MIN(history_station_end_time) over the master log, it survives archive.py
             cur.execute("""
-                WITH first_activity AS (
-                    SELECT 
-                        sn,
-                        model,
-                        MIN(history_station_end_time) as first_activity_time
-                    FROM workstation_master_log
-                    WHERE service_flow NOT IN ('NC Sort', 'RO')
-                        AND service_flow IS NOT NULL
-                    GROUP BY sn, model
-                )
-                SELECT 
-                    model,
+                SELECT
+                    NULLIF(model, '') AS model,
                     COUNT(*) as count,
                     ARRAY_AGG(sn) as parts
-                FROM first_activity
-                WHERE first_activity_time >= %s 
-                    AND first_activity_time < %s
-                GROUP BY model
-                ORDER BY model;
+                FROM part_state
+                WHERE first_seen >= %s
+                    AND first_seen < %s
+                GROUP BY 1
+                ORDER BY 1;
             """, (start_date, end_date))
             
             results = cur.fetchall()
@@ -81,16 +82,19 @@ def calculate_weekly_starters_for_date(target_date):
                 "byModel": by_model
             }
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def calculate_daily_completions_from_week_starters(target_date, week_starters_list):
+def calculate_daily_completions_from_week_starters(target_date, week_starters_list, conn=None):
     """Of the parts that started this week, how many completed on target_date?"""
     start_date = target_date
     end_date = target_date + timedelta(days=1)
     
     print(f"Daily completions on {target_date.strftime('%Y-%m-%d')} from week starters...")
     
-    conn = psycopg2.connect(**DB_CONFIG)
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
             if not week_starters_list:
@@ -153,26 +157,16 @@ def calculate_daily_completions_from_week_starters(target_date, week_starters_li
                 "byModel": by_model
             }
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def aggregate_daily_tpy_for_date(target_date):
-    """Aggregate daily TPY metrics for a specific date"""
-    print(f"\nAGGREGATING DAILY TPY FOR: {target_date.strftime('%Y-%m-%d')}")
-    print("=" * 60)
-    
-    conn = psycopg2.connect(**DB_CONFIG)
+def calculate_daily_station_counts(target_date, routes, conn=None):
+    """Per model and station pass/fail counts for target_date (routed models only)"""
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
-            week_data = calculate_weekly_starters_for_date(target_date)
-            
-            daily_completions = calculate_daily_completions_from_week_starters(
-                target_date, 
-                week_data['weekStarters']
-            )
-            
-            start_date = target_date
-            end_date = target_date + timedelta(days=1)
-            
             cur.execute("""
                 SELECT 
                     model,
@@ -185,14 +179,57 @@ def aggregate_daily_tpy_for_date(target_date):
                     AND history_station_end_time < %s
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
-                    AND model IN ('Tesla SXM4', 'Tesla SXM5')
+                    AND model = ANY(%s)
                 GROUP BY model, workstation_name
                 HAVING COUNT(*) >= 1
                 ORDER BY model, total_parts DESC;
-            """, (start_date, end_date))
-            
-            results = cur.fetchall()
-            
+            """, (target_date, target_date + timedelta(days=1), route_models(routes)))
+            return cur.fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+
+def aggregate_daily_tpy_for_date(target_date, routes=None, models_only=False, conn=None, snapshot_id=None):
+    """Aggregate daily TPY metrics for a specific date (station rows for the routed models)
+
+    conn is optional; the backfill runner passes one connection per worker.
+    The starter, completion and station queries read one snapshot
+    (snapshots.py), like the weekly aggregator; snapshot_id reads a snapshot
+    exported elsewhere instead.
+    """
+    print(f"\nAGGREGATING DAILY TPY FOR: {target_date.strftime('%Y-%m-%d')}")
+    print("=" * 60)
+    
+    if routes is None:
+        routes = load_tpy_routes()
+    if conn is None and snapshot_id is None:
+        setup_conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            ensure_part_state(setup_conn)
+        finally:
+            setup_conn.close()
+    
+    def starters_and_completions(read_conn):
+        week_data = calculate_weekly_starters_for_date(target_date, read_conn)
+        if models_only:
+            return week_data, {"completedToday": 0, "firstPassToday": 0, "dailyFPY": 0.0, "byModel": {}}
+        return week_data, calculate_daily_completions_from_week_starters(
+            target_date, 
+            week_data['weekStarters'],
+            read_conn
+        )
+    
+    with SnapshotCoordinator(DB_CONFIG, conn=conn, snapshot_id=snapshot_id, workers=1 if conn else 2) as snapshot:
+        (week_data, daily_completions), results = snapshot.run(
+            starters_and_completions,
+            lambda read_conn: calculate_daily_station_counts(target_date, routes, read_conn),
+        )
+    
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
             inserted_count = 0
             for model, workstation, total, passed, failed in results:
                 throughput_yield = (passed / total * 100) if total > 0 else 0
@@ -219,6 +256,7 @@ def aggregate_daily_tpy_for_date(target_date):
                 inserted_count += 1
                 print(f"    {model} {workstation}: {passed}/{total} = {throughput_yield:.1f}%")
             
+            notify_summary_updated(cur, 'daily_tpy_metrics')
             conn.commit()
             
             print(f"\nDaily TPY aggregation complete!")
@@ -235,7 +273,8 @@ def aggregate_daily_tpy_for_date(target_date):
             }
             
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 def get_all_available_dates():
     """Get all unique dates when actual testing occurred"""
@@ -243,12 +282,14 @@ def get_all_available_dates():
     
     conn = psycopg2.connect(**DB_CONFIG)
     try:
+        require_date_columns(conn, 'workstation_master_log')
+        # The week starters read part_state; create it before any snapshot is taken
+        ensure_part_state(conn)
         with conn.cursor() as cur:
             cur.execute("""
-                SELECT DISTINCT DATE(history_station_end_time) as test_date
+                SELECT DISTINCT end_date as test_date
                 FROM workstation_master_log
-                WHERE history_station_end_time IS NOT NULL
-                    AND service_flow NOT IN ('NC Sort', 'RO')
+                WHERE service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
                 ORDER BY test_date;
             """)
@@ -259,11 +300,14 @@ def get_all_available_dates():
     finally:
         conn.close()
 
-def aggregate_daily_tpy_metrics(mode='recent'):
-    """Aggregate daily TPY metrics for specified dates"""
+def aggregate_daily_tpy_metrics(mode='recent', models=None):
+    """Aggregate daily TPY metrics for specified dates (optionally only some models)"""
     print("DAILY TPY METRICS AGGREGATOR")
     print("=" * 50)
     
+    routes = load_tpy_routes(models)
+    print(f"TPY models: {', '.join(route_models(routes))}")
+    
     all_dates = get_all_available_dates()
     
     if not all_dates:
@@ -283,6 +327,7 @@ def aggregate_daily_tpy_metrics(mode='recent'):
         dates_to_process = [d for d in all_dates if d in recent_dates]
         print(f"\nProcessing RECENT {len(dates_to_process)} dates (today and past 2 days)...")
     
+    run = PipelineRun("aggregate_tpy_daily", source=mode)
     success_count = 0
     error_count = 0
     
@@ -291,7 +336,8 @@ def aggregate_daily_tpy_metrics(mode='recent'):
             print(f"\nProcessing {i}/{len(dates_to_process)}: {target_date.strftime('%Y-%m-%d')}")
             print("-" * 50)
             
-            result = aggregate_daily_tpy_for_date(target_date)
+            with run.span("date"):
+                result = aggregate_daily_tpy_for_date(target_date, routes, models_only=bool(models))
             success_count += 1
             
         except Exception as e:
@@ -301,6 +347,7 @@ def aggregate_daily_tpy_metrics(mode='recent'):
     print(f"\nDAILY TPY AGGREGATION COMPLETE!")
     print(f"Successfully processed: {success_count} dates")
     print(f"Errors: {error_count} dates")
+    run.finish()
     
     conn = psycopg2.connect(**DB_CONFIG)
     try:
@@ -327,5 +374,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Daily TPY Metrics Aggregator")
     parser.add_argument('--mode', choices=['all', 'recent'], default='recent', 
                        help="Choose 'all' to process all dates, or 'recent' for today and past 2 days (default: recent)")
+    parser.add_argument('--models', nargs='+', metavar='MODEL',
+                       help="Only compute these models' station rows (e.g. after adding a route)")
     args = parser.parse_args()
-    aggregate_daily_tpy_metrics(mode=args.mode) 
\ No newline at end of file
+    aggregate_daily_tpy_metrics(mode=args.mode, models=args.models) 
\ No newline at end of file
@@ -2,6 +2,21 @@ import psycopg2
 import json
 from datetime import datetime, timedelta
 import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from factory_calendar import ensure_calendar, week_id as calendar_week_id, week_range
+from fused_metrics import iter_metric_rows
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from snapshots import SnapshotCoordinator
+from tpy_routes import (
+    calculate_dynamic_route_tpy,
+    calculate_route_tpy,
+    load_tpy_routes,
+    route_models,
+)
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -11,29 +26,68 @@ DB_CONFIG = {
     'port': '5432'
 }
 
+EMPTY_ROUTE_TPY = {"stations": {}, "tpy": None, "stationCount": 0}
+
 def get_iso_week_id(date_obj):
     """Convert date to ISO week format: 2025-W23"""
-    year, week, _ = date_obj.isocalendar()
-    return f"{year}-W{week:02d}"
+    return calendar_week_id(date_obj)
 
 def get_week_date_range(week_id):
     """Get start and end dates for an ISO week"""
-    year, week = week_id.split('-W')
-    year = int(year)
-    week = int(week)
-    
-    jan4 = datetime(year, 1, 4)
-    week_start = jan4 - timedelta(days=jan4.weekday()) + timedelta(weeks=week-1)
-    week_end = week_start + timedelta(days=6)
-    
-    return week_start.date(), week_end.date()
+    return week_range(week_id)
+
+def first_pass_yield_result(result):
+    """FPY dict from (parts started, first pass success, completed, failed, stuck) counts"""
+    if result and result[0] > 0:
+        parts_started, first_pass_success, parts_completed, parts_failed, parts_stuck = result
+        
+        traditional_fpy = (first_pass_success / parts_started * 100) if parts_started > 0 else 0
+        
+        active_parts = parts_completed + parts_failed
+        completed_only_fpy = (first_pass_success / active_parts * 100) if active_parts > 0 else 0
+        
+        print(f"TRADITIONAL FPY: {first_pass_success}/{parts_started} = {traditional_fpy:.2f}%")
+        print(f"COMPLETED-ONLY FPY: {first_pass_success}/{active_parts} = {completed_only_fpy:.2f}%")
+        print(f"Parts breakdown:")
+        print(f"Completed: {parts_completed}")
+        print(f"Failed: {parts_failed}")
+        print(f"Stuck in limbo: {parts_stuck}")
+        print(f"Total: {parts_started}")
+        
+        return {
+            "traditional": {
+                "partsStarted": parts_started,
+                "firstPassSuccess": first_pass_success,
+                "firstPassYield": round(traditional_fpy, 2)
+            },
+            "completedOnly": {
+                "activeParts": active_parts,
+                "firstPassSuccess": first_pass_success,
+                "firstPassYield": round(completed_only_fpy, 2)
+            },
+            "breakdown": {
+                "partsCompleted": parts_completed,
+                "partsFailed": parts_failed,
+                "partsStuckInLimbo": parts_stuck,
+                "totalParts": parts_started
+            }
+        }
+    else:
+        print(f"No data found for this week")
+        return {
+            "traditional": {"partsStarted": 0, "firstPassSuccess": 0, "firstPassYield": 0},
+            "completedOnly": {"activeParts": 0, "firstPassSuccess": 0, "firstPassYield": 0},
+            "breakdown": {"partsCompleted": 0, "partsFailed": 0, "partsStuckInLimbo": 0, "totalParts": 0}
+        }
 
-def calculate_weekly_first_pass_yield_from_raw(week_start, week_end):
+def calculate_weekly_first_pass_yield_from_raw(week_start, week_end, conn=None):
     """Calculate WEEKLY first pass yield using raw data from workstation_master_log"""
     print(f"🎯 Calculating WEEKLY First Pass Yield from raw data...")
     print(f"  Week range: {week_start.strftime('%Y-%m-%d')} to {week_end.strftime('%Y-%m-%d')}")
     
-    conn = psycopg2.connect(**DB_CONFIG)
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
             cur.execute("""
@@ -59,57 +113,57 @@ def calculate_weekly_first_pass_yield_from_raw(week_start, week_end):
                 FROM part_analysis;
             """, (week_start, week_end + timedelta(days=1)))
             
-            result = cur.fetchone()
-            
-            if result and result[0] > 0:
-                parts_started, first_pass_success, parts_completed, parts_failed, parts_stuck = result
-                
-                traditional_fpy = (first_pass_success / parts_started * 100) if parts_started > 0 else 0
-                
-                active_parts = parts_completed + parts_failed
-                completed_only_fpy = (first_pass_success / active_parts * 100) if active_parts > 0 else 0
-                
-                print(f"TRADITIONAL FPY: {first_pass_success}/{parts_started} = {traditional_fpy:.2f}%")
-                print(f"COMPLETED-ONLY FPY: {first_pass_success}/{active_parts} = {completed_only_fpy:.2f}%")
-                print(f"Parts breakdown:")
-                print(f"Completed: {parts_completed}")
-                print(f"Failed: {parts_failed}")
-                print(f"Stuck in limbo: {parts_stuck}")
-                print(f"Total: {parts_started}")
-                
-                return {
-                    "traditional": {
-                        "partsStarted": parts_started,
-                        "firstPassSuccess": first_pass_success,
-                        "firstPassYield": round(traditional_fpy, 2)
-                    },
-                    "completedOnly": {
-                        "activeParts": active_parts,
-                        "firstPassSuccess": first_pass_success,
-                        "firstPassYield": round(completed_only_fpy, 2)
-                    },
-                    "breakdown": {
-                        "partsCompleted": parts_completed,
-                        "partsFailed": parts_failed,
-                        "partsStuckInLimbo": parts_stuck,
-                        "totalParts": parts_started
-                    }
-                }
-            else:
-                print(f"No data found for this week")
-                return {
-                    "traditional": {"partsStarted": 0, "firstPassSuccess": 0, "firstPassYield": 0},
-                    "completedOnly": {"activeParts": 0, "firstPassSuccess": 0, "firstPassYield": 0},
-                    "breakdown": {"partsCompleted": 0, "partsFailed": 0, "partsStuckInLimbo": 0, "totalParts": 0}
-                }
+            return first_pass_yield_result(cur.fetchone())
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def calculate_model_specific_throughput_yields(week_start, week_end):
+def model_specific_yields_from_rows(results, routes):
+    """Per-model and overall station yields from (model, station, total, passed, failed) rows"""
+    model_specific_yields = {model: {} for model in route_models(routes)}
+    model_specific_yields["overall"] = {}
+    
+    overall_aggregates = {}
+    
+    print(f"Model-Specific Station Performance:")
+    
+    for model, station, total, passed, failed in results:
+        throughput_yield = (passed / total * 100) if total > 0 else 0
+        
+        if model in model_specific_yields:
+            model_specific_yields[model][station] = {
+                "totalParts": total,
+                "passedParts": passed,
+                "failedParts": failed,
+                "throughputYield": round(throughput_yield, 2)
+            }
+            print(f"    {model} {station}: {passed}/{total} = {throughput_yield:.1f}%")
+        
+        if station not in overall_aggregates:
+            overall_aggregates[station] = {'totalParts': 0, 'passedParts': 0, 'failedParts': 0}
+        
+        overall_aggregates[station]['totalParts'] += total
+        overall_aggregates[station]['passedParts'] += passed
+        overall_aggregates[station]['failedParts'] += failed
+    
+    for station, totals in overall_aggregates.items():
+        throughput_yield = (totals['passedParts'] / totals['totalParts'] * 100) if totals['totalParts'] > 0 else 0
+        model_specific_yields["overall"][station] = {
+            "totalParts": totals['totalParts'],
+            "passedParts": totals['passedParts'],
+            "failedParts": totals['failedParts'],
+            "throughputYield": round(throughput_yield, 2)
+        }
+    
+    return model_specific_yields
+
+def calculate_model_specific_throughput_yields(week_start, week_end, routes, conn=None):
     """Calculate MODEL-SPECIFIC throughput yields from raw data"""
     print(f"Calculating MODEL-SPECIFIC Throughput Yields...")
     
-    conn = psycopg2.connect(**DB_CONFIG)
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
             cur.execute("""
@@ -124,299 +178,297 @@ def calculate_model_specific_throughput_yields(week_start, week_end):
                     AND history_station_end_time < %s
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
-                    AND model IN ('Tesla SXM4', 'Tesla SXM5')
+                    AND model = ANY(%s)
                 GROUP BY model, workstation_name
                 HAVING COUNT(*) >= 1
                 ORDER BY model, total_parts DESC;
-            """, (week_start, week_end + timedelta(days=1)))
-            
-            results = cur.fetchall()
+            """, (week_start, week_end + timedelta(days=1), route_models(routes)))
             
-            model_specific_yields = {
-                "Tesla SXM4": {},
-                "Tesla SXM5": {},
-                "overall": {}
-            }
-            
-            overall_aggregates = {}
-            
-            print(f"Model-Specific Station Performance:")
-            
-            for model, station, total, passed, failed in results:
-                throughput_yield = (passed / total * 100) if total > 0 else 0
-                
-                if model in model_specific_yields:
-                    model_specific_yields[model][station] = {
-                        "totalParts": total,
-                        "passedParts": passed,
-                        "failedParts": failed,
-                        "throughputYield": round(throughput_yield, 2)
-                    }
-                    print(f"    {model} {station}: {passed}/{total} = {throughput_yield:.1f}%")
-                
-                if station not in overall_aggregates:
-                    overall_aggregates[station] = {'totalParts': 0, 'passedParts': 0, 'failedParts': 0}
-                
-                overall_aggregates[station]['totalParts'] += total
-                overall_aggregates[station]['passedParts'] += passed
-                overall_aggregates[station]['failedParts'] += failed
-            
-            for station, totals in overall_aggregates.items():
-                throughput_yield = (totals['passedParts'] / totals['totalParts'] * 100) if totals['totalParts'] > 0 else 0
-                model_specific_yields["overall"][station] = {
-                    "totalParts": totals['totalParts'],
-                    "passedParts": totals['passedParts'],
-                    "failedParts": totals['failedParts'],
-                    "throughputYield": round(throughput_yield, 2)
-                }
-            
-            return model_specific_yields
+            return model_specific_yields_from_rows(cur.fetchall(), routes)
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
-def calculate_hardcoded_tpy(model_yields):
-    """Calculate hardcoded 4-station TPY"""
-    print(f"Calculating HARDCODED TPY (4-station formula)...")
-    
-    hardcoded_tpy = {
-        "SXM4": {"stations": {}, "tpy": None},
-        "SXM5": {"stations": {}, "tpy": None}
-    }
-    
-    # SXM4 formula: VI2 × ASSY2 × FI × FQC
-    sxm4_stations = ["VI2", "ASSY2", "FI", "FQC"]
-    sxm4_values = []
-    
-    for station in sxm4_stations:
-        if "Tesla SXM4" in model_yields and station in model_yields["Tesla SXM4"]:
-            yield_pct = model_yields["Tesla SXM4"][station]["throughputYield"]
-            hardcoded_tpy["SXM4"]["stations"][station] = yield_pct
-            sxm4_values.append(yield_pct / 100.0)
-            print(f"SXM4 {station}: {yield_pct:.2f}%")
-        else:
-            print(f"SXM4 {station}: NOT FOUND")
-    
-    # Calculate SXM4 TPY
-    if len(sxm4_values) == 4:
-        tpy_value = 1.0
-        for val in sxm4_values:
-            tpy_value *= val
-        hardcoded_tpy["SXM4"]["tpy"] = round(tpy_value * 100, 2)
-        print(f"SXM4 Hardcoded TPY: {hardcoded_tpy['SXM4']['tpy']:.2f}%")
-    
-    sxm5_stations = ["BBD", "ASSY2", "FI", "FQC"]
-    sxm5_values = []
-    
-    for station in sxm5_stations:
-        if "Tesla SXM5" in model_yields and station in model_yields["Tesla SXM5"]:
-            yield_pct = model_yields["Tesla SXM5"][station]["throughputYield"]
-            hardcoded_tpy["SXM5"]["stations"][station] = yield_pct
-            sxm5_values.append(yield_pct / 100.0)
-            print(f"SXM5 {station}: {yield_pct:.2f}%")
-        else:
-            print(f"SXM5 {station}: NOT FOUND")
-    
-    if len(sxm5_values) == 4:
-        tpy_value = 1.0
-        for val in sxm5_values:
-            tpy_value *= val
-        hardcoded_tpy["SXM5"]["tpy"] = round(tpy_value * 100, 2)
-        print(f"SXM5 Hardcoded TPY: {hardcoded_tpy['SXM5']['tpy']:.2f}%")
-    
-    return hardcoded_tpy
+def calculate_weekly_yields_fused(week_start, week_end, routes, conn, models_only=False):
+    """(model-specific yields, FPY or None) from one GROUPING SETS scan of the week.
+
+    Same results as calculate_model_specific_throughput_yields and
+    calculate_weekly_first_pass_yield_from_raw, which each scan the week's
+    rows once (fused_metrics.py). The FPY parts are counted from the per-part
+    rows as they stream in.
+    """
+    print(f"Calculating MODEL-SPECIFIC Throughput Yields and WEEKLY First Pass Yield (one scan)...")
+    print(f"  Week range: {week_start.strftime('%Y-%m-%d')} to {week_end.strftime('%Y-%m-%d')}")
+    names = ["tpy_station_counts"] if models_only else ["tpy_part_outcomes", "tpy_station_counts"]
+    station_rows = []
+    parts = [0, 0, 0, 0, 0]  # started, first pass success, completed, failed, stuck
+    for name, rows in iter_metric_rows(conn, names, week_start, week_end + timedelta(days=1),
+                                       {"models": route_models(routes)}):
+        if name == "tpy_station_counts":
+            station_rows.extend(rows)
+            continue
+        for _, _, reached_packing, failure_count in rows:
+            parts[0] += 1
+            parts[1] += reached_packing > 0 and failure_count == 0
+            parts[2] += reached_packing > 0
+            parts[3] += failure_count > 0
+            parts[4] += reached_packing == 0 and failure_count == 0
+    # ORDER BY model, total_parts DESC of the separate query; station names break its ties
+    station_rows.sort(key=lambda row: (row[0], -row[2], row[1]))
+    model_specific_yields = model_specific_yields_from_rows(station_rows, routes)
+    return model_specific_yields, None if models_only else first_pass_yield_result(parts)
 
-def calculate_dynamic_tpy(model_yields):
+def calculate_hardcoded_tpy(model_yields, routes):
+    """Calculate hardcoded TPY from each route's configured stations"""
+    print(f"Calculating HARDCODED TPY (route formula)...")
+    return calculate_route_tpy(model_yields, routes)
+
+def calculate_dynamic_tpy(model_yields, routes):
     """Calculate DYNAMIC all-stations TPY per model"""
     print(f"Calculating DYNAMIC TPY (all-stations per model)...")
+    return calculate_dynamic_route_tpy(model_yields, routes)
+
+def get_weekly_overall_yield_totals(cur, week_start, week_end):
+    """Sum the daily station totals that fall inside the week"""
+    cur.execute("""
+        SELECT 
+            SUM(total_parts) as total_parts,
+            SUM(passed_parts) as passed_parts
+        FROM daily_tpy_metrics 
+        WHERE date_id >= %s AND date_id <= %s
+    """, (week_start, week_end))
+
+    daily_result = cur.fetchone()
+    total_parts_overall = daily_result[0] if daily_result[0] else 0
+    total_passed_parts = daily_result[1] if daily_result[1] else 0
+    return total_parts_overall, total_passed_parts
+
+def upsert_weekly_tpy_metrics(cur, week_id, week_start, week_end, weekly_first_pass_yield,
+                              model_specific_yields, hardcoded_tpy, dynamic_tpy,
+                              total_parts_overall, total_passed_parts):
+    """Insert or update one week of results in weekly_tpy_metrics (caller commits)"""
+    overall_yield = (total_passed_parts / total_parts_overall * 100) if total_parts_overall > 0 else 0
+    weekly_station_metrics = model_specific_yields["overall"]
+    avg_throughput_yield = round(sum(s["throughputYield"] for s in weekly_station_metrics.values()) / len(weekly_station_metrics), 2) if weekly_station_metrics else 0
     
-    dynamic_tpy = {
-        "SXM4": {"stations": {}, "tpy": None, "stationCount": 0},
-        "SXM5": {"stations": {}, "tpy": None, "stationCount": 0}
-    }
+    best_station = None
+    worst_station = None
+    if weekly_station_metrics:
+        best_station = max(weekly_station_metrics.items(), key=lambda x: x[1]["throughputYield"])
+        worst_station = min(weekly_station_metrics.items(), key=lambda x: x[1]["throughputYield"])
     
-    if "Tesla SXM4" in model_yields:
-        sxm4_stations = model_yields["Tesla SXM4"]
-        dynamic_tpy["SXM4"]["stations"] = {station: data["throughputYield"] for station, data in sxm4_stations.items()}
-        dynamic_tpy["SXM4"]["stationCount"] = len(sxm4_stations)
-        tpy_value = 1.0
-        for station, yield_pct in dynamic_tpy["SXM4"]["stations"].items():
-            tpy_value *= (yield_pct / 100.0)
-        
-        dynamic_tpy["SXM4"]["tpy"] = round(tpy_value * 100, 2)
-        print(f"SXM4 Dynamic TPY: {dynamic_tpy['SXM4']['tpy']:.2f}% (across {dynamic_tpy['SXM4']['stationCount']} stations)")
-    if "Tesla SXM5" in model_yields:
-        sxm5_stations = model_yields["Tesla SXM5"]
-        dynamic_tpy["SXM5"]["stations"] = {station: data["throughputYield"] for station, data in sxm5_stations.items()}
-        dynamic_tpy["SXM5"]["stationCount"] = len(sxm5_stations)
-        
-        tpy_value = 1.0
-        for station, yield_pct in dynamic_tpy["SXM5"]["stations"].items():
-            tpy_value *= (yield_pct / 100.0)
-        
-        dynamic_tpy["SXM5"]["tpy"] = round(tpy_value * 100, 2)
-        print(f"SXM5 Dynamic TPY: {dynamic_tpy['SXM5']['tpy']:.2f}% (across {dynamic_tpy['SXM5']['stationCount']} stations)")
+    # The SXM4/SXM5 columns predate route definitions; every route is in weekly_tpy_route_metrics
+    hardcoded_sxm4 = hardcoded_tpy.get("SXM4", EMPTY_ROUTE_TPY)
+    hardcoded_sxm5 = hardcoded_tpy.get("SXM5", EMPTY_ROUTE_TPY)
+    dynamic_sxm4 = dynamic_tpy.get("SXM4", EMPTY_ROUTE_TPY)
+    dynamic_sxm5 = dynamic_tpy.get("SXM5", EMPTY_ROUTE_TPY)
     
-    return dynamic_tpy
+    cur.execute("""
+        INSERT INTO weekly_tpy_metrics (
+            week_id, week_start, week_end, days_in_week,
+            weekly_first_pass_yield_traditional_parts_started,
+            weekly_first_pass_yield_traditional_first_pass_success,
+            weekly_first_pass_yield_traditional_first_pass_yield,
+            weekly_first_pass_yield_completed_only_active_parts,
+            weekly_first_pass_yield_completed_only_first_pass_success,
+            weekly_first_pass_yield_completed_only_first_pass_yield,
+            weekly_first_pass_yield_breakdown_parts_completed,
+            weekly_first_pass_yield_breakdown_parts_failed,
+            weekly_first_pass_yield_breakdown_parts_stuck_in_limbo,
+            weekly_first_pass_yield_breakdown_total_parts,
+            weekly_overall_yield_total_parts,
+            weekly_overall_yield_completed_parts,
+            weekly_overall_yield_overall_yield,
+            weekly_throughput_yield_station_metrics,
+            weekly_throughput_yield_average_yield,
+            weekly_throughput_yield_model_specific,
+            weekly_tpy_hardcoded_sxm4_stations,
+            weekly_tpy_hardcoded_sxm4_tpy,
+            weekly_tpy_hardcoded_sxm5_stations,
+            weekly_tpy_hardcoded_sxm5_tpy,
+            weekly_tpy_dynamic_sxm4_stations,
+            weekly_tpy_dynamic_sxm4_tpy,
+            weekly_tpy_dynamic_sxm4_station_count,
+            weekly_tpy_dynamic_sxm5_stations,
+            weekly_tpy_dynamic_sxm5_tpy,
+            weekly_tpy_dynamic_sxm5_station_count,
+            total_stations,
+            best_station_name,
+            best_station_yield,
+            worst_station_name,
+            worst_station_yield
+        ) VALUES (
+            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+        ) ON CONFLICT (week_id) DO UPDATE SET
+            week_start = EXCLUDED.week_start,
+            week_end = EXCLUDED.week_end,
+            days_in_week = EXCLUDED.days_in_week,
+            weekly_first_pass_yield_traditional_parts_started = EXCLUDED.weekly_first_pass_yield_traditional_parts_started,
+            weekly_first_pass_yield_traditional_first_pass_success = EXCLUDED.weekly_first_pass_yield_traditional_first_pass_success,
+            weekly_first_pass_yield_traditional_first_pass_yield = EXCLUDED.weekly_first_pass_yield_traditional_first_pass_yield,
+            weekly_first_pass_yield_completed_only_active_parts = EXCLUDED.weekly_first_pass_yield_completed_only_active_parts,
+            weekly_first_pass_yield_completed_only_first_pass_success = EXCLUDED.weekly_first_pass_yield_completed_only_first_pass_success,
+            weekly_first_pass_yield_completed_only_first_pass_yield = EXCLUDED.weekly_first_pass_yield_completed_only_first_pass_yield,
+            weekly_first_pass_yield_breakdown_parts_completed = EXCLUDED.weekly_first_pass_yield_breakdown_parts_completed,
+            weekly_first_pass_yield_breakdown_parts_failed = EXCLUDED.weekly_first_pass_yield_breakdown_parts_failed,
+            weekly_first_pass_yield_breakdown_parts_stuck_in_limbo = EXCLUDED.weekly_first_pass_yield_breakdown_parts_stuck_in_limbo,
+            weekly_first_pass_yield_breakdown_total_parts = EXCLUDED.weekly_first_pass_yield_breakdown_total_parts,
+            weekly_overall_yield_total_parts = EXCLUDED.weekly_overall_yield_total_parts,
+            weekly_overall_yield_completed_parts = EXCLUDED.weekly_overall_yield_completed_parts,
+            weekly_overall_yield_overall_yield = EXCLUDED.weekly_overall_yield_overall_yield,
+            weekly_throughput_yield_station_metrics = EXCLUDED.weekly_throughput_yield_station_metrics,
+            weekly_throughput_yield_average_yield = EXCLUDED.weekly_throughput_yield_average_yield,
+            weekly_throughput_yield_model_specific = EXCLUDED.weekly_throughput_yield_model_specific,
+            weekly_tpy_hardcoded_sxm4_stations = EXCLUDED.weekly_tpy_hardcoded_sxm4_stations,
+            weekly_tpy_hardcoded_sxm4_tpy = EXCLUDED.weekly_tpy_hardcoded_sxm4_tpy,
+            weekly_tpy_hardcoded_sxm5_stations = EXCLUDED.weekly_tpy_hardcoded_sxm5_stations,
+            weekly_tpy_hardcoded_sxm5_tpy = EXCLUDED.weekly_tpy_hardcoded_sxm5_tpy,
+            weekly_tpy_dynamic_sxm4_stations = EXCLUDED.weekly_tpy_dynamic_sxm4_stations,
+            weekly_tpy_dynamic_sxm4_tpy = EXCLUDED.weekly_tpy_dynamic_sxm4_tpy,
+            weekly_tpy_dynamic_sxm4_station_count = EXCLUDED.weekly_tpy_dynamic_sxm4_station_count,
+            weekly_tpy_dynamic_sxm5_stations = EXCLUDED.weekly_tpy_dynamic_sxm5_stations,
+            weekly_tpy_dynamic_sxm5_tpy = EXCLUDED.weekly_tpy_dynamic_sxm5_tpy,
+            weekly_tpy_dynamic_sxm5_station_count = EXCLUDED.weekly_tpy_dynamic_sxm5_station_count,
+            total_stations = EXCLUDED.total_stations,
+            best_station_name = EXCLUDED.best_station_name,
+            best_station_yield = EXCLUDED.best_station_yield,
+            worst_station_name = EXCLUDED.worst_station_name,
+            worst_station_yield = EXCLUDED.worst_station_yield,
+            created_at = NOW();
+    """, (
+        week_id, week_start, week_end, 7,  # days_in_week = 7
+        weekly_first_pass_yield["traditional"]["partsStarted"],
+        weekly_first_pass_yield["traditional"]["firstPassSuccess"],
+        weekly_first_pass_yield["traditional"]["firstPassYield"],
+        weekly_first_pass_yield["completedOnly"]["activeParts"],
+        weekly_first_pass_yield["completedOnly"]["firstPassSuccess"],
+        weekly_first_pass_yield["completedOnly"]["firstPassYield"],
+        weekly_first_pass_yield["breakdown"]["partsCompleted"],
+        weekly_first_pass_yield["breakdown"]["partsFailed"],
+        weekly_first_pass_yield["breakdown"]["partsStuckInLimbo"],
+        weekly_first_pass_yield["breakdown"]["totalParts"],
+        total_parts_overall,
+        total_passed_parts,
+        round(overall_yield, 2),
+        json.dumps(weekly_station_metrics),
+        avg_throughput_yield,
+        json.dumps(model_specific_yields),
+        json.dumps(hardcoded_sxm4["stations"]),
+        hardcoded_sxm4["tpy"],
+        json.dumps(hardcoded_sxm5["stations"]),
+        hardcoded_sxm5["tpy"],
+        json.dumps(dynamic_sxm4["stations"]),
+        dynamic_sxm4["tpy"],
+        dynamic_sxm4["stationCount"],
+        json.dumps(dynamic_sxm5["stations"]),
+        dynamic_sxm5["tpy"],
+        dynamic_sxm5["stationCount"],
+        len(weekly_station_metrics),
+        best_station[0] if best_station else None,
+        best_station[1]["throughputYield"] if best_station else None,
+        worst_station[0] if worst_station else None,
+        worst_station[1]["throughputYield"] if worst_station else None
+    ))
+
+def upsert_weekly_route_metrics(cur, week_id, routes, hardcoded_tpy, dynamic_tpy):
+    """Insert or update one row per route in weekly_tpy_route_metrics (caller commits)"""
+    for route in routes:
+        key = route["routeKey"]
+        hardcoded = hardcoded_tpy.get(key, EMPTY_ROUTE_TPY)
+        dynamic = dynamic_tpy.get(key, EMPTY_ROUTE_TPY)
+        cur.execute("""
+            INSERT INTO weekly_tpy_route_metrics (
+                week_id, model, route_key, formula,
+                hardcoded_stations, hardcoded_tpy,
+                dynamic_stations, dynamic_tpy, dynamic_station_count
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (week_id, model) DO UPDATE SET
+                route_key = EXCLUDED.route_key,
+                formula = EXCLUDED.formula,
+                hardcoded_stations = EXCLUDED.hardcoded_stations,
+                hardcoded_tpy = EXCLUDED.hardcoded_tpy,
+                dynamic_stations = EXCLUDED.dynamic_stations,
+                dynamic_tpy = EXCLUDED.dynamic_tpy,
+                dynamic_station_count = EXCLUDED.dynamic_station_count,
+                created_at = NOW();
+        """, (
+            week_id, route["model"], key, route["formula"],
+            json.dumps(hardcoded["stations"]), hardcoded["tpy"],
+            json.dumps(dynamic["stations"]), dynamic["tpy"], dynamic["stationCount"]
+        ))
 
-def aggregate_weekly_tpy_for_week(week_id):
-    """Aggregate weekly TPY metrics for a specific week"""
+def format_tpy(value):
+    return f"{value:.2f}%" if value is not None else "n/a"
+
+def read_weekly_overall_yield_totals(week_start, week_end, conn):
+    with conn.cursor() as cur:
+        return get_weekly_overall_yield_totals(cur, week_start, week_end)
+
+def aggregate_weekly_tpy_for_week(week_id, routes=None, models_only=False, conn=None, snapshot_id=None):
+    """Aggregate weekly TPY metrics for a specific week.
+
+    With models_only, only the given routes' station yields and TPY are computed
+    and only weekly_tpy_route_metrics is written; the week-level FPY and overall
+    columns depend on every model and are left as they are. conn is optional;
+    the backfill runner passes one connection per worker.
+
+    The FPY and station yields come from one fused scan of the week's rows
+    (calculate_weekly_yields_fused). That scan and the overall totals read
+    one snapshot (snapshots.py), in parallel on their own connections when
+    no conn is given, so a concurrent import cannot land between them.
+    snapshot_id reads a snapshot exported elsewhere instead.
+    """
     print(f"\nAGGREGATING WEEKLY TPY FOR: {week_id}")
     print("=" * 60)
     
-    week_start, week_end = get_week_date_range(week_id)
+    if routes is None:
+        routes = load_tpy_routes()
     
-    weekly_first_pass_yield = calculate_weekly_first_pass_yield_from_raw(week_start, week_end)
+    week_start, week_end = get_week_date_range(week_id)
     
-    model_specific_yields = calculate_model_specific_throughput_yields(week_start, week_end)
+    reads = [lambda c: calculate_weekly_yields_fused(week_start, week_end, routes, c, models_only)]
+    if not models_only:
+        reads.append(lambda c: read_weekly_overall_yield_totals(week_start, week_end, c))
+    with SnapshotCoordinator(DB_CONFIG, conn=conn, snapshot_id=snapshot_id,
+                             workers=1 if conn else len(reads)) as snapshot:
+        (model_specific_yields, weekly_first_pass_yield), *week_totals = snapshot.run(*reads)
+    if not models_only:
+        total_parts_overall, total_passed_parts = week_totals[0]
     
-    hardcoded_tpy = calculate_hardcoded_tpy(model_specific_yields)
+    hardcoded_tpy = calculate_hardcoded_tpy(model_specific_yields, routes)
     
-    dynamic_tpy = calculate_dynamic_tpy(model_specific_yields)
+    dynamic_tpy = calculate_dynamic_tpy(model_specific_yields, routes)
     
-    conn = psycopg2.connect(**DB_CONFIG)
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    SUM(total_parts) as total_parts,
-                    SUM(passed_parts) as passed_parts
-                FROM daily_tpy_metrics 
-                WHERE date_id >= %s AND date_id <= %s
-            """, (week_start, week_end))
-            
-            daily_result = cur.fetchone()
-            total_parts_overall = daily_result[0] if daily_result[0] else 0
-            total_passed_parts = daily_result[1] if daily_result[1] else 0
-            overall_yield = (total_passed_parts / total_parts_overall * 100) if total_parts_overall > 0 else 0
-            weekly_station_metrics = model_specific_yields["overall"]
-            avg_throughput_yield = round(sum(s["throughputYield"] for s in weekly_station_metrics.values()) / len(weekly_station_metrics), 2) if weekly_station_metrics else 0
-            
-            best_station = None
-            worst_station = None
-            if weekly_station_metrics:
-                best_station = max(weekly_station_metrics.items(), key=lambda x: x[1]["throughputYield"])
-                worst_station = min(weekly_station_metrics.items(), key=lambda x: x[1]["throughputYield"])
+            if not models_only:
+                upsert_weekly_tpy_metrics(
+                    cur, week_id, week_start, week_end, weekly_first_pass_yield,
+                    model_specific_yields, hardcoded_tpy, dynamic_tpy,
+                    total_parts_overall, total_passed_parts
+                )
             
-            cur.execute("""
-                INSERT INTO weekly_tpy_metrics (
-                    week_id, week_start, week_end, days_in_week,
-                    weekly_first_pass_yield_traditional_parts_started,
-                    weekly_first_pass_yield_traditional_first_pass_success,
-                    weekly_first_pass_yield_traditional_first_pass_yield,
-                    weekly_first_pass_yield_completed_only_active_parts,
-                    weekly_first_pass_yield_completed_only_first_pass_success,
-                    weekly_first_pass_yield_completed_only_first_pass_yield,
-                    weekly_first_pass_yield_breakdown_parts_completed,
-                    weekly_first_pass_yield_breakdown_parts_failed,
-                    weekly_first_pass_yield_breakdown_parts_stuck_in_limbo,
-                    weekly_first_pass_yield_breakdown_total_parts,
-                    weekly_overall_yield_total_parts,
-                    weekly_overall_yield_completed_parts,
-                    weekly_overall_yield_overall_yield,
-                    weekly_throughput_yield_station_metrics,
-                    weekly_throughput_yield_average_yield,
-                    weekly_throughput_yield_model_specific,
-                    weekly_tpy_hardcoded_sxm4_stations,
-                    weekly_tpy_hardcoded_sxm4_tpy,
-                    weekly_tpy_hardcoded_sxm5_stations,
-                    weekly_tpy_hardcoded_sxm5_tpy,
-                    weekly_tpy_dynamic_sxm4_stations,
-                    weekly_tpy_dynamic_sxm4_tpy,
-                    weekly_tpy_dynamic_sxm4_station_count,
-                    weekly_tpy_dynamic_sxm5_stations,
-                    weekly_tpy_dynamic_sxm5_tpy,
-                    weekly_tpy_dynamic_sxm5_station_count,
-                    total_stations,
-                    best_station_name,
-                    best_station_yield,
-                    worst_station_name,
-                    worst_station_yield
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                ) ON CONFLICT (week_id) DO UPDATE SET
-                    week_start = EXCLUDED.week_start,
-                    week_end = EXCLUDED.week_end,
-                    days_in_week = EXCLUDED.days_in_week,
-                    weekly_first_pass_yield_traditional_parts_started = EXCLUDED.weekly_first_pass_yield_traditional_parts_started,
-                    weekly_first_pass_yield_traditional_first_pass_success = EXCLUDED.weekly_first_pass_yield_traditional_first_pass_success,
-                    weekly_first_pass_yield_traditional_first_pass_yield = EXCLUDED.weekly_first_pass_yield_traditional_first_pass_yield,
-                    weekly_first_pass_yield_completed_only_active_parts = EXCLUDED.weekly_first_pass_yield_completed_only_active_parts,
-                    weekly_first_pass_yield_completed_only_first_pass_success = EXCLUDED.weekly_first_pass_yield_completed_only_first_pass_success,
-                    weekly_first_pass_yield_completed_only_first_pass_yield = EXCLUDED.weekly_first_pass_yield_completed_only_first_pass_yield,
-                    weekly_first_pass_yield_breakdown_parts_completed = EXCLUDED.weekly_first_pass_yield_breakdown_parts_completed,
-                    weekly_first_pass_yield_breakdown_parts_failed = EXCLUDED.weekly_first_pass_yield_breakdown_parts_failed,
-                    weekly_first_pass_yield_breakdown_parts_stuck_in_limbo = EXCLUDED.weekly_first_pass_yield_breakdown_parts_stuck_in_limbo,
-                    weekly_first_pass_yield_breakdown_total_parts = EXCLUDED.weekly_first_pass_yield_breakdown_total_parts,
-                    weekly_overall_yield_total_parts = EXCLUDED.weekly_overall_yield_total_parts,
-                    weekly_overall_yield_completed_parts = EXCLUDED.weekly_overall_yield_completed_parts,
-                    weekly_overall_yield_overall_yield = EXCLUDED.weekly_overall_yield_overall_yield,
-                    weekly_throughput_yield_station_metrics = EXCLUDED.weekly_throughput_yield_station_metrics,
-                    weekly_throughput_yield_average_yield = EXCLUDED.weekly_throughput_yield_average_yield,
-                    weekly_throughput_yield_model_specific = EXCLUDED.weekly_throughput_yield_model_specific,
-                    weekly_tpy_hardcoded_sxm4_stations = EXCLUDED.weekly_tpy_hardcoded_sxm4_stations,
-                    weekly_tpy_hardcoded_sxm4_tpy = EXCLUDED.weekly_tpy_hardcoded_sxm4_tpy,
-                    weekly_tpy_hardcoded_sxm5_stations = EXCLUDED.weekly_tpy_hardcoded_sxm5_stations,
-                    weekly_tpy_hardcoded_sxm5_tpy = EXCLUDED.weekly_tpy_hardcoded_sxm5_tpy,
-                    weekly_tpy_dynamic_sxm4_stations = EXCLUDED.weekly_tpy_dynamic_sxm4_stations,
-                    weekly_tpy_dynamic_sxm4_tpy = EXCLUDED.weekly_tpy_dynamic_sxm4_tpy,
-                    weekly_tpy_dynamic_sxm4_station_count = EXCLUDED.weekly_tpy_dynamic_sxm4_station_count,
-                    weekly_tpy_dynamic_sxm5_stations = EXCLUDED.weekly_tpy_dynamic_sxm5_stations,
-                    weekly_tpy_dynamic_sxm5_tpy = EXCLUDED.weekly_tpy_dynamic_sxm5_tpy,
-                    weekly_tpy_dynamic_sxm5_station_count = EXCLUDED.weekly_tpy_dynamic_sxm5_station_count,
-                    total_stations = EXCLUDED.total_stations,
-                    best_station_name = EXCLUDED.best_station_name,
-                    best_station_yield = EXCLUDED.best_station_yield,
-                    worst_station_name = EXCLUDED.worst_station_name,
-                    worst_station_yield = EXCLUDED.worst_station_yield,
-                    created_at = NOW();
-            """, (
-                week_id, week_start, week_end, 7,  # days_in_week = 7
-                weekly_first_pass_yield["traditional"]["partsStarted"],
-                weekly_first_pass_yield["traditional"]["firstPassSuccess"],
-                weekly_first_pass_yield["traditional"]["firstPassYield"],
-                weekly_first_pass_yield["completedOnly"]["activeParts"],
-                weekly_first_pass_yield["completedOnly"]["firstPassSuccess"],
-                weekly_first_pass_yield["completedOnly"]["firstPassYield"],
-                weekly_first_pass_yield["breakdown"]["partsCompleted"],
-                weekly_first_pass_yield["breakdown"]["partsFailed"],
-                weekly_first_pass_yield["breakdown"]["partsStuckInLimbo"],
-                weekly_first_pass_yield["breakdown"]["totalParts"],
-                total_parts_overall,
-                total_passed_parts,
-                round(overall_yield, 2),
-                json.dumps(weekly_station_metrics),
-                avg_throughput_yield,
-                json.dumps(model_specific_yields),
-                json.dumps(hardcoded_tpy["SXM4"]["stations"]),
-                hardcoded_tpy["SXM4"]["tpy"],
-                json.dumps(hardcoded_tpy["SXM5"]["stations"]),
-                hardcoded_tpy["SXM5"]["tpy"],
-                json.dumps(dynamic_tpy["SXM4"]["stations"]),
-                dynamic_tpy["SXM4"]["tpy"],
-                dynamic_tpy["SXM4"]["stationCount"],
-                json.dumps(dynamic_tpy["SXM5"]["stations"]),
-                dynamic_tpy["SXM5"]["tpy"],
-                dynamic_tpy["SXM5"]["stationCount"],
-                len(weekly_station_metrics),
-                best_station[0] if best_station else None,
-                best_station[1]["throughputYield"] if best_station else None,
-                worst_station[0] if worst_station else None,
-                worst_station[1]["throughputYield"] if worst_station else None
-            ))
+            upsert_weekly_route_metrics(cur, week_id, routes, hardcoded_tpy, dynamic_tpy)
             
+            notify_summary_updated(cur, 'weekly_tpy_metrics', 'weekly_tpy_route_metrics')
             conn.commit()
             
             print(f"\nWeekly TPY aggregation complete!")
             print(f"Week: {week_id}")
-            print(f"Traditional FPY: {weekly_first_pass_yield['traditional']['firstPassYield']:.1f}%")
-            print(f"Completed-Only FPY: {weekly_first_pass_yield['completedOnly']['firstPassYield']:.1f}%")
-            print(f"SXM4 Hardcoded TPY: {hardcoded_tpy['SXM4']['tpy']:.2f}%")
-            print(f"SXM4 Dynamic TPY: {dynamic_tpy['SXM4']['tpy']:.2f}%")
-            print(f"SXM5 Hardcoded TPY: {hardcoded_tpy['SXM5']['tpy']:.2f}%")
-            print(f"SXM5 Dynamic TPY: {dynamic_tpy['SXM5']['tpy']:.2f}%")
+            if not models_only:
+                print(f"Traditional FPY: {weekly_first_pass_yield['traditional']['firstPassYield']:.1f}%")
+                print(f"Completed-Only FPY: {weekly_first_pass_yield['completedOnly']['firstPassYield']:.1f}%")
+            for route in routes:
+                key = route["routeKey"]
+                print(f"{key} Hardcoded TPY: {format_tpy(hardcoded_tpy[key]['tpy'])}")
+                print(f"{key} Dynamic TPY: {format_tpy(dynamic_tpy[key]['tpy'])}")
             
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 def get_all_available_weeks():
     """Get all ISO weeks that have daily data"""
@@ -425,14 +477,17 @@ def get_all_available_weeks():
     conn = psycopg2.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
+            cur.execute("SELECT MIN(date_id) FROM daily_tpy_metrics")
+            first_day = cur.fetchone()[0]
+        # Covers daily rows older than CALENDAR_START, which the inner join would drop
+        ensure_calendar(conn, since=first_day)
+        with conn.cursor() as cur:
+            # ISO year and week from the calendar; EXTRACT(YEAR) mislabels the days around New Year
             cur.execute("""
-                SELECT DISTINCT week_id
-                FROM (
-                    SELECT 
-                        CONCAT(EXTRACT(YEAR FROM date_id), '-W', LPAD(EXTRACT(WEEK FROM date_id)::text, 2, '0')) as week_id
-                    FROM daily_tpy_metrics
-                ) weeks
-                ORDER BY week_id;
+                SELECT DISTINCT c.week_id
+                FROM daily_tpy_metrics d
+                JOIN factory_calendar c ON c.day = d.date_id
+                ORDER BY c.week_id;
             """)
             
             weeks = [row[0] for row in cur.fetchall()]
@@ -446,11 +501,14 @@ def get_current_week_id():
     today = datetime.now()
     return get_iso_week_id(today)
 
-def aggregate_weekly_tpy_metrics(mode='recent'):
-    """Aggregate weekly TPY metrics for specified weeks"""
+def aggregate_weekly_tpy_metrics(mode='recent', models=None):
+    """Aggregate weekly TPY metrics for specified weeks (optionally only some models)"""
     print("WEEKLY TPY METRICS AGGREGATOR")
     print("=" * 50)
     
+    routes = load_tpy_routes(models)
+    print(f"TPY routes: {', '.join(route['routeKey'] for route in routes)}")
+    
     if mode == 'all':
         weeks_to_process = get_all_available_weeks()
         if not weeks_to_process:
@@ -462,6 +520,7 @@ def aggregate_weekly_tpy_metrics(mode='recent'):
         weeks_to_process = [current_week]
         print(f"\nProcessing CURRENT WEEK: {current_week}")
     
+    run = PipelineRun("aggregate_tpy_weekly", source=mode)
     success_count = 0
     error_count = 0
     
@@ -470,7 +529,8 @@ def aggregate_weekly_tpy_metrics(mode='recent'):
             print(f"\nProcessing {i}/{len(weeks_to_process)}: {week_id}")
             print("-" * 40)
             
-            aggregate_weekly_tpy_for_week(week_id)
+            with run.span("week"):
+                aggregate_weekly_tpy_for_week(week_id, routes, models_only=bool(models))
             success_count += 1
             
         except Exception as e:
@@ -480,6 +540,7 @@ def aggregate_weekly_tpy_metrics(mode='recent'):
     print(f"\nWEEKLY TPY AGGREGATION COMPLETE!")
     print(f"Successfully processed: {success_count} weeks")
     print(f"Errors: {error_count} weeks")
+    run.finish()
     
     conn = psycopg2.connect(**DB_CONFIG)
     try:
@@ -490,16 +551,17 @@ def aggregate_weekly_tpy_metrics(mode='recent'):
             
             if total_records > 0:
                 cur.execute("""
-                    SELECT week_id, weekly_tpy_hardcoded_sxm4_tpy, weekly_tpy_hardcoded_sxm5_tpy,
-                           weekly_tpy_dynamic_sxm4_tpy, weekly_tpy_dynamic_sxm5_tpy
-                    FROM weekly_tpy_metrics 
-                    ORDER BY week_id DESC 
-                    LIMIT 3;
+                    SELECT week_id, route_key, hardcoded_tpy, dynamic_tpy
+                    FROM weekly_tpy_route_metrics 
+                    WHERE week_id IN (
+                        SELECT week_id FROM weekly_tpy_route_metrics ORDER BY week_id DESC LIMIT 3
+                    )
+                    ORDER BY week_id DESC, route_key;
                 """)
                 sample_results = cur.fetchall()
                 print(f"\nSAMPLE RESULTS:")
-                for week_id, sxm4_hard, sxm5_hard, sxm4_dyn, sxm5_dyn in sample_results:
-                    print(f"  {week_id}: SXM4 Hard {sxm4_hard:.1f}% Dyn {sxm4_dyn:.1f}%, SXM5 Hard {sxm5_hard:.1f}% Dyn {sxm5_dyn:.1f}%")
+                for week_id, route_key, hardcoded, dynamic in sample_results:
+                    print(f"  {week_id}: {route_key} Hard {format_tpy(hardcoded)} Dyn {format_tpy(dynamic)}")
     finally:
         conn.close()
 
@@ -507,5 +569,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Weekly TPY Metrics Aggregator")
     parser.add_argument('--mode', choices=['all', 'recent'], default='recent', 
                        help="Choose 'all' to process all weeks, or 'recent' for current week only (default: recent)")
+    parser.add_argument('--models', nargs='+', metavar='MODEL',
+                       help="Only compute route TPY for these models (e.g. after adding a route)")
     args = parser.parse_args()
-    aggregate_weekly_tpy_metrics(mode=args.mode) 
\ No newline at end of file
+    aggregate_weekly_tpy_metrics(mode=args.mode, models=args.models) 
\ No newline at end of file
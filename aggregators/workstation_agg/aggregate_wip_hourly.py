@@ -0,0 +1,327 @@
+"""
+Hourly work-in-progress snapshots per station and model.
+
+station_wip_hourly holds, for every hour, how many parts of each model sit
+at each station when the hour ends: their latest event so far is at that
+station, and they have not reached PACKING yet. snapshot_hour is the
+hour's start. Only stations with WIP are stored. Parts are counted per
+(sn, model), over the TPY flows, as in part_state.py, whose --wip report
+is the same count as of now.
+
+Each run continues from where the last one stopped instead of replaying the
+log:
+
+- wip_part_position holds every part's station and packed flag as of the
+  watermark (wip_progress.through_hour);
+- the events since the watermark are grouped per part and hour, giving the
+  hours a part moved and where to;
+- a move is -1 at the station it left and +1 at the one it reached (or none
+  once packed). Adding the moves hour by hour to the counts at the
+  watermark gives each hour's snapshot;
+- the positions and the watermark are advanced in the same transaction.
+
+The watermark stays --lag-hours behind the latest event, because reports
+arrive covering several days. A row loaded later than its hour's snapshot
+rewinds the run to that hour. The positions are then recounted from the
+history before it, the one full scan this does. --rebuild starts over from
+the first event.
+
+Loaders commit out of id order (per batch, and several files at once), so
+"loaded later" is not "id above the last run's highest". Each run reads
+everything in one REPEATABLE READ snapshot and saves it. The next run
+looks for rows its predecessor's snapshot did not see (by xmin), but only
+above safe_id: an id every row at or below which that snapshot saw. safe_id
+lags behind: a run's MAX(id) becomes safe_id once every transaction that
+was running at that run has ended. Deletes leave no such trace, so
+cleanup_duplicates.py and archive.py rewind the runs themselves
+(part_state.rewind_wip()).
+
+Usage:
+    python aggregate_wip_hourly.py
+    python aggregate_wip_hourly.py --lag-hours 72
+    python aggregate_wip_hourly.py --rebuild
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from fused_metrics import TPY_FLOWS
+from part_state import LAST_ORDER
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+from snapshots import begin_snapshot
+from streaming import stream_batches
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+DEFAULT_LAG_HOURS = 24
+
+CREATE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS station_wip_hourly (
+    snapshot_hour TIMESTAMP NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    workstation_name VARCHAR(255) NOT NULL,
+    wip_parts INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_hour, model, workstation_name)
+);
+CREATE TABLE IF NOT EXISTS wip_part_position (
+    sn VARCHAR(255) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    workstation_name VARCHAR(255) NOT NULL,
+    packed BOOLEAN NOT NULL,
+    PRIMARY KEY (sn, model)
+);
+CREATE TABLE IF NOT EXISTS wip_progress (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    through_hour TIMESTAMP NOT NULL,
+    snapshot pg_snapshot NOT NULL,
+    safe_id BIGINT NOT NULL,
+    pending_id BIGINT NOT NULL,
+    pending_xmax xid8 NOT NULL,
+    rewind_from TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# A row's 32-bit xmin widened to the xid8 it had, counting back from the snapshot's xmax;
+# frozen rows (xmin 2) are older than any snapshot
+ROW_XID_SQL = ("(pg_snapshot_xmax(pg_current_snapshot())::text::bigint - "
+               "((pg_snapshot_xmax(pg_current_snapshot())::text::bigint - xmin::text::bigint) "
+               "%% 4294967296 + 4294967296) %% 4294967296)::text::xid8")
+
+# Earliest hour of a row the last run's snapshot did not see, ending before its watermark
+LATE_HOUR_SQL = f"""
+SELECT date_trunc('hour', MIN(history_station_end_time))
+FROM workstation_master_log
+WHERE id > %(safe_id)s AND history_station_end_time < %(through)s
+    AND xmin::text::bigint > 2 AND NOT pg_visible_in_snapshot({ROW_XID_SQL}, %(snapshot)s::pg_snapshot)
+"""
+
+# Each part's last station and packed flag in every hour it had events
+MOVES_SQL = f"""
+CREATE TEMP TABLE wip_moves ON COMMIT DROP AS
+SELECT
+    date_trunc('hour', history_station_end_time) AS hour,
+    sn,
+    COALESCE(model, '') AS model,
+    (array_agg(workstation_name ORDER BY {LAST_ORDER}))[1] AS workstation_name,
+    bool_or(workstation_name = 'PACKING') AS packing
+FROM workstation_master_log
+WHERE history_station_end_time >= %(start)s AND history_station_end_time < %(end)s
+    AND {TPY_FLOWS}
+GROUP BY 1, 2, 3
+"""
+
+# Position after each move and before it (from the previous move, else the stored position)
+STEPS_SQL = """
+CREATE TEMP TABLE wip_steps ON COMMIT DROP AS
+WITH cumulative AS (
+    SELECT m.hour, m.sn, m.model, m.workstation_name,
+           COALESCE(p.packed, FALSE) OR bool_or(m.packing) OVER w AS packed,
+           p.workstation_name AS stored_station, p.packed AS stored_packed
+    FROM wip_moves m
+    LEFT JOIN wip_part_position p ON p.sn = m.sn AND p.model = m.model
+    WINDOW w AS (PARTITION BY m.sn, m.model ORDER BY m.hour ROWS UNBOUNDED PRECEDING)
+)
+SELECT hour, sn, model, workstation_name, packed,
+       COALESCE(LAG(workstation_name) OVER w, stored_station) AS prev_station,
+       COALESCE(LAG(packed) OVER w, stored_packed) AS prev_packed,
+       ROW_NUMBER() OVER (PARTITION BY sn, model ORDER BY hour DESC) = 1 AS latest
+FROM cumulative
+WINDOW w AS (PARTITION BY sn, model ORDER BY hour)
+"""
+
+DELTAS_SQL = """
+SELECT hour, model, workstation_name, SUM(delta)::int
+FROM (
+    SELECT hour, model, workstation_name, 1 AS delta FROM wip_steps WHERE NOT packed
+    UNION ALL
+    SELECT hour, model, prev_station, -1 FROM wip_steps WHERE prev_station IS NOT NULL AND NOT prev_packed
+) d
+GROUP BY hour, model, workstation_name
+HAVING SUM(delta) <> 0
+ORDER BY hour
+"""
+
+ADVANCE_POSITIONS_SQL = """
+INSERT INTO wip_part_position (sn, model, workstation_name, packed)
+SELECT sn, model, workstation_name, packed FROM wip_steps WHERE latest
+ON CONFLICT (sn, model) DO UPDATE SET
+    workstation_name = EXCLUDED.workstation_name,
+    packed = EXCLUDED.packed
+"""
+
+# Positions as of an hour, recounted from the history before it
+RECOUNT_POSITIONS_SQL = f"""
+INSERT INTO wip_part_position (sn, model, workstation_name, packed)
+SELECT sn, COALESCE(model, ''),
+       (array_agg(workstation_name ORDER BY {LAST_ORDER}))[1],
+       bool_or(workstation_name = 'PACKING')
+FROM workstation_master_log
+WHERE history_station_end_time < %s AND {TPY_FLOWS}
+GROUP BY sn, COALESCE(model, '')
+"""
+
+INSERT_SNAPSHOT_SQL = """
+INSERT INTO station_wip_hourly (snapshot_hour, model, workstation_name, wip_parts) VALUES %s
+ON CONFLICT (snapshot_hour, model, workstation_name) DO UPDATE SET wip_parts = EXCLUDED.wip_parts
+"""
+
+SAVE_PROGRESS_SQL = """
+INSERT INTO wip_progress (through_hour, snapshot, safe_id, pending_id, pending_xmax)
+VALUES (%(through)s, pg_current_snapshot(), %(safe_id)s, %(pending_id)s, %(pending_xmax)s::xid8)
+ON CONFLICT (id) DO UPDATE SET
+    through_hour = EXCLUDED.through_hour,
+    snapshot = EXCLUDED.snapshot,
+    safe_id = EXCLUDED.safe_id,
+    pending_id = EXCLUDED.pending_id,
+    pending_xmax = EXCLUDED.pending_xmax,
+    rewind_from = NULL,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+def create_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(CREATE_TABLES_SQL)
+    conn.commit()
+
+def rewind(cur, hour):
+    """Drop the snapshots from hour on and recount every part's position as of hour"""
+    cur.execute("DELETE FROM station_wip_hourly WHERE snapshot_hour >= %s", (hour,))
+    cur.execute("TRUNCATE wip_part_position")
+    cur.execute(RECOUNT_POSITIONS_SQL, (hour,))
+    print(f"Recounted {cur.rowcount:,} part positions as of {hour}")
+
+def snapshot_rows(cur, start, end):
+    """Snapshot rows for every hour in [start, end), from the positions at start and the moves"""
+    cur.execute("""
+        SELECT model, workstation_name, COUNT(*) FROM wip_part_position
+        WHERE NOT packed GROUP BY model, workstation_name
+    """)
+    counts = defaultdict(int, {(model, station): n for model, station, n in cur.fetchall()})
+    deltas = defaultdict(list)
+    for rows in stream_batches(cur.connection, DELTAS_SQL, name="wip_deltas"):
+        for hour, model, station, delta in rows:
+            deltas[hour].append((model, station, delta))
+
+    hour = start
+    while hour < end:
+        for model, station, delta in deltas.get(hour, ()):
+            counts[(model, station)] += delta
+            if not counts[(model, station)]:
+                del counts[(model, station)]
+        for (model, station), parts in counts.items():
+            yield hour, model, station, parts
+        hour += timedelta(hours=1)
+
+def aggregate_wip_hourly(lag_hours=DEFAULT_LAG_HOURS, rebuild=False):
+    """Advance the hourly WIP snapshots to lag_hours before the latest event; returns rows written"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    run = PipelineRun("aggregate_wip_hourly")
+    try:
+        create_tables(conn)
+        # One snapshot for the whole run; it is saved with the progress
+        begin_snapshot(conn, readonly=False)
+        with conn.cursor() as cur:
+            # Serializes concurrent runs and rewinds; taken before the snapshot, which the first query takes
+            cur.execute("LOCK TABLE wip_progress IN EXCLUSIVE MODE")
+            cur.execute("SELECT through_hour, snapshot::text, safe_id, pending_id, pending_xmax::text, rewind_from "
+                        "FROM wip_progress")
+            progress = None if rebuild else cur.fetchone()
+            cur.execute("""
+                SELECT date_trunc('hour', MIN(history_station_end_time)),
+                       date_trunc('hour', MAX(history_station_end_time)), COALESCE(MAX(id), 0),
+                       pg_snapshot_xmin(pg_current_snapshot())::text::bigint,
+                       pg_snapshot_xmax(pg_current_snapshot())::text
+                FROM workstation_master_log
+            """)
+            first_hour, last_hour, max_id, xmin, xmax = cur.fetchone()
+            if first_hour is None:
+                print("No workstation history yet")
+                return 0
+            through = last_hour - timedelta(hours=lag_hours)
+
+            if progress is None:
+                start = first_hour
+                # Nothing is known to have been seen yet; the next run checks every row once
+                safe_id, pending_id, pending_xmax = 0, max_id, xmax
+                rewind(cur, start)
+            else:
+                start, snapshot, safe_id, pending_id, pending_xmax, rewind_from = progress
+                cur.execute(LATE_HOUR_SQL, {"safe_id": safe_id, "through": start, "snapshot": snapshot})
+                late_hour = min(h for h in (cur.fetchone()[0], rewind_from, start) if h is not None)
+                if int(pending_xmax) <= xmin:
+                    # Everything running when pending_id was read has ended, so this snapshot sees all rows up to it
+                    safe_id, pending_id, pending_xmax = pending_id, max_id, xmax
+                if late_hour < start:
+                    print(f"Rows changed since the last run end before {start}; rewinding to {late_hour}")
+                    start = late_hour
+                    rewind(cur, start)
+
+            if through <= start:
+                print(f"Snapshots are up to date through {start - timedelta(hours=1)} "
+                      f"(latest event hour {last_hour}, lag {lag_hours}h)")
+                progress_values = {"through": start, "safe_id": safe_id,
+                                   "pending_id": pending_id, "pending_xmax": pending_xmax}
+                cur.execute(SAVE_PROGRESS_SQL, progress_values)
+                conn.commit()
+                return 0
+
+            print(f"Snapshotting {start} .. {through - timedelta(hours=1)} "
+                  f"({int((through - start).total_seconds() // 3600):,} hours)")
+            with run.span("moves") as span:
+                cur.execute(MOVES_SQL, {"start": start, "end": through})
+                span.rows_out = cur.rowcount
+                cur.execute(STEPS_SQL)
+            print(f"{span.rows_out:,} part-hours with events")
+
+            with run.span("snapshots") as span:
+                rows = list(snapshot_rows(cur, start, through))
+                execute_values(cur, INSERT_SNAPSHOT_SQL, rows, page_size=1000)
+                span.rows_out = len(rows)
+            cur.execute(ADVANCE_POSITIONS_SQL)
+            cur.execute(SAVE_PROGRESS_SQL, {"through": through, "safe_id": safe_id,
+                                            "pending_id": pending_id, "pending_xmax": pending_xmax})
+            notify_summary_updated(cur, 'station_wip_hourly')
+        conn.commit()
+
+        latest = {}
+        for hour, model, station, parts in rows:
+            if hour == through - timedelta(hours=1):
+                latest[(model, station)] = parts
+        print(f"Wrote {len(rows):,} snapshot rows; WIP at {through - timedelta(hours=1)}: {sum(latest.values()):,} parts")
+        for (model, station), parts in sorted(latest.items(), key=lambda item: -item[1])[:10]:
+            print(f"  {model:<14} {station:<16} {parts:>6,}")
+        return len(rows)
+    except Exception as e:
+        conn.rollback()
+        run.fail(e)
+        raise
+    finally:
+        conn.close()
+        run.finish()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hourly WIP snapshots per station and model")
+    parser.add_argument('--lag-hours', type=int, default=DEFAULT_LAG_HOURS,
+                        help=f"Hours behind the latest event to stop at (default: {DEFAULT_LAG_HOURS})")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute every snapshot from the first event")
+    args = parser.parse_args()
+    if args.lag_hours < 0:
+        parser.error("--lag-hours must not be negative")
+    started = time.perf_counter()
+    aggregate_wip_hourly(args.lag_hours, args.rebuild)
+    print(f"Done in {time.perf_counter() - started:.1f}s")
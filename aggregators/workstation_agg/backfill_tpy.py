@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Parallel, resumable backfill of the TPY tables.
+
+aggregate_tpy_all_time_daily.py and aggregate_tpy_all_time_weekly.py walk
+every date/week one after another, opening new connections for each. This
+runs the same per-date and per-week functions
+(aggregate_daily_tpy_for_date, aggregate_weekly_tpy_for_week), so the
+rows written are the same. The difference is that the dates and weeks are
+split into shards of consecutive days/weeks and run in a process pool.
+Each worker keeps one connection for all its shards.
+
+Every date/week is an independent upsert, so the order shards finish in
+does not change the result. The daily pass finishes before the weekly one
+starts, because the week list comes from daily_tpy_metrics, as in the
+serial weekly script.
+
+A finished shard is recorded in tpy_backfill_progress. --resume skips
+recorded shards, so an interrupted or failed backfill picks up where it
+stopped. Without --resume, that pass's progress is reset. Progress is kept
+separately for each --models scope.
+
+Each date and week reads one snapshot of its own (snapshots.py). With
+--consistent, the whole pass reads the one snapshot the parent exports, so
+an import running alongside the backfill shows up in none of its dates
+rather than in some. The parent holds that snapshot open until the pass
+ends, which holds back VACUUM for as long.
+
+The per-date output of the aggregators is suppressed while workers run
+(--verbose shows it). Instead, each finished shard is reported with
+shards/s and an ETA.
+
+Usage:
+    python backfill_tpy.py                                # daily, then weekly
+    python backfill_tpy.py --workers 8 --shard-days 14
+    python backfill_tpy.py --only weekly --shard-weeks 2
+    python backfill_tpy.py --resume
+    python backfill_tpy.py --consistent
+    python backfill_tpy.py --models "Tesla SXM5"
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import psycopg2
+
+from aggregate_tpy_daily import DB_CONFIG, aggregate_daily_tpy_for_date, get_all_available_dates
+from aggregate_tpy_weekly import aggregate_weekly_tpy_for_week, get_all_available_weeks, get_week_date_range
+from tpy_routes import load_tpy_routes, route_models
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from pipeline_metrics import PipelineRun
+from snapshots import SnapshotCoordinator
+
+DEFAULT_WORKERS = 4
+DEFAULT_SHARD_DAYS = 7
+DEFAULT_SHARD_WEEKS = 2
+
+CREATE_PROGRESS_SQL = """
+CREATE TABLE IF NOT EXISTS tpy_backfill_progress (
+    pass VARCHAR(10) NOT NULL,
+    scope TEXT NOT NULL,
+    shard_start DATE NOT NULL,
+    shard_end DATE NOT NULL,
+    items INTEGER NOT NULL,
+    seconds NUMERIC(10,3),
+    finished_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (pass, scope, shard_start)
+)
+"""
+
+RECORD_SHARD_SQL = """
+INSERT INTO tpy_backfill_progress (pass, scope, shard_start, shard_end, items, seconds)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (pass, scope, shard_start) DO UPDATE SET
+    shard_end = EXCLUDED.shard_end,
+    items = EXCLUDED.items,
+    seconds = EXCLUDED.seconds,
+    finished_at = CURRENT_TIMESTAMP
+"""
+
+# One connection per worker process, opened by init_worker and reused for every shard
+_worker_conn = None
+_worker_db_config = None
+
+
+def init_worker(db_config):
+    global _worker_db_config
+    _worker_db_config = db_config
+
+def worker_conn():
+    """The worker's connection, reopened if a previous shard lost it"""
+    global _worker_conn
+    if _worker_conn is None or _worker_conn.closed:
+        _worker_conn = psycopg2.connect(**_worker_db_config)
+    return _worker_conn
+
+def shards(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def shard_bounds(pass_name, shard):
+    """(first day, last day) of a shard of dates or week ids"""
+    if pass_name == "daily":
+        return shard[0], shard[-1]
+    return get_week_date_range(shard[0])[0], get_week_date_range(shard[-1])[1]
+
+def run_shard(pass_name, scope, shard, routes, models_only, verbose, snapshot_id=None):
+    """Aggregate every date/week in the shard, then record it; returns seconds taken"""
+    started = time.perf_counter()
+    conn = worker_conn()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            for item in shard:
+                if pass_name == "daily":
+                    aggregate_daily_tpy_for_date(item, routes, models_only=models_only, conn=conn,
+                                                 snapshot_id=snapshot_id)
+                else:
+                    aggregate_weekly_tpy_for_week(item, routes, models_only=models_only, conn=conn,
+                                                  snapshot_id=snapshot_id)
+        seconds = round(time.perf_counter() - started, 3)
+        first, last = shard_bounds(pass_name, shard)
+        with conn.cursor() as cur:
+            cur.execute(RECORD_SHARD_SQL, (pass_name, scope, first, last, len(shard), seconds))
+        conn.commit()
+        return seconds
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+
+def run_pass(pass_name, items, size, routes, scope, models_only, workers, resume, verbose, run, consistent=False):
+    """Run one pass (daily or weekly) over its shards; returns the number of failed shards"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_PROGRESS_SQL)
+            if not resume:
+                cur.execute("DELETE FROM tpy_backfill_progress WHERE pass = %s AND scope = %s", (pass_name, scope))
+            cur.execute("SELECT shard_start, shard_end FROM tpy_backfill_progress WHERE pass = %s AND scope = %s",
+                        (pass_name, scope))
+            done = set(cur.fetchall())
+        conn.commit()
+    finally:
+        conn.close()
+
+    all_shards = shards(items, size)
+    pending = [s for s in all_shards if shard_bounds(pass_name, s) not in done]
+    unit = "date(s)" if pass_name == "daily" else "week(s)"
+    print(f"\n{pass_name.upper()}: {len(items)} {unit} in {len(all_shards)} shards of {size}, "
+          f"{len(all_shards) - len(pending)} already done, {workers} worker(s)")
+    if not pending:
+        return 0
+
+    failed = 0
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with run.span(pass_name, rows_in=sum(len(s) for s in pending)) as span, \
+            contextlib.ExitStack() as stack:
+        snapshot_id = None
+        if consistent:
+            snapshot_id = stack.enter_context(SnapshotCoordinator(DB_CONFIG)).snapshot_id
+            print(f"Reading snapshot {snapshot_id}")
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                           initializer=init_worker, initargs=(DB_CONFIG,)))
+        futures = {executor.submit(run_shard, pass_name, scope, shard, routes, models_only, verbose, snapshot_id): shard
+                   for shard in pending}
+        finished = 0
+        for future in as_completed(futures):
+            shard = futures[future]
+            first, last = shard_bounds(pass_name, shard)
+            finished += 1
+            label = f"[{finished}/{len(pending)}] {first} .. {last}"
+            try:
+                seconds = future.result()
+            except Exception as e:
+                # Not recorded, so --resume retries the whole shard; its upserts are idempotent
+                failed += 1
+                print(f"{label}: failed ({type(e).__name__}: {str(e).strip()}); rerun with --resume to retry")
+                continue
+            elapsed = time.perf_counter() - started
+            rate = finished / elapsed
+            eta = (len(pending) - finished) / rate
+            span.rows_out = (span.rows_out or 0) + len(shard)
+            print(f"{label}: {len(shard)} {unit} in {seconds:.1f}s "
+                  f"({rate:.2f} shards/s, ETA {eta:.0f}s)")
+        if failed:
+            span.error = f"{failed} shard(s) failed"
+    print(f"{pass_name.upper()} pass: {len(pending) - failed}/{len(pending)} shards in "
+          f"{time.perf_counter() - started:.1f}s")
+    return failed
+
+def backfill_tpy(only=None, models=None, workers=DEFAULT_WORKERS, shard_days=DEFAULT_SHARD_DAYS,
+                 shard_weeks=DEFAULT_SHARD_WEEKS, resume=False, verbose=False, consistent=False):
+    """Daily then weekly TPY for all time; returns the number of failed shards"""
+    print("TPY BACKFILL")
+    print("=" * 50)
+    routes = load_tpy_routes(models)
+    scope = ",".join(sorted(models)) if models else "all"
+    print(f"TPY models: {', '.join(route_models(routes))}")
+
+    run = PipelineRun("backfill_tpy", source=scope)
+    failed = 0
+    try:
+        if only in (None, "daily"):
+            dates = get_all_available_dates()
+            failed += run_pass("daily", dates, shard_days, routes, scope, bool(models), workers, resume, verbose, run,
+                               consistent)
+        if only in (None, "weekly"):
+            if failed:
+                print("\nSkipping the weekly pass until every daily shard has finished (rerun with --resume)")
+            else:
+                weeks = get_all_available_weeks()
+                # A snapshot of its own: the weekly totals read the daily rows just written
+                failed += run_pass("weekly", weeks, shard_weeks, routes, scope, bool(models), workers, resume,
+                                   verbose, run, consistent)
+    except Exception as e:
+        run.fail(e)
+        raise
+    finally:
+        run.finish()
+
+    print("\nTPY BACKFILL " + ("COMPLETE!" if not failed else f"FINISHED WITH {failed} FAILED SHARD(S)"))
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel, resumable all-time TPY backfill")
+    parser.add_argument('--only', choices=['daily', 'weekly'], help="Run one pass (default: daily, then weekly)")
+    parser.add_argument('--models', nargs='+', metavar='MODEL',
+                        help="Only compute these models' rows (e.g. after adding a route)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Worker processes")
+    parser.add_argument('--shard-days', type=int, default=DEFAULT_SHARD_DAYS, help="Dates per daily shard")
+    parser.add_argument('--shard-weeks', type=int, default=DEFAULT_SHARD_WEEKS, help="Weeks per weekly shard")
+    parser.add_argument('--resume', action='store_true', help="Skip shards finished by the previous run")
+    parser.add_argument('--verbose', action='store_true', help="Show the aggregators' per-date output")
+    parser.add_argument('--consistent', action='store_true', help="Read one exported snapshot for each whole pass")
+    args = parser.parse_args()
+    if min(args.workers, args.shard_days, args.shard_weeks) < 1:
+        parser.error("--workers, --shard-days and --shard-weeks must be at least 1")
+    failed = backfill_tpy(args.only, args.models, args.workers, args.shard_days, args.shard_weeks,
+                          args.resume, args.verbose, args.consistent)
+    sys.exit(1 if failed else 0)
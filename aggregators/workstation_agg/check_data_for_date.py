@@ -20,10 +20,10 @@ def check_data_for_date(target_date):
             cur.execute("""
                 SELECT COUNT(*) 
                 FROM workstation_master_log 
-                WHERE DATE(history_station_end_time) = %s
+                WHERE history_station_end_time >= %s AND history_station_end_time < %s::date + 1
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
-            """, (target_date,))
+            """, (target_date, target_date))
             
             total_records = cur.fetchone()[0]
             print(f"Total production records: {total_records}")
@@ -35,12 +35,12 @@ def check_data_for_date(target_date):
             cur.execute("""
                 SELECT model, COUNT(*) 
                 FROM workstation_master_log 
-                WHERE DATE(history_station_end_time) = %s
+                WHERE history_station_end_time >= %s AND history_station_end_time < %s::date + 1
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
                 GROUP BY model
                 ORDER BY COUNT(*) DESC;
-            """, (target_date,))
+            """, (target_date, target_date))
             
             models = cur.fetchall()
             print(f"\nRecords by model:")
@@ -50,13 +50,13 @@ def check_data_for_date(target_date):
             cur.execute("""
                 SELECT workstation_name, COUNT(*) 
                 FROM workstation_master_log 
-                WHERE DATE(history_station_end_time) = %s
+                WHERE history_station_end_time >= %s AND history_station_end_time < %s::date + 1
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
                 GROUP BY workstation_name
                 ORDER BY COUNT(*) DESC
                 LIMIT 10;
-            """, (target_date,))
+            """, (target_date, target_date))
             
             stations = cur.fetchall()
             print(f"\nTop stations:")
@@ -66,11 +66,11 @@ def check_data_for_date(target_date):
             cur.execute("""
                 SELECT COUNT(*) 
                 FROM workstation_master_log 
-                WHERE DATE(history_station_end_time) = %s
+                WHERE history_station_end_time >= %s AND history_station_end_time < %s::date + 1
                     AND workstation_name = 'PACKING'
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
-            """, (target_date,))
+            """, (target_date, target_date))
             
             packing_count = cur.fetchone()[0]
             print(f"\nPACKING station records: {packing_count}")
@@ -78,10 +78,10 @@ def check_data_for_date(target_date):
             cur.execute("""
                 SELECT COUNT(DISTINCT sn) 
                 FROM workstation_master_log 
-                WHERE DATE(history_station_end_time) = %s
+                WHERE history_station_end_time >= %s AND history_station_end_time < %s::date + 1
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
-            """, (target_date,))
+            """, (target_date, target_date))
             
             unique_parts = cur.fetchone()[0]
             print(f"Unique parts: {unique_parts}")
@@ -98,7 +98,7 @@ def find_dates_with_data():
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT 
-                    DATE(history_station_end_time) as test_date,
+                    end_date as test_date,
                     COUNT(*) as record_count,
                     COUNT(DISTINCT sn) as unique_parts,
                     COUNT(CASE WHEN workstation_name = 'PACKING' THEN 1 END) as packing_records
@@ -106,7 +106,7 @@ def find_dates_with_data():
                 WHERE history_station_end_time IS NOT NULL
                     AND service_flow NOT IN ('NC Sort', 'RO')
                     AND service_flow IS NOT NULL
-                GROUP BY DATE(history_station_end_time)
+                GROUP BY end_date
                 HAVING COUNT(*) >= 100
                 ORDER BY record_count DESC
                 LIMIT 10;
@@ -1,21 +1,9 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+import os
+import sys
 
-def get_iso_week_id(date_obj):
-    """Convert date to ISO week format: 2025-W23"""
-    year, week, _ = date_obj.isocalendar()
-    return f"{year}-W{week:02d}"
-
-def get_week_date_range(week_id):
-    """Get start and end dates for an ISO week"""
-    year, week = week_id.split('-W')
-    year = int(year)
-    week = int(week)
-    
-    jan4 = datetime(year, 1, 4)
-    week_start = jan4 - timedelta(days=jan4.weekday()) + timedelta(weeks=week-1)
-    week_end = week_start + timedelta(days=6)
-    
-    return week_start.date(), week_end.date()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from factory_calendar import factory_date, week_id as get_iso_week_id, week_range as get_week_date_range
 
 def test_week_boundaries():
     """Test week boundaries for different dates"""
@@ -28,6 +16,8 @@ def test_week_boundaries():
         datetime(2025, 5, 18).date(),  # Sunday
         datetime(2025, 6, 15).date(),  # Sunday
         datetime(2025, 6, 13).date(),  # Friday
+        datetime(2024, 12, 30).date(),  # Monday of 2025-W01
+        datetime(2027, 1, 2).date(),  # Saturday of 2026-W53
     ]
     
     for test_date in test_dates:
@@ -36,6 +26,7 @@ def test_week_boundaries():
         
         print(f"\nDate: {test_date.strftime('%Y-%m-%d')} ({test_date.strftime('%A')})")
         print(f"  Week ID: {week_id}")
+        print(f"  Factory date: {factory_date(test_date).strftime('%Y-%m-%d')}")
         print(f"  Week Range: {week_start.strftime('%Y-%m-%d')} ({week_start.strftime('%A')}) to {week_end.strftime('%Y-%m-%d')} ({week_end.strftime('%A')})")
         
         if week_start <= test_date <= week_end:
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+TPY route definitions: which models get TPY, which stations make up each
+model's route (in order) and how the station yields are combined.
+
+The routes live in tpy_routes / tpy_route_stations and are seeded with the
+original SXM4/SXM5 formulas. Adding a model is a data change:
+
+    python tpy_routes.py --add "Tesla H100" H100 VI2,ASSY2,FI,FQC
+    python aggregate_tpy_weekly.py --mode all --models "Tesla H100"
+"""
+import argparse
+
+import psycopg2
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+DEFAULT_ROUTES = [
+    {"model": "Tesla SXM4", "routeKey": "SXM4", "formula": "product",
+     "stations": ["VI2", "ASSY2", "FI", "FQC"]},
+    {"model": "Tesla SXM5", "routeKey": "SXM5", "formula": "product",
+     "stations": ["BBD", "ASSY2", "FI", "FQC"]},
+]
+
+CREATE_TABLES_SQL = '''
+CREATE TABLE IF NOT EXISTS tpy_routes (
+    model VARCHAR(255) PRIMARY KEY,
+    route_key VARCHAR(20) NOT NULL UNIQUE,
+    formula VARCHAR(20) NOT NULL DEFAULT 'product',
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS tpy_route_stations (
+    model VARCHAR(255) NOT NULL REFERENCES tpy_routes(model) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    workstation_name VARCHAR(50) NOT NULL,
+    PRIMARY KEY (model, position)
+);
+
+CREATE TABLE IF NOT EXISTS weekly_tpy_route_metrics (
+    week_id VARCHAR(10) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    route_key VARCHAR(20) NOT NULL,
+    formula VARCHAR(20) NOT NULL,
+    hardcoded_stations TEXT,         -- JSON string
+    hardcoded_tpy DECIMAL(5,2),
+    dynamic_stations TEXT,           -- JSON string
+    dynamic_tpy DECIMAL(5,2),
+    dynamic_station_count INTEGER,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (week_id, model)
+);
+'''
+
+LOAD_ROUTES_SQL = '''
+SELECT r.model, r.route_key, r.formula, ARRAY_AGG(s.workstation_name ORDER BY s.position)
+FROM tpy_routes r
+JOIN tpy_route_stations s ON s.model = r.model
+WHERE r.active
+GROUP BY r.model, r.route_key, r.formula
+ORDER BY r.model;
+'''
+
+
+def _product(values):
+    tpy_value = 1.0
+    for val in values:
+        tpy_value *= val
+    return tpy_value
+
+# formula name -> function of the station yields (as fractions, in route order)
+FORMULAS = {
+    "product": _product,
+}
+
+
+ROUTE_TABLES_EXIST_SQL = "SELECT to_regclass('tpy_routes') IS NOT NULL AND to_regclass('tpy_route_stations') IS NOT NULL"
+
+def ensure_route_tables(cur):
+    """Create the route tables and seed them with DEFAULT_ROUTES when empty"""
+    cur.execute(CREATE_TABLES_SQL)
+    cur.execute("SELECT COUNT(*) FROM tpy_routes")
+    if cur.fetchone()[0] == 0:
+        for route in DEFAULT_ROUTES:
+            save_route(cur, route["model"], route["routeKey"], route["stations"], route["formula"])
+
+def save_route(cur, model, route_key, stations, formula="product"):
+    """Insert or replace one model's route"""
+    if formula not in FORMULAS:
+        raise ValueError(f"Unknown TPY formula '{formula}' (expected one of {', '.join(FORMULAS)})")
+    cur.execute("""
+        INSERT INTO tpy_routes (model, route_key, formula)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (model) DO UPDATE SET
+            route_key = EXCLUDED.route_key,
+            formula = EXCLUDED.formula,
+            active = TRUE;
+    """, (model, route_key, formula))
+    cur.execute("DELETE FROM tpy_route_stations WHERE model = %s", (model,))
+    for position, station in enumerate(stations, 1):
+        cur.execute("""
+            INSERT INTO tpy_route_stations (model, position, workstation_name)
+            VALUES (%s, %s, %s);
+        """, (model, position, station))
+
+def load_tpy_routes(models=None, conn=None):
+    """Active routes as a list of dicts shaped like DEFAULT_ROUTES.
+
+    models optionally restricts the result to those model names, which is how a
+    backfill for a newly added model avoids recomputing every other model.
+
+    The route tables are created (and seeded) only when they don't exist yet,
+    and only on a connection of our own: a conn passed in is only read from,
+    so the caller's transaction is never committed here.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ROUTE_TABLES_EXIST_SQL)
+            if not cur.fetchone()[0]:
+                if not own_conn:
+                    return load_tpy_routes(models)
+                ensure_route_tables(cur)
+                conn.commit()
+            cur.execute(LOAD_ROUTES_SQL)
+            routes = [
+                {"model": model, "routeKey": route_key, "formula": formula, "stations": list(stations)}
+                for model, route_key, formula, stations in cur.fetchall()
+            ]
+    finally:
+        if own_conn:
+            conn.close()
+
+    if models:
+        unknown = set(models) - {route["model"] for route in routes}
+        if unknown:
+            raise ValueError(f"No TPY route defined for: {', '.join(sorted(unknown))}")
+        routes = [route for route in routes if route["model"] in models]
+    return routes
+
+def route_models(routes):
+    return [route["model"] for route in routes]
+
+def calculate_route_tpy(model_yields, routes):
+    """Hardcoded TPY for every route: the route formula over its listed stations.
+
+    Returns {routeKey: {"stations": {station: yield_pct}, "tpy": pct or None}};
+    tpy stays None unless every route station has a yield.
+    """
+    route_tpy = {}
+    for route in routes:
+        key = route["routeKey"]
+        route_tpy[key] = {"stations": {}, "tpy": None}
+        station_yields = model_yields.get(route["model"], {})
+        values = []
+        for station in route["stations"]:
+            if station in station_yields:
+                yield_pct = station_yields[station]["throughputYield"]
+                route_tpy[key]["stations"][station] = yield_pct
+                values.append(yield_pct / 100.0)
+                print(f"{key} {station}: {yield_pct:.2f}%")
+            else:
+                print(f"{key} {station}: NOT FOUND")
+
+        if len(values) == len(route["stations"]):
+            route_tpy[key]["tpy"] = round(FORMULAS[route["formula"]](values) * 100, 2)
+            print(f"{key} Hardcoded TPY: {route_tpy[key]['tpy']:.2f}%")
+    return route_tpy
+
+def calculate_dynamic_route_tpy(model_yields, routes):
+    """Dynamic TPY for every route: the route formula over all stations seen for the model"""
+    dynamic_tpy = {}
+    for route in routes:
+        key = route["routeKey"]
+        dynamic_tpy[key] = {"stations": {}, "tpy": None, "stationCount": 0}
+        if route["model"] not in model_yields:
+            continue
+        stations = model_yields[route["model"]]
+        dynamic_tpy[key]["stations"] = {station: data["throughputYield"] for station, data in stations.items()}
+        dynamic_tpy[key]["stationCount"] = len(stations)
+        values = [yield_pct / 100.0 for yield_pct in dynamic_tpy[key]["stations"].values()]
+        dynamic_tpy[key]["tpy"] = round(FORMULAS[route["formula"]](values) * 100, 2)
+        print(f"{key} Dynamic TPY: {dynamic_tpy[key]['tpy']:.2f}% (across {dynamic_tpy[key]['stationCount']} stations)")
+    return dynamic_tpy
+
+def list_routes():
+    routes = load_tpy_routes()
+    print(f"{'Model':<20} {'Key':<8} {'Formula':<10} Stations")
+    print("-" * 60)
+    for route in routes:
+        print(f"{route['model']:<20} {route['routeKey']:<8} {route['formula']:<10} {' x '.join(route['stations'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage TPY route definitions")
+    parser.add_argument('--add', nargs=3, metavar=('MODEL', 'KEY', 'STATIONS'),
+                        help="Add or replace a route, stations comma-separated in route order")
+    parser.add_argument('--formula', default='product', choices=sorted(FORMULAS),
+                        help="Formula for --add (default: product)")
+    parser.add_argument('--deactivate', metavar='MODEL', help="Stop computing TPY for a model")
+    args = parser.parse_args()
+
+    if args.add or args.deactivate:
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            with conn.cursor() as cur:
+                ensure_route_tables(cur)
+                if args.add:
+                    model, route_key, stations = args.add
+                    save_route(cur, model, route_key, [s.strip() for s in stations.split(',') if s.strip()], args.formula)
+                    print(f"Saved route for {model}")
+                if args.deactivate:
+                    cur.execute("UPDATE tpy_routes SET active = FALSE WHERE model = %s", (args.deactivate,))
+                    print(f"Deactivated {cur.rowcount} route(s) for {args.deactivate}")
+            conn.commit()
+        finally:
+            conn.close()
+    list_routes()
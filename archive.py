@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Cold archive of old master-log months to compressed Parquet.
+
+Almost every query reads the last few weeks, but the master logs keep every
+row since the first upload. --archive exports each month older than the
+retention threshold (--older-than-months, default DEFAULT_RETENTION_MONTHS,
+or --before YYYY-MM) to one zstd-compressed Parquet file:
+
+    <archive dir>/<table>/month=YYYY-MM/<table>_YYYY-MM.parquet
+    <archive dir>/<table>/manifest.json
+
+The manifest records each month's file, row count, SUM(id), first/last end
+time, size, sha256 and status. After writing, the file is read back and its
+count and SUM(id) are checked against the database. Only then are the rows
+removed. A partitioned table (partitions.py) has the month's partition
+detached, re-counted and dropped. Otherwise the month is deleted in one
+transaction. Either way, if what would be removed differs from what was
+archived (rows arrived for the month in the meantime), it is rolled back
+and the month stays in PostgreSQL. --keep exports without deleting.
+
+In star mode (dimensions.py) rows are exported through the view, so the
+files hold the plain master-log values, and deleted from the fact table.
+Generated columns (date_columns.py) are not exported; they are recomputed
+on rehydration.
+
+Reading archived data:
+    archived_batches() streams a table's archived months as Arrow record
+    batches, optionally restricted to an end-time range; read_archived() and
+    read_range() (archive + hot rows) return DataFrames. The columnar TPY
+    engine reads the archive this way, so all-time backfills still see every
+    row. --rehydrate puts a month back into PostgreSQL (ON CONFLICT DO
+    NOTHING, creating its partition if needed) and marks it rehydrated.
+
+Materialized summary views are computed from the hot rows, so a refresh
+after archiving drops the archived months from them; keep the retention
+threshold beyond the periods they report.
+
+The daily TPY week starters are the parts whose first event falls in the
+week. Taken over the hot rows, a part with archived history would look new
+in a later week, so they come from part_state.first_seen (part_state.py),
+which archiving leaves alone. Archiving workstation_master_log creates
+part_state first if it does not exist yet. Everything else in the TPY
+aggregators only reads rows inside the week being computed.
+
+Archiving or rehydrating workstation_master_log rewinds the hourly WIP
+snapshots (part_state.rewind_wip()), which cannot notice either.
+
+Usage:
+    python archive.py --status
+    python archive.py --archive --older-than-months 12
+    python archive.py --archive --before 2025-01 --table testboard_master_log --dry-run
+    python archive.py --archive --before 2025-01 --keep
+    python archive.py --query workstation_master_log 2024-03-01 2024-04-01
+    python archive.py --rehydrate workstation_master_log 2024-03
+"""
+import argparse
+import hashlib
+import json
+import os
+from datetime import date, datetime
+
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from psycopg2.extras import execute_values
+
+from dimensions import (DB_CONFIG, FACT_DIMENSIONS, fact_table, generated_columns, insert_facts, is_star,
+                        table_columns)
+from part_state import SOURCE_TABLE as PART_STATE_SOURCE, ensure_part_state, rewind_wip
+from partitions import PARTITION_KEY, add_months, create_partition, is_partitioned, partition_name, partitions
+from pipeline_metrics import PipelineRun
+
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.environ.get("FOX_ARCHIVE_DIR", os.path.join(ETL_DIR, "archive"))
+DEFAULT_RETENTION_MONTHS = 12
+COMPRESSION = "zstd"
+BATCH_ROWS = 50_000
+
+# PostgreSQL type (format_type, without the length) -> Arrow type; anything else is exported as text
+ARROW_TYPES = {
+    "smallint": pa.int16(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "double precision": pa.float64(),
+    "real": pa.float32(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+    "timestamp without time zone": pa.timestamp("us"),
+}
+
+
+def arrow_type(pg_type):
+    return ARROW_TYPES.get(pg_type.split("(")[0], pa.string())
+
+def month_label(month):
+    return f"{month:%Y-%m}"
+
+def month_bounds(month):
+    return datetime.combine(month, datetime.min.time()), datetime.combine(add_months(month, 1), datetime.min.time())
+
+def table_dir(table, archive_dir=None):
+    return os.path.join(archive_dir or ARCHIVE_DIR, table)
+
+def month_file(table, month, archive_dir=None):
+    label = month_label(month)
+    return os.path.join(table_dir(table, archive_dir), f"month={label}", f"{table}_{label}.parquet")
+
+def load_manifest(table, archive_dir=None):
+    path = os.path.join(table_dir(table, archive_dir), "manifest.json")
+    if not os.path.exists(path):
+        return {"table": table, "months": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, archive_dir=None):
+    """Write through a temporary file so a crash never leaves half a manifest"""
+    directory = table_dir(manifest["table"], archive_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def export_columns(cur, table, storage):
+    """[(name, pg type)] of the master log as readers see it, without generated columns"""
+    generated = generated_columns(cur, storage)
+    return [(name, type_name) for name, type_name, _, _ in table_columns(cur, table) if name not in generated]
+
+def archive_schema(columns):
+    return pa.schema([(name, arrow_type(type_name)) for name, type_name in columns])
+
+def months_before(cur, storage, before):
+    """Months with rows ending before `before`, oldest first"""
+    cur.execute(f"""
+        SELECT DISTINCT date_trunc('month', {PARTITION_KEY})::date
+        FROM {storage} WHERE {PARTITION_KEY} < %s ORDER BY 1
+    """, (before,))
+    return [month for (month,) in cur.fetchall()]
+
+def export_month(conn, table, month, columns, archive_dir=None):
+    """Stream one month into its Parquet file; returns the manifest entry"""
+    start, end = month_bounds(month)
+    path = month_file(table, month, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    schema = archive_schema(columns)
+    names = [name for name, _ in columns]
+    rows = id_sum = 0
+    first = last = None
+    with conn.cursor(name=f"archive_{table}") as cur, pq.ParquetWriter(path + ".tmp", schema, compression=COMPRESSION) as writer:
+        cur.itersize = BATCH_ROWS
+        cur.execute(f"""
+            SELECT {', '.join(names)} FROM {table}
+            WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s
+            ORDER BY {PARTITION_KEY}, id
+        """, (start, end))
+        while True:
+            batch = cur.fetchmany(BATCH_ROWS)
+            if not batch:
+                break
+            values = list(zip(*batch))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(v, type=field.type) for v, field in zip(values, schema)], schema=schema))
+            ends = values[names.index(PARTITION_KEY)]
+            first = first or ends[0]
+            last = ends[-1]
+            rows += len(batch)
+            id_sum += sum(values[names.index("id")])
+    conn.commit()  # closes the snapshot the named cursor held
+    os.replace(path + ".tmp", path)
+    return {
+        "month": month_label(month),
+        "file": os.path.relpath(path, table_dir(table, archive_dir)),
+        "rows": rows,
+        "id_sum": id_sum,
+        "first_end_time": first.isoformat() if first else None,
+        "last_end_time": last.isoformat() if last else None,
+        "bytes": os.path.getsize(path),
+        "sha256": file_sha256(path),
+        "compression": COMPRESSION,
+        "columns": [name for name, _ in columns],
+        "archived_at": datetime.now().isoformat(timespec="seconds"),
+        "status": "exported",
+    }
+
+def verify_file(table, entry, archive_dir=None):
+    """Read the file back: checksum, row count and SUM(id) must match the entry"""
+    path = os.path.join(table_dir(table, archive_dir), entry["file"])
+    if file_sha256(path) != entry["sha256"]:
+        return False
+    ids = pq.read_table(path, columns=["id"]).column("id")
+    id_sum = pc.sum(ids).as_py() or 0
+    return len(ids) == entry["rows"] and id_sum == entry["id_sum"]
+
+def delete_month(conn, storage, month, entry):
+    """Remove an archived month from PostgreSQL; rolled back unless exactly the archived rows go"""
+    start, end = month_bounds(month)
+    with conn.cursor() as cur:
+        name = partition_name(storage, month)
+        if is_partitioned(cur, storage) and (name, month) in partitions(cur, storage):
+            cur.execute(f"ALTER TABLE {storage} DETACH PARTITION {name}")
+            cur.execute(f"SELECT COUNT(*), COALESCE(SUM(id), 0) FROM {name}")
+            removed = cur.fetchone()
+            cur.execute(f"DROP TABLE {name}")
+        else:
+            cur.execute(f"""
+                WITH gone AS (
+                    DELETE FROM {storage} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING id
+                )
+                SELECT COUNT(*), COALESCE(SUM(id), 0) FROM gone
+            """, (start, end))
+            removed = cur.fetchone()
+    if tuple(removed) != (entry["rows"], entry["id_sum"]):
+        conn.rollback()
+        print(f"  {entry['month']}: PostgreSQL has {removed[0]:,} rows, the archive {entry['rows']:,}; "
+              f"nothing deleted (re-run to archive the month again)")
+        return False
+    conn.commit()
+    return True
+
+def archive_table(conn, table, before, archive_dir=None, keep=False, dry_run=False):
+    """Archive every month of a master log ending before `before`; returns the months archived"""
+    star = is_star(conn, table)
+    storage = fact_table(table) if star else table
+    with conn.cursor() as cur:
+        months = months_before(cur, storage, before)
+        columns = export_columns(cur, table, storage)
+    conn.commit()
+    print(f"{table}: {len(months)} month(s) before {before:%Y-%m}"
+          + (" (star mode: exporting the view, deleting from the fact table)" if star else ""))
+    if dry_run or not months:
+        for month in months:
+            print(f"  would archive {month_label(month)}")
+        return []
+
+    if table == PART_STATE_SOURCE and not keep:
+        # part_state.first_seen is what keeps the TPY week starters right once these rows are gone
+        ensure_part_state(conn)
+    manifest = load_manifest(table, archive_dir)
+    run = PipelineRun("archive", source=table)
+    archived = []
+    try:
+        for month in months:
+            label = month_label(month)
+            if manifest["months"].get(label, {}).get("status") == "archived":
+                # Rows for an archived month arrived late; rehydrate it and archive it again
+                print(f"  {label}: already archived, skipping the late rows (--rehydrate, then --archive)")
+                continue
+            with run.span("export") as span:
+                entry = export_month(conn, table, month, columns, archive_dir)
+                span.rows_out = entry["rows"]
+            with run.span("verify", rows_in=entry["rows"]) as span:
+                if not verify_file(table, entry, archive_dir):
+                    span.error = f"{label}: file does not match what was exported"
+                    print(f"  {label}: read-back check failed; rows left in PostgreSQL")
+                    continue
+            manifest["months"][label] = entry
+            save_manifest(manifest, archive_dir)
+            if not keep:
+                with run.span("delete", rows_in=entry["rows"]) as span:
+                    if not delete_month(conn, storage, month, entry):
+                        span.error = f"{label}: row count changed since export"
+                        continue
+                    span.rows_out = entry["rows"]
+                entry["status"] = "archived"
+                save_manifest(manifest, archive_dir)
+            archived.append(month)
+            print(f"  {label}: {entry['rows']:,} rows, {entry['bytes'] / 2**20:,.1f} MB "
+                  f"({entry['status']})")
+    except Exception as e:
+        conn.rollback()
+        run.fail(e)
+        raise
+    finally:
+        run.finish()
+
+    if archived and not keep:
+        if table == PART_STATE_SOURCE:
+            # The hourly WIP positions counted the deleted rows
+            rewind_wip(conn)
+        with conn.cursor() as cur:
+            plain = not is_partitioned(cur, storage)
+        conn.commit()
+        if plain:
+            # Partitions were dropped outright; a plain table has dead rows to clear
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"VACUUM (ANALYZE) {storage}")
+            finally:
+                conn.autocommit = False
+    return archived
+
+def as_timestamp(value):
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return pa.scalar(value, pa.timestamp("us"))
+
+def archived_months(table, archive_dir=None):
+    """{month label: entry} of the months whose rows now live only in the archive"""
+    return {label: entry for label, entry in load_manifest(table, archive_dir)["months"].items()
+            if entry["status"] == "archived"}
+
+def archived_batches(table, columns=None, start=None, end=None, archive_dir=None, batch_size=BATCH_ROWS):
+    """Yield Arrow record batches of archived rows, optionally only end times in [start, end)"""
+    entries = archived_months(table, archive_dir)
+    if start is not None:
+        entries = {k: e for k, e in entries.items() if e["last_end_time"] and e["last_end_time"] >= start.isoformat()}
+    if end is not None:
+        entries = {k: e for k, e in entries.items() if e["first_end_time"] and e["first_end_time"] < end.isoformat()}
+    if not entries:
+        return
+    directory = table_dir(table, archive_dir)
+    dataset = ds.dataset([os.path.join(directory, e["file"]) for _, e in sorted(entries.items())], format="parquet")
+    condition = None
+    if start is not None:
+        condition = ds.field(PARTITION_KEY) >= as_timestamp(start)
+    if end is not None:
+        upper = ds.field(PARTITION_KEY) < as_timestamp(end)
+        condition = upper if condition is None else condition & upper
+    yield from dataset.to_batches(columns=columns, filter=condition, batch_size=batch_size)
+
+def read_archived(table, columns=None, start=None, end=None, archive_dir=None):
+    """Archived rows as a DataFrame"""
+    batches = list(archived_batches(table, columns, start, end, archive_dir))
+    if not batches:
+        return pd.DataFrame(columns=columns or [])
+    return pa.Table.from_batches(batches).to_pandas()
+
+def read_range(conn, table, columns, start, end, archive_dir=None):
+    """Rows with end times in [start, end) from the archive and PostgreSQL together"""
+    archived = read_archived(table, columns, start, end, archive_dir)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {', '.join(columns)} FROM {table}
+            WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s
+        """, (start, end))
+        hot = pd.DataFrame(cur.fetchall(), columns=columns)
+    return pd.concat([archived, hot], ignore_index=True) if len(archived) else hot
+
+def rehydrate(conn, table, month, archive_dir=None):
+    """Insert an archived month back into PostgreSQL; returns the rows inserted"""
+    manifest = load_manifest(table, archive_dir)
+    label = month_label(month)
+    entry = manifest["months"].get(label)
+    if entry is None:
+        print(f"{table} {label} is not in the archive")
+        return 0
+    if not verify_file(table, entry, archive_dir):
+        raise RuntimeError(f"{entry['file']} does not match its manifest entry")
+    data = pq.read_table(os.path.join(table_dir(table, archive_dir), entry["file"]))
+    columns = data.column_names
+    rows = list(zip(*(data.column(c).to_pylist() for c in columns)))
+    star = is_star(conn, table)
+    storage = fact_table(table) if star else table
+    with conn.cursor() as cur:
+        if is_partitioned(cur, storage) and month not in {m for _, m in partitions(cur, storage)}:
+            create_partition(cur, storage, month)
+        cur.execute(f"SELECT COUNT(*) FROM {storage} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s",
+                    month_bounds(month))
+        before = cur.fetchone()[0]
+        for i in range(0, len(rows), BATCH_ROWS):
+            if star:
+                insert_facts(cur, table, columns, rows[i:i + BATCH_ROWS])
+            else:
+                execute_values(cur, f"""
+                    INSERT INTO {table} ({', '.join(columns)}) VALUES %s
+                    ON CONFLICT DO NOTHING
+                """, rows[i:i + BATCH_ROWS], page_size=1000)
+        cur.execute(f"SELECT COUNT(*) FROM {storage} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s",
+                    month_bounds(month))
+        inserted = cur.fetchone()[0] - before
+    conn.commit()
+    if table == PART_STATE_SOURCE:
+        # The rows keep their old ids, below what the hourly WIP run checks for late rows
+        rewind_wip(conn, month_bounds(month)[0])
+    entry["status"] = "rehydrated"
+    entry["rehydrated_at"] = datetime.now().isoformat(timespec="seconds")
+    save_manifest(manifest, archive_dir)
+    print(f"Rehydrated {table} {label}: {inserted:,} of {len(rows):,} rows inserted")
+    return inserted
+
+def print_status(archive_dir=None):
+    print(f"Archive: {archive_dir or ARCHIVE_DIR}")
+    for table in FACT_DIMENSIONS:
+        months = load_manifest(table, archive_dir)["months"]
+        if not months:
+            print(f"{table}: nothing archived")
+            continue
+        rows = sum(e["rows"] for e in months.values() if e["status"] == "archived")
+        size = sum(e["bytes"] for e in months.values())
+        print(f"{table}: {len(months)} month(s), {rows:,} rows only in the archive, {size / 2**20:,.1f} MB")
+        for label, entry in sorted(months.items()):
+            print(f"  {label}  {entry['rows']:>12,} rows  {entry['bytes'] / 2**20:>8,.1f} MB  {entry['status']}")
+
+def print_query(table, start, end, archive_dir=None):
+    data = read_archived(table, ["workstation_name", PARTITION_KEY], start, end, archive_dir)
+    print(f"{table} archived rows ending {start} to {end}: {len(data):,}")
+    if len(data):
+        print(data.groupby("workstation_name").size().sort_values(ascending=False).to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old master-log months to Parquet")
+    parser.add_argument('--table', choices=sorted(FACT_DIMENSIONS), help="One master log (default: both)")
+    parser.add_argument('--archive-dir', help=f"Archive location (default: {ARCHIVE_DIR})")
+    parser.add_argument('--status', action='store_true', help="List archived months")
+    parser.add_argument('--archive', action='store_true', help="Archive months older than the retention threshold")
+    parser.add_argument('--older-than-months', type=int, default=DEFAULT_RETENTION_MONTHS,
+                        help=f"Months kept in PostgreSQL besides the current one (default: {DEFAULT_RETENTION_MONTHS})")
+    parser.add_argument('--before', metavar='YYYY-MM', help="Archive months before this one instead")
+    parser.add_argument('--keep', action='store_true', help="Export and verify but leave the rows in PostgreSQL")
+    parser.add_argument('--dry-run', action='store_true', help="List the months that would be archived")
+    parser.add_argument('--rehydrate', nargs=2, metavar=('TABLE', 'YYYY-MM'), help="Load an archived month back")
+    parser.add_argument('--query', nargs=3, metavar=('TABLE', 'START', 'END'),
+                        help="Count archived rows per station with end times in [START, END)")
+    args = parser.parse_args()
+
+    tables = [args.table] if args.table else list(FACT_DIMENSIONS)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.archive:
+            before = (datetime.strptime(args.before, '%Y-%m').date() if args.before
+                      else add_months(date.today().replace(day=1), -args.older_than_months))
+            for table in tables:
+                archive_table(conn, table, before, args.archive_dir, keep=args.keep, dry_run=args.dry_run)
+        if args.rehydrate:
+            rehydrate(conn, args.rehydrate[0], datetime.strptime(args.rehydrate[1], '%Y-%m').date(), args.archive_dir)
+        if args.query:
+            start, end = (datetime.strptime(v, '%Y-%m-%d').date() for v in args.query[1:])
+            print_query(args.query[0], start, end, args.archive_dir)
+        if args.status or not (args.archive or args.rehydrate or args.query):
+            print_status(args.archive_dir)
+    finally:
+        conn.close()
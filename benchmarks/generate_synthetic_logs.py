@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic workstation, testboard and snfn reports.
+
+Every serial walks its model's route; tests fail at --fail-rate, a failure
+sends the part through <STATION>_REPAIR and back (up to --max-rework loops)
+and a share of parts never finish (limbo). Events are cut into report
+windows like the portal exports and each window repeats --overlap of the
+previous window's rows, so duplicate handling is exercised too.
+
+Usage:
+    python generate_synthetic_logs.py --rows 100000 --format xlsx --output /tmp/synthetic
+    python generate_synthetic_logs.py --rows 1000000 --format csv --output /tmp/synthetic
+    python generate_synthetic_logs.py --rows 10000000 --format postgres
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+ETL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ETL_DIR)
+from date_columns import MASTER_LOGS, apply_date_columns
+from part_state import ensure_part_state, rebuild_part_state
+
+from upload_snfn_master_log import create_snfn_table
+from upload_testboard_master_log import create_testboard_table
+from upload_workstation_master_log import create_workstation_table
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+MODEL_ROUTES = {
+    "Tesla SXM4": {
+        "pn": "692-2G506-0210-0R6",
+        "service_flow": "NC PG506/PG510 Refurbish",
+        "stations": ["RECEIVE", "VI1", "ASSY1", "FLA", "BAT", "BIT", "FCT", "FPF", "OQA",
+                     "VI2", "ASSY2", "UPGRADE", "FI", "FQC", "PACKING", "SHIPPING"],
+    },
+    "Tesla SXM5": {
+        "pn": "965-2G520-0100-0R0",
+        "service_flow": "NC PG520 TIM Rework",
+        "stations": ["RECEIVE", "VI1", "BBD", "CHIFLASH", "FLB", "FLA", "BAT", "BIT", "FCT",
+                     "FPF", "OQA", "ASSY2", "FI", "FQC", "PACKING", "SHIPPING"],
+    },
+    "Red October": {
+        "pn": "900-2G900-0000-000",
+        "service_flow": "RO",
+        "stations": ["RECEIVE", "Disassembly", "PT2", "PT3", "FLA", "RIN", "FCT", "VI3",
+                     "FI", "FQC", "PACKING", "SHIPPING"],
+    },
+}
+MODEL_WEIGHTS = {"Tesla SXM4": 0.6, "Tesla SXM5": 0.38, "Red October": 0.02}
+
+# Stations that also produce a testboard record (and an snfn record on failure)
+TEST_STATIONS = {"CHIFLASH", "FLB", "FLA", "BAT", "BIT", "FCT", "FPF", "OQA"}
+# Stations that can fail; everything else always passes
+FAILING_STATIONS = TEST_STATIONS | {"VI1", "VI2", "FI", "FQC", "PT2", "PT3", "RIN"}
+ERROR_CODES = [("CID", "Cannot identify device"), ("PCIE", "PCIe link training failure"),
+               ("HBM", "HBM memory test failure"), ("THERM", "Thermal limit exceeded"),
+               ("PWR", "Power rail out of range")]
+OPERATORS = ["RichardA", "AnthonyA", "Cameron Leathers", "Sneha Vaghani", "MariaL", "KevinT"]
+
+WORKSTATION_HEADERS = ['SN', 'PN', 'Customer PN', 'Outbound version', 'Workstation Name',
+                       'History station start time', 'History station end time', 'Hours', 'Service Flow',
+                       'Model', 'History station passing status', 'Passing Station Method', 'operator',
+                       'First Station Start Time', 'day']
+TESTBOARD_HEADERS = ['SN', 'PN', 'Model', 'Work station process', 'Baseboard SN', 'Baseboard PN',
+                     'Number of times baseboard is used', 'Workstation Name', 'History station start time',
+                     'History station end time', 'History station passing status', 'operator',
+                     'Failure reasons', 'Failure note', 'Failure Code', 'Diag Version', 'Fixture No']
+SNFN_HEADERS = ['Workstation Name', 'Fixture No', 'Error Code', 'Error Disc', 'Model', 'SN', 'PN',
+                'History station start time', 'History station end time']
+
+REPORT_DIRS = {
+    "workstation": ("workstationreport_xlsx", "workstationOutputReport"),
+    "testboard": ("testboardrecord_xlsx", "test_board_record_report"),
+    "snfn": ("snfnrecord_xlsx", "snfnrecord"),
+}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class SyntheticFactory:
+    """Simulates parts flowing through the factory and emits report rows"""
+
+    def __init__(self, start, days, fail_rate=0.06, max_rework=2, limbo_rate=0.08,
+                 fixtures=40, models=None, seed=42):
+        self.rng = np.random.default_rng(seed)
+        self.start = datetime.combine(start, datetime.min.time())
+        self.days = days
+        self.fail_rate = fail_rate
+        self.max_rework = max_rework
+        self.limbo_rate = limbo_rate
+        self.fixtures = [f"NV-NC{i:04d}" for i in range(1, fixtures + 1)]
+        self.models = models or list(MODEL_ROUTES)
+        weights = np.array([MODEL_WEIGHTS.get(m, 0.1) for m in self.models])
+        self.model_weights = weights / weights.sum()
+        self.next_sn = 1650000000000
+
+    def part_events(self, model):
+        """All events for one new serial number, in time order"""
+        rng = self.rng
+        route = MODEL_ROUTES[model]
+        sn = str(self.next_sn)
+        self.next_sn += 1
+        first_start = self.start + timedelta(seconds=float(rng.uniform(0, self.days * 86400)))
+        stop_after = len(route["stations"])
+        if rng.random() < self.limbo_rate:
+            stop_after = int(rng.integers(1, len(route["stations"])))
+
+        events = []
+        clock = first_start
+        for station in route["stations"][:stop_after]:
+            for attempt in range(self.max_rework + 1):
+                clock += timedelta(minutes=float(rng.exponential(45)))
+                start_time = clock
+                clock += timedelta(minutes=float(rng.uniform(2, 40)))
+                failed = (station in FAILING_STATIONS and attempt < self.max_rework
+                          and rng.random() < self.fail_rate)
+                events.append((sn, model, station, start_time, clock, 'Fail' if failed else 'Pass', first_start))
+                if not failed:
+                    break
+                clock += timedelta(minutes=float(rng.exponential(90)))
+                repair_start = clock
+                clock += timedelta(minutes=float(rng.uniform(10, 120)))
+                events.append((sn, model, f"{station}_REPAIR", repair_start, clock, 'Pass', first_start))
+        return events
+
+    def generate(self, rows):
+        """Generate at least `rows` workstation events; returns the three report frames"""
+        workstation, testboard, snfn = [], [], []
+        models = self.rng.choice(self.models, size=max(rows // 10, 1), p=self.model_weights)
+        model_index = 0
+        while len(workstation) < rows:
+            if model_index >= len(models):
+                models = self.rng.choice(self.models, size=max(rows // 10, 1), p=self.model_weights)
+                model_index = 0
+            model = str(models[model_index])
+            model_index += 1
+            route = MODEL_ROUTES[model]
+            for sn, _, station, start_time, end_time, status, first_start in self.part_events(model):
+                operator = OPERATORS[int(self.rng.integers(len(OPERATORS)))]
+                workstation.append((
+                    sn, route["pn"], None, 'H', station, start_time, end_time,
+                    f"{start_time:%H:%M}-{end_time:%H:%M}", route["service_flow"], model, status,
+                    'automatic' if station in TEST_STATIONS else 'manual', operator, first_start,
+                    (end_time - first_start).days
+                ))
+                if station in TEST_STATIONS:
+                    fixture = self.fixtures[int(self.rng.integers(len(self.fixtures)))]
+                    code, description = ERROR_CODES[int(self.rng.integers(len(ERROR_CODES)))]
+                    failed = status == 'Fail'
+                    testboard.append((
+                        sn, route["pn"], model, route["service_flow"], str(int(sn) + 7000000000),
+                        'E3665', float(self.rng.integers(1, 200)), station, start_time, end_time, status,
+                        operator, description if failed else None, None, code if failed else None,
+                        f"618-2G510-0210-CMF-{35000 + len(testboard) % 999}", fixture
+                    ))
+                    if failed:
+                        snfn.append((station, fixture, code, description, model, sn, route["pn"],
+                                     start_time, end_time))
+        return (pd.DataFrame(workstation, columns=WORKSTATION_HEADERS),
+                pd.DataFrame(testboard, columns=TESTBOARD_HEADERS),
+                pd.DataFrame(snfn, columns=SNFN_HEADERS))
+
+
+def split_into_windows(df, window_days, overlap):
+    """Cut a report frame into [(window_start, window_end, frame)] by end time.
+
+    Each window also repeats `overlap` (0..1) of the previous window's rows,
+    the way consecutive portal exports overlap.
+    """
+    end_times = df['History station end time']
+    first = end_times.min().normalize()
+    window_index = ((end_times - first).dt.days // window_days).to_numpy()
+    windows = []
+    previous = None
+    for index in np.unique(window_index):
+        frame = df[window_index == index]
+        if previous is not None and overlap > 0:
+            frame = pd.concat([previous.sample(frac=overlap, random_state=int(index)), frame])
+        window_start = (first + timedelta(days=int(index) * window_days)).date()
+        windows.append((window_start, window_start + timedelta(days=window_days - 1), frame))
+        previous = df[window_index == index]
+    return windows
+
+def format_for_report(frame):
+    """Timestamps as the portal's text, like the real exports"""
+    frame = frame.copy()
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.strftime(TIME_FORMAT)
+    return frame
+
+def write_reports(reports, output_dir, file_format='xlsx', window_days=3, overlap=0.1):
+    """Write each report as windowed files under output_dir/<report>_xlsx/<Month_YYYY>/"""
+    written = {}
+    for report, df in reports.items():
+        if df.empty:
+            continue
+        folder, prefix = REPORT_DIRS[report]
+        paths = []
+        for window_start, window_end, frame in split_into_windows(df, window_days, overlap):
+            month_dir = os.path.join(output_dir, folder, window_start.strftime('%B_%Y'))
+            os.makedirs(month_dir, exist_ok=True)
+            name = f"{prefix}_{window_start:%m_%d_%Y}_to_{window_end:%m_%d_%Y}.{file_format}"
+            path = os.path.join(month_dir, name)
+            frame = format_for_report(frame)
+            if file_format == 'xlsx':
+                frame.to_excel(path, index=False)
+            else:
+                frame.to_csv(path, index=False)
+            paths.append(path)
+        written[report] = paths
+        print(f"  {report}: {len(df):,} rows in {len(paths)} {file_format} files")
+    return written
+
+def copy_rows(cur, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if value is None else value for value in row])
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+
+def load_into_postgres(reports, conn):
+    """COPY the generated rows straight into the master logs (no overlap duplicates)"""
+    create_workstation_table(conn)
+    create_testboard_table(conn)
+    create_snfn_table(conn)
+    # The aggregators read the generated date columns; cheap to add while the tables are empty
+    for table in MASTER_LOGS:
+        apply_date_columns(conn, table)
+
+    ws = reports["workstation"]
+    tb = reports["testboard"]
+    sf = reports["snfn"]
+    with conn.cursor() as cur:
+        copy_rows(cur, "workstation_master_log", [
+            'sn', 'pn', 'customer_pn', 'outbound_version', 'workstation_name',
+            'history_station_start_time', 'history_station_end_time', 'hours', 'service_flow', 'model',
+            'history_station_passing_status', 'passing_station_method', 'operator',
+            'first_station_start_time', 'data_source'
+        ], ((r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8], r[9], r[10], r[11], r[12], r[13], 'workstation')
+            for r in ws.itertuples(index=False)))
+        copy_rows(cur, "testboard_master_log", [
+            'sn', 'pn', 'model', 'work_station_process', 'baseboard_sn', 'baseboard_pn', 'workstation_name',
+            'history_station_start_time', 'history_station_end_time', 'history_station_passing_status',
+            'operator', 'failure_reasons', 'failure_note', 'failure_code', 'diag_version', 'fixture_no',
+            'data_source'
+        ], ((r[0], r[1], r[2], r[3], r[4], r[5], r[7], r[8], r[9], r[10], r[11], r[12], r[13], r[14], r[15], r[16], 'testboard')
+            for r in tb.itertuples(index=False)))
+        copy_rows(cur, "snfn_master_log", [
+            'workstation_name', 'fixture_no', 'error_code', 'error_disc', 'sn', 'pn',
+            'history_station_start_time', 'history_station_end_time', 'data_source'
+        ], ((r[0], r[1], r[2], r[3], r[5], r[6], r[7], r[8], 'snfn')
+            for r in sf.itertuples(index=False)))
+    conn.commit()
+    # COPY bypasses the loaders, so count the new history into part_state here
+    if not ensure_part_state(conn):
+        rebuild_part_state(conn)
+    print(f"  Copied {len(ws):,} workstation, {len(tb):,} testboard and {len(sf):,} snfn rows")
+
+def generate_synthetic_logs(rows, file_format='xlsx', output_dir=None, days=90, start=None,
+                            fail_rate=0.06, max_rework=2, limbo_rate=0.08, window_days=3,
+                            overlap=0.1, models=None, seed=42, db_config=None):
+    """Generate the reports and write them as files or into PostgreSQL"""
+    start = start or (date.today() - timedelta(days=days))
+    print(f"Generating ~{rows:,} workstation events from {start} over {days} days...")
+    t0 = time.perf_counter()
+    factory = SyntheticFactory(start, days, fail_rate=fail_rate, max_rework=max_rework,
+                               limbo_rate=limbo_rate, models=models, seed=seed)
+    workstation, testboard, snfn = factory.generate(rows)
+    reports = {"workstation": workstation, "testboard": testboard, "snfn": snfn}
+    print(f"Simulated {workstation['SN'].nunique():,} serials in {time.perf_counter() - t0:.1f}s")
+
+    if file_format == 'postgres':
+        conn = psycopg2.connect(**(db_config or DB_CONFIG))
+        try:
+            load_into_postgres(reports, conn)
+        finally:
+            conn.close()
+        return reports, None
+
+    written = write_reports(reports, output_dir, file_format, window_days, overlap)
+    return reports, written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic factory-log generator")
+    parser.add_argument('--rows', type=int, default=100000, help="Workstation events to generate (default: 100000)")
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'postgres'], default='xlsx',
+                        help="Write report files or COPY directly into PostgreSQL (default: xlsx)")
+    parser.add_argument('--output', default=os.path.join(ETL_DIR, "input", "synthetic"),
+                        help="Output directory for xlsx/csv reports")
+    parser.add_argument('--days', type=int, default=90, help="Days of history to spread events over (default: 90)")
+    parser.add_argument('--start', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help="First day (YYYY-MM-DD, default: today minus --days)")
+    parser.add_argument('--models', nargs='+', choices=sorted(MODEL_ROUTES), help="Models to simulate (default: all)")
+    parser.add_argument('--fail-rate', type=float, default=0.06, help="Failure probability at failing stations")
+    parser.add_argument('--max-rework', type=int, default=2, help="Maximum repair loops per station")
+    parser.add_argument('--limbo-rate', type=float, default=0.08, help="Share of parts that stop mid-route")
+    parser.add_argument('--window-days', type=int, default=3, help="Days per report file")
+    parser.add_argument('--overlap', type=float, default=0.1,
+                        help="Share of the previous window's rows repeated in each report file")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_synthetic_logs(
+        args.rows, file_format=args.format, output_dir=args.output, days=args.days, start=args.start,
+        fail_rate=args.fail_rate, max_rework=args.max_rework, limbo_rate=args.limbo_rate,
+        window_days=args.window_days, overlap=args.overlap, models=args.models, seed=args.seed
+    )
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the ETL pipeline.
+
+Creates a throwaway database per scale, fills it with synthetic reports and
+times the upload scripts, loaders and aggregators against it. Every stage
+result is appended to results/benchmark_results.jsonl and compared with the
+previous run of the same stage at the same scale, so a regression shows up as
+a slower line rather than as a slow morning.
+
+Excel parsing dominates the file stages long before 1M rows, so file stages
+run on at most --file-rows-limit rows; the database stages always run on the
+full scale (rows are COPY'd in directly).
+
+Usage:
+    python run_benchmarks.py                       # 100k, 1M, 10M
+    python run_benchmarks.py --scales 100000 --stages upload aggregate
+    python run_benchmarks.py --keep-db             # leave fox_bench_* databases for inspection
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+
+import psycopg2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ETL_DIR = os.path.dirname(BENCH_DIR)
+for path in (ETL_DIR, os.path.join(ETL_DIR, "loaders"),
+             os.path.join(ETL_DIR, "aggregators", "workstation_agg"),
+             os.path.join(ETL_DIR, "aggregators", "testboard_agg")):
+    sys.path.insert(0, path)
+
+import pipeline_metrics
+from generate_synthetic_logs import DB_CONFIG, SyntheticFactory, load_into_postgres, write_reports
+
+RESULTS_FILE = os.path.join(BENCH_DIR, "results", "benchmark_results.jsonl")
+DEFAULT_SCALES = [100000, 1000000, 10000000]
+
+# (stage, module, function); the DB settings of every loaded repo module are pointed at the benchmark database
+UPLOAD_STAGES = [
+    ("upload_workstation", "upload_workstation_master_log", "main"),
+    ("upload_testboard", "upload_testboard_master_log", "main"),
+    ("upload_snfn", "upload_snfn_master_log", "main"),
+]
+# Loaders take their file from the command line, like File_Monitor calls them
+LOADER_STAGES = [
+    ("loader_workstation", "import_workstation_file", "main"),
+    ("loader_testboard", "import_testboard_file", "main"),
+    ("loader_snfn", "import_snfn_file", "main"),
+]
+AGGREGATE_STAGES = [
+    ("tpy_columnar", "aggregate_tpy_columnar", "aggregate_tpy_columnar"),
+    ("tpy_weekly_all", "aggregate_tpy_all_time_weekly", "aggregate_weekly_tpy_metrics_all_time"),
+    ("tpy_daily_all", "aggregate_tpy_all_time_daily", "aggregate_daily_tpy_metrics_all_time"),
+    ("packing_daily", "aggregate_packing_daily_dedup", "main"),
+    ("packing_weekly", "aggregate_packing_weekly_all_time_dedup", "main"),
+    ("sort_test_all_time", "aggregate_sort_test_all_time", "main"),
+    ("station_hourly_counts", "aggregate_station_hourly_counts", "aggregate_station_hourly_counts"),
+    ("testboard_station_performance", "aggregate_all_time_dedup", "main"),
+    ("fixture_performance", "aggregate_fixture_performance_all_time", "main"),
+]
+# The per-day/per-week SQL paths issue several queries per period; above this
+# they take hours and are skipped (the columnar engine covers the same output)
+SLOW_STAGES = {"tpy_daily_all": 1000000, "tpy_weekly_all": 1000000}
+
+REPORT_FOLDERS = {
+    "workstation": "workstationreport_xlsx",
+    "testboard": "testboardrecord_xlsx",
+    "snfn": "snfnrecord_xlsx",
+}
+
+
+def admin_connection():
+    conn = psycopg2.connect(**{**DB_CONFIG, 'database': 'postgres'})
+    conn.autocommit = True
+    return conn
+
+def create_bench_database(name):
+    conn = admin_connection()
+    with conn.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        cur.execute(f'CREATE DATABASE "{name}"')
+    conn.close()
+    bench_config = {**DB_CONFIG, 'database': name}
+    conn = psycopg2.connect(**bench_config)
+    with conn.cursor() as cur, open(os.path.join(ETL_DIR, "aggregators", "workstation_agg", "create_tpy_tables.sql")) as f:
+        cur.execute(f.read())
+    conn.commit()
+    conn.close()
+    return bench_config
+
+def drop_bench_database(name):
+    conn = admin_connection()
+    with conn.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+    conn.close()
+
+def point_module_at(module, bench_config):
+    """Redirect a script module's DB settings to the benchmark database.
+
+    Scripts either keep a module-level DB_CONFIG (shared with anything that
+    imported it) or a connect_to_db() with the settings inline; both are covered.
+    """
+    if isinstance(getattr(module, "DB_CONFIG", None), dict):
+        module.DB_CONFIG.update(bench_config)
+    if hasattr(module, "connect_to_db"):
+        module.connect_to_db = lambda: psycopg2.connect(**bench_config)
+    if hasattr(module, "get_db_connection"):
+        module.get_db_connection = lambda: psycopg2.connect(**bench_config)
+
+def point_etl_modules_at(bench_config):
+    """point_module_at every loaded module from this repo.
+
+    A stage script's helpers (tpy_routes, summary_views, snapshots,
+    pipeline_metrics, ...) open their own connections from their own
+    DB_CONFIG, so redirecting only the script would leave them on fox_db.
+    Called after each stage's import, when its helpers are loaded too.
+    """
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path and os.path.abspath(path).startswith(ETL_DIR + os.sep) and module is not sys.modules[__name__]:
+            point_module_at(module, bench_config)
+
+def table_counts(bench_config):
+    conn = psycopg2.connect(**bench_config)
+    counts = {}
+    with conn.cursor() as cur:
+        for table in ("workstation_master_log", "testboard_master_log", "snfn_master_log"):
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cur.fetchone()[0]
+    conn.close()
+    return counts
+
+def run_stage(stage, func, args, verbose=False):
+    """Call one pipeline entry point and return its result record"""
+    output = io.StringIO()
+    started = time.perf_counter()
+    error = None
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            func(*args)
+    except SystemExit as e:
+        if e.code:
+            error = f"exited with {e.code}: {output.getvalue().strip().splitlines()[-1:]}"
+    except Exception:
+        error = traceback.format_exc(limit=3).strip().splitlines()[-1]
+    seconds = time.perf_counter() - started
+    return {"stage": stage, "seconds": round(seconds, 3), "error": error}
+
+def with_argv(main, script):
+    """Wrap a script main() that reads its file from sys.argv"""
+    def run(path):
+        saved = sys.argv
+        sys.argv = [script, path]
+        try:
+            main()
+        finally:
+            sys.argv = saved
+    return run
+
+def reset_master_logs(bench_config):
+    conn = psycopg2.connect(**bench_config)
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE workstation_master_log, testboard_master_log, snfn_master_log RESTART IDENTITY")
+        # The loaders add to part_state; start it over with the history
+        cur.execute("SELECT to_regclass('part_state') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("TRUNCATE part_state")
+    conn.commit()
+    conn.close()
+
+def copy_reports_for_loader(written, report, work_dir):
+    """Loaders delete what they import, so hand them copies"""
+    copies = []
+    for path in written.get(report, []):
+        target = os.path.join(work_dir, "loader_input", report, os.path.basename(path))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy(path, target)
+        copies.append(target)
+    return copies
+
+def run_scale(rows, stages, args):
+    """Run every selected stage at one scale; returns the result records"""
+    db_name = f"fox_bench_{rows}"
+    print(f"\n{'=' * 60}\nSCALE: {rows:,} workstation rows (database {db_name})\n{'=' * 60}")
+    bench_config = create_bench_database(db_name)
+    work_dir = tempfile.mkdtemp(prefix=f"fox_bench_{rows}_")
+    previous_dir = os.getcwd()
+    # Upload scripts and loaders write debug logs next to wherever they run
+    os.chdir(work_dir)
+    # Stage spans from the pipeline itself land in the benchmark database, not fox_db
+    point_etl_modules_at(bench_config)
+    pipeline_metrics.METRICS_FILE = os.path.join(work_dir, "pipeline_metrics.jsonl")
+    results = []
+
+    def record(result, **extra):
+        result.update(extra)
+        status = f"FAILED: {result['error']}" if result["error"] else f"{result['seconds']:.2f}s"
+        print(f"  {result['stage']:<32} {status}")
+        results.append(result)
+
+    try:
+        t0 = time.perf_counter()
+        factory = SyntheticFactory(datetime.strptime(args.start, '%Y-%m-%d').date(), args.days, seed=args.seed)
+        workstation, testboard, snfn = factory.generate(rows)
+        reports = {"workstation": workstation, "testboard": testboard, "snfn": snfn}
+        record({"stage": "generate", "seconds": round(time.perf_counter() - t0, 3), "error": None},
+               rows_out=len(workstation))
+
+        file_rows = min(rows, args.file_rows_limit)
+        written = {}
+        if {"upload", "loader"} & set(stages):
+            file_reports = {
+                name: df[df["SN"].isin(set(workstation["SN"].iloc[:file_rows]))]
+                for name, df in reports.items()
+            }
+            t0 = time.perf_counter()
+            written = write_reports(file_reports, os.path.join(work_dir, "data log"), 'xlsx',
+                                    args.window_days, args.overlap)
+            record({"stage": "write_xlsx", "seconds": round(time.perf_counter() - t0, 3), "error": None},
+                   rows_in=file_rows)
+
+        if "upload" in stages:
+            for stage, module_name, func_name in UPLOAD_STAGES:
+                module = importlib.import_module(module_name)
+                point_etl_modules_at(bench_config)
+                report = stage.split("_", 1)[1]
+                input_dir = os.path.join(work_dir, "data log", REPORT_FOLDERS[report])
+                record(run_stage(stage, getattr(module, func_name), (input_dir,), args.verbose),
+                       rows_in=len(file_reports[report]))
+            print(f"  rows after upload: {table_counts(bench_config)}")
+
+        if "loader" in stages:
+            reset_master_logs(bench_config)
+            for stage, module_name, func_name in LOADER_STAGES:
+                module = importlib.import_module(module_name)
+                point_etl_modules_at(bench_config)
+                report = stage.split("_", 1)[1]
+                paths = copy_reports_for_loader(written, report, work_dir)
+                started = time.perf_counter()
+                loader = with_argv(getattr(module, func_name), f"{module_name}.py")
+                errors = [run_stage(stage, loader, (path,), args.verbose)["error"]
+                          for path in paths]
+                errors = [e for e in errors if e]
+                record({"stage": stage, "seconds": round(time.perf_counter() - started, 3),
+                        "error": errors[0] if errors else None},
+                       rows_in=len(file_reports[report]), files=len(paths))
+
+        if "load" in stages or "aggregate" in stages:
+            reset_master_logs(bench_config)
+            conn = psycopg2.connect(**bench_config)
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                load_into_postgres(reports, conn)
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE")
+            conn.commit()
+            conn.close()
+            record({"stage": "copy_load", "seconds": round(time.perf_counter() - t0, 3), "error": None},
+                   rows_in=len(workstation) + len(testboard) + len(snfn))
+
+        if "aggregate" in stages:
+            for stage, module_name, func_name in AGGREGATE_STAGES:
+                if rows > SLOW_STAGES.get(stage, rows):
+                    print(f"  {stage:<32} skipped above {SLOW_STAGES[stage]:,} rows")
+                    continue
+                module = importlib.import_module(module_name)
+                point_etl_modules_at(bench_config)
+                record(run_stage(stage, getattr(module, func_name), (), args.verbose),
+                       rows_in=rows)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.keep_db:
+            drop_bench_database(db_name)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ETL_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_previous_results():
+    """Latest recorded result per (stage, scale)"""
+    previous = {}
+    if not os.path.exists(RESULTS_FILE):
+        return previous
+    with open(RESULTS_FILE) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            result = json.loads(line)
+            if not result.get("error"):
+                previous[(result["stage"], result["scale"])] = result
+    return previous
+
+def save_results(results):
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+def print_comparison(results, previous, threshold):
+    print(f"\n{'=' * 60}\nCOMPARISON WITH PREVIOUS RUN\n{'=' * 60}")
+    print(f"{'Stage':<32} {'Scale':>10} {'Now':>9} {'Before':>9} {'Change':>8}")
+    print("-" * 72)
+    regressions = 0
+    for result in results:
+        before = previous.get((result["stage"], result["scale"]))
+        now = "FAILED" if result["error"] else f"{result['seconds']:.2f}s"
+        if before is None or result["error"]:
+            print(f"{result['stage']:<32} {result['scale']:>10,} {now:>9} {'-':>9} {'-':>8}")
+            continue
+        change = (result["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  <-- slower"
+            regressions += 1
+        print(f"{result['stage']:<32} {result['scale']:>10,} {now:>9} {before['seconds']:>8.2f}s {change:>+7.1f}%{flag}")
+    if regressions:
+        print(f"\n{regressions} stage(s) more than {threshold:.0f}% slower than the previous run")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ETL pipeline on synthetic factory logs")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help="Workstation row counts to run (default: 100000 1000000 10000000)")
+    parser.add_argument('--stages', nargs='+', choices=['upload', 'loader', 'load', 'aggregate'],
+                        default=['upload', 'loader', 'load', 'aggregate'])
+    parser.add_argument('--file-rows-limit', type=int, default=100000,
+                        help="Maximum workstation rows written to xlsx for the file stages (default: 100000)")
+    parser.add_argument('--start', default='2025-01-06', help="First synthetic day (default: 2025-01-06)")
+    parser.add_argument('--days', type=int, default=90, help="Days of synthetic history (default: 90)")
+    parser.add_argument('--window-days', type=int, default=3, help="Days per report file")
+    parser.add_argument('--overlap', type=float, default=0.1, help="Report window overlap")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--regression-threshold', type=float, default=20.0,
+                        help="Percent slowdown flagged against the previous run (default: 20)")
+    parser.add_argument('--keep-db', action='store_true', help="Keep the fox_bench_* databases")
+    parser.add_argument('--no-save', action='store_true', help="Do not append to the results file")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    previous = load_previous_results()
+    run_info = {
+        "run_at": datetime.now().isoformat(timespec='seconds'),
+        "revision": git_revision(),
+        "host": socket.gethostname(),
+    }
+    all_results = []
+    for scale in args.scales:
+        for result in run_scale(scale, args.stages, args):
+            all_results.append({**run_info, "scale": scale, **result})
+
+    if not args.no_save:
+        save_results(all_results)
+        print(f"\nResults appended to {RESULTS_FILE}")
+    regressions = print_comparison(all_results, previous, args.regression_threshold)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Stored generated date columns on the master logs.
+
+The aggregators group by DATE(history_station_end_time), EXTRACT(HOUR ...)
+and the weekend fold (Saturday and Sunday count toward Friday). That costs a
+function call per row on every run, and those expressions can't use an index
+on history_station_end_time. Each master log gets three columns, computed
+once by PostgreSQL when a row is written:
+
+    end_date      history_station_end_time::date
+    end_hour      hour of history_station_end_time (0-23)
+    factory_date  end_date with Saturday/Sunday folded back to Friday
+
+They are indexed as (end_date, end_hour) and (factory_date). The writers
+list their insert columns, so they don't need to change. Copies between
+tables (partitions.py, dimensions.py) skip generated columns and let the
+target recompute them.
+
+Adding them rewrites the whole table under an exclusive lock, so it is a
+migration step of its own: --apply, run once per deployment while the
+loaders are stopped. The indexes are then built CONCURRENTLY (not possible
+on a partitioned parent, which is indexed in the usual way). In star mode
+the columns go on the fact table and the view is extended; on a partitioned
+table they are added to the parent and every partition.
+
+Readers (the aggregators, read_api, summary_views, indexes.py) never alter
+the table: they call require_date_columns(), which fails with a pointer to
+--apply if the columns are missing.
+
+Usage:
+    python date_columns.py --status
+    python date_columns.py --apply                      # all master logs
+    python date_columns.py --apply testboard_master_log
+"""
+import argparse
+import time
+
+import psycopg2
+
+from dimensions import DB_CONFIG, fact_table, is_star, table_columns, view_sql
+from summary_views import relation_kind
+
+MASTER_LOGS = ("workstation_master_log", "testboard_master_log", "snfn_master_log")
+
+# name, type, expression; expressions must be IMMUTABLE (they are, on timestamp without time zone)
+DATE_COLUMNS = (
+    ("end_date", "date", "history_station_end_time::date"),
+    ("end_hour", "smallint", "EXTRACT(HOUR FROM history_station_end_time)::smallint"),
+    ("factory_date", "date", """history_station_end_time::date - CASE EXTRACT(DOW FROM history_station_end_time)
+        WHEN 6 THEN 1  -- Saturday to Friday
+        WHEN 0 THEN 2  -- Sunday to Friday
+        ELSE 0 END"""),
+)
+
+DATE_INDEXES = (
+    "CREATE INDEX {concurrently}IF NOT EXISTS {storage}_end_date_hour_idx ON {storage} (end_date, end_hour)",
+    "CREATE INDEX {concurrently}IF NOT EXISTS {storage}_factory_date_idx ON {storage} (factory_date)",
+)
+
+
+def missing_date_columns(cur, relation):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (relation,))
+    present = {row[0] for row in cur.fetchall()}
+    return [column for column in DATE_COLUMNS if column[0] not in present]
+
+def require_date_columns(conn, table):
+    """Raise unless the generated date columns are there; only reads the catalog"""
+    with conn.cursor() as cur:
+        if relation_kind(cur, table) is None:
+            return
+        missing = missing_date_columns(cur, table)
+    conn.commit()
+    if missing:
+        raise RuntimeError(f"{table} has no {', '.join(c[0] for c in missing)} column(s) yet; "
+                           f"run 'python date_columns.py --apply {table}' first (it rewrites the table)")
+
+def apply_date_columns(conn, table):
+    """Add the generated date columns and their indexes; returns True if anything was added.
+
+    The ALTER TABLE rewrites the table under an ACCESS EXCLUSIVE lock and is
+    committed on its own, before the indexes are built.
+    """
+    star = is_star(conn, table)
+    storage = fact_table(table) if star else table
+    with conn.cursor() as cur:
+        kind = relation_kind(cur, storage)
+        if kind not in ('r', 'p'):
+            return False
+        missing = missing_date_columns(cur, storage)
+        if missing:
+            started = time.perf_counter()
+            additions = ", ".join(
+                f"ADD COLUMN IF NOT EXISTS {name} {type_name} GENERATED ALWAYS AS ({expression}) STORED"
+                for name, type_name, expression in missing
+            )
+            cur.execute(f"ALTER TABLE {storage} {additions}")
+            print(f"Added {', '.join(c[0] for c in missing)} to {storage} in {time.perf_counter() - started:.2f}s")
+        # The star view lists its columns; new ones are appended (CREATE OR REPLACE VIEW allows that)
+        view_missing = missing_date_columns(cur, table) if star else []
+        if view_missing:
+            columns = table_columns(cur, table) + [(name, type_name, False, None) for name, type_name, _ in view_missing]
+            cur.execute(f"CREATE OR REPLACE VIEW {table} AS {view_sql(table, columns)}")
+    conn.commit()
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, nor on a partitioned parent
+    concurrently = "" if kind == 'p' else "CONCURRENTLY "
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for statement in DATE_INDEXES:
+                cur.execute(statement.format(storage=storage, concurrently=concurrently))
+            if missing:
+                cur.execute(f"ANALYZE {storage}")
+    finally:
+        conn.autocommit = False
+    return bool(missing or view_missing)
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        print(f"{'Master log':<26} {'Date columns':<14} Indexes")
+        print("-" * 80)
+        for table in MASTER_LOGS:
+            storage = fact_table(table) if is_star(conn, table) else table
+            if relation_kind(cur, storage) is None:
+                print(f"{table:<26} {'missing':<14}")
+                continue
+            missing = missing_date_columns(cur, storage)
+            state = "present" if not missing else f"{len(DATE_COLUMNS) - len(missing)}/{len(DATE_COLUMNS)}"
+            cur.execute("""
+                SELECT indexname FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = %s
+                  AND (indexname LIKE '%%end_date_hour_idx' OR indexname LIKE '%%factory_date_idx')
+                ORDER BY indexname
+            """, (storage,))
+            print(f"{table:<26} {state:<14} {', '.join(row[0] for row in cur.fetchall()) or '-'}")
+    conn.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generated end_date / end_hour / factory_date columns on the master logs")
+    parser.add_argument('--apply', nargs='*', metavar='TABLE', help="Add the columns and indexes (default: all master logs)")
+    parser.add_argument('--status', action='store_true', help="Show which master logs have the columns")
+    args = parser.parse_args()
+
+    unknown = set(args.apply or []) - set(MASTER_LOGS)
+    if unknown:
+        parser.error(f"unknown master log: {', '.join(sorted(unknown))} (expected {', '.join(MASTER_LOGS)})")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.apply is not None:
+            for table in args.apply or MASTER_LOGS:
+                if not apply_date_columns(conn, table):
+                    print(f"{table}: nothing to add")
+        if args.status or args.apply is None:
+            print_status(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Star-schema mode for the workstation and testboard master logs.
+
+The master logs repeat a few hundred distinct model / station / operator /
+part number strings on every row as VARCHAR(255). Enabling star mode moves a
+master log's rows into <table>_fact, which stores those columns as
+SMALLINT/INTEGER keys into shared dim_* tables (dim_pn holds pn,
+customer_pn and baseboard_pn alike). A view with the old table name joins
+the keys back to text, so the aggregators, dashboards and read_api keep
+querying workstation_master_log / testboard_master_log unchanged. The old
+table is kept as <table>_legacy, as summary_views.py does.
+
+Writers check is_star() and insert into the fact table with insert_facts(),
+which resolves keys through an in-process DimensionCache. Only values not
+seen yet cost a round trip, and those are inserted in bulk. async_ingest
+resolves keys in SQL from its COPY staging table instead (star_merge_sql).
+
+Usage:
+    python dimensions.py --status
+    python dimensions.py --enable                       # both master logs
+    python dimensions.py --enable testboard_master_log
+    python dimensions.py --disable workstation_master_log
+"""
+import argparse
+import re
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from row_hash import ensure_row_hash_column
+from summary_views import SUMMARY_VIEWS, disable_view, enable_view, relation_kind
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+# Dimension table -> key type; a few hundred values each today, pn/operator/failure_code can grow
+DIMENSIONS = {
+    "dim_pn": "INTEGER",
+    "dim_model": "SMALLINT",
+    "dim_workstation": "SMALLINT",
+    "dim_process": "SMALLINT",
+    "dim_service_flow": "SMALLINT",
+    "dim_passing_status": "SMALLINT",
+    "dim_passing_method": "SMALLINT",
+    "dim_operator": "INTEGER",
+    "dim_outbound_version": "SMALLINT",
+    "dim_failure_code": "INTEGER",
+    "dim_diag_version": "SMALLINT",
+    "dim_fixture": "SMALLINT",
+    "dim_data_source": "SMALLINT",
+}
+
+# Master log column -> dimension; in the fact table the column becomes <column>_id
+FACT_DIMENSIONS = {
+    "workstation_master_log": {
+        "pn": "dim_pn",
+        "customer_pn": "dim_pn",
+        "model": "dim_model",
+        "workstation_name": "dim_workstation",
+        "service_flow": "dim_service_flow",
+        "history_station_passing_status": "dim_passing_status",
+        "passing_station_method": "dim_passing_method",
+        "operator": "dim_operator",
+        "outbound_version": "dim_outbound_version",
+        "data_source": "dim_data_source",
+    },
+    "testboard_master_log": {
+        "pn": "dim_pn",
+        "baseboard_pn": "dim_pn",
+        "model": "dim_model",
+        "work_station_process": "dim_process",
+        "workstation_name": "dim_workstation",
+        "history_station_passing_status": "dim_passing_status",
+        "operator": "dim_operator",
+        "failure_code": "dim_failure_code",
+        "diag_version": "dim_diag_version",
+        "fixture_no": "dim_fixture",
+        "data_source": "dim_data_source",
+    },
+}
+
+IS_STAR_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND c.relname = $1 AND c.relkind = 'v'
+) AND to_regclass($1 || '_fact') IS NOT NULL
+"""
+
+
+def fact_table(table):
+    return f"{table}_fact"
+
+def is_star(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(IS_STAR_SQL.replace("$1", "%s"), (table, table))
+        return cur.fetchone()[0]
+
+def fact_columns(table, columns):
+    """Master log column names -> fact table column names"""
+    dims = FACT_DIMENSIONS[table]
+    return [f"{c}_id" if c in dims else c for c in columns]
+
+def create_dimensions(cur):
+    for dim, key_type in DIMENSIONS.items():
+        serial = "SMALLSERIAL" if key_type == "SMALLINT" else "SERIAL"
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {dim} (
+                id {serial} PRIMARY KEY,
+                value VARCHAR(255) NOT NULL UNIQUE
+            )
+        """)
+
+
+class DimensionCache:
+    """value -> key per dimension, filled on demand and kept for the life of the process"""
+
+    def __init__(self):
+        self.keys = {dim: {} for dim in DIMENSIONS}
+
+    def resolve(self, cur, dim, values):
+        """Make sure every non-NULL value has a key; returns the dimension's value -> key dict.
+
+        Misses are inserted in one statement and committed straight away, so
+        a cached key never points at a row a later rollback removed. Callers
+        must not have uncommitted work on the connection.
+        """
+        keys = self.keys[dim]
+        misses = {v for v in values if v is not None and v not in keys}
+        if misses:
+            execute_values(cur, f"INSERT INTO {dim} (value) VALUES %s ON CONFLICT (value) DO NOTHING",
+                           [(v,) for v in misses])
+            cur.execute(f"SELECT value, id FROM {dim} WHERE value = ANY(%s)", (list(misses),))
+            keys.update(cur.fetchall())
+            cur.connection.commit()
+        return keys
+
+_cache = DimensionCache()
+
+def insert_facts(cur, table, columns, rows, page_size=1000, wrap=None):
+    """execute_values into <table>_fact, rows given in master log column order.
+
+    Duplicates are skipped by the fact table's copy of the unique constraint
+    (ON CONFLICT DO NOTHING), as the writers do on the flat tables. wrap, if
+    given, rewrites the INSERT statement (part_state.state_wrapper).
+    """
+    rows = [list(row) for row in rows]
+    for i, column in enumerate(columns):
+        dim = FACT_DIMENSIONS[table].get(column)
+        if dim is None:
+            continue
+        keys = _cache.resolve(cur, dim, {row[i] for row in rows})
+        for row in rows:
+            if row[i] is not None:
+                row[i] = keys[row[i]]
+    insert_sql = f"""
+        INSERT INTO {fact_table(table)} ({', '.join(fact_columns(table, columns))}) VALUES %s
+        ON CONFLICT DO NOTHING
+    """
+    execute_values(cur, wrap(insert_sql) if wrap else insert_sql, rows, page_size=page_size)
+
+def star_merge_sql(table, columns, staging, wrap=None):
+    """Statements moving a staging table (master log columns) into the fact table, resolving keys in SQL.
+
+    The last statement is the INSERT; it skips rows whose row_hash is
+    already loaded, like async_ingest does for the flat tables. wrap, if
+    given, rewrites it (part_state.state_wrapper).
+    """
+    dims = FACT_DIMENSIONS[table]
+    statements = [
+        f"INSERT INTO {dims[c]} (value) SELECT DISTINCT {c} FROM {staging} WHERE {c} IS NOT NULL ON CONFLICT (value) DO NOTHING"
+        for c in columns if c in dims
+    ]
+    select = ", ".join(f"d_{c}.id" if c in dims else f"s.{c}" for c in columns)
+    joins = " ".join(f"LEFT JOIN {dims[c]} d_{c} ON d_{c}.value = s.{c}" for c in columns if c in dims)
+    merge = f"""
+        INSERT INTO {fact_table(table)} ({', '.join(fact_columns(table, columns))})
+        SELECT {select} FROM {staging} s {joins}
+        WHERE NOT EXISTS (SELECT 1 FROM {fact_table(table)} t WHERE t.row_hash = s.row_hash)
+        ON CONFLICT DO NOTHING
+    """
+    statements.append(wrap(merge) if wrap else merge)
+    return statements
+
+def table_columns(cur, table):
+    """[(name, type, not null, default)] in column order"""
+    cur.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull, pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, (table,))
+    return cur.fetchall()
+
+def generated_columns(cur, table):
+    """{name: expression} of the stored generated columns, which writers never insert into"""
+    cur.execute("""
+        SELECT a.attname, pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_attribute a
+        JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = %s::regclass AND a.attgenerated = 's' AND NOT a.attisdropped
+    """, (table,))
+    return dict(cur.fetchall())
+
+def dependent_views(cur, relation):
+    """Views and materialized views reading the relation directly"""
+    cur.execute("""
+        SELECT DISTINCT c.relname FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class c ON c.oid = r.ev_class
+        WHERE d.refobjid = %s::regclass AND c.relname <> %s
+    """, (relation, relation))
+    return sorted(row[0] for row in cur.fetchall())
+
+def suspend_summary_views(conn, table):
+    """Turn off materialized summaries built on the table; returns their names for resume_summary_views"""
+    with conn.cursor() as cur:
+        views = dependent_views(cur, table)
+    unknown = [v for v in views if v not in SUMMARY_VIEWS]
+    if unknown:
+        raise RuntimeError(f"{table} is used by {', '.join(unknown)}; drop them first")
+    for name in views:
+        disable_view(conn, name)
+    return views
+
+def resume_summary_views(conn, views):
+    for name in views:
+        enable_view(conn, name)
+
+def view_sql(table, columns):
+    """SELECT giving the fact table the master log's columns, names and types"""
+    dims = FACT_DIMENSIONS[table]
+    select = []
+    for name, type_name, _, _ in columns:
+        select.append(f"d_{name}.value::{type_name} AS {name}" if name in dims else f"f.{name}")
+    joins = "\n".join(f"LEFT JOIN {dims[c]} d_{c} ON d_{c}.id = f.{c}_id" for c, *_ in columns if c in dims)
+    return f"SELECT {', '.join(select)}\nFROM {fact_table(table)} f\n{joins}"
+
+def enable_star(conn, table):
+    """Move a master log into <table>_fact + dimensions behind a view of the same name"""
+    dims = FACT_DIMENSIONS[table]
+    with conn.cursor() as cur:
+        kind = relation_kind(cur, table)
+        if kind == 'v':
+            print(f"{table} is already in star mode")
+            return
+        if kind == 'p':
+            print(f"{table} is partitioned; switch to star mode before partitioning (partitions.py then partitions the fact table)")
+            return
+        if kind != 'r':
+            print(f"{table} does not exist; run its upload script first")
+            return
+        ensure_row_hash_column(cur, table)
+    conn.commit()
+    summaries = suspend_summary_views(conn, table)
+
+    started = time.perf_counter()
+    fact = fact_table(table)
+    with conn.cursor() as cur:
+        create_dimensions(cur)
+        for column, dim in dims.items():
+            cur.execute(f"INSERT INTO {dim} (value) SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL ON CONFLICT (value) DO NOTHING")
+
+        columns = table_columns(cur, table)
+        generated = generated_columns(cur, table)
+        definitions = []
+        for name, type_name, not_null, default in columns:
+            if name in generated:
+                definition = f"{name} {type_name} GENERATED ALWAYS AS ({generated[name]}) STORED"
+            elif name in dims:
+                definition = f"{name}_id {DIMENSIONS[dims[name]]} REFERENCES {dims[name]} (id)"
+            else:
+                definition = f"{name} {type_name}" + (f" DEFAULT {default}" if default else "")
+            definitions.append(definition + (" NOT NULL" if not_null else ""))
+        cur.execute(f"DROP TABLE IF EXISTS {fact}")
+        cur.execute(f"CREATE TABLE {fact} ({', '.join(definitions)}, PRIMARY KEY (id))")
+
+        names = [c[0] for c in columns if c[0] not in generated]
+        select = ", ".join(f"d_{c}.id" if c in dims else f"t.{c}" for c in names)
+        joins = " ".join(f"LEFT JOIN {dims[c]} d_{c} ON d_{c}.value = t.{c}" for c in names if c in dims)
+        cur.execute(f"INSERT INTO {fact} ({', '.join(fact_columns(table, names))}) SELECT {select} FROM {table} t {joins}")
+        rows = cur.rowcount
+
+        # Secondary indexes and unique constraints carry over under the same names, on the key columns
+        cur.execute("""
+            SELECT i.relname, pg_get_indexdef(x.indexrelid), con.conname
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            LEFT JOIN pg_constraint con ON con.conindid = x.indexrelid AND con.contype = 'u'
+            WHERE x.indrelid = %s::regclass AND NOT x.indisprimary
+        """, (table,))
+        for index, definition, constraint in cur.fetchall():
+            head, _, tail = definition.partition(" USING ")
+            for column in dims:
+                tail = re.sub(rf"\b{column}\b", f"{column}_id", tail)
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index}_legacy")
+            if constraint:
+                columns_sql = tail[tail.index("("):]
+                cur.execute(f"ALTER TABLE {fact} ADD CONSTRAINT {constraint} UNIQUE {columns_sql}")
+            else:
+                head = re.sub(rf" ON (\w+\.)?{table}$", f" ON {fact}", head)
+                cur.execute(f"{head} USING {tail}")
+
+        cur.execute(f"DROP TABLE IF EXISTS {table}_legacy")
+        cur.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        cur.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY {fact}.id")
+        cur.execute(f"CREATE VIEW {table} AS {view_sql(table, columns)}")
+        # The planner needs dimension statistics to estimate filters on the view's text columns
+        for dim in set(dims.values()):
+            cur.execute(f"ANALYZE {dim}")
+        cur.execute(f"ANALYZE {fact}")
+    conn.commit()
+    print(f"Moved {rows:,} rows of {table} into {fact} in {time.perf_counter() - started:.2f}s (old table kept as {table}_legacy)")
+    resume_summary_views(conn, summaries)
+
+def disable_star(conn, table):
+    """Back to a flat table: the legacy table is refilled from the view, fact table dropped"""
+    fact = fact_table(table)
+    with conn.cursor() as cur:
+        if relation_kind(cur, table) != 'v':
+            print(f"{table} is not in star mode")
+            return
+        if relation_kind(cur, f"{table}_legacy") != 'r':
+            print(f"{table}_legacy is missing; leaving {table} in star mode")
+            return
+    summaries = suspend_summary_views(conn, table)
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        generated = generated_columns(cur, f"{table}_legacy")
+        legacy_columns = [c[0] for c in table_columns(cur, f"{table}_legacy") if c[0] not in generated]
+        column_list = ", ".join(legacy_columns)
+        cur.execute(f"TRUNCATE {table}_legacy")
+        cur.execute(f"INSERT INTO {table}_legacy ({column_list}) SELECT {column_list} FROM {table}")
+        rows = cur.rowcount
+        cur.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY {table}_legacy.id")
+        cur.execute(f"DROP VIEW {table}")
+        cur.execute(f"DROP TABLE {fact}")
+        cur.execute(f"ALTER TABLE {table}_legacy RENAME TO {table}")
+        cur.execute("""
+            SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = %s::regclass AND i.relname LIKE '%%\\_legacy'
+        """, (table,))
+        for (index,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index[:-len('_legacy')]}")
+        cur.execute(f"ANALYZE {table}")
+    conn.commit()
+    print(f"Restored {table} as a table ({rows:,} rows) in {time.perf_counter() - started:.2f}s")
+    resume_summary_views(conn, summaries)
+
+def relation_size(cur, relation):
+    """Total size including indexes, summed over partitions if it has any"""
+    cur.execute("""
+        SELECT COALESCE(SUM(pg_total_relation_size(relid)), pg_total_relation_size(%s::regclass))
+        FROM pg_partition_tree(%s::regclass)
+    """, (relation, relation))
+    return cur.fetchone()[0]
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        print(f"{'Master log':<26} {'Mode':<8} {'Rows':>10} {'Size':>10} {'Flat size':>10}")
+        print("-" * 68)
+        for table in FACT_DIMENSIONS:
+            kind = relation_kind(cur, table)
+            mode = {'v': 'star', 'r': 'flat', 'p': 'flat', None: 'missing'}.get(kind, kind)
+            rows = size = flat = "-"
+            if kind:
+                cur.execute(f"SELECT COUNT(*) FROM {table}")
+                rows = f"{cur.fetchone()[0]:,}"
+            if kind == 'v':
+                size = f"{relation_size(cur, fact_table(table)) / 2**20:,.1f} MB"
+                if relation_kind(cur, f"{table}_legacy") == 'r':
+                    flat = f"{relation_size(cur, f'{table}_legacy') / 2**20:,.1f} MB"
+            elif kind in ('r', 'p'):
+                size = flat = f"{relation_size(cur, table) / 2**20:,.1f} MB"
+            print(f"{table:<26} {mode:<8} {rows:>10} {size:>10} {flat:>10}")
+        print()
+        for dim in DIMENSIONS:
+            if relation_kind(cur, dim) == 'r':
+                cur.execute(f"SELECT COUNT(*) FROM {dim}")
+                print(f"  {dim:<24} {cur.fetchone()[0]:>8,} values")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Star-schema mode for the master logs")
+    parser.add_argument('--enable', nargs='*', metavar='TABLE', help="Move master logs to fact + dimension tables (default: both)")
+    parser.add_argument('--disable', nargs='*', metavar='TABLE', help="Move master logs back to flat tables (default: both)")
+    parser.add_argument('--status', action='store_true', help="Show mode and size of each master log")
+    args = parser.parse_args()
+
+    for names in (args.enable, args.disable):
+        unknown = set(names or []) - set(FACT_DIMENSIONS)
+        if unknown:
+            parser.error(f"unknown master log: {', '.join(sorted(unknown))} (expected {', '.join(FACT_DIMENSIONS)})")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.enable is not None:
+            for table in args.enable or FACT_DIMENSIONS:
+                enable_star(conn, table)
+        if args.disable is not None:
+            for table in args.disable or FACT_DIMENSIONS:
+                disable_star(conn, table)
+        if args.status or (args.enable is None and args.disable is None):
+            print_status(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+The factory calendar: one row per day with its ISO week, the weekend fold,
+shift boundaries and a holiday flag.
+
+Week ids ('2025-W23') used to be worked out in three places that did not
+agree: isocalendar() in the daily TPY aggregator, a Jan 4th calculation in
+the weekly one, and EXTRACT(YEAR)/EXTRACT(WEEK) in get_all_available_weeks.
+The last one puts 2024-12-30 in '2024-W01' instead of '2025-W01'. The
+Python helpers here and the factory_calendar table use the same ISO rules
+(isocalendar / to_char IYYY-IW). SQL joins to the table by day; Python
+calls week_id() / week_range().
+
+factory_date is the weekend rule: Saturday and Sunday count toward Friday.
+It is the same rule as the master logs' factory_date column
+(date_columns.py), which the packing and sort test aggregators group by.
+
+Shifts are DAY_SHIFT_START-NIGHT_SHIFT_START (day) and
+NIGHT_SHIFT_START-DAY_SHIFT_START the next morning (night).
+
+ensure_calendar() creates the table and fills it from CALENDAR_START (or
+an earlier day it is given, such as the oldest row of the table joined)
+through the end of next year. Rows that already exist are left alone, so
+holiday flags survive. The aggregators that join to it call it first, so a
+backfilled or rehydrated older month never falls out of an inner join.
+
+Usage:
+    python factory_calendar.py --status
+    python factory_calendar.py --ensure
+    python factory_calendar.py --holiday 2025-07-04 "Independence Day"
+    python factory_calendar.py --clear-holiday 2025-07-04
+    python factory_calendar.py --week 2024-12-30
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+
+import psycopg2
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+CALENDAR_START = date(2024, 1, 1)
+DAY_SHIFT_START = time(7, 0)
+NIGHT_SHIFT_START = time(19, 0)
+
+CREATE_CALENDAR_SQL = """
+CREATE TABLE IF NOT EXISTS factory_calendar (
+    day DATE PRIMARY KEY,
+    iso_year SMALLINT NOT NULL,
+    iso_week SMALLINT NOT NULL,
+    week_id VARCHAR(8) NOT NULL,
+    week_start DATE NOT NULL,
+    week_end DATE NOT NULL,
+    factory_date DATE NOT NULL,
+    is_weekend BOOLEAN NOT NULL,
+    day_shift_start TIMESTAMP NOT NULL,
+    night_shift_start TIMESTAMP NOT NULL,
+    night_shift_end TIMESTAMP NOT NULL,
+    is_holiday BOOLEAN NOT NULL DEFAULT FALSE,
+    holiday_name TEXT
+);
+CREATE INDEX IF NOT EXISTS factory_calendar_week_id_idx ON factory_calendar (week_id);
+"""
+
+# Same rules as week_id() / factory_date() below
+FILL_CALENDAR_SQL = """
+INSERT INTO factory_calendar (
+    day, iso_year, iso_week, week_id, week_start, week_end, factory_date, is_weekend,
+    day_shift_start, night_shift_start, night_shift_end
+)
+SELECT
+    d,
+    EXTRACT(ISOYEAR FROM d)::smallint,
+    EXTRACT(WEEK FROM d)::smallint,
+    to_char(d, 'IYYY-"W"IW'),
+    date_trunc('week', d)::date,
+    date_trunc('week', d)::date + 6,
+    d - CASE EXTRACT(ISODOW FROM d) WHEN 6 THEN 1 WHEN 7 THEN 2 ELSE 0 END,
+    EXTRACT(ISODOW FROM d) >= 6,
+    d + %(day_shift)s::time,
+    d + %(night_shift)s::time,
+    d + 1 + %(day_shift)s::time
+FROM generate_series(%(start)s::date, %(end)s::date, interval '1 day') AS g(t)
+CROSS JOIN LATERAL (SELECT g.t::date AS d) AS days
+ON CONFLICT (day) DO NOTHING
+"""
+
+
+def week_id(day):
+    """ISO week id of a date or datetime: '2025-W23'"""
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def week_range(week):
+    """Monday and Sunday of an ISO week id"""
+    year, number = week.split('-W')
+    week_start = date.fromisocalendar(int(year), int(number), 1)
+    return week_start, week_start + timedelta(days=6)
+
+def week_bounds(day):
+    """Monday and Sunday of the week containing day"""
+    if isinstance(day, datetime):
+        day = day.date()
+    week_start = day - timedelta(days=day.weekday())
+    return week_start, week_start + timedelta(days=6)
+
+def factory_date(day):
+    """Saturday and Sunday count toward the Friday before"""
+    return day - timedelta(days=max(day.weekday() - 4, 0))
+
+def ensure_calendar(conn, through=None, since=None):
+    """Create factory_calendar and fill it from `since` (if before CALENDAR_START) through `through` (default: end of next year)"""
+    through = through or date(date.today().year + 1, 12, 31)
+    start = min(since, CALENDAR_START) if since else CALENDAR_START
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('factory_calendar') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT MIN(day), MAX(day) FROM factory_calendar")
+            first, last = cur.fetchone()
+            if first is not None and first <= start and last >= through:
+                return 0
+        else:
+            cur.execute(CREATE_CALENDAR_SQL)
+        cur.execute(FILL_CALENDAR_SQL, {
+            "start": start, "end": through,
+            "day_shift": DAY_SHIFT_START, "night_shift": NIGHT_SHIFT_START,
+        })
+        added = cur.rowcount
+    conn.commit()
+    if added:
+        print(f"Added {added:,} days to factory_calendar (through {through})")
+    return added
+
+def set_holiday(conn, day, name=None, holiday=True):
+    ensure_calendar(conn, max(day, date(date.today().year + 1, 12, 31)), since=day)
+    with conn.cursor() as cur:
+        cur.execute("UPDATE factory_calendar SET is_holiday = %s, holiday_name = %s WHERE day = %s",
+                    (holiday, name if holiday else None, day))
+    conn.commit()
+
+def print_week(conn, day):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT day, week_id, week_start, week_end, factory_date, is_holiday, holiday_name
+            FROM factory_calendar WHERE day = %s
+        """, (day,))
+        row = cur.fetchone()
+    if row is None:
+        print(f"{day} is not in factory_calendar; run --ensure")
+        return
+    day, week, week_start, week_end, folded, holiday, name = row
+    print(f"{day} ({day:%A}): {week}, {week_start} to {week_end}, reported on {folded}"
+          + (f", holiday: {name or 'yes'}" if holiday else ""))
+    if week != week_id(day) or (week_start, week_end) != week_range(week) or folded != factory_date(day):
+        print("  Python helpers disagree with the table; rebuild it (DROP TABLE factory_calendar, --ensure)")
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('factory_calendar') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            print("factory_calendar does not exist; run --ensure")
+            return
+        cur.execute("SELECT MIN(day), MAX(day), COUNT(*), COUNT(*) FILTER (WHERE is_holiday) FROM factory_calendar")
+        first, last, days, holidays = cur.fetchone()
+        print(f"factory_calendar: {days:,} days, {first} to {last}, {holidays} holidays")
+        cur.execute("SELECT day, holiday_name FROM factory_calendar WHERE is_holiday ORDER BY day")
+        for day, name in cur.fetchall():
+            print(f"  {day} {name or ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Factory calendar: ISO weeks, weekend fold, shifts, holidays")
+    parser.add_argument('--ensure', action='store_true', help="Create the table and fill missing days")
+    parser.add_argument('--through', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help="With --ensure: fill through this date (default: end of next year)")
+    parser.add_argument('--since', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help=f"With --ensure: fill from this date if before {CALENDAR_START}")
+    parser.add_argument('--holiday', nargs='+', metavar=('DATE', 'NAME'), help="Mark a day as a holiday")
+    parser.add_argument('--clear-holiday', metavar='DATE', help="Unmark a holiday")
+    parser.add_argument('--week', metavar='DATE', help="Show the calendar row for a day")
+    parser.add_argument('--status', action='store_true', help="Show the calendar range and holidays")
+    args = parser.parse_args()
+
+    def parse_day(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            parser.error(f"invalid date: {value} (expected YYYY-MM-DD)")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.ensure:
+            ensure_calendar(conn, args.through, args.since)
+        if args.holiday:
+            set_holiday(conn, parse_day(args.holiday[0]), " ".join(args.holiday[1:]) or None)
+        if args.clear_holiday:
+            set_holiday(conn, parse_day(args.clear_holiday), holiday=False)
+        if args.week:
+            print_week(conn, parse_day(args.week))
+        if args.status or not (args.ensure or args.holiday or args.clear_holiday or args.week):
+            print_status(conn)
+    finally:
+        conn.close()
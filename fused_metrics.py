@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Declarative metrics, computed several at a time in one GROUPING SETS scan.
+
+The aggregators run one scan per metric even when the scans differ only in
+their GROUP BY. Examples are weekly FPY per part vs station counts per
+model, and testboard results per station vs per fixture. Each METRICS
+entry declares a metric's source table, grouping keys, row filter and
+measures. run_metrics() compiles metrics that share a source table into a
+single query for the period:
+
+    SELECT GROUPING(<keys>) AS grouping_id, <every metric's keys>,
+           COUNT(*) FILTER (WHERE <filter 1>) AS m0_rows,
+           COUNT(*) FILTER (WHERE (<filter 1>) AND (<condition>)) AS m0_pass, ...
+    FROM <source>
+    WHERE <period> AND (<filter 1> OR <filter 2> ...)
+    GROUP BY GROUPING SETS ((<keys 1>), (<keys 2>), ...)
+
+Each metric's measures are aggregates filtered by that metric's own
+filter. So a row of metric A's grouping set is exactly what A's separate
+query would return. Rows are routed back to their metric by grouping_id.
+Groups that only exist because of another metric's filter (m<i>_rows = 0)
+are dropped. Metrics on different sources run as separate scans.
+
+Keys are column names, or (alias, expression) pairs. Measures map an output
+name to (aggregate, condition); condition is None or an extra SQL predicate
+(a FILTER clause cannot be nested, so it is given separately). Filters may
+use %(name)s parameters, passed to run_metrics().
+
+Weekly TPY (aggregate_tpy_weekly.py) reads tpy_part_outcomes and
+tpy_station_counts from one scan. aggregate_testboard_fused.py fills
+testboard_station_performance_daily and fixture_performance_daily from
+one scan.
+
+Usage:
+    python fused_metrics.py                # list the metrics
+    python fused_metrics.py --sql testboard_station_daily testboard_fixture_daily
+    python fused_metrics.py --run tpy_part_outcomes tpy_station_counts --start 2025-06-02 --end 2025-06-09
+"""
+import argparse
+from datetime import datetime
+
+import psycopg2
+
+from partitions import PARTITION_KEY
+from streaming import stream_batches
+from summary_views import DB_CONFIG
+
+TPY_FLOWS = "service_flow NOT IN ('NC Sort', 'RO') AND service_flow IS NOT NULL"
+PASSED = "history_station_passing_status = 'Pass'"
+NOT_PASSED = "history_station_passing_status != 'Pass'"
+FAILED = "history_station_passing_status = 'Fail'"
+
+METRICS = {
+    # aggregate_tpy_weekly: FPY is counted per part, then summarized in Python
+    "tpy_part_outcomes": {
+        "source": "workstation_master_log",
+        "keys": ("sn", "model"),
+        "filter": TPY_FLOWS,
+        "measures": {
+            "reached_packing": ("COUNT(*)", "workstation_name = 'PACKING'"),
+            "failure_count": ("COUNT(*)", NOT_PASSED),
+        },
+    },
+    # aggregate_tpy_weekly / aggregate_tpy_daily: station throughput yield for the routed models
+    "tpy_station_counts": {
+        "source": "workstation_master_log",
+        "keys": ("model", "workstation_name"),
+        "filter": f"{TPY_FLOWS} AND model = ANY(%(models)s)",
+        "measures": {
+            "total_parts": ("COUNT(*)", None),
+            "passed_parts": ("COUNT(*)", PASSED),
+            "failed_parts": ("COUNT(*)", NOT_PASSED),
+        },
+    },
+    # aggregate_all_time_dedup: testboard_station_performance_daily
+    "testboard_station_daily": {
+        "source": "testboard_master_log",
+        "keys": ("end_date", "model", "work_station_process", "workstation_name"),
+        "filter": f"{PARTITION_KEY} IS NOT NULL",
+        "measures": {
+            "total": ("COUNT(*)", None),
+            "pass": ("COUNT(*)", PASSED),
+            "fail": ("COUNT(*)", FAILED),
+        },
+    },
+    # aggregate_fixture_performance_all_time: fixture_performance_daily
+    "testboard_fixture_daily": {
+        "source": "testboard_master_log",
+        "keys": (("day", "end_date"), "fixture_no", "model", "pn", "workstation_name"),
+        "filter": f"{PARTITION_KEY} IS NOT NULL",
+        "measures": {
+            "total": ("COUNT(*)", None),
+            "pass": ("COUNT(*)", PASSED),
+            "fail": ("COUNT(*)", FAILED),
+        },
+    },
+}
+
+
+def key_expressions(metric):
+    """[(alias, expression)] of a metric's keys"""
+    return [key if isinstance(key, tuple) else (key, key) for key in metric["keys"]]
+
+def compile_scan(names, period=False):
+    """(sql, routes) for one fused scan over metrics sharing a source table.
+
+    routes is [(name, grouping_id, row count column, output columns)], used
+    to pick each metric's rows back out of the result. Column 0 of a result
+    row is its grouping_id.
+    """
+    metrics = [METRICS[name] for name in names]
+    sources = {metric["source"] for metric in metrics}
+    if len(sources) != 1:
+        raise ValueError(f"metrics from different sources cannot share a scan: {', '.join(sorted(sources))}")
+
+    expressions = []  # every distinct key expression, in first-seen order
+    for metric in metrics:
+        for _, expression in key_expressions(metric):
+            if expression not in expressions:
+                expressions.append(expression)
+    select = [f"GROUPING({', '.join(expressions)}) AS grouping_id"]
+    select += [f"{expression} AS k{i}" for i, expression in enumerate(expressions)]
+
+    routes = []
+    grouping_sets = []
+    for i, (name, metric) in enumerate(zip(names, metrics)):
+        positions = [expressions.index(expression) for _, expression in key_expressions(metric)]
+        # GROUPING() sets the bit of every key left out of the grouping set, first key highest
+        grouping_id = sum(1 << (len(expressions) - 1 - j) for j in range(len(expressions)) if j not in positions)
+        select.append(f"COUNT(*) FILTER (WHERE {metric['filter']}) AS m{i}_rows")
+        rows_column = len(select) - 1
+        columns = [1 + p for p in positions]
+        for measure, (aggregate, condition) in metric["measures"].items():
+            where = f"({metric['filter']}) AND ({condition})" if condition else metric["filter"]
+            select.append(f"{aggregate} FILTER (WHERE {where}) AS m{i}_{measure}")
+            columns.append(len(select) - 1)
+        routes.append((name, grouping_id, rows_column, columns))
+        grouping_set = f"({', '.join(expressions[p] for p in sorted(positions))})"
+        if grouping_set not in grouping_sets:
+            grouping_sets.append(grouping_set)
+
+    where = " OR ".join(f"({f})" for f in dict.fromkeys(metric["filter"] for metric in metrics))
+    if period:
+        where = f"{PARTITION_KEY} >= %(start)s AND {PARTITION_KEY} < %(end)s AND ({where})"
+    sql = (f"SELECT {', '.join(select)}\n"
+           f"FROM {sources.pop()}\n"
+           f"WHERE {where}\n"
+           f"GROUP BY GROUPING SETS ({', '.join(grouping_sets)})")
+    return sql, routes
+
+def scans(names):
+    """Metric names grouped by source table, one group per scan"""
+    groups = {}
+    for name in names:
+        groups.setdefault(METRICS[name]["source"], []).append(name)
+    return list(groups.values())
+
+def iter_metric_rows(conn, names, start=None, end=None, params=None, itersize=None):
+    """Yield (metric name, rows) batches; each row is the metric's keys followed by its measures"""
+    params = dict(params or {})
+    if start is not None:
+        params.update(start=start, end=end)
+    for group in scans(names):
+        sql, routes = compile_scan(group, period=start is not None)
+        for batch in stream_batches(conn, sql, params, itersize=itersize, name="fused_metrics"):
+            for name, grouping_id, rows_column, columns in routes:
+                rows = [tuple(row[c] for c in columns) for row in batch
+                        if row[0] == grouping_id and row[rows_column]]
+                if rows:
+                    yield name, rows
+
+def run_metrics(conn, names, start=None, end=None, params=None):
+    """{metric name: [rows]} from one scan per source table for [start, end)"""
+    result = {name: [] for name in names}
+    for name, rows in iter_metric_rows(conn, names, start, end, params):
+        result[name].extend(rows)
+    return result
+
+def print_sql(names, period=False):
+    for group in scans(names):
+        print(compile_scan(group, period)[0])
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fused GROUPING SETS scans over declared metrics")
+    parser.add_argument('--sql', nargs='+', metavar='METRIC', choices=sorted(METRICS), help="Print the compiled scan")
+    parser.add_argument('--run', nargs='+', metavar='METRIC', choices=sorted(METRICS), help="Run and summarize")
+    parser.add_argument('--start', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help="Period start (YYYY-MM-DD)")
+    parser.add_argument('--end', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help="Period end, exclusive")
+    parser.add_argument('--models', nargs='+', default=['Tesla SXM4', 'Tesla SXM5'],
+                        help="Value of %%(models)s in the TPY filters")
+    args = parser.parse_args()
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end go together")
+
+    if args.sql:
+        print_sql(args.sql, period=args.start is not None)
+    if args.run:
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            for name, rows in run_metrics(conn, args.run, args.start, args.end, {"models": args.models}).items():
+                print(f"{name}: {len(rows):,} rows")
+                for row in rows[:5]:
+                    print(f"  {row}")
+        finally:
+            conn.close()
+    if not (args.sql or args.run):
+        for name, metric in METRICS.items():
+            keys = ", ".join(alias for alias, _ in key_expressions(metric))
+            print(f"{name:<26} {metric['source']:<24} by {keys}")
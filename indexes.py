@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Managed secondary indexes for the aggregator query shapes, and an EXPLAIN report.
+
+Apart from the primary keys, the master logs only had the 15-17 column
+unique constraints, which lead with sn and are no help to the aggregators'
+predicates:
+
+- end-time ranges plus service_flow NOT IN ('NC Sort', 'RO') (TPY);
+- workstation_name = 'PACKING' / 'TEST' with a Pass status (packing, sort test).
+
+MANAGED_INDEXES holds the partial and covering indexes for those shapes. The
+whole-table GROUP BYs (TPY week starters, station hourly, the testboard
+all-time summaries) read most of the table and stay sequential scans; a
+(sn, model) index and plain end-time indexes were tried for them and went
+unused. The plain end-time indexes are still managed for MAX(end time):
+metrics_server's freshness gauge asks for it every minute, and without
+them that is a full scan of each master log (the partial indexes can't
+answer it, and BRIN can't answer MAX at all).
+--apply creates the missing ones: CONCURRENTLY on plain tables, and on the
+parent of a partitioned table (partitions.py), which builds one per partition.
+
+--report EXPLAINs the queries the aggregators run (their AGGREGATE_SQL
+constants where they have one) over the latest week of data. For each query
+it shows the cost and the indexes used, with and without the managed set.
+"Without" drops the managed indexes inside a transaction that is rolled
+back, so nothing changes, but each drop briefly locks the table
+(lock_timeout keeps that short).
+
+Star mode (dimensions.py): indexes on plain columns are created on the fact
+table. Partial indexes filtering on text now stored as dimension keys are
+skipped.
+
+Usage:
+    python indexes.py --status
+    python indexes.py --apply
+    python indexes.py --report
+    python indexes.py --report --analyze          # EXPLAIN ANALYZE timings too
+    python indexes.py --drop                      # remove the managed set
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+from datetime import timedelta
+
+import psycopg2
+
+from date_columns import require_date_columns
+from dimensions import DB_CONFIG, FACT_DIMENSIONS, fact_table, is_star
+from metrics_server import FRESHNESS_SQL
+from summary_views import SUMMARY_VIEWS, relation_kind
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PRODUCTION_ROWS = "service_flow NOT IN ('NC Sort', 'RO') AND service_flow IS NOT NULL"
+
+MANAGED_INDEXES = [
+    {
+        "name": "wml_production_end_time_idx",
+        "table": "workstation_master_log",
+        "columns": "history_station_end_time",
+        "include": "model, workstation_name, history_station_passing_status, sn",
+        "where": PRODUCTION_ROWS,
+        "for": "TPY daily/weekly station counts: end-time range over production rows",
+    },
+    {
+        "name": "wml_packing_pass_idx",
+        "table": "workstation_master_log",
+        "columns": "history_station_end_time",
+        "include": "factory_date, model, pn",
+        "where": "workstation_name = 'PACKING' AND history_station_passing_status = 'Pass'",
+        "for": "packing daily/weekly summaries",
+    },
+    {
+        "name": "wml_test_pass_idx",
+        "table": "workstation_master_log",
+        "columns": "history_station_end_time",
+        "include": "factory_date, model",
+        "where": "workstation_name = 'TEST' AND history_station_passing_status = 'Pass'",
+        "for": "sort test weekly/all-time",
+    },
+    {
+        "name": "wml_end_time_idx",
+        "table": "workstation_master_log",
+        "columns": "history_station_end_time",
+        "for": "data freshness: MAX(end time) (metrics_server.py)",
+    },
+    {
+        "name": "tml_end_time_idx",
+        "table": "testboard_master_log",
+        "columns": "history_station_end_time",
+        "for": "data freshness: MAX(end time) (metrics_server.py)",
+    },
+]
+
+# Week starters / completions / station counts from aggregate_tpy_daily.py, which runs them inline
+TPY_WEEK_STARTERS_SQL = """
+WITH first_activity AS (
+    SELECT sn, model, MIN(history_station_end_time) as first_activity_time
+    FROM workstation_master_log
+    WHERE service_flow NOT IN ('NC Sort', 'RO')
+        AND service_flow IS NOT NULL
+    GROUP BY sn, model
+)
+SELECT model, COUNT(*) as count, ARRAY_AGG(sn) as parts
+FROM first_activity
+WHERE first_activity_time >= %(start)s AND first_activity_time < %(end)s
+GROUP BY model
+"""
+TPY_COMPLETIONS_SQL = """
+SELECT sn, model,
+    COUNT(CASE WHEN workstation_name = 'PACKING' THEN 1 END) as reached_packing,
+    COUNT(CASE WHEN history_station_passing_status != 'Pass' THEN 1 END) as failure_count
+FROM workstation_master_log
+WHERE sn = ANY(%(sns)s)
+    AND history_station_end_time >= %(start)s
+    AND history_station_end_time < %(end)s
+    AND service_flow NOT IN ('NC Sort', 'RO')
+    AND service_flow IS NOT NULL
+GROUP BY sn, model
+"""
+TPY_STATION_COUNTS_SQL = """
+SELECT model, workstation_name, COUNT(*) as total_parts,
+    COUNT(CASE WHEN history_station_passing_status = 'Pass' THEN 1 END) as passed_parts
+FROM workstation_master_log
+WHERE history_station_end_time >= %(start)s
+    AND history_station_end_time < %(end)s
+    AND service_flow NOT IN ('NC Sort', 'RO')
+    AND service_flow IS NOT NULL
+    AND model = ANY(%(models)s)
+GROUP BY model, workstation_name
+"""
+
+
+def aggregator_constant(path, name):
+    """A SQL constant from an aggregator script, so the report follows the script"""
+    path = os.path.join(ROOT, path)
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return getattr(module, name)
+    finally:
+        sys.path.remove(os.path.dirname(path))
+
+def advisor_queries():
+    """(name, sql with %(start)s/%(end)s/... placeholders or a loader error)"""
+    weekly = lambda sql: re.sub(r"history_station_end_time >= %s\s+AND history_station_end_time < %s",
+                                "history_station_end_time >= %(start)s AND history_station_end_time < %(end)s", sql)
+    sources = [
+        ("packing_daily", lambda: aggregator_constant("aggregators/workstation_agg/aggregate_packing_daily_dedup.py", "AGGREGATE_SQL")),
+        ("packing_weekly", lambda: weekly(aggregator_constant("aggregators/workstation_agg/aggregate_packing_weekly_dedup.py", "AGGREGATE_SQL"))),
+        ("sort_test_weekly", lambda: weekly(aggregator_constant("aggregators/workstation_agg/aggregate_sort_test_weekly_dedup.py", "AGGREGATE_SQL"))),
+        ("tpy_week_starters", lambda: TPY_WEEK_STARTERS_SQL),
+        ("tpy_completions", lambda: TPY_COMPLETIONS_SQL),
+        ("tpy_station_counts", lambda: TPY_STATION_COUNTS_SQL),
+        ("tpy_columnar_load", lambda: aggregator_constant("aggregators/workstation_agg/aggregate_tpy_columnar.py", "LOAD_SQL")),
+        ("station_hourly", lambda: SUMMARY_VIEWS["station_hourly_summary"]["sql"]),
+        ("testboard_station_daily", lambda: aggregator_constant("aggregators/testboard_agg/aggregate_all_time_dedup.py", "AGGREGATE_SQL")),
+        ("fixture_daily", lambda: aggregator_constant("aggregators/testboard_agg/aggregate_fixture_performance_all_time.py", "AGGREGATE_SQL")),
+        ("freshness", lambda: FRESHNESS_SQL.format(table="workstation_master_log")),
+    ]
+    queries = []
+    for name, load in sources:
+        try:
+            queries.append((name, load()))
+        except Exception as e:
+            queries.append((name, e))
+    return queries
+
+def report_params(cur):
+    """The latest full week in the data, a sample of its serial numbers, and the models seen"""
+    cur.execute("SELECT date_trunc('week', MAX(history_station_end_time)) - interval '7 days' FROM workstation_master_log")
+    start = cur.fetchone()[0]
+    if start is None:
+        return None
+    end = start + timedelta(days=7)
+    cur.execute("""
+        SELECT ARRAY(SELECT DISTINCT sn FROM workstation_master_log
+                     WHERE history_station_end_time >= %s AND history_station_end_time < %s LIMIT 500)
+    """, (start, end))
+    sns = cur.fetchone()[0]
+    cur.execute("SELECT ARRAY(SELECT DISTINCT model FROM workstation_master_log WHERE model IS NOT NULL)")
+    return {"start": start, "end": end, "sns": sns, "models": cur.fetchone()[0]}
+
+def resolve(conn, index):
+    """(table to build on, CREATE INDEX statement) or (None, reason it is skipped)"""
+    table = index["table"]
+    if relation_kind(conn.cursor(), table) is None:
+        return None, f"{table} does not exist"
+    columns, include, where = index["columns"], index.get("include"), index.get("where")
+    if is_star(conn, table):
+        dims = FACT_DIMENSIONS[table]
+        if where and any(re.search(rf"\b{c}\b", where) for c in dims):
+            return None, "filters on dimension text (star mode)"
+        rename = lambda sql: re.sub(r"\b(" + "|".join(dims) + r")\b", r"\1_id", sql) if sql else sql
+        table, columns, include = fact_table(table), rename(columns), rename(include)
+    sql = f"CREATE INDEX {{concurrently}}IF NOT EXISTS {index['name']} ON {table} ({columns})"
+    if include:
+        sql += f" INCLUDE ({include})"
+    if where:
+        sql += f" WHERE {where}"
+    concurrently = "" if relation_kind(conn.cursor(), table) == 'p' else "CONCURRENTLY "
+    return table, sql.format(concurrently=concurrently)
+
+def existing_indexes(cur):
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")
+    return {row[0] for row in cur.fetchall()}
+
+def apply_indexes(conn):
+    """Create missing managed indexes; returns the names created"""
+    created = []
+    for index in MANAGED_INDEXES:
+        table, sql = resolve(conn, index)
+        if table is None:
+            print(f"  skip   {index['name']}: {sql}")
+            continue
+        if index["name"] in existing_indexes(conn.cursor()):
+            print(f"  ok     {index['name']}")
+            continue
+        if "factory_date" in (index.get("include") or ""):
+            # The packing/test indexes cover factory_date
+            try:
+                require_date_columns(conn, index["table"])
+            except RuntimeError as e:
+                print(f"  skip   {index['name']}: {e}")
+                continue
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute(f"ANALYZE {table}")
+        finally:
+            conn.autocommit = False
+        created.append(index["name"])
+        print(f"  create {index['name']} on {table}")
+    return created
+
+def drop_indexes(conn):
+    with conn.cursor() as cur:
+        present = existing_indexes(cur)
+        for index in MANAGED_INDEXES:
+            if index["name"] in present:
+                cur.execute(f"DROP INDEX {index['name']}")
+                print(f"  drop   {index['name']}")
+    conn.commit()
+
+def plan_summary(cur, sql, params, analyze=False):
+    """(total cost, actual ms or None, sorted index names used)"""
+    options = "FORMAT JSON, ANALYZE, BUFFERS" if analyze else "FORMAT JSON"
+    cur.execute(f"EXPLAIN ({options}) {sql}", params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]
+    used = set()
+    def walk(node):
+        if "Index Name" in node:
+            used.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+    walk(root["Plan"])
+    return root["Plan"]["Total Cost"], root.get("Execution Time"), sorted(used)
+
+def partition_index_parents(cur):
+    """Per-partition index name -> the partitioned index it was created from"""
+    cur.execute("""
+        WITH RECURSIVE tree AS (
+            SELECT inhrelid AS child, inhparent AS parent FROM pg_inherits
+            JOIN pg_class c ON c.oid = inhrelid WHERE c.relkind = 'i'
+            UNION ALL
+            SELECT t.child, i.inhparent FROM tree t JOIN pg_inherits i ON i.inhrelid = t.parent
+        )
+        SELECT child::regclass::text, parent::regclass::text FROM tree
+        WHERE NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = tree.parent)
+    """)
+    return dict(cur.fetchall())
+
+def report(conn, analyze=False):
+    with conn.cursor() as cur:
+        params = report_params(cur)
+    conn.commit()
+    if params is None:
+        print("workstation_master_log is empty; nothing to explain")
+        return
+    print(f"EXPLAIN over {params['start']:%Y-%m-%d} .. {params['end']:%Y-%m-%d}"
+          f" ({len(params['sns'])} sample SNs, {len(params['models'])} models)")
+    present = existing_indexes(conn.cursor())
+    parents = partition_index_parents(conn.cursor())
+    managed = [i["name"] for i in MANAGED_INDEXES if i["name"] in present]
+    if not managed:
+        print("No managed indexes present; run --apply first (costs below are without them)")
+
+    rows = []
+    for name, sql in advisor_queries():
+        if isinstance(sql, Exception):
+            rows.append((name, f"could not load: {sql}"))
+            continue
+        with conn.cursor() as cur:
+            try:
+                after = plan_summary(cur, sql, params, analyze)
+                before = None
+                if managed:
+                    # Hide the managed set for one EXPLAIN; the rollback restores it untouched
+                    cur.execute("SET LOCAL lock_timeout = '2s'")
+                    for index in managed:
+                        cur.execute(f"DROP INDEX {index}")
+                    before = plan_summary(cur, sql, params, analyze)
+            finally:
+                conn.rollback()
+        rows.append((name, before, after))
+
+    print(f"{'Query':<24} {'Cost before':>12} {'Cost after':>12} {'ms before':>10} {'ms after':>9}  Indexes used (after)")
+    print("-" * 110)
+    for row in rows:
+        if len(row) == 2:
+            print(f"{row[0]:<24} {row[1]}")
+            continue
+        name, before, after = row
+        b_cost = f"{before[0]:,.0f}" if before else "-"
+        b_ms = f"{before[1]:,.1f}" if before and before[1] is not None else "-"
+        a_ms = f"{after[1]:,.1f}" if after[1] is not None else "-"
+        used = sorted({parents.get(i, i) for i in after[2]}) or ["(seq scan)"]
+        print(f"{name:<24} {b_cost:>12} {after[0]:>12,.0f} {b_ms:>10} {a_ms:>9}  {', '.join(used)}")
+
+def print_status(conn):
+    present = existing_indexes(conn.cursor())
+    print(f"{'Index':<30} {'State':<9} {'Size':>9}  For")
+    print("-" * 100)
+    for index in MANAGED_INDEXES:
+        table, detail = resolve(conn, index)
+        if table is None:
+            state, size = "skipped", "-"
+        elif index["name"] in present:
+            state = "present"
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT COALESCE(SUM(pg_relation_size(relid)), pg_relation_size(%s::regclass))
+                    FROM pg_partition_tree(%s::regclass)
+                """, (index["name"], index["name"]))
+                size = f"{cur.fetchone()[0] / 2**20:,.1f} MB"
+        else:
+            state, size = "missing", "-"
+        print(f"{index['name']:<30} {state:<9} {size:>9}  {index['for']}")
+    conn.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Managed indexes for the aggregator queries")
+    parser.add_argument('--apply', action='store_true', help="Create missing managed indexes")
+    parser.add_argument('--drop', action='store_true', help="Drop the managed indexes")
+    parser.add_argument('--report', action='store_true', help="EXPLAIN the aggregator queries with and without the managed indexes")
+    parser.add_argument('--analyze', action='store_true', help="With --report: EXPLAIN ANALYZE (runs the queries)")
+    parser.add_argument('--status', action='store_true', help="List managed indexes and their sizes")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.drop:
+            drop_indexes(conn)
+        if args.apply:
+            apply_indexes(conn)
+        if args.report:
+            report(conn, args.analyze)
+        if args.status or not (args.apply or args.drop or args.report):
+            print_status(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+asyncio ingest path for the master logs.
+
+The sync loaders do everything in a row: read_excel, a Python loop over the
+rows, then one SELECT COUNT(*) round trip per row to skip duplicates, then
+execute_values. Here:
+
+- read_report/map_rows from the existing loaders run in a process pool, so
+  several reports can be parsed at once (map_rows also adds row_hash and
+  drops in-file duplicates);
+- rows go to PostgreSQL through asyncpg with a binary COPY into a per-session
+  staging table, then a single INSERT ... SELECT skipping known row_hash
+  values (and ON CONFLICT DO NOTHING for rows not yet backfilled) replaces
+  the per-row probes;
+- every file gets its own pooled connection, so files and sources are in
+  flight together on one event loop.
+
+Master logs in star mode (dimensions.py) are merged into their fact table,
+with dimension keys resolved in SQL from the staging table. Workstation
+merges also fold the rows they insert into part_state (part_state.py).
+
+The import_*_file.py scripts are unchanged and still the way to load a single
+file by hand. File_Monitor uses this module when started with --async.
+
+Usage:
+    python async_ingest.py workstationOutputReport.xlsx "Test board record report.xlsx"
+    python async_ingest.py --source snfn --workers 4 reports/*.xlsx
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import asyncpg
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import import_snfn_file
+import import_testboard_file
+import import_workstation_file
+from dimensions import IS_STAR_SQL, star_merge_sql
+from part_state import ensure_part_state, state_wrapper
+from partitions import ensure_partitions
+from pipeline_metrics import PipelineRun
+from row_hash import ADD_ROW_HASH_SQL, HAS_ROW_HASH_SQL, ROW_HASH_INDEX_SQL
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+# Insert columns per source; the order is the COPY column order
+SOURCES = {
+    "workstation": {
+        "loader": import_workstation_file,
+        "table": "workstation_master_log",
+        "columns": (
+            "sn", "pn", "customer_pn", "outbound_version", "workstation_name",
+            "history_station_start_time", "history_station_end_time", "hours", "service_flow", "model",
+            "history_station_passing_status", "passing_station_method", "operator", "first_station_start_time", "data_source",
+            "row_hash",
+        ),
+    },
+    "testboard": {
+        "loader": import_testboard_file,
+        "table": "testboard_master_log",
+        "columns": (
+            "sn", "pn", "model", "work_station_process", "baseboard_sn", "baseboard_pn", "workstation_name",
+            "history_station_start_time", "history_station_end_time", "history_station_passing_status", "operator",
+            "failure_reasons", "failure_note", "failure_code", "diag_version", "fixture_no", "data_source",
+            "row_hash",
+        ),
+    },
+    "snfn": {
+        "loader": import_snfn_file,
+        "table": "snfn_master_log",
+        # snfn_master_log has no model column (upload_snfn_master_log.py creates it without one)
+        "columns": (
+            "workstation_name", "fixture_no", "error_code", "error_disc", "sn", "pn",
+            "history_station_start_time", "history_station_end_time", "data_source", "row_hash",
+        ),
+    },
+}
+
+# Portal export names, as File_Monitor and the upload scripts see them
+FILENAME_HINTS = (("workstation", "workstation"), ("test board", "testboard"), ("test_board", "testboard"),
+                  ("testboard", "testboard"), ("snfn", "snfn"))
+
+
+def guess_source(file_path):
+    name = os.path.basename(file_path).lower()
+    for hint, source in FILENAME_HINTS:
+        if hint in name:
+            return source
+    return None
+
+def parse_report(source, file_path):
+    """Runs in a worker process: the sync loader's read and map steps, as COPY-ready tuples"""
+    spec = SOURCES[source]
+    df = spec["loader"].read_report(file_path)
+    mapped_data = spec["loader"].map_rows(df)
+    columns = spec["columns"]
+    return len(df), [tuple(row[c] for c in columns) for row in mapped_data]
+
+async def create_pool(db_config=None, size=4):
+    config = db_config or DB_CONFIG
+    return await asyncpg.create_pool(
+        host=config['host'],
+        port=int(config['port']),
+        user=config['user'],
+        password=config['password'] or None,
+        database=config['database'],
+        min_size=1,
+        max_size=size,
+    )
+
+async def ensure_row_hash_columns(pool):
+    async with pool.acquire() as conn:
+        for spec in SOURCES.values():
+            table = spec["table"]
+            if await conn.fetchval("SELECT to_regclass($1) IS NULL", table):
+                continue
+            if not await conn.fetchval(HAS_ROW_HASH_SQL, table):
+                await conn.execute(ADD_ROW_HASH_SQL.format(table=table))
+                await conn.execute(ROW_HASH_INDEX_SQL.format(table=table))
+
+def ensure_all_partitions(db_config=None):
+    """Monthly partitions for the partitioned master logs (no-op for the rest) and part_state;
+    psycopg2, run in an executor"""
+    conn = psycopg2.connect(**(db_config or DB_CONFIG))
+    try:
+        for spec in SOURCES.values():
+            ensure_partitions(conn, spec["table"])
+        ensure_part_state(conn)
+    finally:
+        conn.close()
+
+async def copy_and_merge(conn, source, records):
+    """Binary COPY into a staging table, then one deduplicating insert; returns rows inserted"""
+    table = SOURCES[source]["table"]
+    column_list = ", ".join(SOURCES[source]["columns"])
+    async with conn.transaction():
+        await conn.execute(f"""
+            CREATE TEMP TABLE ingest_staging ON COMMIT DROP AS
+            SELECT {column_list} FROM {table} WITH NO DATA
+        """)
+        await conn.copy_records_to_table("ingest_staging", records=records, columns=SOURCES[source]["columns"])
+        star = await conn.fetchval(IS_STAR_SQL, table)
+        # Workstation merges also update part_state; the wrapped statement returns the rows inserted
+        wrap = state_wrapper(table, star)
+        if star:
+            *resolve_keys, merge = star_merge_sql(table, SOURCES[source]["columns"], "ingest_staging", wrap=wrap)
+            for statement in resolve_keys:
+                await conn.execute(statement)
+        else:
+            merge = f"""
+                INSERT INTO {table} ({column_list})
+                SELECT {column_list} FROM ingest_staging s
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.row_hash = s.row_hash)
+                ON CONFLICT DO NOTHING
+            """
+            if wrap:
+                merge = wrap(merge)
+        if wrap:
+            return await conn.fetchval(merge)
+        status = await conn.execute(merge)
+    # status is "INSERT 0 <rows>"
+    return int(status.split()[-1])
+
+async def ingest_file(pool, executor, source, file_path, parent_run_id=None, delete=True):
+    """Parse one report in the process pool and merge it; returns (inserted, skipped)"""
+    loop = asyncio.get_running_loop()
+    run = PipelineRun(f"async_ingest_{source}", source=file_path, parent_run_id=parent_run_id)
+    try:
+        with run.span("parse", bytes_read=os.path.getsize(file_path), children=True) as span:
+            rows_read, records = await loop.run_in_executor(executor, parse_report, source, file_path)
+            span.rows_in = rows_read
+            span.rows_out = len(records)
+        with run.span("copy_merge", rows_in=len(records)) as span:
+            async with pool.acquire() as conn:
+                inserted = await copy_and_merge(conn, source, records) if records else 0
+            span.rows_out = inserted
+        skipped = len(records) - inserted
+        print(f"Found {skipped:,} existing records, {inserted:,} new records to insert")
+        print(f"Imported {inserted:,} new records from {os.path.basename(file_path)}")
+        if delete:
+            try:
+                os.remove(file_path)
+            except OSError as e:
+                print(f"Could not delete XLSX file: {e}")
+        return inserted, skipped
+    except Exception as e:
+        run.fail(e)
+        raise
+    finally:
+        # finish() writes to pipeline_runs with psycopg2; keep it off the event loop
+        await loop.run_in_executor(None, run.finish)
+
+async def ingest_files(files, workers=None, db_config=None, delete=False):
+    """Load (source, path) pairs concurrently; returns {path: (inserted, skipped) or exception}"""
+    workers = workers or min(len(files), os.cpu_count() or 1)
+    pool = await create_pool(db_config, size=max(workers, 1))
+    try:
+        await ensure_row_hash_columns(pool)
+        await asyncio.get_running_loop().run_in_executor(None, ensure_all_partitions, db_config)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = await asyncio.gather(
+                *(ingest_file(pool, executor, source, path, delete=delete) for source, path in files),
+                return_exceptions=True,
+            )
+    finally:
+        await pool.close()
+    return dict(zip((path for _, path in files), results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load report files concurrently with asyncpg and binary COPY")
+    parser.add_argument('files', nargs='+', help="xlsx report files")
+    parser.add_argument('--source', choices=sorted(SOURCES), help="Report type (default: guessed from each file name)")
+    parser.add_argument('--workers', type=int, help="Parser processes (default: one per file, up to the CPU count)")
+    parser.add_argument('--delete', action='store_true', help="Delete each file after it is loaded, like the sync loaders")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.files:
+        if not os.path.isfile(path):
+            parser.error(f"file not found: {path}")
+        source = args.source or guess_source(path)
+        if not source:
+            parser.error(f"cannot tell the report type of {path}; pass --source")
+        files.append((source, path))
+
+    started = time.perf_counter()
+    results = asyncio.run(ingest_files(files, args.workers, delete=args.delete))
+    failed = 0
+    for path, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"Error importing {os.path.basename(path)}: {result}")
+        else:
+            print(f"{os.path.basename(path)}: {result[0]:,} inserted, {result[1]:,} already loaded")
+    print(f"Loaded {len(files) - failed} of {len(files)} files in {time.perf_counter() - started:.2f}s")
+    sys.exit(1 if failed else 0)
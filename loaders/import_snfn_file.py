@@ -9,6 +9,11 @@ import pandas as pd
 import psycopg2
 import math
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline_metrics import PipelineRun
+from row_hash import ensure_row_hash_column, existing_hashes, first_occurrences, row_hashes
+from timestamps import normalize_timestamps, py_timestamp
+
 def connect_to_db():
     return psycopg2.connect(
         host="localhost",
@@ -21,6 +26,36 @@ def connect_to_db():
 def clean_column_name(col_name):
     return col_name.lower().replace(' ', '_').replace('-', '_')
 
+def read_report(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    df['data_source'] = 'snfn'
+    return normalize_timestamps(
+        df, ['history_station_start_time', 'history_station_end_time'],
+        required=('history_station_start_time', 'history_station_end_time'),
+    )
+
+def map_rows(df):
+    mapped_data = []
+    for _, row in df.iterrows():
+        mapped_row = {
+            'workstation_name': str(row.get('workstation_name', '')),
+            'fixture_no': str(row.get('fixture_no', '')).strip() or None,
+            'error_code': str(row.get('error_code', '')).strip() or None,
+            'error_disc': str(row.get('error_disc', '')).strip() or None,
+            'model': str(row.get('model', '')).strip() or None,
+            'sn': str(row.get('sn', '')),
+            'pn': str(row.get('pn', '')),
+            'history_station_start_time': py_timestamp(row['history_station_start_time']),
+            'history_station_end_time': py_timestamp(row['history_station_end_time']),
+            'data_source': 'snfn'
+        }
+        mapped_data.append(mapped_row)
+    # One hash per row over the inserted values: in-file dedup here, cross-file dedup in the probe
+    hashes = row_hashes(mapped_data, 'snfn_master_log')
+    for mapped_row, row_hash in zip(mapped_data, hashes):
+        mapped_row['row_hash'] = int(row_hash)
+    return [row for row, keep in zip(mapped_data, first_occurrences(hashes)) if keep]
 
 def main():
     if len(sys.argv) != 2:
@@ -31,82 +66,46 @@ def main():
         print(f"File not found: {file_path}")
         sys.exit(1)
     print(f"📥 Importing {file_path} into snfn_master_log...")
+    run = PipelineRun("import_snfn_file", source=file_path)
     conn = connect_to_db()
     try:
-        df = pd.read_excel(file_path)
-        df.columns = [clean_column_name(col) for col in df.columns]
-        df['data_source'] = 'snfn'
-        dedup_cols = [c for c in df.columns if c != 'number_of_times_baseboard_is_used']
-        df = df.drop_duplicates(subset=dedup_cols)
-        mapped_data = []
-        for _, row in df.iterrows():
-            mapped_row = {
-                'workstation_name': str(row.get('workstation_name', '')),
-                'fixture_no': str(row.get('fixture_no', '')).strip() or None,
-                'error_code': str(row.get('error_code', '')).strip() or None,
-                'error_disc': str(row.get('error_disc', '')).strip() or None,
-                'model': str(row.get('model', '')).strip() or None,
-                'sn': str(row.get('sn', '')),
-                'pn': str(row.get('pn', '')),
-                'history_station_start_time': pd.to_datetime(row.get('history_station_start_time')).to_pydatetime(),
-                'history_station_end_time': pd.to_datetime(row.get('history_station_end_time')).to_pydatetime(),
-                'data_source': 'snfn'
-            }
-            mapped_data.append(mapped_row)
+        with run.span("read_excel", bytes_read=os.path.getsize(file_path)) as span:
+            df = read_report(file_path)
+            span.rows_out = len(df)
+        with run.span("map_rows", rows_in=len(df)) as span:
+            mapped_data = map_rows(df)
+            span.rows_out = len(mapped_data)
         cursor = conn.cursor()
         
         # Check for existing records to avoid duplicates (excluding 'number_of_times_baseboard_is_used' column)
         print(f"🔍 Checking for existing records to prevent duplicates...")
-        existing_count = 0
-        new_records = []
-        
-        for row in mapped_data:
-            # Create a check query using only the actual snfn columns (no number_of_times_baseboard_is_used column)
-            check_query = """
-            SELECT COUNT(*) FROM snfn_master_log 
-            WHERE 
-            workstation_name = %s
-            AND fixture_no = %s
-            AND error_code = %s
-            AND error_disc = %s
-            And model = %s
-            AND sn = %s
-            AND pn = %s
-            AND history_station_start_time = %s
-            AND history_station_end_time = %s
-            AND data_source = %s
-            """
-            
-            check_values = (
-                 row['workstation_name'], row['fixture_no'], row['error_code'], row['error_disc'],  row['sn'], row['pn'], row['model'], row['history_station_start_time'], row['history_station_end_time'], row['data_source']
-            )
-            
-            cursor.execute(check_query, check_values)
-            exists = cursor.fetchone()[0]
-            
-            if exists > 0:
-                existing_count += 1
-            else:
-                new_records.append(row)
+        with run.span("dedup_probe", rows_in=len(mapped_data)) as span:
+            ensure_row_hash_column(cursor, 'snfn_master_log')
+            conn.commit()
+            existing = existing_hashes(cursor, 'snfn_master_log', [row['row_hash'] for row in mapped_data])
+            new_records = [row for row in mapped_data if row['row_hash'] not in existing]
+            existing_count = len(mapped_data) - len(new_records)
+            span.rows_out = len(new_records)
         
         print(f"📊 Found {existing_count:,} existing records, {len(new_records):,} new records to insert")
         
-        if new_records:
-            insert_query = """
-            INSERT INTO snfn_master_log (
-                workstation_name, fixture_no, error_code, error_disc, sn, pn, model, history_station_start_time, history_station_end_time, data_source
-            ) VALUES %s
-            ON CONFLICT DO NOTHING
-            """
-            from psycopg2.extras import execute_values
-            values = [(
-                row['workstation_name'], row['fixture_no'], row['error_code'], row['error_disc'], row['sn'], row['pn'], row['model'], row['history_station_start_time'], row['history_station_end_time'], row['data_source']
-            ) for row in new_records]
-            execute_values(cursor, insert_query, values)
-            conn.commit()
-            print(f"✅ Imported {len(new_records):,} new records from {os.path.basename(file_path)}")
-        else:
-            print(f"✅ No new records to import (all {existing_count:,} records already exist)")
+        with run.span("insert", rows_in=len(new_records)):
+            if new_records:
+                insert_query = """
+                INSERT INTO snfn_master_log (
+                    workstation_name, fixture_no, error_code, error_disc, sn, pn, history_station_start_time, history_station_end_time, data_source, row_hash
+                ) VALUES %s
+                ON CONFLICT DO NOTHING
+                """
+                from psycopg2.extras import execute_values
+                values = [(
+                    row['workstation_name'], row['fixture_no'], row['error_code'], row['error_disc'], row['sn'], row['pn'], row['history_station_start_time'], row['history_station_end_time'], row['data_source'], row['row_hash']
+                ) for row in new_records]
+                execute_values(cursor, insert_query, values)
+                conn.commit()
+                print(f"✅ Imported {len(new_records):,} new records from {os.path.basename(file_path)}")
+            else:
+                print(f"✅ No new records to import (all {existing_count:,} records already exist)")
         
         cursor.close()
         
@@ -120,8 +119,10 @@ def main():
     except Exception as e:
         print(f"❌ Error importing {os.path.basename(file_path)}: {e}")
         conn.rollback()
+        run.fail(e)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -4,6 +4,13 @@ import pandas as pd
 import psycopg2
 import math
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dimensions import insert_facts, is_star
+from partitions import ensure_partitions
+from pipeline_metrics import PipelineRun
+from row_hash import HASH_COLUMNS, ensure_row_hash_column, existing_hashes, first_occurrences, row_hashes
+from timestamps import normalize_timestamps, py_timestamp
+
 def connect_to_db():
     return psycopg2.connect(
         host="localhost",
@@ -16,6 +23,52 @@ def connect_to_db():
 def clean_column_name(col_name):
     return col_name.lower().replace(' ', '_').replace('-', '_')
 
+def read_report(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    df['data_source'] = 'testboard'
+    return normalize_timestamps(
+        df, ['history_station_start_time', 'history_station_end_time'],
+        required=('history_station_start_time', 'history_station_end_time'),
+    )
+
+def map_rows(df):
+    mapped_data = []
+    for _, row in df.iterrows():
+        val = row.get('number_of_times_baseboard_is_used')
+        if pd.isna(val) or (isinstance(val, float) and math.isnan(val)):
+            safe_number_of_times = None
+        else:
+            try:
+                safe_number_of_times = int(val)
+            except Exception:
+                safe_number_of_times = None
+        mapped_row = {
+            'sn': str(row.get('sn', '')),
+            'pn': str(row.get('pn', '')),
+            'model': str(row.get('model', '')),
+            'work_station_process': str(row.get('work_station_process', '')).strip() or None,
+            'baseboard_sn': str(row.get('baseboard_sn', '')).strip() or None,
+            'baseboard_pn': str(row.get('baseboard_pn', '')).strip() or None,
+            'workstation_name': str(row.get('workstation_name', '')),
+            'history_station_start_time': py_timestamp(row['history_station_start_time']),
+            'history_station_end_time': py_timestamp(row['history_station_end_time']),
+            'history_station_passing_status': str(row.get('history_station_passing_status', '')),
+            'operator': str(row.get('operator', '')),
+            'failure_reasons': str(row.get('failure_reasons', '')).strip() or None,
+            'failure_note': str(row.get('failure_note', '')).strip() or None,
+            'failure_code': str(row.get('failure_code', '')).strip() or None,
+            'diag_version': str(row.get('diag_version', '')).strip() or None,
+            'fixture_no': str(row.get('fixture_no', '')).strip() or None,
+            'data_source': 'testboard'
+        }
+        mapped_data.append(mapped_row)
+    # One hash per row over the inserted values: in-file dedup here, cross-file dedup in the probe
+    hashes = row_hashes(mapped_data, 'testboard_master_log')
+    for mapped_row, row_hash in zip(mapped_data, hashes):
+        mapped_row['row_hash'] = int(row_hash)
+    return [row for row, keep in zip(mapped_data, first_occurrences(hashes)) if keep]
+
 def main():
     if len(sys.argv) != 2:
         print("Usage: python import_testboard_file.py /path/to/file.xlsx")
@@ -25,108 +78,54 @@ def main():
         print(f"File not found: {file_path}")
         sys.exit(1)
     print(f"Importing {file_path} into testboard_master_log...")
+    run = PipelineRun("import_testboard_file", source=file_path)
     conn = connect_to_db()
     try:
-        df = pd.read_excel(file_path)
-        df.columns = [clean_column_name(col) for col in df.columns]
-        df['data_source'] = 'testboard'
-        dedup_cols = [c for c in df.columns if c != 'number_of_times_baseboard_is_used']
-        df = df.drop_duplicates(subset=dedup_cols)
-        mapped_data = []
-        for _, row in df.iterrows():
-            val = row.get('number_of_times_baseboard_is_used')
-            if pd.isna(val) or (isinstance(val, float) and math.isnan(val)):
-                safe_number_of_times = None
-            else:
-                try:
-                    safe_number_of_times = int(val)
-                except Exception:
-                    safe_number_of_times = None
-            mapped_row = {
-                'sn': str(row.get('sn', '')),
-                'pn': str(row.get('pn', '')),
-                'model': str(row.get('model', '')),
-                'work_station_process': str(row.get('work_station_process', '')).strip() or None,
-                'baseboard_sn': str(row.get('baseboard_sn', '')).strip() or None,
-                'baseboard_pn': str(row.get('baseboard_pn', '')).strip() or None,
-                'workstation_name': str(row.get('workstation_name', '')),
-                'history_station_start_time': pd.to_datetime(row.get('history_station_start_time')).to_pydatetime(),
-                'history_station_end_time': pd.to_datetime(row.get('history_station_end_time')).to_pydatetime(),
-                'history_station_passing_status': str(row.get('history_station_passing_status', '')),
-                'operator': str(row.get('operator', '')),
-                'failure_reasons': str(row.get('failure_reasons', '')).strip() or None,
-                'failure_note': str(row.get('failure_note', '')).strip() or None,
-                'failure_code': str(row.get('failure_code', '')).strip() or None,
-                'diag_version': str(row.get('diag_version', '')).strip() or None,
-                'fixture_no': str(row.get('fixture_no', '')).strip() or None,
-                'data_source': 'testboard'
-            }
-            mapped_data.append(mapped_row)
+        with run.span("read_excel", bytes_read=os.path.getsize(file_path)) as span:
+            df = read_report(file_path)
+            span.rows_out = len(df)
+        with run.span("map_rows", rows_in=len(df)) as span:
+            mapped_data = map_rows(df)
+            span.rows_out = len(mapped_data)
         cursor = conn.cursor()
         
         print(f"Checking for existing records to prevent duplicates...")
-        existing_count = 0
-        new_records = []
-        
-        for row in mapped_data:
-            check_query = """
-            SELECT COUNT(*) FROM testboard_master_log 
-            WHERE sn = %s 
-            AND pn = %s 
-            AND model = %s 
-            AND work_station_process = %s 
-            AND baseboard_sn = %s 
-            AND baseboard_pn = %s 
-            AND workstation_name = %s 
-            AND history_station_start_time = %s 
-            AND history_station_end_time = %s 
-            AND history_station_passing_status = %s 
-            AND operator = %s 
-            AND failure_reasons = %s 
-            AND failure_note = %s 
-            AND failure_code = %s 
-            AND diag_version = %s 
-            AND fixture_no = %s 
-            AND data_source = %s
-            """
-            
-            check_values = (
-                row['sn'], row['pn'], row['model'], row['work_station_process'], 
-                row['baseboard_sn'], row['baseboard_pn'], row['workstation_name'], 
-                row['history_station_start_time'], row['history_station_end_time'], 
-                row['history_station_passing_status'], row['operator'], row['failure_reasons'], 
-                row['failure_note'], row['failure_code'], row['diag_version'], row['fixture_no'], row['data_source']
-            )
-            
-            cursor.execute(check_query, check_values)
-            exists = cursor.fetchone()[0]
-            
-            if exists > 0:
-                existing_count += 1
-            else:
-                new_records.append(row)
+        with run.span("dedup_probe", rows_in=len(mapped_data)) as span:
+            ensure_row_hash_column(cursor, 'testboard_master_log')
+            conn.commit()
+            ensure_partitions(conn, 'testboard_master_log')
+            existing = existing_hashes(cursor, 'testboard_master_log', [row['row_hash'] for row in mapped_data])
+            new_records = [row for row in mapped_data if row['row_hash'] not in existing]
+            existing_count = len(mapped_data) - len(new_records)
+            span.rows_out = len(new_records)
         
         print(f"Found {existing_count:,} existing records, {len(new_records):,} new records to insert")
         
-        if new_records:
-            insert_query = """
-            INSERT INTO testboard_master_log (
-                sn, pn, model, work_station_process, baseboard_sn, baseboard_pn, workstation_name,
-                history_station_start_time, history_station_end_time, history_station_passing_status, operator,
-                failure_reasons, failure_note, failure_code, diag_version, fixture_no, data_source
-            ) VALUES %s
-            """
-            from psycopg2.extras import execute_values
-            values = [(
-                row['sn'], row['pn'], row['model'], row['work_station_process'], row['baseboard_sn'], row['baseboard_pn'], row['workstation_name'],
-                row['history_station_start_time'], row['history_station_end_time'], row['history_station_passing_status'], row['operator'],
-                row['failure_reasons'], row['failure_note'], row['failure_code'], row['diag_version'], row['fixture_no'], row['data_source']
-            ) for row in new_records]
-            execute_values(cursor, insert_query, values)
-            conn.commit()
-            print(f"Imported {len(new_records):,} new records from {os.path.basename(file_path)}")
-        else:
-            print(f"No new records to import (all {existing_count:,} records already exist)")
+        with run.span("insert", rows_in=len(new_records)):
+            if new_records:
+                insert_query = """
+                INSERT INTO testboard_master_log (
+                    sn, pn, model, work_station_process, baseboard_sn, baseboard_pn, workstation_name,
+                    history_station_start_time, history_station_end_time, history_station_passing_status, operator,
+                    failure_reasons, failure_note, failure_code, diag_version, fixture_no, data_source, row_hash
+                ) VALUES %s
+                ON CONFLICT DO NOTHING
+                """
+                from psycopg2.extras import execute_values
+                values = [(
+                    row['sn'], row['pn'], row['model'], row['work_station_process'], row['baseboard_sn'], row['baseboard_pn'], row['workstation_name'],
+                    row['history_station_start_time'], row['history_station_end_time'], row['history_station_passing_status'], row['operator'],
+                    row['failure_reasons'], row['failure_note'], row['failure_code'], row['diag_version'], row['fixture_no'], row['data_source'], row['row_hash']
+                ) for row in new_records]
+                if is_star(conn, 'testboard_master_log'):
+                    # Columns above are HASH_COLUMNS + row_hash, in that order
+                    insert_facts(cursor, 'testboard_master_log', HASH_COLUMNS['testboard_master_log'] + ('row_hash',), values)
+                else:
+                    execute_values(cursor, insert_query, values)
+                conn.commit()
+                print(f"Imported {len(new_records):,} new records from {os.path.basename(file_path)}")
+            else:
+                print(f"No new records to import (all {existing_count:,} records already exist)")
         
         cursor.close()
         
@@ -139,8 +138,10 @@ def main():
     except Exception as e:
         print(f"Error importing {os.path.basename(file_path)}: {e}")
         conn.rollback()
+        run.fail(e)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
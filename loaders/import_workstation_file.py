@@ -4,6 +4,14 @@ import pandas as pd
 import psycopg2
 import math
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dimensions import insert_facts, is_star
+from part_state import ensure_part_state, state_wrapper
+from partitions import ensure_partitions
+from pipeline_metrics import PipelineRun
+from row_hash import HASH_COLUMNS, ensure_row_hash_column, existing_hashes, first_occurrences, row_hashes
+from timestamps import normalize_timestamps, py_timestamp
+
 def connect_to_db():
     return psycopg2.connect(
         host="localhost",
@@ -16,6 +24,44 @@ def connect_to_db():
 def clean_column_name(col_name):
     return col_name.lower().replace(' ', '_').replace('-', '_')
 
+def read_report(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    df['data_source'] = 'workstation'
+    # Whole-column parse; a missing start time falls back to the end time
+    return normalize_timestamps(
+        df, ['history_station_start_time', 'history_station_end_time', 'first_station_start_time'],
+        start_fallback=('history_station_start_time', 'history_station_end_time'),
+        required=('history_station_start_time', 'history_station_end_time'),
+    )
+
+def map_rows(df):
+    mapped_data = []
+    for _, row in df.iterrows():
+        mapped_row = {
+            'sn': str(row.get('sn', '')),
+            'pn': str(row.get('pn', '')),
+            'customer_pn': str(row.get('customer_pn', '')).strip() or None,
+            'outbound_version': str(row.get('outbound_version', '')),
+            'workstation_name': str(row.get('workstation_name', '')),
+            'history_station_start_time': py_timestamp(row['history_station_start_time']),
+            'history_station_end_time': py_timestamp(row['history_station_end_time']),
+            'hours': str(row.get('hours', '')),
+            'service_flow': str(row.get('service_flow', '')),
+            'model': str(row.get('model', '')),
+            'history_station_passing_status': str(row.get('history_station_passing_status', '')),
+            'passing_station_method': str(row.get('passing_station_method', '')),
+            'operator': str(row.get('operator', '')),
+            'first_station_start_time': py_timestamp(row['first_station_start_time']),
+            'data_source': 'workstation'
+        }
+        mapped_data.append(mapped_row)
+    # One hash per row over the inserted values: in-file dedup here, cross-file dedup in the probe
+    hashes = row_hashes(mapped_data, 'workstation_master_log')
+    for mapped_row, row_hash in zip(mapped_data, hashes):
+        mapped_row['row_hash'] = int(row_hash)
+    return [row for row, keep in zip(mapped_data, first_occurrences(hashes)) if keep]
+
 def main():
     if len(sys.argv) != 2:
         print("Usage: python import_workstation_file.py /path/to/file.xlsx")
@@ -25,95 +71,58 @@ def main():
         print(f"File not found: {file_path}")
         sys.exit(1)
     print(f"Importing {file_path} into workstation_master_log...")
+    run = PipelineRun("import_workstation_file", source=file_path)
     conn = connect_to_db()
     try:
-        df = pd.read_excel(file_path)
-        df.columns = [clean_column_name(col) for col in df.columns]
-        df['data_source'] = 'workstation'
-        dedup_cols = [c for c in df.columns if c != 'day']
-        df = df.drop_duplicates(subset=dedup_cols)
-        mapped_data = []
-        for _, row in df.iterrows():
-            mapped_row = {
-                'sn': str(row.get('sn', '')),
-                'pn': str(row.get('pn', '')),
-                'customer_pn': str(row.get('customer_pn', '')).strip() or None,
-                'outbound_version': str(row.get('outbound_version', '')),
-                'workstation_name': str(row.get('workstation_name', '')),
-                'history_station_start_time': pd.to_datetime(row.get('history_station_end_time')).to_pydatetime() if pd.isna(row.get('history_station_start_time')) else pd.to_datetime(row.get('history_station_start_time')).to_pydatetime() if pd.notna(row.get('history_station_start_time')) else None,
-                'history_station_end_time': pd.to_datetime(row.get('history_station_end_time')).to_pydatetime() if pd.notna(row.get('history_station_end_time')) else None,
-                'hours': str(row.get('hours', '')),
-                'service_flow': str(row.get('service_flow', '')),
-                'model': str(row.get('model', '')),
-                'history_station_passing_status': str(row.get('history_station_passing_status', '')),
-                'passing_station_method': str(row.get('passing_station_method', '')),
-                'operator': str(row.get('operator', '')),
-                'first_station_start_time': pd.to_datetime(row.get('first_station_start_time')).to_pydatetime() if pd.notna(row.get('first_station_start_time')) else None,
-                'data_source': 'workstation'
-            }
-            mapped_data.append(mapped_row)
+        with run.span("read_excel", bytes_read=os.path.getsize(file_path)) as span:
+            df = read_report(file_path)
+            span.rows_out = len(df)
+        with run.span("map_rows", rows_in=len(df)) as span:
+            mapped_data = map_rows(df)
+            span.rows_out = len(mapped_data)
         cursor = conn.cursor()
         
         print(f"Checking for existing records to prevent duplicates...")
-        existing_count = 0
-        new_records = []
-        
-        for row in mapped_data:
-            check_query = """
-            SELECT COUNT(*) FROM workstation_master_log 
-            WHERE sn = %s 
-            AND pn = %s 
-            AND customer_pn = %s 
-            AND outbound_version = %s 
-            AND workstation_name = %s 
-            AND history_station_start_time = %s 
-            AND history_station_end_time = %s 
-            AND hours = %s 
-            AND service_flow = %s 
-            AND model = %s 
-            AND history_station_passing_status = %s 
-            AND passing_station_method = %s 
-            AND operator = %s 
-            AND first_station_start_time = %s 
-            AND data_source = %s
-            """
-            
-            check_values = (
-                row['sn'], row['pn'], row['customer_pn'], row['outbound_version'], 
-                row['workstation_name'], row['history_station_start_time'], row['history_station_end_time'], 
-                row['hours'], row['service_flow'], row['model'], row['history_station_passing_status'], 
-                row['passing_station_method'], row['operator'], row['first_station_start_time'], row['data_source']
-            )
-            
-            cursor.execute(check_query, check_values)
-            exists = cursor.fetchone()[0]
-            
-            if exists > 0:
-                existing_count += 1
-            else:
-                new_records.append(row)
+        with run.span("dedup_probe", rows_in=len(mapped_data)) as span:
+            ensure_row_hash_column(cursor, 'workstation_master_log')
+            conn.commit()
+            ensure_partitions(conn, 'workstation_master_log')
+            ensure_part_state(conn)
+            existing = existing_hashes(cursor, 'workstation_master_log', [row['row_hash'] for row in mapped_data])
+            new_records = [row for row in mapped_data if row['row_hash'] not in existing]
+            existing_count = len(mapped_data) - len(new_records)
+            span.rows_out = len(new_records)
         
         print(f"Found {existing_count:,} existing records, {len(new_records):,} new records to insert")
         
-        if new_records:
-            insert_query = """
-            INSERT INTO workstation_master_log (
-                sn, pn, customer_pn, outbound_version, workstation_name,
-                history_station_start_time, history_station_end_time, hours, service_flow, model,
-                history_station_passing_status, passing_station_method, operator, first_station_start_time, data_source
-            ) VALUES %s
-            """
-            from psycopg2.extras import execute_values
-            values = [(
-                row['sn'], row['pn'], row['customer_pn'], row['outbound_version'], row['workstation_name'],
-                row['history_station_start_time'], row['history_station_end_time'], row['hours'], row['service_flow'], row['model'],
-                row['history_station_passing_status'], row['passing_station_method'], row['operator'], row['first_station_start_time'], row['data_source']
-            ) for row in new_records]
-            execute_values(cursor, insert_query, values)
-            conn.commit()
-            print(f"Imported {len(new_records):,} new records from {os.path.basename(file_path)}")
-        else:
-            print(f"No new records to import (all {existing_count:,} records already exist)")
+        with run.span("insert", rows_in=len(new_records)):
+            if new_records:
+                insert_query = """
+                INSERT INTO workstation_master_log (
+                    sn, pn, customer_pn, outbound_version, workstation_name,
+                    history_station_start_time, history_station_end_time, hours, service_flow, model,
+                    history_station_passing_status, passing_station_method, operator, first_station_start_time, data_source, row_hash
+                ) VALUES %s
+                ON CONFLICT DO NOTHING
+                """
+                from psycopg2.extras import execute_values
+                values = [(
+                    row['sn'], row['pn'], row['customer_pn'], row['outbound_version'], row['workstation_name'],
+                    row['history_station_start_time'], row['history_station_end_time'], row['hours'], row['service_flow'], row['model'],
+                    row['history_station_passing_status'], row['passing_station_method'], row['operator'], row['first_station_start_time'], row['data_source'], row['row_hash']
+                ) for row in new_records]
+                star = is_star(conn, 'workstation_master_log')
+                # part_state takes the inserted rows in the same statement
+                wrap = state_wrapper('workstation_master_log', star)
+                if star:
+                    # Columns above are HASH_COLUMNS + row_hash, in that order
+                    insert_facts(cursor, 'workstation_master_log', HASH_COLUMNS['workstation_master_log'] + ('row_hash',), values, wrap=wrap)
+                else:
+                    execute_values(cursor, wrap(insert_query), values)
+                conn.commit()
+                print(f"Imported {len(new_records):,} new records from {os.path.basename(file_path)}")
+            else:
+                print(f"No new records to import (all {existing_count:,} records already exist)")
         
         cursor.close()
         
@@ -126,8 +135,10 @@ def main():
     except Exception as e:
         print(f"Error importing {os.path.basename(file_path)}: {e}")
         conn.rollback()
+        run.fail(e)
     finally:
         conn.close()
+        run.finish()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
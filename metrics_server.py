@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Prometheus-format metrics for the long-running ETL processes.
+
+Counters, gauges and histograms are kept in-process and served as text on a
+local HTTP endpoint (/metrics) from a daemon thread, so File_Monitor's
+while-True loop and the daily_monitor batch can be scraped and alerted on
+(stalls, failures, freshness lag) without adding a client library.
+
+    from metrics_server import Counter, start_metrics_server
+
+    FILES = Counter("fox_etl_files_processed_total", "Files imported", ["source"])
+    start_metrics_server(9108)
+    FILES.labels(source="workstation").inc()
+
+Short-lived jobs can write the same text to a file for node_exporter's
+textfile collector instead (write_textfile).
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+DEFAULT_PORT = int(os.environ.get("FOX_ETL_METRICS_PORT", "9108"))
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+# End times are naive factory-local timestamps, so compare with LOCALTIMESTAMP
+FRESHNESS_SQL = "SELECT EXTRACT(EPOCH FROM LOCALTIMESTAMP - MAX(history_station_end_time)) FROM {table}"
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), register=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self.labels()
+        if register:
+            with _registry_lock:
+                _registry.append(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = self._new_child()
+            return self._children[key]
+
+    def _default(self):
+        """The unlabelled child, for metrics without labels"""
+        return self.labels()
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(child.samples(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set_to_current_time(self):
+        self.set(time.time())
+
+    def set_function(self, function):
+        """Evaluate function() at scrape time instead of storing a value"""
+        self.function = function
+
+    def samples(self, name, labelnames, key):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+            if value is None:
+                return []
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(float(value))}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def set_to_current_time(self):
+        self._default().set_to_current_time()
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        with self._lock:
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', '+Inf')])} {self.count}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(self.sum)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, key)} {self.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, register=True):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames, register)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+def generate_latest():
+    """The whole registry in Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def write_textfile(path):
+    """Write the registry atomically for node_exporter's textfile collector"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(generate_latest())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = generate_latest()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/healthz":
+            body = b"ok\n"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+        else:
+            body = b"not found\n"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every 15s would drown the monitor's own log
+        pass
+
+def start_metrics_server(port=DEFAULT_PORT, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; returns the server (port 0 picks a free one)"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
+
+
+class DataFreshness:
+    """now - MAX(history_station_end_time) per master log, cached between scrapes.
+
+    MAX() is one index probe with the end-time indexes (indexes.py --apply);
+    without them it scans the whole table.
+    """
+
+    TABLES = ("workstation_master_log", "testboard_master_log")
+
+    def __init__(self, max_age=60, db_config=None):
+        self.max_age = max_age
+        self.db_config = db_config or DB_CONFIG
+        self._lag = {}
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            with conn.cursor() as cur:
+                for table in self.TABLES:
+                    cur.execute(FRESHNESS_SQL.format(table=table))
+                    value = cur.fetchone()[0]
+                    self._lag[table] = float(value) if value is not None else None
+        finally:
+            conn.close()
+
+    def lag_seconds(self, table):
+        with self._lock:
+            if self._checked is None or time.monotonic() - self._checked > self.max_age:
+                try:
+                    self._refresh()
+                except psycopg2.Error:
+                    self._lag = {}
+                self._checked = time.monotonic()
+            lag = self._lag.get(table)
+            if lag is None:
+                return None
+            return max(lag + time.monotonic() - self._checked, 0.0)
+
+    def register(self, gauge):
+        """Bind one child of a gauge labelled by table to each master log"""
+        for table in self.TABLES:
+            gauge.labels(table=table).set_function(lambda table=table: self.lag_seconds(table))
@@ -1,5 +1,79 @@
+#!/usr/bin/env python3
+"""
+Remove duplicate rows from the master logs, one end-time range at a time.
+
+A duplicate is a row whose unique-constraint columns (row_hash.HASH_COLUMNS)
+all match an earlier row; the lowest id is kept. Because
+history_station_end_time is one of those columns, duplicates always share an
+end time. So the table can be cleaned in independent end-time chunks
+(--chunk-days, a week by default). An id range, by contrast, could split a
+duplicate from its original.
+
+Each chunk is deleted in its own short transaction, with a lock_timeout so
+it gives up instead of queueing behind an aggregator. The chunk is recorded
+in duplicate_cleanup_progress in the same transaction. --resume skips
+chunks that are already recorded, so an interrupted or failed run picks up
+where it stopped; without --resume the table's progress is reset.
+--workers runs chunks in parallel, each on its own connection. On a
+partitioned table each chunk only touches its month's partition.
+
+Afterwards only the partitions that lost rows are vacuumed and analyzed (or
+the whole table if it is not partitioned). In star mode (dimensions.py) the
+fact table is cleaned, comparing dimension keys. part_state had counted
+the workstation duplicates; each chunk takes the rows it deletes off the
+parts' counts in the same transaction (part_state.delete_duplicates()),
+and the hourly WIP snapshots are rewound to the first chunk that lost rows.
+
+Usage:
+    python cleanup_duplicates.py                                  # both master logs
+    python cleanup_duplicates.py --table testboard_master_log --workers 4
+    python cleanup_duplicates.py --since 2025-06-01 --chunk-days 1
+    python cleanup_duplicates.py --resume
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
 import psycopg2
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dimensions import fact_columns, fact_table, is_star
+from part_state import SOURCE_TABLE as PART_STATE_SOURCE, delete_duplicates, ensure_part_state, rewind_wip
+from partitions import PARTITION_KEY, is_partitioned, partitions
+from pipeline_metrics import PipelineRun
+from row_hash import HASH_COLUMNS
+
+TABLES = ("workstation_master_log", "testboard_master_log")
+DEFAULT_CHUNK_DAYS = 7
+LOCK_TIMEOUT = "5s"
+# Chunks are laid on a fixed grid so a resumed run with the same --chunk-days sees the same boundaries
+CHUNK_ORIGIN = date(2000, 1, 3)
+
+CREATE_PROGRESS_SQL = """
+CREATE TABLE IF NOT EXISTS duplicate_cleanup_progress (
+    table_name TEXT NOT NULL,
+    chunk_start TIMESTAMP NOT NULL,
+    chunk_end TIMESTAMP NOT NULL,
+    deleted_rows INTEGER NOT NULL,
+    seconds NUMERIC(10,3),
+    finished_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, chunk_start)
+)
+"""
+
+RECORD_CHUNK_SQL = """
+INSERT INTO duplicate_cleanup_progress (table_name, chunk_start, chunk_end, deleted_rows, seconds)
+VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (table_name, chunk_start) DO UPDATE SET
+    chunk_end = EXCLUDED.chunk_end,
+    deleted_rows = EXCLUDED.deleted_rows,
+    seconds = EXCLUDED.seconds,
+    finished_at = CURRENT_TIMESTAMP
+"""
+
 def connect_to_db():
     return psycopg2.connect(
         host="localhost",
@@ -9,129 +83,218 @@ def connect_to_db():
         port="5432"
     )
 
-def cleanup_workstation_duplicates():
-    conn = connect_to_db()
-    cursor = conn.cursor()
-    
-    try:
-        print("Cleaning up workstation_master_log duplicates...")
-        
-        cursor.execute("SELECT COUNT(*) FROM workstation_master_log")
-        initial_count = cursor.fetchone()[0]
-        print(f"Initial record count: {initial_count:,}")
-        
-        cleanup_query = """
-        DELETE FROM workstation_master_log 
-        WHERE id IN (
+def delete_chunk_sql(storage, columns):
+    """Delete every row but the lowest id of each duplicate group within [start, end)"""
+    return f"""
+        DELETE FROM {storage} d
+        USING (
             SELECT id FROM (
-                SELECT id,
-                       ROW_NUMBER() OVER (
-                           PARTITION BY sn, pn, customer_pn, outbound_version, workstation_name,
-                                        history_station_start_time, history_station_end_time, hours,
-                                        service_flow, model, history_station_passing_status,
-                                        passing_station_method, operator, first_station_start_time, data_source
-                           ORDER BY id
-                       ) as rn
-                FROM workstation_master_log
-            ) t
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY {', '.join(columns)} ORDER BY id) AS rn
+                FROM {storage}
+                WHERE {PARTITION_KEY} >= %(start)s AND {PARTITION_KEY} < %(end)s
+            ) ranked
             WHERE rn > 1
-        )
-        """
-        
-        cursor.execute(cleanup_query)
-        deleted_count = cursor.rowcount
+        ) dup
+        WHERE d.id = dup.id
+          AND d.{PARTITION_KEY} >= %(start)s AND d.{PARTITION_KEY} < %(end)s
+    """
+
+def chunk_ranges(cur, storage, chunk_days, since=None):
+    """[(start, end)] covering the table's end times, on the CHUNK_ORIGIN grid"""
+    cur.execute(f"SELECT MIN({PARTITION_KEY}), MAX({PARTITION_KEY}) FROM {storage}")
+    first, last = cur.fetchone()
+    if first is None:
+        return []
+    first = max(first.date(), since) if since else first.date()
+    first -= timedelta(days=(first - CHUNK_ORIGIN).days % chunk_days)
+    ranges = []
+    start = datetime.combine(first, datetime.min.time())
+    while start <= last:
+        end = start + timedelta(days=chunk_days)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def clean_chunk(table, storage, columns, start, end, track_parts=False, star=False):
+    """One chunk in one transaction; returns (rows deleted, seconds)
+
+    With track_parts, the deleted rows also come off part_state's counts.
+    """
+    started = time.perf_counter()
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            params = {"start": start, "end": end}
+            if track_parts:
+                deleted = delete_duplicates(cur, delete_chunk_sql(storage, columns), params, star, alias="d")
+            else:
+                cur.execute(delete_chunk_sql(storage, columns), params)
+                deleted = cur.rowcount
+            seconds = round(time.perf_counter() - started, 3)
+            cur.execute(RECORD_CHUNK_SQL, (table, start, end, deleted, seconds))
         conn.commit()
-        
-        cursor.execute("SELECT COUNT(*) FROM workstation_master_log")
-        final_count = cursor.fetchone()[0]
-        
-        print(f"Deleted {deleted_count:,} duplicate records")
-        print(f"Final record count: {final_count:,}")
-        print(f"Workstation cleanup complete!")
-        
-        return deleted_count
-        
-    except Exception as e:
-        print(f"Error cleaning workstation duplicates: {e}")
-        conn.rollback()
-        return 0
+        return deleted, seconds
     finally:
-        cursor.close()
         conn.close()
 
-def cleanup_testboard_duplicates():
+def rewind_wip_to_cleanup(table):
+    """Rewind the hourly WIP snapshots to the first chunk that lost rows, in this run or a resumed one"""
     conn = connect_to_db()
-    cursor = conn.cursor()
-    
     try:
-        print("Cleaning up testboard_master_log duplicates...")
-        
-        cursor.execute("SELECT COUNT(*) FROM testboard_master_log")
-        initial_count = cursor.fetchone()[0]
-        print(f"Initial record count: {initial_count:,}")
-    
-        cleanup_query = """
-        DELETE FROM testboard_master_log 
-        WHERE id IN (
-            SELECT id FROM (
-                SELECT id,
-                       ROW_NUMBER() OVER (
-                           PARTITION BY sn, pn, model, work_station_process, baseboard_sn,
-                                        baseboard_pn, workstation_name, history_station_start_time,
-                                        history_station_end_time, history_station_passing_status,
-                                        operator, failure_reasons, failure_note, failure_code,
-                                        diag_version, fixture_no, data_source
-                           ORDER BY id
-                       ) as rn
-                FROM testboard_master_log
-            ) t
-            WHERE rn > 1
-        )
-        """
-        
-        cursor.execute(cleanup_query)
-        deleted_count = cursor.rowcount
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(chunk_start) FROM duplicate_cleanup_progress WHERE table_name = %s AND deleted_rows > 0",
+                        (table,))
+            since = cur.fetchone()[0]
         conn.commit()
-        
-        cursor.execute("SELECT COUNT(*) FROM testboard_master_log")
-        final_count = cursor.fetchone()[0]
-        
-        print(f"Deleted {deleted_count:,} duplicate records")
-        print(f"Final record count: {final_count:,}")
-        print(f"Testboard cleanup complete!")
-        
-        return deleted_count
-        
-    except Exception as e:
-        print(f"Error cleaning testboard duplicates: {e}")
-        conn.rollback()
-        return 0
+        if since is not None:
+            rewind_wip(conn, since)
     finally:
-        cursor.close()
         conn.close()
 
+def vacuum_touched(storage, touched):
+    """VACUUM ANALYZE the partitions overlapping the ranges that lost rows, or the whole table"""
+    if not touched:
+        return
+    conn = connect_to_db()
+    conn.autocommit = True  # VACUUM cannot run in a transaction block
+    try:
+        with conn.cursor() as cur:
+            targets = [storage]
+            if is_partitioned(cur, storage):
+                targets = []
+                for name, month in partitions(cur, storage):
+                    if month is None:
+                        targets.append(name)
+                        continue
+                    month_start = datetime.combine(month, datetime.min.time())
+                    month_end = datetime.combine((month + timedelta(days=32)).replace(day=1), datetime.min.time())
+                    if any(start < month_end and end > month_start for start, end in touched):
+                        targets.append(name)
+            for target in targets:
+                started = time.perf_counter()
+                cur.execute(f"VACUUM (ANALYZE) {target}")
+                print(f"  VACUUM ANALYZE {target} ({time.perf_counter() - started:.1f}s)")
+    finally:
+        conn.close()
+
+def cleanup_duplicates(table, chunk_days=DEFAULT_CHUNK_DAYS, workers=1, resume=False, since=None, vacuum=True):
+    """Chunked duplicate cleanup of one master log; returns rows deleted"""
+    print(f"Cleaning up {table} duplicates...")
+    conn = connect_to_db()
+    try:
+        star = is_star(conn, table)
+        storage = fact_table(table) if star else table
+        columns = fact_columns(table, HASH_COLUMNS[table]) if star else list(HASH_COLUMNS[table])
+        with conn.cursor() as cur:
+            cur.execute(CREATE_PROGRESS_SQL)
+            if not resume:
+                cur.execute("DELETE FROM duplicate_cleanup_progress WHERE table_name = %s", (table,))
+            cur.execute("SELECT chunk_start, chunk_end FROM duplicate_cleanup_progress WHERE table_name = %s", (table,))
+            done = cur.fetchall()
+            ranges = chunk_ranges(cur, storage, chunk_days, since)
+            cur.execute(f"SELECT COUNT(*) FROM {storage}")
+            initial_count = cur.fetchone()[0]
+        conn.commit()
+        track_parts = table == PART_STATE_SOURCE
+        if track_parts:
+            # Created from the history as it is now, duplicates included; the chunks take them off
+            ensure_part_state(conn)
+    finally:
+        conn.close()
+
+    pending = [(s, e) for s, e in ranges if not any(ds <= s and de >= e for ds, de in done)]
+    print(f"Initial record count: {initial_count:,}")
+    print(f"{len(ranges)} chunks of {chunk_days} day(s), {len(ranges) - len(pending)} already done, "
+          f"{workers} worker(s)" + (" (star mode: cleaning the fact table)" if star else ""))
+
+    run = PipelineRun("cleanup_duplicates", source=table)
+    total_deleted = 0
+    failed = 0
+    touched = []
+    started = time.perf_counter()
+    try:
+        with run.span("delete", rows_in=initial_count) as span, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(clean_chunk, table, storage, columns, s, e, track_parts, star): (s, e)
+                       for s, e in pending}
+            for i, future in enumerate(as_completed(futures), 1):
+                start, end = futures[future]
+                label = f"[{i}/{len(pending)}] {start:%Y-%m-%d} .. {end:%Y-%m-%d}"
+                try:
+                    deleted, seconds = future.result()
+                except psycopg2.Error as e:
+                    # Not recorded as done, so --resume retries it
+                    failed += 1
+                    print(f"{label}: failed ({type(e).__name__}: {str(e).strip()}); rerun with --resume to retry")
+                    continue
+                total_deleted += deleted
+                span.rows_out = total_deleted
+                if deleted:
+                    touched.append((start, end))
+                print(f"{label}: deleted {deleted:,} in {seconds:.2f}s "
+                      f"(total {total_deleted:,}, {time.perf_counter() - started:.0f}s elapsed)")
+            if failed:
+                span.error = f"{failed} chunk(s) failed"
+        if track_parts:
+            rewind_wip_to_cleanup(table)
+        if vacuum:
+            with run.span("vacuum"):
+                vacuum_touched(storage, touched)
+    except Exception as e:
+        run.fail(e)
+        raise
+    finally:
+        run.finish()
+
+    print(f"Deleted {total_deleted:,} duplicate records")
+    print(f"Final record count: {initial_count - total_deleted:,}")
+    if failed:
+        print(f"{failed} chunk(s) failed; rerun with --resume to retry them")
+    else:
+        print(f"{table} cleanup complete!")
+    return total_deleted
+
+def cleanup_workstation_duplicates(**options):
+    return cleanup_duplicates("workstation_master_log", **options)
+
+def cleanup_testboard_duplicates(**options):
+    return cleanup_duplicates("testboard_master_log", **options)
+
 def main():
+    parser = argparse.ArgumentParser(description="Chunked, resumable duplicate cleanup of the master logs")
+    parser.add_argument('--table', choices=TABLES, help="Clean one master log (default: both)")
+    parser.add_argument('--chunk-days', type=int, default=DEFAULT_CHUNK_DAYS, help="End-time range per transaction")
+    parser.add_argument('--workers', type=int, default=1, help="Chunks cleaned in parallel")
+    parser.add_argument('--since', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help="Only rows ending on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--resume', action='store_true', help="Skip chunks finished by the previous run")
+    parser.add_argument('--no-vacuum', action='store_true', help="Skip the VACUUM ANALYZE of touched partitions")
+    args = parser.parse_args()
+    if args.chunk_days < 1 or args.workers < 1:
+        parser.error("--chunk-days and --workers must be at least 1")
+
+    options = dict(chunk_days=args.chunk_days, workers=args.workers, resume=args.resume,
+                   since=args.since, vacuum=not args.no_vacuum)
+
     print("Starting duplicate cleanup process...")
     print("=" * 50)
-    
-    workstation_deleted = cleanup_workstation_duplicates()
-    
-    print()
-    
-    testboard_deleted = cleanup_testboard_duplicates()
-    
-    print()
+
+    deleted = {}
+    for table in ([args.table] if args.table else TABLES):
+        deleted[table] = cleanup_duplicates(table, **options)
+        print()
+
     print("Cleanup Summary")
     print("=" * 50)
-    print(f"Workstation duplicates removed: {workstation_deleted:,}")
-    print(f"Testboard duplicates removed: {testboard_deleted:,}")
-    print(f"Total duplicates removed: {workstation_deleted + testboard_deleted:,}")
-    
-    if workstation_deleted > 0 or testboard_deleted > 0:
+    for table, count in deleted.items():
+        print(f"{table} duplicates removed: {count:,}")
+    print(f"Total duplicates removed: {sum(deleted.values()):,}")
+
+    if any(deleted.values()):
         print("Database cleaned up successfully!")
         print("You can now test the import scripts again - they should show 0 new records.")
     else:
         print("No duplicates found - database is already clean!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,9 +1,14 @@
 import subprocess
 import sys
 import os
+import time
 from datetime import datetime
 import psycopg2
 import argparse
+import atexit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics_server import Counter, DataFreshness, Gauge, Histogram, start_metrics_server, write_textfile
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -13,23 +18,36 @@ DB_CONFIG = {
     'port': '5432'
 }
 
+OPERATION_RUNS = Counter("fox_etl_operation_runs_total", "Daily/weekly operations run", ["operation", "status"])
+OPERATION_SECONDS = Histogram("fox_etl_operation_seconds", "Daily/weekly operation run time", ["operation"],
+                              buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+OPERATION_LAST_SUCCESS = Gauge("fox_etl_operation_last_success_timestamp_seconds",
+                               "Unix time an operation last succeeded", ["operation"])
+DATA_FRESHNESS = Gauge("fox_etl_data_freshness_lag_seconds", "Now minus the newest history_station_end_time", ["table"])
+
 def log_message(message, level="INFO"):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {level}: {message}")
 
 def run_command(command, description):
     log_message(f"Starting: {description}")
+    started = time.perf_counter()
     try:
         result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        OPERATION_SECONDS.labels(operation=description).observe(time.perf_counter() - started)
         if result.returncode == 0:
             log_message(f"Success: {description}")
+            OPERATION_RUNS.labels(operation=description, status="success").inc()
+            OPERATION_LAST_SUCCESS.labels(operation=description).set_to_current_time()
             return True
         else:
             log_message(f"Failed: {description}", "ERROR")
             log_message(f"Error output: {result.stderr}", "ERROR")
+            OPERATION_RUNS.labels(operation=description, status="failed").inc()
             return False
     except Exception as e:
         log_message(f"Exception in {description}: {str(e)}", "ERROR")
+        OPERATION_RUNS.labels(operation=description, status="failed").inc()
         return False
 
 def check_database_health():
@@ -73,6 +91,8 @@ def run_daily_operations():
         
         ("cd aggregators/workstation_agg && python aggregate_tpy_daily.py --mode recent", "Daily TPY aggregation"),
         ("cd aggregators/workstation_agg && python aggregate_packing_daily_dedup.py", "Daily packing aggregation"),
+        ("cd aggregators/workstation_agg && python aggregate_wip_hourly.py", "Hourly WIP snapshots"),
+        ("cd aggregators/workstation_agg && python aggregate_station_durations.py", "Station cycle and queue times"),
         
         ("python cleanup_duplicates.py", "Clean duplicates"),
         ("python check_record_counts.py", "Check record counts"),
@@ -156,10 +176,20 @@ def main():
                        default='daily', help="Operation mode")
     parser.add_argument('--check-only', action='store_true', 
                        help="Only check status, don't run operations")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                       help="Serve Prometheus /metrics on this local port while running (default: off)")
+    parser.add_argument('--metrics-textfile',
+                       help="Write metrics here on exit, for node_exporter's textfile collector")
     
     args = parser.parse_args()
     
     log_message("ETL Daily Monitor Starting...")
+    DataFreshness(db_config=DB_CONFIG).register(DATA_FRESHNESS)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        log_message(f"Metrics endpoint: http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.metrics_textfile:
+        atexit.register(write_textfile, args.metrics_textfile)
     
     if not check_database_health():
         log_message("Database health check failed. Exiting.", "ERROR")
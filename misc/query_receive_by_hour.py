@@ -3,10 +3,14 @@
 Query all RECEIVE records from workstation_master_log for a given date and hours 20-23.
 Usage: python query_receive_by_hour.py 2025-07-07
 """
+import os
 import sys
 import psycopg2
 from datetime import datetime, timedelta
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streaming import stream_batches
+
 DB_CONFIG = {
     'host': 'localhost',
     'database': 'fox_db',
@@ -31,22 +35,22 @@ def main():
 
     conn = psycopg2.connect(**DB_CONFIG)
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT sn, history_station_end_time, EXTRACT(HOUR FROM history_station_end_time) AS hour
-                FROM workstation_master_log
-                WHERE workstation_name = 'RECEIVE'
-                  AND history_station_end_time >= %s
-                  AND history_station_end_time < %s
-                ORDER BY history_station_end_time;
-            """, (start_dt, end_dt))
-            rows = cur.fetchall()
-            print(f"RECEIVE records for {date_str} between 20:00 and 23:59:")
-            print(f"{'sn':<20} {'end_time':<20} {'hour':<4}")
-            print('-' * 50)
+        print(f"RECEIVE records for {date_str} between 20:00 and 23:59:")
+        print(f"{'sn':<20} {'end_time':<20} {'hour':<4}")
+        print('-' * 50)
+        total = 0
+        for rows in stream_batches(conn, """
+            SELECT sn, history_station_end_time, end_hour AS hour
+            FROM workstation_master_log
+            WHERE workstation_name = 'RECEIVE'
+              AND history_station_end_time >= %s
+              AND history_station_end_time < %s
+            ORDER BY history_station_end_time;
+        """, (start_dt, end_dt), name="receive_by_hour"):
             for sn, end_time, hour in rows:
                 print(f"{sn:<20} {end_time}   {int(hour):<4}")
-            print(f"\nTotal records: {len(rows)}")
+            total += len(rows)
+        print(f"\nTotal records: {total}")
     finally:
         conn.close()
 
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+One row per part (sn, model) with its lifecycle so far, kept up to date on ingest.
+
+FPY, completed / failed / "stuck in limbo" counts and WIP all regroup the
+raw workstation history by sn every time they are asked for. part_state
+keeps that grouping instead:
+
+    first_seen / last_seen     first and last station end time
+    last_station / last_status the station (and its result) the part was last seen at
+    station_visits             history rows
+    pass_count / fail_count    rows with status 'Pass' / anything else, as the FPY query counts them
+    rework_count               visits to *_REPAIR stations
+    reached_packing_at         first PACKING end time, NULL while the part has not reached it
+
+Only the TPY flows are counted (service_flow set and not 'NC Sort' or
+'RO'), as in the FPY and TPY queries.
+
+The loaders keep it current in the statement that inserts the history.
+with_part_state() wraps their INSERT in a data-modifying CTE. The rows the
+INSERT actually returns are grouped per part, then merged into part_state
+in one upsert: counts are added, first/last are widened. Rows skipped as
+duplicates are not returned, so they are never counted twice. The merge
+is order independent, so a late file with older rows gives the same state
+as loading everything in end-time order.
+
+Counts are over the parts' whole history, so window metrics here are
+cohort metrics. part_fpy() takes the parts first seen in the window and
+follows them to today. That is different from the weekly TPY tables, which
+regroup only the rows inside the week.
+
+Archiving months (archive.py) leaves part_state alone, so it still counts
+the history of parts whose early months were archived; the daily TPY week
+starters rely on first_seen for that. --rebuild recounts it from the rows
+in the database, e.g. after deleting history by hand, then merges the
+archived months back in (archived_batches()), so a rebuild after archiving
+gives the same state as before it. cleanup_duplicates.py takes the
+duplicates it removes off the counts in the same transaction
+(delete_duplicates()). Both scripts also rewind the hourly WIP snapshots,
+which cannot see deletes themselves (rewind_wip()).
+
+Usage:
+    python part_state.py --status
+    python part_state.py --rebuild
+    python part_state.py --fpy 2025-06-02 2025-06-09
+    python part_state.py --wip --idle-hours 48
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from dimensions import FACT_DIMENSIONS
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+SOURCE_TABLE = "workstation_master_log"
+# Master log columns part_state is computed from; the INSERT returns these
+SOURCE_COLUMNS = ("sn", "model", "workstation_name", "history_station_passing_status", "service_flow",
+                  "history_station_end_time")
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS part_state (
+    sn VARCHAR(255) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    first_seen TIMESTAMP NOT NULL,
+    last_seen TIMESTAMP NOT NULL,
+    last_station VARCHAR(255) NOT NULL,
+    last_status VARCHAR(255),
+    station_visits INTEGER NOT NULL,
+    pass_count INTEGER NOT NULL,
+    fail_count INTEGER NOT NULL,
+    rework_count INTEGER NOT NULL,
+    reached_packing_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sn, model)
+)
+"""
+
+INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_part_state_first_seen ON part_state (first_seen)",
+    "CREATE INDEX IF NOT EXISTS idx_part_state_wip ON part_state (last_station, last_seen) "
+    "WHERE reached_packing_at IS NULL",
+)
+
+# The latest row wins; ties on end time go to the greater station name, then status
+LAST_ORDER = ("history_station_end_time DESC, workstation_name DESC, "
+              "COALESCE(history_station_passing_status, '') DESC")
+IS_LATER = ("(EXCLUDED.last_seen, EXCLUDED.last_station, COALESCE(EXCLUDED.last_status, '')) > "
+            "(part_state.last_seen, part_state.last_station, COALESCE(part_state.last_status, ''))")
+
+UPSERT_SQL = f"""
+INSERT INTO part_state (sn, model, first_seen, last_seen, last_station, last_status,
+                        station_visits, pass_count, fail_count, rework_count, reached_packing_at)
+SELECT
+    sn,
+    COALESCE(model, ''),
+    MIN(history_station_end_time),
+    MAX(history_station_end_time),
+    (array_agg(workstation_name ORDER BY {LAST_ORDER}))[1],
+    (array_agg(history_station_passing_status ORDER BY {LAST_ORDER}))[1],
+    COUNT(*),
+    COUNT(*) FILTER (WHERE history_station_passing_status = 'Pass'),
+    COUNT(*) FILTER (WHERE history_station_passing_status != 'Pass'),
+    COUNT(*) FILTER (WHERE right(workstation_name, 7) = '_REPAIR'),
+    MIN(history_station_end_time) FILTER (WHERE workstation_name = 'PACKING')
+FROM {{source}}
+WHERE service_flow NOT IN ('NC Sort', 'RO') AND service_flow IS NOT NULL
+GROUP BY sn, COALESCE(model, '')
+ON CONFLICT (sn, model) DO UPDATE SET
+    first_seen = LEAST(part_state.first_seen, EXCLUDED.first_seen),
+    last_seen = GREATEST(part_state.last_seen, EXCLUDED.last_seen),
+    last_station = CASE WHEN {IS_LATER} THEN EXCLUDED.last_station ELSE part_state.last_station END,
+    last_status = CASE WHEN {IS_LATER} THEN EXCLUDED.last_status ELSE part_state.last_status END,
+    station_visits = part_state.station_visits + EXCLUDED.station_visits,
+    pass_count = part_state.pass_count + EXCLUDED.pass_count,
+    fail_count = part_state.fail_count + EXCLUDED.fail_count,
+    rework_count = part_state.rework_count + EXCLUDED.rework_count,
+    reached_packing_at = LEAST(part_state.reached_packing_at, EXCLUDED.reached_packing_at),
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+# Archived rows are staged here and merged like a load
+ARCHIVED_ROWS_SQL = f"""
+CREATE TEMP TABLE part_state_archived ON COMMIT DROP AS
+SELECT {', '.join(SOURCE_COLUMNS)} FROM {SOURCE_TABLE} LIMIT 0
+"""
+
+# Duplicates being removed, grouped per part; their twin stays, so only the counts change
+REMOVED_SQL = """
+CREATE TEMP TABLE part_state_removed (
+    sn VARCHAR(255) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    station_visits INTEGER NOT NULL,
+    pass_count INTEGER NOT NULL,
+    fail_count INTEGER NOT NULL,
+    rework_count INTEGER NOT NULL
+)
+"""
+GROUP_REMOVED_SQL = """
+INSERT INTO part_state_removed
+SELECT
+    sn,
+    COALESCE(model, ''),
+    COUNT(*),
+    COUNT(*) FILTER (WHERE history_station_passing_status = 'Pass'),
+    COUNT(*) FILTER (WHERE history_station_passing_status != 'Pass'),
+    COUNT(*) FILTER (WHERE right(workstation_name, 7) = '_REPAIR')
+FROM {source}
+WHERE service_flow NOT IN ('NC Sort', 'RO') AND service_flow IS NOT NULL
+GROUP BY sn, COALESCE(model, '')
+"""
+# In key order, so parallel deletes wait on each other instead of deadlocking
+LOCK_REMOVED_SQL = """
+SELECT 1 FROM part_state JOIN part_state_removed gone USING (sn, model)
+ORDER BY sn, model
+FOR UPDATE OF part_state
+"""
+SUBTRACT_SQL = """
+UPDATE part_state SET
+    station_visits = part_state.station_visits - gone.station_visits,
+    pass_count = part_state.pass_count - gone.pass_count,
+    fail_count = part_state.fail_count - gone.fail_count,
+    rework_count = part_state.rework_count - gone.rework_count,
+    updated_at = CURRENT_TIMESTAMP
+FROM part_state_removed gone
+WHERE part_state.sn = gone.sn AND part_state.model = gone.model
+"""
+
+FPY_SQL = """
+SELECT
+    COUNT(*) AS parts_started,
+    COUNT(*) FILTER (WHERE reached_packing_at IS NOT NULL AND fail_count = 0) AS first_pass_success,
+    COUNT(*) FILTER (WHERE reached_packing_at IS NOT NULL) AS parts_completed,
+    COUNT(*) FILTER (WHERE fail_count > 0) AS parts_failed,
+    COUNT(*) FILTER (WHERE reached_packing_at IS NULL AND fail_count = 0) AS parts_stuck_in_limbo
+FROM part_state
+WHERE first_seen >= %s AND first_seen < %s
+"""
+
+WIP_SQL = """
+SELECT last_station, COUNT(*) AS parts, MIN(last_seen) AS oldest, SUM(rework_count) AS rework
+FROM part_state
+WHERE reached_packing_at IS NULL AND last_seen < %s
+GROUP BY last_station
+ORDER BY parts DESC, last_station
+"""
+
+
+def returned_rows(name, star=False, alias=None):
+    """(RETURNING list, source of SOURCE_COLUMNS values) for a data-modifying CTE called name.
+
+    With star, the statement writes the fact table, whose dimension columns
+    are keys; they are joined back to values (dimensions.py).
+    """
+    prefix = f"{alias}." if alias else ""
+    if not star:
+        return ", ".join(prefix + c for c in SOURCE_COLUMNS), name
+    dims = FACT_DIMENSIONS[SOURCE_TABLE]
+    returning = ", ".join(prefix + (f"{c}_id" if c in dims else c) for c in SOURCE_COLUMNS)
+    select = ", ".join(f"d_{c}.value AS {c}" if c in dims else f"r.{c}" for c in SOURCE_COLUMNS)
+    joins = " ".join(f"LEFT JOIN {dims[c]} d_{c} ON d_{c}.id = r.{c}_id" for c in SOURCE_COLUMNS if c in dims)
+    return returning, f"(SELECT {select} FROM {name} r {joins}) {name}"
+
+def with_part_state(insert_sql, star=False):
+    """Wrap an INSERT into the workstation history so part_state takes the rows it inserts.
+
+    Returns one statement whose result is the number of rows inserted.
+    """
+    insert_sql = insert_sql.strip().rstrip(";")
+    returning, source = returned_rows("inserted", star)
+    return (f"WITH inserted AS (\n{insert_sql}\nRETURNING {returning}\n),\n"
+            f"merged AS ({UPSERT_SQL.format(source=source)})\n"
+            f"SELECT COUNT(*) FROM inserted")
+
+def delete_duplicates(cur, delete_sql, params, star=False, alias=None):
+    """Run a DELETE of duplicate workstation rows and take them off part_state's counts; returns rows deleted.
+
+    Only for rows that duplicate one that stays (every SOURCE_COLUMNS value
+    equal): the counts go down, everything else is what the twin already
+    gives. alias is the DELETE's alias for the table, if it has one.
+    """
+    delete_sql = delete_sql.strip().rstrip(";")
+    returning, source = returned_rows("deleted", star, alias)
+    cur.execute(REMOVED_SQL)
+    cur.execute(f"WITH deleted AS (\n{delete_sql}\nRETURNING {returning}\n),\n"
+                f"grouped AS ({GROUP_REMOVED_SQL.format(source=source)})\n"
+                f"SELECT COUNT(*) FROM deleted", params)
+    deleted = cur.fetchone()[0]
+    cur.execute(LOCK_REMOVED_SQL)
+    cur.execute(SUBTRACT_SQL)
+    cur.execute("DROP TABLE part_state_removed")
+    return deleted
+
+def state_wrapper(table, star=False):
+    """with_part_state for writers into table, or None if part_state does not follow it"""
+    if table != SOURCE_TABLE:
+        return None
+    return lambda insert_sql: with_part_state(insert_sql, star)
+
+def merge_archived(cur, archive_dir=None):
+    """Merge the archived months of the workstation history into part_state; returns the rows merged"""
+    from archive import archived_batches  # archive imports this module
+    cur.execute(ARCHIVED_ROWS_SQL)
+    rows = 0
+    for batch in archived_batches(SOURCE_TABLE, list(SOURCE_COLUMNS), archive_dir=archive_dir):
+        values = list(zip(*(batch.column(c).to_pylist() for c in SOURCE_COLUMNS)))
+        execute_values(cur, f"INSERT INTO part_state_archived ({', '.join(SOURCE_COLUMNS)}) VALUES %s",
+                       values, page_size=1000)
+        rows += len(values)
+    if rows:
+        cur.execute(UPSERT_SQL.format(source="part_state_archived"))
+    return rows
+
+def rebuild_part_state(conn, archive_dir=None):
+    """Recount part_state from the whole workstation history, archived months included; returns the number of parts"""
+    with conn.cursor() as cur:
+        # Loaders wait on the lock; their increments land after the recount, which cannot see their rows
+        cur.execute("LOCK TABLE part_state IN ACCESS EXCLUSIVE MODE")
+        cur.execute("TRUNCATE part_state")
+        cur.execute(UPSERT_SQL.format(source=SOURCE_TABLE))
+        merge_archived(cur, archive_dir)
+        cur.execute("SELECT COUNT(*) FROM part_state")
+        parts = cur.fetchone()[0]
+        cur.execute("ANALYZE part_state")
+    conn.commit()
+    return parts
+
+def ensure_part_state(conn):
+    """Create part_state if needed, counting the existing history into it; returns True if it was created"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('part_state') IS NULL, to_regclass(%s) IS NOT NULL", (SOURCE_TABLE,))
+        missing, has_source = cur.fetchone()
+        if not missing:
+            return False
+        cur.execute(CREATE_TABLE_SQL)
+        for sql in INDEX_SQL:
+            cur.execute(sql)
+    conn.commit()
+    if has_source:
+        started = time.perf_counter()
+        parts = rebuild_part_state(conn)
+        print(f"Created part_state from {SOURCE_TABLE}: {parts:,} parts in {time.perf_counter() - started:.2f}s")
+    return True
+
+def rewind_wip(conn, since=None):
+    """Have the next hourly WIP run (aggregate_wip_hourly.py) recompute its snapshots from since.
+
+    For writers that delete workstation history or put back rows with old
+    ids, which that run cannot notice itself. Without since it starts over
+    from the first event. Waits for a WIP run in progress to finish.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('wip_progress') IS NOT NULL")
+        if cur.fetchone()[0]:
+            if since is None:
+                cur.execute("DELETE FROM wip_progress")
+            else:
+                cur.execute("UPDATE wip_progress SET rewind_from = LEAST(rewind_from, date_trunc('hour', %s::timestamp))",
+                            (since,))
+    conn.commit()
+
+def part_fpy(conn, start, end):
+    """FPY counts of the parts first seen in [start, end), followed through their whole history"""
+    with conn.cursor() as cur:
+        cur.execute(FPY_SQL, (start, end))
+        names = [d[0] for d in cur.description]
+        return dict(zip(names, cur.fetchone()))
+
+def wip(conn, idle_hours=0, now=None):
+    """[(last station, parts, oldest last_seen, rework)] of parts not at PACKING yet, idle for idle_hours"""
+    cutoff = (now or datetime.now()) - timedelta(hours=idle_hours)
+    with conn.cursor() as cur:
+        cur.execute(WIP_SQL, (cutoff,))
+        return cur.fetchall()
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*), COUNT(reached_packing_at), SUM(station_visits), MIN(first_seen), MAX(last_seen),
+                   MAX(updated_at), pg_size_pretty(pg_total_relation_size('part_state'))
+            FROM part_state
+        """)
+        parts, packed, visits, first, last, updated, size = cur.fetchone()
+    print(f"part_state: {parts:,} parts ({packed:,} reached PACKING), {visits or 0:,} history rows, {size}")
+    print(f"  activity {first} .. {last}, last updated {updated}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-part lifecycle state kept up to date by the loaders")
+    parser.add_argument('--status', action='store_true', help="Summarize part_state")
+    parser.add_argument('--rebuild', action='store_true', help="Recount part_state from the workstation history")
+    parser.add_argument('--archive-dir', help="With --rebuild, where archive.py keeps the archived months")
+    parser.add_argument('--fpy', nargs=2, metavar=('START', 'END'),
+                        type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
+                        help="FPY of the parts first seen in [START, END)")
+    parser.add_argument('--wip', action='store_true', help="Parts not at PACKING yet, by last station")
+    parser.add_argument('--idle-hours', type=float, default=0, help="With --wip, only parts idle this long")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        ensure_part_state(conn)
+        if args.rebuild:
+            started = time.perf_counter()
+            print(f"Rebuilt part_state: {rebuild_part_state(conn, args.archive_dir):,} parts in {time.perf_counter() - started:.2f}s")
+        if args.fpy:
+            counts = part_fpy(conn, *args.fpy)
+            started_parts = counts["parts_started"]
+            active = counts["parts_completed"] + counts["parts_failed"]
+            print(f"Parts first seen {args.fpy[0]:%Y-%m-%d} .. {args.fpy[1]:%Y-%m-%d}: {started_parts:,}")
+            for name, value in counts.items():
+                print(f"  {name}: {value:,}")
+            if started_parts:
+                print(f"  traditional FPY: {counts['first_pass_success'] / started_parts * 100:.2f}%")
+            if active:
+                print(f"  completed-only FPY: {counts['first_pass_success'] / active * 100:.2f}%")
+        if args.wip:
+            rows = wip(conn, args.idle_hours)
+            print(f"WIP by last station ({sum(r[1] for r in rows):,} parts):")
+            for station, parts, oldest, rework in rows:
+                print(f"  {station:<20} {parts:>7,}  oldest {oldest}  rework {rework:,}")
+        if args.status or not (args.rebuild or args.fpy or args.wip):
+            print_status(conn)
+    finally:
+        conn.close()
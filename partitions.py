@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Monthly range partitioning of the master logs on history_station_end_time.
+
+--migrate copies a master log into a table PARTITION BY RANGE
+(history_station_end_time), one partition per month (<table>_pYYYY_MM) plus a
+default partition, and swaps it in under the same name. The old table is
+kept as <table>_unpartitioned until you drop it. In star mode
+(dimensions.py) the fact table is partitioned and the view is re-pointed.
+
+Each partition gets a BRIN index on history_station_end_time, which is tiny
+because rows arrive roughly in time order, and a B-tree on sn. The unique
+constraints carry over, so the writers' ON CONFLICT clauses still work. A
+query with an end-time range (every weekly/daily aggregator) only scans the
+months it touches. --explain shows the plan for one day.
+
+ensure_partitions() creates the current month and the next few. The loaders
+and upload scripts call it before inserting. Rows that arrived for a month
+with no partition sit in the default partition and are moved out when the
+month's partition is created.
+
+Old months can be detached cheaply (a catalog change, no row copying). The
+detached tables stay as plain tables for archiving or dropping.
+
+Usage:
+    python partitions.py --status
+    python partitions.py --migrate                      # both master logs
+    python partitions.py --ensure --months-ahead 6
+    python partitions.py --explain workstation_master_log 2025-06-04
+    python partitions.py --detach-before 2025-01 --table testboard_master_log
+"""
+import argparse
+import re
+import time
+from datetime import date, datetime
+
+import psycopg2
+
+from dimensions import (DB_CONFIG, FACT_DIMENSIONS, dependent_views, fact_table, generated_columns, is_star,
+                        relation_size, resume_summary_views, suspend_summary_views, table_columns)
+from summary_views import relation_kind
+
+PARTITION_KEY = "history_station_end_time"
+DEFAULT_MONTHS_AHEAD = 3
+PARTITION_NAME_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(storage, month):
+    return f"{storage}_p{month:%Y_%m}"
+
+def storage_table(conn, table):
+    """The relation actually holding the rows: the fact table in star mode"""
+    return fact_table(table) if is_star(conn, table) else table
+
+def is_partitioned(cur, relation):
+    return relation_kind(cur, relation) == 'p'
+
+def partitions(cur, storage):
+    """[(partition, month or None for the default partition)] in month order"""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (storage,))
+    result = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME_RE.search(name)
+        result.append((name, date(int(match.group(1)), int(match.group(2)), 1) if match else None))
+    return sorted(result, key=lambda p: (p[1] is None, p[1] or date.min))
+
+def stored_columns(cur, storage):
+    """Column list for copying rows between tables; generated columns are recomputed, not copied"""
+    generated = generated_columns(cur, storage)
+    return ", ".join(c[0] for c in table_columns(cur, storage) if c[0] not in generated)
+
+def create_partition(cur, storage, month):
+    """Attach one month; rows already sitting in the default partition for it are moved in first"""
+    name = partition_name(storage, month)
+    start, end = month, add_months(month, 1)
+    default = f"{storage}_pdefault"
+    if relation_kind(cur, default) is None:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {storage} FOR VALUES FROM (%s) TO (%s)", (start, end))
+        return name
+    # With a default partition, attaching checks it holds no rows for the month; move them out first
+    cur.execute(f"CREATE TABLE {name} (LIKE {storage} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)")
+    columns = stored_columns(cur, storage)
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING {columns}
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+    """, (start, end))
+    if cur.rowcount:
+        print(f"Moved {cur.rowcount:,} rows from {default} into {name}")
+    cur.execute(f"ALTER TABLE {storage} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    return name
+
+def ensure_partitions(conn, table, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """Create missing partitions from this month through months_ahead; returns the names created"""
+    created = []
+    with conn.cursor() as cur:
+        storage = storage_table(conn, table)
+        if not is_partitioned(cur, storage):
+            return created
+        existing = {month for _, month in partitions(cur, storage)}
+        this_month = date.today().replace(day=1)
+        for n in range(months_ahead + 1):
+            month = add_months(this_month, n)
+            if month not in existing:
+                created.append(create_partition(cur, storage, month))
+    conn.commit()
+    for name in created:
+        print(f"Created partition {name}")
+    return created
+
+def migrate(conn, table, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """Copy a master log into a partitioned table and swap it in under the same name"""
+    star = is_star(conn, table)
+    storage = fact_table(table) if star else table
+    new = f"{storage}_partitioned"
+    with conn.cursor() as cur:
+        kind = relation_kind(cur, storage)
+        if kind == 'p':
+            print(f"{storage} is already partitioned")
+            return
+        if kind != 'r':
+            print(f"{storage} does not exist; run its upload script first")
+            return
+        blocking = [v for v in dependent_views(cur, storage) if not (star and v == table)]
+        if blocking and not all(relation_kind(cur, v) == 'm' for v in blocking):
+            raise RuntimeError(f"{storage} is used by {', '.join(blocking)}; drop them first")
+        view_definition = None
+        if star:
+            cur.execute("SELECT pg_get_viewdef(%s::regclass)", (table,))
+            view_definition = cur.fetchone()[0]
+    # Summaries read the master log by name; they are rebuilt on the partitioned table
+    summaries = suspend_summary_views(conn, table)
+
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {new} CASCADE")
+        cur.execute(f"""
+            CREATE TABLE {new} (LIKE {storage} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+            PARTITION BY RANGE ({PARTITION_KEY})
+        """)
+        # A partitioned table's unique keys must contain the partition key
+        cur.execute(f"ALTER TABLE {new} ADD PRIMARY KEY (id, {PARTITION_KEY})")
+        cur.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+        """, (storage,))
+        for name, definition in cur.fetchall():
+            cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {name} {definition}")
+
+        cur.execute(f"SELECT MIN({PARTITION_KEY}), MAX({PARTITION_KEY}) FROM {storage}")
+        first, last = cur.fetchone()
+        this_month = date.today().replace(day=1)
+        first = first.date().replace(day=1) if first else this_month
+        last = max(last.date().replace(day=1) if last else this_month, this_month)
+        months = []
+        month = first
+        while month <= add_months(last, months_ahead):
+            months.append(month)
+            month = add_months(month, 1)
+        for month in months:
+            cur.execute(f"CREATE TABLE {partition_name(storage, month)} PARTITION OF {new} FOR VALUES FROM (%s) TO (%s)",
+                        (month, add_months(month, 1)))
+        cur.execute(f"CREATE TABLE {storage}_pdefault PARTITION OF {new} DEFAULT")
+
+        # Same names as before on the new table; the old table's copies get an _unpartitioned suffix
+        cur.execute("""
+            SELECT i.relname, pg_get_indexdef(x.indexrelid), con.conname, pg_get_constraintdef(con.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            LEFT JOIN pg_constraint con ON con.conindid = x.indexrelid AND con.contype = 'u'
+            WHERE x.indrelid = %s::regclass AND NOT x.indisprimary
+        """, (storage,))
+        for index, definition, constraint, constraint_definition in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index}_unpartitioned")
+            if constraint:
+                if PARTITION_KEY not in constraint_definition:
+                    constraint_definition = constraint_definition[:-1] + f", {PARTITION_KEY})"
+                cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {constraint} {constraint_definition}")
+            else:
+                head, _, tail = definition.partition(" USING ")
+                head = re.sub(rf" ON (\w+\.)?{storage}$", f" ON {new}", head)
+                cur.execute(f"{head} USING {tail}")
+        cur.execute(f"CREATE INDEX {storage}_end_time_brin ON {new} USING brin ({PARTITION_KEY})")
+        cur.execute(f"CREATE INDEX {storage}_sn_idx ON {new} (sn)")
+
+        total = 0
+        columns = stored_columns(cur, storage)
+        for month in months:
+            cur.execute(f"""
+                INSERT INTO {new} ({columns}) SELECT {columns} FROM {storage}
+                WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s
+            """, (month, add_months(month, 1)))
+            if cur.rowcount:
+                print(f"  {partition_name(storage, month)}: {cur.rowcount:,} rows")
+            total += cur.rowcount
+
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (storage,))
+        sequence = cur.fetchone()[0]
+        cur.execute(f"DROP TABLE IF EXISTS {storage}_unpartitioned")
+        cur.execute("""
+            SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = %s::regclass AND x.indisprimary
+        """, (storage,))
+        for (pkey,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {pkey} RENAME TO {storage}_unpartitioned_pkey")
+        cur.execute(f"ALTER TABLE {storage} RENAME TO {storage}_unpartitioned")
+        cur.execute(f"ALTER TABLE {new} RENAME TO {storage}")
+        cur.execute(f"ALTER TABLE {storage} RENAME CONSTRAINT {new}_pkey TO {storage}_pkey")
+        if sequence:
+            # The old table owns the id sequence; dropping it later would take the sequence along
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {storage}.id")
+        if view_definition:
+            # Views bind to the table, not the name; re-create it over the partitioned fact table
+            cur.execute(f"CREATE OR REPLACE VIEW {table} AS {view_definition}")
+        cur.execute(f"ANALYZE {storage}")
+    conn.commit()
+    print(f"Partitioned {storage}: {total:,} rows in {len(months)} monthly partitions "
+          f"in {time.perf_counter() - started:.2f}s (old table kept as {storage}_unpartitioned)")
+    resume_summary_views(conn, summaries)
+
+def detach_before(conn, table, month):
+    """Detach every monthly partition ending on or before month; returns the detached table names"""
+    detached = []
+    with conn.cursor() as cur:
+        storage = storage_table(conn, table)
+        if not is_partitioned(cur, storage):
+            print(f"{storage} is not partitioned")
+            return detached
+        for name, start in partitions(cur, storage):
+            if start is not None and add_months(start, 1) <= month:
+                cur.execute(f"ALTER TABLE {storage} DETACH PARTITION {name}")
+                detached.append(name)
+    conn.commit()
+    for name in detached:
+        print(f"Detached {name} (now a plain table; archive or DROP it)")
+    return detached
+
+def explain_day(conn, table, day):
+    """EXPLAIN of a one-day count, to check that only one partition is scanned"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            EXPLAIN SELECT workstation_name, COUNT(*) FROM {table}
+            WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s::date + 1
+            GROUP BY workstation_name
+        """, (day, day))
+        for (line,) in cur.fetchall():
+            print(line)
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        for table in FACT_DIMENSIONS:
+            storage = storage_table(conn, table)
+            if not is_partitioned(cur, storage):
+                kind = relation_kind(cur, storage)
+                print(f"{storage}: {'not partitioned' if kind else 'missing'}")
+                continue
+            print(f"{storage}: partitioned by month on {PARTITION_KEY}")
+            print(f"  {'Partition':<44} {'Rows (est.)':>12} {'Size':>10}")
+            for name, _ in partitions(cur, storage):
+                cur.execute("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = %s::regclass", (name,))
+                rows = cur.fetchone()[0]
+                print(f"  {name:<44} {rows:>12,} {relation_size(cur, name) / 2**20:>7,.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monthly partitioning of the master logs")
+    parser.add_argument('--table', choices=sorted(FACT_DIMENSIONS), help="One master log (default: both)")
+    parser.add_argument('--status', action='store_true', help="List partitions with row estimates and sizes")
+    parser.add_argument('--migrate', action='store_true', help="Convert to a partitioned table, copying existing rows")
+    parser.add_argument('--ensure', action='store_true', help="Create partitions through --months-ahead")
+    parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD,
+                        help=f"Future months to keep partitions for (default: {DEFAULT_MONTHS_AHEAD})")
+    parser.add_argument('--detach-before', metavar='YYYY-MM', help="Detach partitions for months before this one")
+    parser.add_argument('--explain', nargs=2, metavar=('TABLE', 'YYYY-MM-DD'), help="Show the plan for a one-day query")
+    args = parser.parse_args()
+
+    tables = [args.table] if args.table else list(FACT_DIMENSIONS)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.migrate:
+            for table in tables:
+                migrate(conn, table, args.months_ahead)
+        if args.ensure:
+            for table in tables:
+                ensure_partitions(conn, table, args.months_ahead)
+        if args.detach_before:
+            month = datetime.strptime(args.detach_before, '%Y-%m').date()
+            for table in tables:
+                detach_before(conn, table, month)
+        if args.explain:
+            explain_day(conn, args.explain[0], args.explain[1])
+        if args.status or not (args.migrate or args.ensure or args.detach_before or args.explain):
+            print_status(conn)
+    finally:
+        conn.close()
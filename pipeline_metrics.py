@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and throughput for the ETL scripts.
+
+A run is one invocation of a loader, upload script, aggregator or one file
+handled by File_Monitor; a span is one stage inside it (LibreOffice
+conversion, read_excel, dedup probe, insert, ...). Each span records wall
+time, rows in/out, rows/s, bytes read and peak RSS. Finished runs go to
+pipeline_runs / pipeline_spans and to a JSON-lines file, so timings survive
+even when the database is the thing that is slow or down.
+
+    from pipeline_metrics import PipelineRun
+
+    with PipelineRun("import_workstation_file", source=file_path) as run:
+        with run.span("read_excel", bytes_read=os.path.getsize(file_path)) as span:
+            df = pd.read_excel(file_path)
+            span.rows_out = len(df)
+
+Summary of the last 20 runs per job (p50/p95 per stage):
+    python pipeline_metrics.py --last 20
+    python pipeline_metrics.py --last 20 --job import_workstation_file --from-file
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_FILE = os.environ.get("PIPELINE_METRICS_FILE", os.path.join(ETL_DIR, "logs", "pipeline_metrics.jsonl"))
+# File_Monitor passes its run id to the loaders it starts so their runs can be tied back
+PARENT_RUN_ENV = "PIPELINE_PARENT_RUN_ID"
+
+CREATE_TABLES_SQL = '''
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    run_id VARCHAR(32) PRIMARY KEY,
+    parent_run_id VARCHAR(32),
+    job VARCHAR(100) NOT NULL,
+    source TEXT,
+    host VARCHAR(255),
+    pid INTEGER,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP,
+    seconds DOUBLE PRECISION,
+    status VARCHAR(20) NOT NULL,
+    error TEXT
+);
+
+CREATE TABLE IF NOT EXISTS pipeline_spans (
+    id SERIAL PRIMARY KEY,
+    run_id VARCHAR(32) NOT NULL REFERENCES pipeline_runs(run_id) ON DELETE CASCADE,
+    stage VARCHAR(100) NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    seconds DOUBLE PRECISION NOT NULL,
+    rows_in BIGINT,
+    rows_out BIGINT,
+    rows_per_sec DOUBLE PRECISION,
+    bytes_read BIGINT,
+    peak_rss_mb DOUBLE PRECISION,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_runs_job_started ON pipeline_runs (job, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_pipeline_spans_run ON pipeline_spans (run_id);
+'''
+
+SUMMARY_SQL = '''
+WITH recent AS (
+    SELECT run_id, job
+    FROM (
+        SELECT run_id, job, ROW_NUMBER() OVER (PARTITION BY job ORDER BY started_at DESC) AS rn
+        FROM pipeline_runs
+        WHERE %(job)s IS NULL OR job = %(job)s
+    ) ranked
+    WHERE rn <= %(last)s
+)
+SELECT
+    r.job,
+    s.stage,
+    COUNT(*) AS spans,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY s.seconds) AS p50_seconds,
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY s.seconds) AS p95_seconds,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY s.rows_per_sec) AS p50_rows_per_sec,
+    MAX(s.peak_rss_mb) AS max_peak_rss_mb,
+    COUNT(s.error) AS errors
+FROM recent r
+JOIN pipeline_spans s ON s.run_id = r.run_id
+GROUP BY r.job, s.stage
+ORDER BY r.job, MIN(s.id);
+'''
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size so far (ru_maxrss is KB on Linux, bytes on macOS)"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+
+class Span:
+    """One timed stage; set rows_in/rows_out/bytes_read while it runs"""
+
+    def __init__(self, stage, rows_in=None, rows_out=None, bytes_read=None, children=False):
+        self.stage = stage
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.bytes_read = bytes_read
+        # Subprocess stages (LibreOffice, loaders) report the children's peak RSS
+        self.children = children
+        self.started_at = datetime.now()
+        self.seconds = None
+        self.peak_rss_mb = None
+        self.error = None
+
+    @property
+    def rows_per_sec(self):
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        if rows is None or not self.seconds:
+            return None
+        return round(rows / self.seconds, 1)
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "started_at": self.started_at.isoformat(timespec='milliseconds'),
+            "seconds": self.seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_sec": self.rows_per_sec,
+            "bytes_read": self.bytes_read,
+            "peak_rss_mb": self.peak_rss_mb,
+            "error": self.error,
+        }
+
+
+class PipelineRun:
+    """Collects the spans of one run and saves them when it finishes"""
+
+    def __init__(self, job, source=None, parent_run_id=None, save_to_db=True, db_config=None):
+        self.run_id = uuid.uuid4().hex
+        self.parent_run_id = parent_run_id or os.environ.get(PARENT_RUN_ENV)
+        self.job = job
+        self.source = source
+        self.save_to_db = save_to_db
+        self.db_config = db_config or DB_CONFIG
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self.seconds = None
+        self.status = "running"
+        self.error = None
+        self.spans = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, SystemExit):
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.finish()
+        return False
+
+    @contextmanager
+    def span(self, stage, rows_in=None, rows_out=None, bytes_read=None, children=False):
+        span = Span(stage, rows_in, rows_out, bytes_read, children)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.seconds = round(time.perf_counter() - started, 4)
+            span.peak_rss_mb = peak_rss_mb(span.children)
+            self.spans.append(span)
+
+    def fail(self, error):
+        """Mark the run failed for errors the script catches itself"""
+        self.error = str(error)
+
+    def finish(self):
+        if self.seconds is not None:
+            return
+        self.seconds = round(time.perf_counter() - self._started, 4)
+        if self.error is None:
+            self.error = next((span.error for span in self.spans if span.error), None)
+        self.status = "failed" if self.error else "success"
+        record = self.as_dict()
+        write_jsonl(record)
+        if self.save_to_db:
+            save_run(record, self.db_config)
+
+    def as_dict(self):
+        return {
+            "run_id": self.run_id,
+            "parent_run_id": self.parent_run_id,
+            "job": self.job,
+            "source": self.source,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_at": self.started_at.isoformat(timespec='milliseconds'),
+            "seconds": self.seconds,
+            "status": self.status,
+            "error": self.error,
+            "spans": [span.as_dict() for span in self.spans],
+        }
+
+    def print_summary(self):
+        print(f"\n{'Stage':<24} {'Seconds':>9} {'Rows in':>10} {'Rows out':>10} {'Rows/s':>10} {'RSS MB':>8}")
+        print("-" * 76)
+        for span in self.spans:
+            print(f"{span.stage:<24} {span.seconds:>9.3f} {_fmt(span.rows_in):>10} {_fmt(span.rows_out):>10} "
+                  f"{_fmt(span.rows_per_sec):>10} {_fmt(span.peak_rss_mb):>8}")
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.1f}"
+    return f"{value:,}"
+
+def write_jsonl(record, path=None):
+    path = path or METRICS_FILE
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Warning: could not write pipeline metrics to {path}: {e}")
+
+def ensure_metrics_tables(cur):
+    cur.execute(CREATE_TABLES_SQL)
+
+def save_run(record, db_config=None):
+    """Insert one finished run; metrics problems never fail the pipeline"""
+    try:
+        conn = psycopg2.connect(**(db_config or DB_CONFIG))
+    except psycopg2.Error as e:
+        print(f"Warning: could not save pipeline metrics: {e}")
+        return
+    try:
+        with conn.cursor() as cur:
+            ensure_metrics_tables(cur)
+            cur.execute("""
+                INSERT INTO pipeline_runs (
+                    run_id, parent_run_id, job, source, host, pid, started_at, finished_at, seconds, status, error
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s)
+                ON CONFLICT (run_id) DO NOTHING;
+            """, (record["run_id"], record["parent_run_id"], record["job"], record["source"], record["host"],
+                  record["pid"], record["started_at"], record["seconds"], record["status"], record["error"]))
+            if record["spans"]:
+                execute_values(cur, """
+                    INSERT INTO pipeline_spans (
+                        run_id, stage, started_at, seconds, rows_in, rows_out, rows_per_sec,
+                        bytes_read, peak_rss_mb, error
+                    ) VALUES %s
+                """, [(
+                    record["run_id"], s["stage"], s["started_at"], s["seconds"], s["rows_in"], s["rows_out"],
+                    s["rows_per_sec"], s["bytes_read"], s["peak_rss_mb"], s["error"]
+                ) for s in record["spans"]])
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Warning: could not save pipeline metrics: {e}")
+    finally:
+        conn.close()
+
+
+def summarize_from_db(last, job=None):
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            ensure_metrics_tables(cur)
+            conn.commit()
+            cur.execute(SUMMARY_SQL, {"last": last, "job": job})
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+def _percentile(values, pct):
+    """Linear-interpolated percentile, matching percentile_cont"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * pct
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def summarize_from_file(last, job=None, path=None):
+    path = path or METRICS_FILE
+    runs_by_job = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            run = json.loads(line)
+            if job is None or run["job"] == job:
+                runs_by_job.setdefault(run["job"], []).append(run)
+
+    rows = []
+    for job_name in sorted(runs_by_job):
+        runs = sorted(runs_by_job[job_name], key=lambda r: r["started_at"])[-last:]
+        stages = {}
+        for run in runs:
+            for span in run["spans"]:
+                stages.setdefault(span["stage"], []).append(span)
+        for stage, spans in stages.items():
+            seconds = [s["seconds"] for s in spans]
+            rates = [s["rows_per_sec"] for s in spans if s["rows_per_sec"] is not None]
+            rss = [s["peak_rss_mb"] for s in spans if s["peak_rss_mb"] is not None]
+            rows.append((job_name, stage, len(spans), _percentile(seconds, 0.5), _percentile(seconds, 0.95),
+                         _percentile(rates, 0.5), max(rss) if rss else None,
+                         sum(1 for s in spans if s["error"])))
+    return rows
+
+def print_stage_summary(rows, last):
+    print(f"PIPELINE STAGE SUMMARY (last {last} runs per job)")
+    print("=" * 110)
+    print(f"{'Job':<40} {'Stage':<22} {'Spans':>6} {'p50 s':>9} {'p95 s':>9} {'p50 rows/s':>12} {'RSS MB':>8} {'Err':>4}")
+    print("-" * 110)
+    previous_job = None
+    for job, stage, spans, p50, p95, rate, rss, errors in rows:
+        label = job if job != previous_job else ""
+        previous_job = job
+        print(f"{label:<40} {stage:<22} {spans:>6} {p50:>9.3f} {p95:>9.3f} {_fmt(rate):>12} {_fmt(rss):>8} {errors:>4}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline stage timing summary (p50/p95 per stage)")
+    parser.add_argument('--last', type=int, default=20, help="Runs per job to include (default: 20)")
+    parser.add_argument('--job', help="Only this job (e.g. import_workstation_file)")
+    parser.add_argument('--from-file', action='store_true',
+                        help=f"Read the JSON-lines file instead of the database ({METRICS_FILE})")
+    args = parser.parse_args()
+
+    if args.from_file:
+        summary = summarize_from_file(args.last, args.job)
+    else:
+        summary = summarize_from_db(args.last, args.job)
+    if not summary:
+        print("No pipeline runs recorded yet.")
+    else:
+        print_stage_summary(summary, args.last)
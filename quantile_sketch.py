@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Mergeable quantile sketches for durations, with relative-error guarantees.
+
+A percentile of a week can't be computed from the days' percentiles, and
+recomputing it from the raw rows means rescanning all of history for every
+report. A sketch can be merged instead: it keeps a count per bucket of
+logarithmically growing width (the DDSketch layout), so
+
+- any quantile read from it is within RELATIVE_ACCURACY (1%) of the true
+  value;
+- merging two sketches is adding their bucket counts, so a week's or a
+  month's sketch is the sum of its days' sketches, with the same accuracy
+  as if it had been built from the raw values.
+
+Value v > 0 goes to bucket ceil(ln(v) / ln(GAMMA)); bucket i covers
+(GAMMA^(i-1), GAMMA^i] and is read back as the value 2 * GAMMA^i / (GAMMA + 1),
+which is within RELATIVE_ACCURACY of anything in it. Values below MIN_VALUE
+(durations under a second, at the logs' one-second resolution) are counted
+in zero_count and read back as 0. bucket_sql() is the same bucketing as a
+SQL expression, so an aggregator can GROUP BY bucket and ship counts instead
+of rows.
+
+Sketches are stored as JSONB ({"bucket": count, ...}); to_json()/from_json()
+convert.
+
+    sketch = QuantileSketch()
+    for seconds in durations:
+        sketch.add(seconds)
+    week = QuantileSketch.merged(day_sketches)
+    week.quantile(0.9)
+"""
+import json
+import math
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1.0
+
+
+def bucket_index(value):
+    """Bucket of a value, or None for the zero bucket"""
+    if value < MIN_VALUE:
+        return None
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+def bucket_sql(expression):
+    """bucket_index() as SQL; NULL for the zero bucket"""
+    return (f"CASE WHEN ({expression}) < {MIN_VALUE!r} THEN NULL "
+            f"ELSE CEIL(LN({expression}) / {LOG_GAMMA!r})::int END")
+
+def bucket_value(index):
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+class QuantileSketch:
+    def __init__(self):
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value, n=1):
+        value = max(value, 0.0)
+        index = bucket_index(value)
+        if index is None:
+            self.zero_count += n
+        else:
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self._tally(n, value * n, value, value)
+
+    def add_bucket(self, index, n, total, low, high):
+        """Add n values already bucketed (index None for the zero bucket), with their sum, min and max"""
+        if index is None:
+            self.zero_count += n
+        else:
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self._tally(n, total, low, high)
+
+    def merge(self, other):
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.zero_count += other.zero_count
+        if other.count:
+            self._tally(other.count, other.total, other.min, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, sketches):
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def _tally(self, n, total, low, high):
+        self.count += n
+        self.total += total
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def quantile(self, q):
+        """Value at quantile q (0..1), None if the sketch is empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return min(max(bucket_value(index), self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_json(self):
+        return json.dumps({str(index): n for index, n in sorted(self.buckets.items())})
+
+    @classmethod
+    def from_json(cls, buckets, zero_count=0, count=None, total=0.0, low=None, high=None):
+        """A sketch from its stored columns; buckets is the JSONB value (a dict once psycopg2 has read it)"""
+        if isinstance(buckets, str):
+            buckets = json.loads(buckets)
+        sketch = cls()
+        sketch.buckets = {int(index): n for index, n in buckets.items()}
+        sketch.zero_count = zero_count
+        sketch.count = count if count is not None else zero_count + sum(sketch.buckets.values())
+        sketch.total = total
+        sketch.min = low
+        sketch.max = high
+        return sketch
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Read-only HTTP API over the summary tables for the dashboards.
+
+Responses are cached in-process, keyed by path and query parameters. The
+aggregators call notify_summary_updated() in the transaction that writes a
+summary table; PostgreSQL delivers the NOTIFY on commit and the listener
+thread drops every cached response built from that table. Every response
+carries an ETag, so a dashboard polling an unchanged endpoint gets a 304
+without a database round trip.
+
+Endpoints (all GET, JSON):
+    /api/tpy/daily               ?start=&end=&model=&station=
+    /api/tpy/weekly              ?start_week=&end_week=
+    /api/tpy/weekly/routes       ?start_week=&end_week=&model=
+    /api/packing/daily           ?start=&end=&model=
+    /api/packing/weekly          ?start=&end=&model=
+    /api/stations/hourly         ?start=&end=&station=
+    /api/wip/hourly              ?start=&end=&model=&station=
+    /api/durations/daily         ?start=&end=&kind=&model=&station=
+    /api/testboard/stations      ?start=&end=&model=&station=
+    /api/testboard/fixtures      ?start=&end=&fixture=&model=
+    /api/sort-test               ?start=&end=
+    /api/cache                   cache statistics
+
+Usage:
+    python read_api.py --port 8085
+"""
+import argparse
+import hashlib
+import json
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+SUMMARY_CHANNEL = "fox_summary_updated"
+
+# path -> query definition. "filters" maps a query parameter to its WHERE
+# fragment; "tables" are the summary tables the response is built from.
+# Endpoints over the master log itself have no NOTIFY and expire after "ttl".
+ENDPOINTS = {
+    "/api/tpy/daily": {
+        "tables": ["daily_tpy_metrics"],
+        "sql": """
+            SELECT date_id, model, workstation_name, total_parts, passed_parts, failed_parts,
+                   throughput_yield, week_id, week_start, week_end, total_starters
+            FROM daily_tpy_metrics
+        """,
+        "filters": {
+            "start": "date_id >= %(start)s",
+            "end": "date_id <= %(end)s",
+            "model": "model = %(model)s",
+            "station": "workstation_name = %(station)s",
+        },
+        "order": "date_id, model, workstation_name",
+    },
+    "/api/tpy/weekly": {
+        "tables": ["weekly_tpy_metrics"],
+        "sql": "SELECT * FROM weekly_tpy_metrics",
+        "filters": {
+            "start_week": "week_id >= %(start_week)s",
+            "end_week": "week_id <= %(end_week)s",
+        },
+        "order": "week_id",
+    },
+    "/api/tpy/weekly/routes": {
+        "tables": ["weekly_tpy_route_metrics"],
+        "sql": """
+            SELECT week_id, model, route_key, formula, hardcoded_stations, hardcoded_tpy,
+                   dynamic_stations, dynamic_tpy, dynamic_station_count
+            FROM weekly_tpy_route_metrics
+        """,
+        "filters": {
+            "start_week": "week_id >= %(start_week)s",
+            "end_week": "week_id <= %(end_week)s",
+            "model": "model = %(model)s",
+        },
+        "order": "week_id, model",
+    },
+    "/api/packing/daily": {
+        "tables": ["packing_daily_summary"],
+        "sql": "SELECT pack_date, model, part_number, packed_count FROM packing_daily_summary",
+        "filters": {
+            "start": "pack_date >= %(start)s",
+            "end": "pack_date <= %(end)s",
+            "model": "model = %(model)s",
+        },
+        "order": "pack_date, model, part_number",
+    },
+    "/api/packing/weekly": {
+        "tables": ["packing_daily_summary"],
+        "sql": """
+            SELECT DATE_TRUNC('week', pack_date)::date AS week_start, model, SUM(packed_count) AS packed_count
+            FROM packing_daily_summary
+        """,
+        "filters": {
+            "start": "pack_date >= %(start)s",
+            "end": "pack_date <= %(end)s",
+            "model": "model = %(model)s",
+        },
+        "group": "week_start, model",
+        "order": "week_start, model",
+    },
+    "/api/stations/hourly": {
+        "tables": ["station_hourly_summary"],
+        "sql": "SELECT date, hour, workstation_name, part_count FROM station_hourly_summary",
+        "filters": {
+            "start": "date >= %(start)s",
+            "end": "date <= %(end)s",
+            "station": "workstation_name = %(station)s",
+        },
+        "order": "date, hour, workstation_name",
+    },
+    "/api/wip/hourly": {
+        "tables": ["station_wip_hourly"],
+        "sql": "SELECT snapshot_hour, model, workstation_name, wip_parts FROM station_wip_hourly",
+        "filters": {
+            "start": "snapshot_hour >= %(start)s",
+            "end": "snapshot_hour < %(end)s::date + 1",
+            "model": "model = %(model)s",
+            "station": "workstation_name = %(station)s",
+        },
+        "order": "snapshot_hour, model, workstation_name",
+    },
+    "/api/durations/daily": {
+        "tables": ["station_duration_daily"],
+        "sql": """
+            SELECT day, model, workstation_name, kind, samples, p50_seconds, p90_seconds, p99_seconds
+            FROM station_duration_daily
+        """,
+        "filters": {
+            "start": "day >= %(start)s",
+            "end": "day <= %(end)s",
+            "kind": "kind = %(kind)s",
+            "model": "model = %(model)s",
+            "station": "workstation_name = %(station)s",
+        },
+        "order": "day, model, workstation_name, kind",
+    },
+    "/api/testboard/stations": {
+        "tables": ["testboard_station_performance_daily"],
+        "sql": """
+            SELECT end_date, model, work_station_process, workstation_name, pass, fail, total, failurerate
+            FROM testboard_station_performance_daily
+        """,
+        "filters": {
+            "start": "end_date >= %(start)s",
+            "end": "end_date <= %(end)s",
+            "model": "model = %(model)s",
+            "station": "workstation_name = %(station)s",
+        },
+        "order": "end_date, model, work_station_process, workstation_name",
+    },
+    "/api/testboard/fixtures": {
+        "tables": ["fixture_performance_daily"],
+        "sql": "SELECT day, fixture_no, model, pn, workstation_name, pass, fail, total FROM fixture_performance_daily",
+        "filters": {
+            "start": "day >= %(start)s",
+            "end": "day <= %(end)s",
+            "fixture": "fixture_no = %(fixture)s",
+            "model": "model = %(model)s",
+        },
+        "order": "day, fixture_no",
+    },
+    # Same shape as the sort_data dict aggregate_sort_test_weekly_dedup.py prints
+    "/api/sort-test": {
+        "tables": ["workstation_master_log"],
+        "ttl": 300,
+        "sql": """
+            SELECT
+              CASE WHEN model = 'Tesla SXM4' THEN '506' WHEN model = 'Tesla SXM5' THEN '520' END AS sort_code,
+              factory_date AS test_date,
+              COUNT(*) AS test_count
+            FROM workstation_master_log
+            WHERE workstation_name = 'TEST'
+              AND history_station_passing_status = 'Pass'
+              AND model IN ('Tesla SXM4', 'Tesla SXM5')
+        """,
+        "filters": {
+            "start": "history_station_end_time >= %(start)s",
+            "end": "history_station_end_time < %(end)s::date + 1",
+        },
+        "group": "sort_code, test_date",
+        "order": "sort_code, test_date",
+        "shape": "sort_data",
+    },
+}
+
+
+def notify_summary_updated(cur, *tables):
+    """Tell read_api which summary tables changed; delivered when the caller commits"""
+    for table in tables:
+        cur.execute("SELECT pg_notify(%s, %s)", (SUMMARY_CHANNEL, table))
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _shape_sort_data(rows):
+    sort_data = {'506': {}, '520': {}}
+    for row in rows:
+        if row["sort_code"] in sort_data:
+            test_date = row["test_date"]
+            sort_data[row["sort_code"]][f"{test_date.month}/{test_date.day}/{test_date.year}"] = row["test_count"]
+    return sort_data
+
+
+class ResponseCache:
+    """LRU of encoded responses, invalidated per source table.
+
+    Each invalidation bumps the table's generation. A response read the
+    generation of its tables before querying; put() doesn't store it if one
+    moved in the meantime (a NOTIFY arrived mid-query), as it may be stale.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry["expires"] is not None and entry["expires"] < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _generation(self, tables):
+        return tuple(self._generations.get(table, 0) for table in (None, *tables))
+
+    def generation(self, tables):
+        """Invalidation count of each table (and of the whole cache), to pass to put()"""
+        with self._lock:
+            return self._generation(tables)
+
+    def put(self, key, body, tables, ttl=None, generation=None):
+        entry = {
+            "body": body,
+            "etag": '"' + hashlib.sha1(body).hexdigest() + '"',
+            "tables": set(tables),
+            "expires": time.monotonic() + ttl if ttl else None,
+        }
+        with self._lock:
+            if generation is not None and generation != self._generation(tables):
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, table=None):
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if table is None or table in entry["tables"]]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations}
+
+
+class SummaryListener(threading.Thread):
+    """LISTENs on SUMMARY_CHANNEL and invalidates the cache for each notified table"""
+
+    def __init__(self, cache, db_config=None):
+        super().__init__(name="summary-listener", daemon=True)
+        self.cache = cache
+        self.db_config = db_config or DB_CONFIG
+
+    def run(self):
+        while True:
+            try:
+                conn = psycopg2.connect(**self.db_config)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {SUMMARY_CHANNEL}")
+                # Anything committed while we were not listening is unknown
+                self.cache.invalidate()
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        dropped = self.cache.invalidate(notify.payload)
+                        print(f"{notify.payload} updated, dropped {dropped} cached responses")
+            except psycopg2.Error as e:
+                print(f"Summary listener lost its connection ({e}); reconnecting in 5s")
+                self.cache.invalidate()
+                time.sleep(5)
+
+
+def build_query(endpoint, params):
+    where = [fragment for name, fragment in endpoint["filters"].items() if name in params]
+    sql = endpoint["sql"]
+    if where:
+        sql += (" AND " if " WHERE " in sql.upper() else " WHERE ") + " AND ".join(where)
+    if endpoint.get("group"):
+        sql += f" GROUP BY {endpoint['group']}"
+    return sql + f" ORDER BY {endpoint['order']}"
+
+
+class ReadApi:
+    def __init__(self, db_config=None, max_connections=8, max_entries=512):
+        self.pool = ThreadedConnectionPool(1, max_connections, **(db_config or DB_CONFIG))
+        self.cache = ResponseCache(max_entries)
+
+    def query(self, endpoint, params):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(build_query(endpoint, params), params)
+                rows = cur.fetchall()
+            conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+        if endpoint.get("shape") == "sort_data":
+            return _shape_sort_data(rows)
+        return rows
+
+    def response(self, path, params):
+        """(entry, cached) for a path and its filter parameters"""
+        endpoint = ENDPOINTS[path]
+        params = {name: params[name] for name in endpoint["filters"] if name in params}
+        key = (path, tuple(sorted(params.items())))
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry, True
+        generation = self.cache.generation(endpoint["tables"])
+        body = json.dumps(self.query(endpoint, params), default=_json_default).encode("utf-8")
+        return self.cache.put(key, body, endpoint["tables"], endpoint.get("ttl"), generation), False
+
+
+def make_handler(api):
+    class ReadApiHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = url.path.rstrip("/") or "/"
+            if path == "/api/cache":
+                body = json.dumps(api.cache.stats()).encode("utf-8")
+                return self._send(200, body, {"Content-Type": "application/json"})
+            if path not in ENDPOINTS:
+                body = json.dumps({"error": "unknown endpoint", "endpoints": sorted(ENDPOINTS)}).encode("utf-8")
+                return self._send(404, body, {"Content-Type": "application/json"})
+
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                entry, cached = api.response(path, params)
+            except psycopg2.Error as e:
+                body = json.dumps({"error": str(e).strip().splitlines()[0]}).encode("utf-8")
+                return self._send(400 if isinstance(e, psycopg2.DataError) else 503, body,
+                                  {"Content-Type": "application/json"})
+
+            headers = {"ETag": entry["etag"], "Cache-Control": "no-cache", "X-Cache": "HIT" if cached else "MISS"}
+            if self.headers.get("If-None-Match") == entry["etag"]:
+                return self._send(304, headers=headers)
+            headers["Content-Type"] = "application/json"
+            self._send(200, entry["body"], headers)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReadApiHandler
+
+def serve(host="127.0.0.1", port=8085, db_config=None):
+    from date_columns import require_date_columns  # date_columns imports this module via summary_views
+
+    api = ReadApi(db_config)
+    # /api/sort-test groups by the generated factory_date column
+    conn = api.pool.getconn()
+    try:
+        require_date_columns(conn, 'workstation_master_log')
+    finally:
+        api.pool.putconn(conn)
+    SummaryListener(api.cache, db_config).start()
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    print(f"Read API listening on http://{host}:{port} ({len(ENDPOINTS)} endpoints)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Read API shutdown requested")
+    finally:
+        server.server_close()
+        api.pool.closeall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read API over the summary tables")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8085, help="Port (default: 8085)")
+    args = parser.parse_args()
+    serve(args.host, args.port)
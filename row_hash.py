@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+64-bit row hashes for the master logs.
+
+Each mapped row (the values that are actually inserted) is hashed once with
+pandas' vectorized hash_pandas_object over a fixed column order per table.
+The loaders drop in-file duplicates on the hash, replacing drop_duplicates
+over 10-17 object columns. They also look up the hashes in the table's
+row_hash column with one query per file, replacing the per-row SELECT
+COUNT(*) probes. The upload scripts and async_ingest store the same hash, so
+a row gets the same key whichever path loads it.
+
+At 64 bits the chance of any collision is about n^2 / 2^65: roughly 3e-6 at
+10M rows, and a collision only means one row is skipped.
+
+Existing rows need a one-off backfill before the hash lookups see them (until
+then the inserts fall back to the unique constraints):
+    python row_hash.py --backfill
+    python row_hash.py --backfill --table testboard_master_log --batch 20000
+
+Hashes stored before NULL and NUL were escaped (see NULL below) differ from
+the ones computed now; --rehash recomputes every row's:
+    python row_hash.py --backfill --rehash
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+# Fixed order per table (the unique-constraint columns); changing it changes every hash
+HASH_COLUMNS = {
+    "workstation_master_log": (
+        "sn", "pn", "customer_pn", "outbound_version", "workstation_name",
+        "history_station_start_time", "history_station_end_time", "hours", "service_flow", "model",
+        "history_station_passing_status", "passing_station_method", "operator", "first_station_start_time", "data_source",
+    ),
+    "testboard_master_log": (
+        "sn", "pn", "model", "work_station_process", "baseboard_sn", "baseboard_pn", "workstation_name",
+        "history_station_start_time", "history_station_end_time", "history_station_passing_status", "operator",
+        "failure_reasons", "failure_note", "failure_code", "diag_version", "fixture_no", "data_source",
+    ),
+    "snfn_master_log": (
+        "workstation_name", "fixture_no", "error_code", "error_disc", "sn", "pn",
+        "history_station_start_time", "history_station_end_time", "data_source",
+    ),
+}
+HASH_KEY = "fox_etl_row_hash"  # hash_pandas_object wants exactly 16 bytes
+# hash_pandas_object stops reading a string at NUL, so values are escaped as in
+# COPY's text format (backslash doubled, NUL as \0) and NULL is the one \N
+NULL = "\\N"
+
+HAS_ROW_HASH_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = $1 AND column_name = 'row_hash'
+)
+"""
+ADD_ROW_HASH_SQL = "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_hash BIGINT"
+ROW_HASH_INDEX_SQL = "CREATE INDEX IF NOT EXISTS {table}_row_hash_idx ON {table} (row_hash)"
+
+
+def row_hashes(rows, table):
+    """int64 hash per row; rows are dicts (or tuples in HASH_COLUMNS order) of mapped values.
+
+    Values are compared as str(value) with NULL kept distinct from '', so
+    datetime vs pd.Timestamp and rows read back from PostgreSQL all agree.
+    """
+    if not len(rows):
+        return np.empty(0, dtype=np.int64)
+    frame = pd.DataFrame(list(rows), columns=list(HASH_COLUMNS[table]), dtype=object)
+    nulls = frame.isna()
+    frame = frame.astype(str).apply(lambda column: column.str.replace("\\", "\\\\").str.replace("\0", "\\0"))
+    frame = frame.mask(nulls, NULL)
+    return pd.util.hash_pandas_object(frame, index=False, hash_key=HASH_KEY).to_numpy().view(np.int64)
+
+def first_occurrences(hashes):
+    """Boolean mask keeping the first row of each hash"""
+    return ~pd.Series(hashes).duplicated().to_numpy()
+
+def ensure_row_hash_column(cur, table):
+    """Nullable column plus a plain index, added once.
+
+    Checked first so routine loads don't take ALTER TABLE's exclusive lock
+    (it would queue behind long aggregate reads).
+    """
+    cur.execute(HAS_ROW_HASH_SQL.replace("$1", "%s"), (table,))
+    if not cur.fetchone()[0]:
+        cur.execute(ADD_ROW_HASH_SQL.format(table=table))
+        cur.execute(ROW_HASH_INDEX_SQL.format(table=table))
+
+def existing_hashes(cur, table, hashes):
+    """The subset of hashes already in the table, in one round trip"""
+    if not len(hashes):
+        return set()
+    cur.execute(f"SELECT row_hash FROM {table} WHERE row_hash = ANY(%s)", ([int(h) for h in hashes],))
+    return {row[0] for row in cur.fetchall()}
+
+def backfill(conn, table, batch=50000, rehash=False):
+    """Hash the rows loaded before row_hash existed (every row with rehash); returns rows updated"""
+    from dimensions import FACT_DIMENSIONS, fact_table, is_star  # dimensions imports this module
+    columns = HASH_COLUMNS[table]
+    pending_filter = "TRUE" if rehash else "row_hash IS NULL"
+    # A star-mode master log is a view; the hashes go on its fact table
+    target = fact_table(table) if table in FACT_DIMENSIONS and is_star(conn, table) else table
+    with conn.cursor() as cur:
+        ensure_row_hash_column(cur, table)
+        conn.commit()
+        cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {pending_filter}")
+        pending = cur.fetchone()[0]
+    print(f"{table}: {pending:,} rows to hash")
+    updated = 0
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id, {', '.join(columns)} FROM {table}
+                WHERE {pending_filter} AND id > %s
+                ORDER BY id LIMIT %s
+            """, (last_id, batch))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            hashes = row_hashes([row[1:] for row in rows], table)
+            execute_values(cur, f"""
+                UPDATE {target} AS t SET row_hash = v.row_hash
+                FROM (VALUES %s) AS v (id, row_hash)
+                WHERE t.id = v.id
+            """, list(zip(ids, (int(h) for h in hashes))), page_size=5000)
+        conn.commit()
+        updated += len(rows)
+        last_id = ids[-1]
+        rate = updated / (time.perf_counter() - started)
+        print(f"  {updated:,}/{pending:,} rows ({rate:,.0f} rows/s)")
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill row_hash on the master logs")
+    parser.add_argument('--backfill', action='store_true', help="Hash rows that have no row_hash yet")
+    parser.add_argument('--rehash', action='store_true', help="With --backfill, recompute every row's hash")
+    parser.add_argument('--table', choices=sorted(HASH_COLUMNS), help="One table (default: all)")
+    parser.add_argument('--batch', type=int, default=50000, help="Rows per UPDATE batch (default: 50000)")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        raise SystemExit(0)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        for table in ([args.table] if args.table else HASH_COLUMNS):
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0] is None:
+                    print(f"{table}: table does not exist, skipping")
+                    continue
+            backfill(conn, table, args.batch, args.rehash)
+    finally:
+        conn.close()
@@ -1,6 +1,9 @@
+import asyncio
 import os
+import re
 import sys
 import time
+import argparse
 import subprocess
 from datetime import datetime
 import logging
@@ -19,6 +22,27 @@ ETL_V2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMPORT_TESTBOARD_SCRIPT = os.path.join(ETL_V2_DIR, "loaders", "import_testboard_file.py")
 IMPORT_WORKSTATION_SCRIPT = os.path.join(ETL_V2_DIR, "loaders", "import_workstation_file.py")
 
+sys.path.insert(0, ETL_V2_DIR)
+from pipeline_metrics import PARENT_RUN_ENV, PipelineRun
+from metrics_server import DEFAULT_PORT, Counter, DataFreshness, Gauge, Histogram, start_metrics_server
+
+FILES_DETECTED = Counter("fox_etl_files_detected_total", "Report files found in the input directory", ["source"])
+FILES_PROCESSED = Counter("fox_etl_files_processed_total", "Report files converted and imported", ["source"])
+FILES_FAILED = Counter("fox_etl_files_failed_total", "Report files that failed, by pipeline stage", ["source", "stage"])
+CONVERSION_SECONDS = Histogram("fox_etl_conversion_seconds", "LibreOffice xls to xlsx conversion time", ["source"],
+                               buckets=(1, 2, 5, 10, 20, 30, 45, 60))
+IMPORT_SECONDS = Histogram("fox_etl_import_seconds", "Loader run time per file", ["source"],
+                           buckets=(1, 5, 10, 30, 60, 120, 180, 240, 300))
+ROWS_INSERTED = Counter("fox_etl_rows_inserted_total", "Rows inserted by the loaders", ["source"])
+ROWS_SKIPPED = Counter("fox_etl_rows_skipped_duplicate_total", "Rows skipped as already loaded", ["source"])
+QUEUE_DEPTH = Gauge("fox_etl_queue_depth", "Report files waiting in the input directory")
+LAST_SUCCESS = Gauge("fox_etl_last_success_timestamp_seconds", "Unix time of the last successful import", ["source"])
+LOOP_HEARTBEAT = Gauge("fox_etl_monitor_heartbeat_timestamp_seconds", "Unix time of the last monitor loop pass")
+DATA_FRESHNESS = Gauge("fox_etl_data_freshness_lag_seconds", "Now minus the newest history_station_end_time", ["table"])
+
+# Loaders print e.g. "Found 1,204 existing records, 310 new records to insert"
+LOADER_COUNTS_RE = re.compile(r"Found ([\d,]+) existing records, ([\d,]+) new records")
+
 def convert_xls_to_xlsx(xls_file_path):
     try:
         xlsx_file_path = os.path.splitext(xls_file_path)[0] + '.xlsx'
@@ -57,15 +81,36 @@ def convert_xls_to_xlsx(xls_file_path):
         return None
 
 def process_file(file_path, script_path, file_type):
+    run = PipelineRun(f"file_monitor_{file_type}", source=file_path)
+    try:
+        return _process_file(run, file_path, script_path, file_type)
+    finally:
+        run.finish()
+
+def record_loader_counts(output, file_type):
+    match = LOADER_COUNTS_RE.search(output or "")
+    if match:
+        skipped, inserted = (int(value.replace(",", "")) for value in match.groups())
+        ROWS_SKIPPED.labels(source=file_type).inc(skipped)
+        ROWS_INSERTED.labels(source=file_type).inc(inserted)
+
+def _process_file(run, file_path, script_path, file_type):
+    stage = "convert"
     try:
-        xlsx_file_path = convert_xls_to_xlsx(file_path)
+        with run.span("convert_xls", bytes_read=os.path.getsize(file_path), children=True), \
+                CONVERSION_SECONDS.labels(source=file_type).time():
+            xlsx_file_path = convert_xls_to_xlsx(file_path)
         
         if not xlsx_file_path:
             logger.error(f"Failed to convert {os.path.basename(file_path)} to XLSX")
+            run.fail("conversion failed")
+            FILES_FAILED.labels(source=file_type, stage=stage).inc()
             return False
         
         if not os.path.exists(xlsx_file_path):
             logger.error(f"XLSX file not found after conversion: {os.path.basename(xlsx_file_path)}")
+            run.fail("xlsx missing after conversion")
+            FILES_FAILED.labels(source=file_type, stage=stage).inc()
             return False
 
         try:
@@ -79,39 +124,60 @@ def process_file(file_path, script_path, file_type):
         cmd = ['python3', script_path, xlsx_file_path]
         logger.info(f"Running command: {' '.join(cmd)}")
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        stage = "import"
+        with run.span("import", bytes_read=os.path.getsize(xlsx_file_path), children=True), \
+                IMPORT_SECONDS.labels(source=file_type).time():
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=300,
+                env={**os.environ, PARENT_RUN_ENV: run.run_id}
+            )
         
         if result.returncode == 0:
             logger.info(f"Successfully imported {file_type} data")
             logger.info(f"Output: {result.stdout}")
+            record_loader_counts(result.stdout, file_type)
+            FILES_PROCESSED.labels(source=file_type).inc()
+            LAST_SUCCESS.labels(source=file_type).set_to_current_time()
             return True
         else:
             logger.error(f"Import script failed: {result.stderr}")
+            run.fail(f"import script exited with {result.returncode}")
+            FILES_FAILED.labels(source=file_type, stage=stage).inc()
             return False
             
     except subprocess.TimeoutExpired:
         logger.error(f"Import script timed out for {file_type}")
+        run.fail("import timed out")
+        FILES_FAILED.labels(source=file_type, stage=stage).inc()
         return False
     except Exception as e:
         logger.error(f"Error processing {file_type}: {e}")
+        run.fail(e)
+        FILES_FAILED.labels(source=file_type, stage=stage).inc()
         return False
 
-def monitor_for_files():
+def monitor_for_files(metrics_port=DEFAULT_PORT):
     logger.info("Starting file monitor for PostgreSQL ETL pipeline")
+    if metrics_port:
+        start_metrics_server(metrics_port)
+        DataFreshness().register(DATA_FRESHNESS)
+        logger.info(f"Metrics endpoint: http://127.0.0.1:{metrics_port}/metrics")
     logger.info(f"Monitoring directory: {INPUT_DIR}")
     logger.info(f"Target files: {WORKSTATION_XLS_FILENAME}, {TESTBOARD_XLS_FILENAME}")
     logger.info(f"Import scripts: {os.path.basename(IMPORT_WORKSTATION_SCRIPT)}, {os.path.basename(IMPORT_TESTBOARD_SCRIPT)}")
     
     while True:
         try:
+            LOOP_HEARTBEAT.set_to_current_time()
+            QUEUE_DEPTH.set(sum(os.path.exists(path) for path in (WORKSTATION_FILEPATH, TESTBOARD_FILEPATH)))
+
             if os.path.exists(WORKSTATION_FILEPATH):
                 logger.info(f"Workstation file detected: {WORKSTATION_XLS_FILENAME} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
                 logger.info(f"Starting workstation file processing pipeline...")
+                FILES_DETECTED.labels(source="workstation").inc()
                 
                 success = process_file(
                     WORKSTATION_FILEPATH, 
@@ -127,6 +193,7 @@ def monitor_for_files():
             if os.path.exists(TESTBOARD_FILEPATH):
                 logger.info(f"Test board file detected: {TESTBOARD_XLS_FILENAME} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
                 logger.info(f"Starting test board file processing pipeline...")
+                FILES_DETECTED.labels(source="testboard").inc()
                 
                 success = process_file(
                     TESTBOARD_FILEPATH, 
@@ -150,5 +217,132 @@ def monitor_for_files():
             logger.error(traceback.format_exc())
             time.sleep(10)
 
+async def convert_xls_to_xlsx_async(xls_file_path, file_type):
+    xlsx_file_path = os.path.splitext(xls_file_path)[0] + '.xlsx'
+    # Concurrent headless LibreOffice runs need separate profiles or the second exits silently
+    cmd = [
+        'libreoffice',
+        f'-env:UserInstallation=file:///tmp/fox_etl_lo_{file_type}',
+        '--headless',
+        '--convert-to', 'xlsx',
+        '--outdir', os.path.dirname(xls_file_path),
+        xls_file_path
+    ]
+    logger.info(f"Running command: {' '.join(cmd)}")
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=60)
+    except asyncio.TimeoutError:
+        process.kill()
+        logger.error(f"LibreOffice conversion timed out for {os.path.basename(xls_file_path)}")
+        return None
+    if process.returncode != 0 or not os.path.exists(xlsx_file_path):
+        logger.error(f"LibreOffice conversion failed: {stderr.decode(errors='replace')}")
+        return None
+    logger.info(f"Successfully converted to {os.path.basename(xlsx_file_path)}")
+    return xlsx_file_path
+
+async def process_file_async(pool, executor, file_path, file_type):
+    from async_ingest import ingest_file
+
+    run = PipelineRun(f"file_monitor_{file_type}", source=file_path)
+    stage = "convert"
+    try:
+        with run.span("convert_xls", bytes_read=os.path.getsize(file_path), children=True), \
+                CONVERSION_SECONDS.labels(source=file_type).time():
+            xlsx_file_path = await convert_xls_to_xlsx_async(file_path, file_type)
+        if not xlsx_file_path:
+            run.fail("conversion failed")
+            FILES_FAILED.labels(source=file_type, stage=stage).inc()
+            return False
+
+        try:
+            os.remove(file_path)
+            logger.info(f"Deleted original XLS file: {os.path.basename(file_path)}")
+        except Exception as e:
+            logger.warning(f"Could not delete original XLS file: {e}")
+
+        stage = "import"
+        with run.span("import", bytes_read=os.path.getsize(xlsx_file_path)), \
+                IMPORT_SECONDS.labels(source=file_type).time():
+            inserted, skipped = await ingest_file(pool, executor, file_type, xlsx_file_path, parent_run_id=run.run_id)
+        logger.info(f"Imported {file_type} data: {inserted:,} new, {skipped:,} already loaded")
+        ROWS_INSERTED.labels(source=file_type).inc(inserted)
+        ROWS_SKIPPED.labels(source=file_type).inc(skipped)
+        FILES_PROCESSED.labels(source=file_type).inc()
+        LAST_SUCCESS.labels(source=file_type).set_to_current_time()
+        return True
+    except Exception as e:
+        logger.error(f"Error processing {file_type}: {e}")
+        run.fail(e)
+        FILES_FAILED.labels(source=file_type, stage=stage).inc()
+        return False
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, run.finish)
+
+async def monitor_for_files_async(metrics_port=DEFAULT_PORT, workers=2):
+    """Same loop as monitor_for_files, but conversions and imports overlap on one event loop"""
+    from concurrent.futures import ProcessPoolExecutor
+    sys.path.insert(0, os.path.join(ETL_V2_DIR, "loaders"))
+    from async_ingest import create_pool, ensure_all_partitions, ensure_row_hash_columns
+
+    logger.info("Starting async file monitor for PostgreSQL ETL pipeline")
+    if metrics_port:
+        start_metrics_server(metrics_port)
+        DataFreshness().register(DATA_FRESHNESS)
+        logger.info(f"Metrics endpoint: http://127.0.0.1:{metrics_port}/metrics")
+    logger.info(f"Monitoring directory: {INPUT_DIR}")
+
+    watched = {WORKSTATION_FILEPATH: "workstation", TESTBOARD_FILEPATH: "testboard"}
+    in_flight = {}
+    partitions_checked = None
+    hash_columns_checked = False
+    pool = await create_pool(size=workers)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                try:
+                    LOOP_HEARTBEAT.set_to_current_time()
+                    QUEUE_DEPTH.set(sum(os.path.exists(path) for path in watched))
+                    if not hash_columns_checked:
+                        await ensure_row_hash_columns(pool)
+                        hash_columns_checked = True
+                    # The sync loaders do this per file; here once a day keeps next months' partitions in place
+                    if partitions_checked != datetime.now().date():
+                        await asyncio.get_running_loop().run_in_executor(None, ensure_all_partitions)
+                        partitions_checked = datetime.now().date()
+                    for path, file_type in watched.items():
+                        if path in in_flight or not os.path.exists(path):
+                            continue
+                        logger.info(f"{file_type} file detected: {os.path.basename(path)} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                        FILES_DETECTED.labels(source=file_type).inc()
+                        task = asyncio.create_task(process_file_async(pool, executor, path, file_type))
+                        task.add_done_callback(lambda _, path=path: in_flight.pop(path, None))
+                        in_flight[path] = task
+                    await asyncio.sleep(10)
+                except Exception as e:
+                    # As in monitor_for_files: a DB hiccup at the partition check must not stop the monitor
+                    logger.error(f"Error in monitor loop: {e}")
+                    import traceback
+                    logger.error(traceback.format_exc())
+                    await asyncio.sleep(10)
+    finally:
+        if in_flight:
+            await asyncio.gather(*in_flight.values(), return_exceptions=True)
+        await pool.close()
+
 if __name__ == "__main__":
-    monitor_for_files() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Watch the input directory and import new report files")
+    parser.add_argument('--metrics-port', type=int, default=DEFAULT_PORT,
+                        help=f"Local port for the Prometheus /metrics endpoint, 0 to disable (default: {DEFAULT_PORT})")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Convert and import files concurrently through loaders/async_ingest.py (needs asyncpg)")
+    parser.add_argument('--workers', type=int, default=2, help="Parser processes and DB connections in --async mode")
+    args = parser.parse_args()
+    if args.use_async:
+        try:
+            asyncio.run(monitor_for_files_async(metrics_port=args.metrics_port, workers=args.workers))
+        except KeyboardInterrupt:
+            logger.info("File monitor shutdown requested")
+    else:
+        monitor_for_files(metrics_port=args.metrics_port) 
\ No newline at end of file
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Consistent reads across several connections with exported snapshots.
+
+Each statement in a default (READ COMMITTED) transaction sees the rows
+committed when that statement starts. So the queries behind one weekly TPY
+row can disagree while File_Monitor is importing: the FPY query may count
+a part that the station-yield query, run a moment later, does not.
+
+SnapshotCoordinator opens a REPEATABLE READ, READ ONLY transaction, exports
+its snapshot (pg_export_snapshot) and keeps the transaction open until the
+with block ends. Worker connections import that snapshot (SET TRANSACTION
+SNAPSHOT) and see exactly the same rows as the coordinator, however long
+they run. run() executes independent read functions in parallel, each on
+its own worker connection. Results are written afterwards on an ordinary
+connection.
+
+    with SnapshotCoordinator(DB_CONFIG, workers=3) as snapshot:
+        fpy, yields = snapshot.run(
+            lambda conn: calculate_fpy(week_start, week_end, conn),
+            lambda conn: calculate_yields(week_start, week_end, conn),
+        )
+
+Given an existing connection (conn=...), the coordinator uses it instead of
+opening one; its session settings are restored on exit, so the caller can
+write on it afterwards. Given a snapshot_id exported elsewhere (another
+coordinator, possibly in another process), it imports that one instead of
+exporting a new snapshot. The parallel TPY backfill uses this to read one
+state across all its worker processes.
+
+An open snapshot holds back VACUUM on every table for as long as it is
+open, so keep coordinators around one computation, not a whole day.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+
+def begin_snapshot(conn, snapshot_id=None, readonly=True):
+    """Start a REPEATABLE READ transaction on an idle conn, importing snapshot_id if given"""
+    conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=readonly)
+    if snapshot_id:
+        with conn.cursor() as cur:
+            # Must be the transaction's first statement; psycopg2 has only sent BEGIN so far
+            cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+
+
+class SnapshotCoordinator:
+    """Holds one snapshot open and lends it to parallel worker connections"""
+
+    def __init__(self, db_config=None, conn=None, snapshot_id=None, workers=1):
+        self.db_config = db_config or DB_CONFIG
+        self.conn = conn
+        self.own_conn = conn is None
+        self.snapshot_id = snapshot_id
+        self.imported = snapshot_id is not None
+        self.workers = workers
+        self._session = None
+
+    def __enter__(self):
+        if self.own_conn:
+            self.conn = psycopg2.connect(**self.db_config)
+        else:
+            self._session = (self.conn.isolation_level, self.conn.readonly)
+        try:
+            begin_snapshot(self.conn, self.snapshot_id)
+            if not self.imported:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT pg_export_snapshot()")
+                    self.snapshot_id = cur.fetchone()[0]
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Read only, so nothing to commit; ending the transaction releases the snapshot
+        self.conn.rollback()
+        if self.own_conn:
+            self.conn.close()
+        else:
+            # None would mean "leave as is" to set_session; the server default is 'DEFAULT'
+            isolation_level, readonly = (value if value is not None else 'DEFAULT' for value in self._session)
+            self.conn.set_session(isolation_level=isolation_level, readonly=readonly)
+        return False
+
+    def run(self, *calls):
+        """Call each fn(conn) against the snapshot; results in call order.
+
+        With one worker (or one call) they run one after another on the
+        coordinator's own connection. Otherwise each worker thread opens one
+        connection that imports the snapshot and reuses it for its calls.
+        """
+        if self.workers <= 1 or len(calls) <= 1:
+            return [call(self.conn) for call in calls]
+
+        local = threading.local()
+        opened = []
+        lock = threading.Lock()
+
+        def invoke(call):
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = psycopg2.connect(**self.db_config)
+                with lock:
+                    opened.append(conn)
+                begin_snapshot(conn, self.snapshot_id)
+            return call(conn)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(calls))) as executor:
+                return list(executor.map(invoke, calls))
+        finally:
+            for conn in opened:
+                conn.close()
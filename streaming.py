@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Streaming large query results through server-side (named) cursors.
+
+cur.fetchall() on an ordinary cursor pulls the whole result into client
+memory before the first row is used, and the all-time aggregators' results
+grow with history. stream_batches() declares a named cursor instead:
+PostgreSQL keeps the result and the client fetches ITERSIZE rows at a time.
+upsert_stream() writes each batch as it arrives, on the same connection,
+so client memory stays at about one batch however long the history is.
+
+A named cursor only lives as long as its transaction. Don't commit on its
+connection until the stream is exhausted; the aggregators commit once at
+the end, as they did before.
+
+ITERSIZE defaults to 10,000 rows. Set FOX_ITERSIZE to change it for every
+script, or pass itersize= to one call.
+
+    for rows in stream_batches(conn, AGGREGATE_SQL, name="station_hourly"):
+        ...
+"""
+import os
+
+from psycopg2.extras import execute_values
+
+ITERSIZE = int(os.environ.get("FOX_ITERSIZE", "10000"))
+
+
+def stream_batches(conn, sql, params=None, itersize=None, name="stream"):
+    """Yield lists of up to itersize rows from a named cursor on conn"""
+    itersize = itersize or ITERSIZE
+    with conn.cursor(name=name) as cur:
+        cur.itersize = itersize
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(itersize)
+            if not rows:
+                return
+            yield rows
+
+def upsert_stream(conn, insert_sql, batches, values=None, page_size=1000):
+    """execute_values every batch (mapped through values, if given); returns the rows written"""
+    written = 0
+    with conn.cursor() as cur:
+        for rows in batches:
+            if values is not None:
+                rows = [values(row) for row in rows]
+            execute_values(cur, insert_sql, rows, page_size=page_size)
+            written += len(rows)
+    return written
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Materialized-view mode for the one-GROUP-BY summary tables.
+
+testboard_station_performance_daily, fixture_performance_daily,
+packing_daily_summary and station_hourly_summary are each a single GROUP BY
+over a master log. Enabling view mode replaces the table with a materialized
+view of the same name (the old table is kept as <name>_legacy), so the
+dashboards and read_api keep querying the same name. Each view has a unique
+index, so it is refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY and
+readers are never blocked.
+
+The aggregator scripts check is_materialized() first and refresh the view
+instead of fetching and upserting. Refresh times are recorded as
+pipeline_metrics spans (job refresh_<view>).
+
+Usage:
+    python summary_views.py --status
+    python summary_views.py --enable                      # all four summaries
+    python summary_views.py --enable packing_daily_summary
+    python summary_views.py --refresh
+    python summary_views.py --disable station_hourly_summary
+    python summary_views.py --benchmark 3                 # refresh vs fetch-and-upsert
+"""
+import argparse
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from pipeline_metrics import PipelineRun
+from read_api import notify_summary_updated
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'fox_db',
+    'user': 'gpu_user',
+    'password': '',
+    'port': '5432'
+}
+
+# Same GROUP BYs as the aggregator scripts, with the columns cast to the
+# summary tables' types. "key" is the primary key / unique index; "table" is
+# the master log read, whose generated date columns (date_columns.py) it uses.
+SUMMARY_VIEWS = {
+    "testboard_station_performance_daily": {
+        "aggregator": "aggregators/testboard_agg/aggregate_all_time_dedup.py",
+        "table": "testboard_master_log",
+        "key": ["end_date", "model", "work_station_process", "workstation_name"],
+        "sql": """
+            SELECT
+                end_date,
+                model::text AS model,
+                work_station_process::text AS work_station_process,
+                workstation_name::text AS workstation_name,
+                COUNT(CASE WHEN history_station_passing_status = 'Pass' THEN 1 END)::integer AS pass,
+                COUNT(CASE WHEN history_station_passing_status = 'Fail' THEN 1 END)::integer AS fail,
+                COUNT(*)::integer AS total,
+                ROUND(
+                    COUNT(CASE WHEN history_station_passing_status = 'Fail' THEN 1 END)::numeric /
+                    NULLIF(COUNT(*), 0), 3
+                )::numeric(5,3) AS failurerate
+            FROM testboard_master_log
+            WHERE history_station_end_time IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        """,
+    },
+    "fixture_performance_daily": {
+        "aggregator": "aggregators/testboard_agg/aggregate_fixture_performance_all_time.py",
+        "table": "testboard_master_log",
+        "key": ["day", "fixture_no", "model", "pn", "workstation_name"],
+        "sql": """
+            SELECT
+                end_date AS day,
+                fixture_no::text AS fixture_no,
+                model::text AS model,
+                pn::text AS pn,
+                workstation_name::text AS workstation_name,
+                COUNT(CASE WHEN history_station_passing_status = 'Pass' THEN 1 END)::integer AS pass,
+                COUNT(CASE WHEN history_station_passing_status = 'Fail' THEN 1 END)::integer AS fail,
+                COUNT(*)::integer AS total
+            FROM testboard_master_log
+            WHERE history_station_end_time IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+        """,
+    },
+    "packing_daily_summary": {
+        "aggregator": "aggregators/workstation_agg/aggregate_packing_daily_dedup.py",
+        "table": "workstation_master_log",
+        "key": ["pack_date", "model", "part_number"],
+        "sql": """
+            SELECT
+                factory_date AS pack_date,  -- Saturday/Sunday count toward Friday
+                model::text AS model,
+                pn::text AS part_number,
+                COUNT(*)::integer AS packed_count
+            FROM workstation_master_log
+            WHERE workstation_name = 'PACKING'
+              AND history_station_passing_status = 'Pass'
+            GROUP BY 1, 2, 3
+        """,
+    },
+    "station_hourly_summary": {
+        "aggregator": "aggregators/workstation_agg/aggregate_station_hourly_counts.py",
+        "table": "workstation_master_log",
+        "key": ["date", "hour", "workstation_name"],
+        "sql": """
+            SELECT
+                end_date AS date,
+                end_hour::integer AS hour,
+                workstation_name::text AS workstation_name,
+                COUNT(*)::integer AS part_count
+            FROM workstation_master_log
+            WHERE history_station_end_time IS NOT NULL
+            GROUP BY 1, 2, 3
+        """,
+    },
+}
+
+
+def relation_kind(cur, name):
+    """'r' table, 'm' materialized view, None if missing"""
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relname = %s
+    """, (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def is_materialized(conn, name):
+    with conn.cursor() as cur:
+        return relation_kind(cur, name) == 'm'
+
+def enable_view(conn, name):
+    """Swap the summary table for a materialized view of the same name"""
+    from date_columns import require_date_columns  # date_columns imports this module
+
+    view = SUMMARY_VIEWS[name]
+    with conn.cursor() as cur:
+        kind = relation_kind(cur, name)
+        if kind == 'm':
+            print(f"{name} is already a materialized view")
+            return
+    require_date_columns(conn, view["table"])
+    with conn.cursor() as cur:
+        if kind == 'r':
+            cur.execute(f"DROP TABLE IF EXISTS {name}_legacy")
+            cur.execute(f"ALTER TABLE {name} RENAME TO {name}_legacy")
+            print(f"Kept the old table as {name}_legacy")
+        started = time.perf_counter()
+        cur.execute(f"CREATE MATERIALIZED VIEW {name} AS {view['sql']} WITH DATA")
+        cur.execute(f"CREATE UNIQUE INDEX {name}_key ON {name} ({', '.join(view['key'])})")
+        notify_summary_updated(cur, name)
+    conn.commit()
+    print(f"Created materialized view {name} in {time.perf_counter() - started:.2f}s")
+
+def disable_view(conn, name):
+    """Back to a plain table; the aggregator repopulates it on its next run"""
+    with conn.cursor() as cur:
+        if relation_kind(cur, name) != 'm':
+            print(f"{name} is not a materialized view")
+            return
+        cur.execute(f"DROP MATERIALIZED VIEW {name}")
+        if relation_kind(cur, f"{name}_legacy") == 'r':
+            cur.execute(f"ALTER TABLE {name}_legacy RENAME TO {name}")
+            print(f"Restored {name} from {name}_legacy (run {SUMMARY_VIEWS[name]['aggregator']} to bring it up to date)")
+        else:
+            print(f"Dropped {name}; {SUMMARY_VIEWS[name]['aggregator']} will recreate the table")
+        notify_summary_updated(cur, name)
+    conn.commit()
+
+def refresh_summary_view(conn, name):
+    """REFRESH ... CONCURRENTLY one view; returns the refresh time in seconds"""
+    run = PipelineRun(f"refresh_{name}", source=name)
+    try:
+        with run.span("refresh") as span, conn.cursor() as cur:
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+            notify_summary_updated(cur, name)
+            conn.commit()
+            cur.execute(f"SELECT COUNT(*) FROM {name}")
+            span.rows_out = cur.fetchone()[0]
+    except Exception as e:
+        conn.rollback()
+        run.fail(e)
+        raise
+    finally:
+        run.finish()
+    print(f"Refreshed {name} ({run.spans[0].rows_out:,} rows) in {run.seconds:.2f}s")
+    return run.seconds
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        print(f"{'Summary':<38} {'Mode':<10} {'Rows':>10} {'Last refresh':>13} {'p50 (20)':>9}")
+        print("-" * 86)
+        cur.execute("SELECT to_regclass('pipeline_spans') IS NOT NULL")
+        has_metrics = cur.fetchone()[0]
+        for name in SUMMARY_VIEWS:
+            kind = relation_kind(cur, name)
+            mode = {'m': 'view', 'r': 'table', None: 'missing'}[kind]
+            rows = "-"
+            if kind:
+                cur.execute(f"SELECT COUNT(*) FROM {name}")
+                rows = f"{cur.fetchone()[0]:,}"
+            last = p50 = "-"
+            if has_metrics:
+                cur.execute("""
+                    SELECT s.seconds FROM pipeline_runs r JOIN pipeline_spans s ON s.run_id = r.run_id
+                    WHERE r.job = %s AND s.stage = 'refresh' ORDER BY r.started_at DESC LIMIT 20
+                """, (f"refresh_{name}",))
+                timings = [row[0] for row in cur.fetchall()]
+                if timings:
+                    last = f"{timings[0]:.2f}s"
+                    p50 = f"{sorted(timings)[len(timings) // 2]:.2f}s"
+            print(f"{name:<38} {mode:<10} {rows:>10} {last:>13} {p50:>9}")
+
+def benchmark(conn, repeats=3):
+    """Fetch-and-upsert vs REFRESH CONCURRENTLY on scratch copies of every summary"""
+    from date_columns import require_date_columns
+
+    print(f"SUMMARY REFRESH BENCHMARK ({repeats} runs each, median seconds)")
+    print("=" * 72)
+    print(f"{'Summary':<38} {'Rows':>9} {'Upsert':>9} {'Refresh':>9} {'Speedup':>8}")
+    print("-" * 72)
+    conn.autocommit = False
+    for name, view in SUMMARY_VIEWS.items():
+        key = ", ".join(view["key"])
+        table, matview = f"bench_{name}_table", f"bench_{name}_mv"
+        require_date_columns(conn, view["table"])
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {matview}")
+            cur.execute(f"CREATE TABLE {table} AS {view['sql']} WITH NO DATA")
+            cur.execute(f"CREATE UNIQUE INDEX ON {table} ({key})")
+            cur.execute(f"CREATE MATERIALIZED VIEW {matview} AS {view['sql']} WITH DATA")
+            cur.execute(f"CREATE UNIQUE INDEX ON {matview} ({key})")
+            conn.commit()
+
+            upsert_times, refresh_times = [], []
+            for _ in range(repeats):
+                # What the aggregator scripts do: pull the GROUP BY into Python, upsert it back
+                started = time.perf_counter()
+                cur.execute(view["sql"])
+                rows = cur.fetchall()
+                columns = [d[0] for d in cur.description]
+                updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in view["key"])
+                execute_values(cur, f"""
+                    INSERT INTO {table} ({', '.join(columns)}) VALUES %s
+                    ON CONFLICT ({key}) DO UPDATE SET {updates}
+                """, rows, page_size=1000)
+                conn.commit()
+                upsert_times.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {matview}")
+                conn.commit()
+                refresh_times.append(time.perf_counter() - started)
+
+            cur.execute(f"DROP TABLE {table}")
+            cur.execute(f"DROP MATERIALIZED VIEW {matview}")
+            conn.commit()
+
+        upsert = sorted(upsert_times)[len(upsert_times) // 2]
+        refresh = sorted(refresh_times)[len(refresh_times) // 2]
+        print(f"{name:<38} {len(rows):>9,} {upsert:>8.2f}s {refresh:>8.2f}s {upsert / refresh:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialized-view mode for the summary tables")
+    parser.add_argument('--enable', nargs='*', metavar='SUMMARY', help="Switch summaries to materialized views (default: all)")
+    parser.add_argument('--disable', nargs='*', metavar='SUMMARY', help="Switch summaries back to tables (default: all)")
+    parser.add_argument('--refresh', nargs='*', metavar='SUMMARY', help="Refresh views concurrently (default: all views)")
+    parser.add_argument('--status', action='store_true', help="Show mode, size and refresh times")
+    parser.add_argument('--benchmark', type=int, metavar='RUNS', help="Compare refresh with fetch-and-upsert")
+    args = parser.parse_args()
+
+    for names in (args.enable, args.disable, args.refresh):
+        unknown = set(names or []) - set(SUMMARY_VIEWS)
+        if unknown:
+            parser.error(f"unknown summary: {', '.join(sorted(unknown))} (expected {', '.join(SUMMARY_VIEWS)})")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.enable is not None:
+            for name in args.enable or SUMMARY_VIEWS:
+                enable_view(conn, name)
+        if args.disable is not None:
+            for name in args.disable or SUMMARY_VIEWS:
+                disable_view(conn, name)
+        if args.refresh is not None:
+            for name in args.refresh or SUMMARY_VIEWS:
+                if is_materialized(conn, name):
+                    refresh_summary_view(conn, name)
+                else:
+                    print(f"{name} is a table; its aggregator keeps it up to date")
+        if args.benchmark:
+            benchmark(conn, args.benchmark)
+        if args.status or not any(v is not None for v in (args.enable, args.disable, args.refresh, args.benchmark)):
+            print_status(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,53 @@
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from factory_calendar import factory_date, week_bounds, week_id, week_range
+
+
+def test_week_id_uses_the_iso_year_around_new_year():
+    assert week_id(date(2024, 12, 29)) == "2024-W52"
+    assert week_id(date(2024, 12, 30)) == "2025-W01"
+    assert week_id(date(2025, 1, 1)) == "2025-W01"
+    assert week_id(date(2021, 1, 3)) == "2020-W53"
+    assert week_id(date(2021, 1, 4)) == "2021-W01"
+    assert week_id(date(2027, 1, 2)) == "2026-W53"
+
+
+def test_week_id_accepts_datetimes():
+    assert week_id(datetime(2024, 12, 30, 23, 59)) == "2025-W01"
+    assert week_id(datetime(2025, 6, 2, 7, 0)) == "2025-W23"
+
+
+def test_week_range_is_monday_to_sunday():
+    assert week_range("2025-W01") == (date(2024, 12, 30), date(2025, 1, 5))
+    assert week_range("2020-W53") == (date(2020, 12, 28), date(2021, 1, 3))
+    assert week_range("2026-W53") == (date(2026, 12, 28), date(2027, 1, 3))
+
+
+def test_week_range_and_bounds_contain_the_day():
+    day = date(2024, 12, 20)
+    while day < date(2025, 1, 15):
+        start, end = week_range(week_id(day))
+        assert start <= day <= end
+        assert start.weekday() == 0 and end - start == timedelta(days=6)
+        assert week_bounds(day) == (start, end)
+        day += timedelta(days=1)
+
+
+def test_factory_date_folds_weekends_into_friday():
+    assert factory_date(date(2025, 1, 3)) == date(2025, 1, 3)
+    assert factory_date(date(2025, 1, 4)) == date(2025, 1, 3)
+    assert factory_date(date(2025, 1, 5)) == date(2025, 1, 3)
+    assert factory_date(date(2025, 1, 6)) == date(2025, 1, 6)
+    # Across New Year and an ISO year boundary
+    assert factory_date(date(2022, 1, 1)) == date(2021, 12, 31)
+    assert factory_date(date(2022, 1, 2)) == date(2021, 12, 31)
+
+
+def test_factory_date_leaves_weekdays_alone():
+    monday = date(2024, 12, 30)
+    for offset in range(5):
+        day = monday + timedelta(days=offset)
+        assert factory_date(day) == day
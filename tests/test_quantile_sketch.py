@@ -0,0 +1,95 @@
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from quantile_sketch import (MIN_VALUE, RELATIVE_ACCURACY, QuantileSketch, bucket_index,
+                             bucket_sql)
+
+QUANTILES = (0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0)
+
+
+def durations(seed, n=20000):
+    """Cycle-time-like seconds: mostly minutes, a long tail, some under a second"""
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(5, 1.5) for _ in range(n)]
+    values += [rng.expovariate(1 / 3600) for _ in range(n // 4)]
+    values += [rng.random() for _ in range(n // 20)]
+    return values
+
+
+def sketch_of(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def exact_quantile(values, q):
+    """The order statistic the sketch's rank q * (count - 1) lands on"""
+    ordered = sorted(values)
+    return ordered[math.floor(q * (len(ordered) - 1))]
+
+
+def test_quantiles_are_within_relative_accuracy():
+    values = durations(seed=1)
+    sketch = sketch_of(values)
+    for q in QUANTILES:
+        exact = exact_quantile(values, q)
+        estimate = sketch.quantile(q)
+        if exact < MIN_VALUE:
+            assert estimate == 0.0
+        else:
+            assert abs(estimate - exact) <= RELATIVE_ACCURACY * exact + 1e-9, q
+
+
+def test_empty_sketch_has_no_quantile():
+    assert QuantileSketch().quantile(0.5) is None
+    assert QuantileSketch().mean() is None
+
+
+def test_merged_days_equal_one_sketch_of_all_values():
+    days = [durations(seed, n=2000) for seed in range(7)]
+    merged = QuantileSketch.merged(sketch_of(values) for values in days)
+    whole = sketch_of([value for values in days for value in values])
+
+    assert merged.buckets == whole.buckets
+    assert merged.zero_count == whole.zero_count
+    assert merged.count == whole.count
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    assert merged.total == pytest.approx(whole.total)
+    for q in QUANTILES:
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_json_round_trip():
+    sketch = sketch_of(durations(seed=2, n=500))
+    copy = QuantileSketch.from_json(sketch.to_json(), sketch.zero_count, sketch.count,
+                                    sketch.total, sketch.min, sketch.max)
+    assert copy.buckets == sketch.buckets
+    assert (copy.zero_count, copy.count, copy.total, copy.min, copy.max) == \
+        (sketch.zero_count, sketch.count, sketch.total, sketch.min, sketch.max)
+    for q in QUANTILES:
+        assert copy.quantile(q) == sketch.quantile(q)
+
+    # Decoded JSONB (a dict) works too, and count defaults to the bucket counts
+    decoded = QuantileSketch.from_json(json.loads(sketch.to_json()), sketch.zero_count)
+    assert decoded.count == sketch.count
+
+
+def test_bucket_sql_matches_bucket_index():
+    # Evaluated by SQLite with Python's ln and ceil, so no PostgreSQL is needed
+    conn = sqlite3.connect(":memory:")
+    conn.create_function("LN", 1, math.log, deterministic=True)
+    conn.create_function("CEIL", 1, math.ceil, deterministic=True)
+    sql = f"SELECT {bucket_sql('?')}".replace("::int", "")
+    values = [0.0, 0.5, 0.999, MIN_VALUE, 1.0001, 2.0, 59.5, 60.0, 3600.0, 86400.0 * 3]
+    values += durations(seed=3, n=1000)
+    for value in values:
+        (bucket,) = conn.execute(sql, (value, value)).fetchone()
+        assert bucket == bucket_index(value), value
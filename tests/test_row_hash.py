@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from row_hash import HASH_COLUMNS, row_hashes
+
+COLUMNS = HASH_COLUMNS["snfn_master_log"]
+
+
+def snfn_row(**values):
+    row = dict.fromkeys(COLUMNS, "x")
+    row.update(values)
+    return row
+
+
+def test_null_empty_and_nul_hash_differently():
+    values = [None, "", "\0", "a", "a\0b", "a\0c", "\\N", "\\0", "\\"]
+    hashes = row_hashes([snfn_row(error_disc=value) for value in values], "snfn_master_log")
+    assert len(set(hashes.tolist())) == len(values)
+
+
+def test_hash_is_stable_across_value_types():
+    from datetime import datetime
+
+    import pandas as pd
+
+    started = datetime(2025, 6, 1, 8, 30)
+    hashes = row_hashes([
+        snfn_row(history_station_start_time=started),
+        snfn_row(history_station_start_time=pd.Timestamp(started)),
+    ], "snfn_master_log")
+    assert hashes[0] == hashes[1]
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Column-wise timestamp normalization for the report loaders.
+
+The portal exports times as text in one format ('2025-06-04 03:47:15'), and
+the odd hand-edited sheet has real Excel dates or other layouts. Rather than
+calling pd.to_datetime once per cell while mapping rows, normalize_timestamps()
+parses each timestamp column of the DataFrame once:
+
+1. strptime on the whole column with each known portal format in turn;
+2. whatever is still unparsed is parsed per unique value with pd.to_datetime,
+   cached across files;
+3. anything left is NaT. Bad cells become NULLs instead of raising mid-file.
+
+The workstation report's "start time missing -> use the end time" rule is
+applied on whole columns too. Rows still missing a required timestamp are
+dropped and counted, since the master logs declare those columns NOT NULL.
+"""
+from functools import lru_cache
+
+import pandas as pd
+
+# Portal export first; the others have turned up in re-saved sheets
+PORTAL_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y/%m/%d %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+)
+
+
+@lru_cache(maxsize=65536)
+def _parse_odd(value):
+    try:
+        parsed = pd.to_datetime(value)
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+    # Offsets are dropped like the naive TIMESTAMP columns would; the portal times are factory-local
+    if getattr(parsed, 'tzinfo', None) is not None:
+        parsed = parsed.tz_localize(None)
+    return parsed
+
+def parse_timestamps(values):
+    """Series of mixed cells -> datetime64 Series, NaT where blank or unparseable"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.tz_localize(None) if values.dt.tz is not None else values
+    text = values.where(~values.map(lambda v: isinstance(v, str)), values.astype(str).str.strip())
+    text = text.replace('', None)
+    parsed = pd.to_datetime(text, format=PORTAL_FORMATS[0], errors='coerce')
+    for fmt in PORTAL_FORMATS[1:]:
+        missing = parsed.isna() & text.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=fmt, errors='coerce')
+    missing = parsed.isna() & text.notna()
+    if missing.any():
+        odd = text[missing]
+        lookup = {value: _parse_odd(value) for value in pd.unique(odd)}
+        parsed[missing] = pd.to_datetime(odd.map(lookup), errors='coerce')
+    return parsed
+
+def normalize_timestamps(df, columns, start_fallback=None, required=(), log=print):
+    """Parse timestamp columns in place; returns df without rows missing a required timestamp.
+
+    start_fallback=(start_column, end_column) fills a missing start time from
+    the end time. Columns absent from the sheet are added as all-NaT.
+    """
+    for column in columns:
+        df[column] = parse_timestamps(df[column]) if column in df.columns else pd.Series(pd.NaT, index=df.index, dtype='datetime64[us]')
+    if start_fallback:
+        start, end = start_fallback
+        df[start] = df[start].fillna(df[end])
+    if required:
+        missing = df[list(required)].isna().any(axis=1)
+        if missing.any():
+            log(f"Dropping {int(missing.sum()):,} rows with a missing or unparseable {' / '.join(required)}")
+            df = df[~missing]
+    return df
+
+def py_timestamp(value):
+    """A normalized cell as datetime (or None) for psycopg2/asyncpg"""
+    return None if pd.isna(value) else value.to_pydatetime()
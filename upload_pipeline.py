@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Pipelined read -> map -> write for the upload scripts.
+
+The upload scripts used to read a whole file, map every row, then insert,
+so the CPU sat idle during the inserts and the database sat idle during the
+parsing. This module runs the stages side by side with bounded queues
+between them:
+
+    reader thread --chunks--> mapper processes --value batches--> writer (caller)
+
+The reader parses one file at a time and hands out chunk_rows-row slices.
+Mappers turn slices into insert tuples in a process pool, since the per-row
+mapping is pure Python and would hold the GIL against the other stages. The
+writer runs execute_values
+on the caller's connection, committing each batch. A full queue blocks the
+stage feeding it, so memory stays at one parsed file plus queue_size chunks
+per queue, however many files are found.
+
+Each stage still records read_excel / map_rows / insert spans on the
+script's PipelineRun (one span per file or chunk).
+
+Given table and columns (the insert_sql column order), the writer inserts
+into the fact table instead when that master log is in star mode (see
+dimensions.py). For workstation_master_log each insert also merges the rows
+it added into part_state, in the same statement (part_state.py).
+"""
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from dimensions import insert_facts, is_star
+from part_state import state_wrapper
+
+DEFAULT_CHUNK_ROWS = 5000
+# Leave a core for the reader and the writer; 0 maps in a thread instead of processes
+DEFAULT_MAPPERS = min(max((os.cpu_count() or 1) - 1, 0), 4)
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class UploadPipeline:
+    def __init__(self, run, read_file, map_chunk, insert_sql, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 mappers=DEFAULT_MAPPERS, queue_size=DEFAULT_QUEUE_SIZE, log=print, table=None, columns=None):
+        """read_file(path) -> DataFrame, map_chunk(df) -> list of insert tuples (module-level, it is pickled)"""
+        self.run = run
+        self.read_file = read_file
+        self.map_chunk = map_chunk
+        self.insert_sql = insert_sql
+        self.table = table
+        self.columns = columns
+        self.star = False
+        self.wrap = None
+        self.chunk_rows = max(chunk_rows, 1)
+        self.mappers = max(mappers, 0)
+        self.feeders = max(self.mappers, 1)
+        self.log = log
+        self.chunks = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        # file_path -> [chunks expected (None while still reading), chunks written, rows written, error]
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def _put(self, q, item):
+        """Blocking put that gives up once the pipeline is stopping"""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Blocking get that returns _DONE once the pipeline is stopping"""
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _reader(self, file_paths):
+        try:
+            for i, file_path in enumerate(file_paths, 1):
+                if self.stop.is_set():
+                    break
+                self.log(f"Reading file {i}/{len(file_paths)}: {os.path.basename(file_path)}")
+                with self._lock:
+                    self.files[file_path] = [None, 0, 0, None]
+                try:
+                    with self.run.span("read_excel", bytes_read=os.path.getsize(file_path)) as span:
+                        df = self.read_file(file_path)
+                        span.rows_out = len(df)
+                except Exception as e:
+                    self.log(f"Error reading {os.path.basename(file_path)}: {e}")
+                    with self._lock:
+                        self.files[file_path] = [0, 0, 0, e]
+                    continue
+                starts = range(0, len(df), self.chunk_rows)
+                with self._lock:
+                    self.files[file_path][0] = len(starts)
+                for start in starts:
+                    if not self._put(self.chunks, (file_path, df.iloc[start:start + self.chunk_rows])):
+                        return
+        finally:
+            for _ in range(self.feeders):
+                self._put(self.chunks, _DONE)
+
+    def _mapper(self, executor):
+        try:
+            while True:
+                item = self._get(self.chunks)
+                if item is _DONE:
+                    break
+                file_path, df = item
+                try:
+                    with self.run.span("map_rows", rows_in=len(df)) as span:
+                        if executor is None:
+                            values = self.map_chunk(df)
+                        else:
+                            values = executor.submit(self.map_chunk, df).result()
+                        span.rows_out = len(values)
+                except Exception as e:
+                    self.log(f"Error mapping rows from {os.path.basename(file_path)}: {e}")
+                    values, error = [], e
+                else:
+                    error = None
+                if not self._put(self.batches, (file_path, values, error)):
+                    break
+        finally:
+            self._put(self.batches, _DONE)
+
+    def _write(self, conn, file_path, values):
+        with self.run.span("insert", rows_in=len(values)):
+            with conn.cursor() as cursor:
+                if self.star:
+                    insert_facts(cursor, self.table, self.columns, values, wrap=self.wrap)
+                else:
+                    execute_values(cursor, self.wrap(self.insert_sql) if self.wrap else self.insert_sql, values)
+            conn.commit()
+
+    def _chunk_done(self, file_path, rows, error):
+        """Count a finished chunk; returns the file's state once its last chunk is in"""
+        with self._lock:
+            state = self.files[file_path]
+            state[1] += 1
+            state[2] += rows
+            state[3] = state[3] or error
+            if state[0] is not None and state[1] == state[0]:
+                return state
+        return None
+
+    def upload(self, conn, file_paths):
+        """Run the pipeline over file_paths; returns the number of rows sent to the database"""
+        self.star = self.table is not None and is_star(conn, self.table)
+        if self.star:
+            self.log(f"{self.table} is in star mode; inserting into {self.table}_fact")
+        self.wrap = state_wrapper(self.table, self.star)
+        executor = None
+        if self.mappers:
+            # spawn, not fork: forking while the reader thread holds a lock (logging, pandas) deadlocks the child
+            executor = ProcessPoolExecutor(max_workers=self.mappers, mp_context=multiprocessing.get_context("spawn"))
+        # One feeder thread per mapper process keeps every process busy
+        threads = [threading.Thread(target=self._reader, args=(file_paths,), name="upload-reader", daemon=True)]
+        threads += [threading.Thread(target=self._mapper, args=(executor,), name=f"upload-mapper-{i}", daemon=True)
+                    for i in range(self.feeders)]
+        for thread in threads:
+            thread.start()
+
+        total_imported = 0
+        finished_mappers = 0
+        try:
+            while finished_mappers < self.feeders:
+                item = self.batches.get()
+                if item is _DONE:
+                    finished_mappers += 1
+                    continue
+                file_path, values, error = item
+                written = 0
+                if values and error is None:
+                    try:
+                        self._write(conn, file_path, values)
+                        written = len(values)
+                    except Exception as e:
+                        conn.rollback()
+                        error = e
+                        self.log(f"Error importing {os.path.basename(file_path)}: {e}")
+                total_imported += written
+                state = self._chunk_done(file_path, written, error)
+                if state is not None:
+                    status = f" ({state[3]})" if state[3] else ""
+                    self.log(f"Imported {state[2]:,} records from {os.path.basename(file_path)}{status}")
+        except BaseException:
+            self.stop.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join(timeout=5)
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return total_imported
@@ -2,9 +2,14 @@ import psycopg2
 import pandas as pd
 import glob
 import os
-from psycopg2.extras import execute_values
+import argparse
 from datetime import timezone
 
+from pipeline_metrics import PipelineRun
+from row_hash import ensure_row_hash_column, row_hashes
+from timestamps import normalize_timestamps, py_timestamp
+from upload_pipeline import DEFAULT_CHUNK_ROWS, DEFAULT_MAPPERS, DEFAULT_QUEUE_SIZE, UploadPipeline
+
 def connect_to_db():
     print("Attempting to connect to database...")
     return psycopg2.connect(
@@ -44,6 +49,8 @@ def create_snfn_table(conn):
     except Exception as e:
         print(f"Note: Unique constraint may already exist: {e}")
     
+    conn.commit()
+    ensure_row_hash_column(cursor, 'snfn_master_log')
     conn.commit()
     cursor.close()
 
@@ -53,18 +60,51 @@ def clean_column_name(col_name):
     return cleaned
 
 def convert_timestamp(value):
-    if pd.isna(value):
-        return None
-    if isinstance(value, pd.Timestamp):
-        return value.to_pydatetime()
-    return pd.to_datetime(value)
+    # read_file has already parsed the timestamp columns; this only unwraps them
+    return py_timestamp(value)
 
 def convert_empty_string(value):
     if isinstance(value, str) and value.strip() == '':
         return None
     return value
 
-def main():
+INSERT_SQL = """
+INSERT INTO snfn_master_log (
+    workstation_name, fixture_no, error_code, error_disc, sn, pn, history_station_start_time, history_station_end_time, data_source, row_hash
+) VALUES %s
+ON CONFLICT ON CONSTRAINT snfn_unique_constraint
+DO NOTHING
+"""
+
+def read_file(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    return normalize_timestamps(
+        df, ['history_station_start_time', 'history_station_end_time'],
+        required=('history_station_start_time', 'history_station_end_time'),
+    )
+
+def map_chunk(df):
+    mapped_data = []
+    for _, row in df.iterrows():
+        mapped_row = {
+            'workstation_name': convert_empty_string(str(row.get('workstation_name', ''))),
+            'fixture_no': convert_empty_string(str(row.get('fixture_no', ''))),
+            'error_code': convert_empty_string(str(row.get('error_code', ''))),
+            'error_disc': convert_empty_string(str(row.get('error_disc', ''))),
+            'sn': convert_empty_string(str(row.get('sn', ''))),
+            'pn': convert_empty_string(str(row.get('pn', ''))),
+            'history_station_start_time': convert_timestamp(row.get('history_station_start_time')),
+            'history_station_end_time': convert_timestamp(row.get('history_station_end_time')),
+            'data_source': 'snfn'
+        }
+        mapped_data.append(mapped_row)
+    hashes = row_hashes(mapped_data, 'snfn_master_log')
+    return [(
+        row['workstation_name'], row['fixture_no'], row['error_code'], row['error_disc'], row['sn'], row['pn'], row['history_station_start_time'], row['history_station_end_time'], row['data_source'], int(row_hash)
+    ) for row, row_hash in zip(mapped_data, hashes)]
+
+def main(input_dir=None, mappers=DEFAULT_MAPPERS, queue_size=DEFAULT_QUEUE_SIZE, chunk_rows=DEFAULT_CHUNK_ROWS):
     print("Starting snfn data upload process...")
     
     try:
@@ -79,7 +119,10 @@ def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     print(f"Script directory: {script_dir}")
     
-    excel_path = os.path.join(script_dir, "input", "snfnrecord.xlsx")
+    if input_dir:
+        excel_path = os.path.join(input_dir, "**", "*.xlsx")
+    else:
+        excel_path = os.path.join(script_dir, "input", "snfnrecord.xlsx")
     print(f"Looking for Excel files in: {excel_path}")
     
     excel_path_normalized = os.path.normpath(excel_path)
@@ -104,64 +147,22 @@ def main():
             print(f"Directory does not exist: {check_path}")
         return
         
-    total_imported = 0
-    
-    for i, file_path in enumerate(snfn_files, 1):
-        print(f"\nProcessing file {i}/{len(snfn_files)}: {os.path.basename(file_path)}")
-        
-        try:
-            print(f"Reading file: {file_path}")
-            df = pd.read_excel(file_path)
-            print(f"Successfully read file with {len(df)} rows")
-            
-            df.columns = [clean_column_name(col) for col in df.columns]
-            
-            mapped_data = []
-            for _, row in df.iterrows():
-                mapped_row = {
-                    'workstation_name': convert_empty_string(str(row.get('workstation_name', ''))),
-                    'fixture_no': convert_empty_string(str(row.get('fixture_no', ''))),
-                    'error_code': convert_empty_string(str(row.get('error_code', ''))),
-                    'error_disc': convert_empty_string(str(row.get('error_disc', ''))),
-                    'sn': convert_empty_string(str(row.get('sn', ''))),
-                    'pn': convert_empty_string(str(row.get('pn', ''))),
-                    'history_station_start_time': convert_timestamp(row.get('history_station_start_time')),
-                    'history_station_end_time': convert_timestamp(row.get('history_station_end_time')),
-                    'data_source': 'snfn'
-                }
-                mapped_data.append(mapped_row)
-            
-            cursor = conn.cursor()
-            
-            insert_query = """
-            INSERT INTO snfn_master_log (
-                workstation_name, fixture_no, error_code, error_disc, sn, pn, history_station_start_time, history_station_end_time, data_source
-            ) VALUES %s
-            ON CONFLICT ON CONSTRAINT snfn_unique_constraint
-            DO NOTHING
-            """
-            
-            values = [(
-                row['workstation_name'], row['fixture_no'], row['error_code'], row['error_disc'], row['sn'], row['pn'], row['history_station_start_time'], row['history_station_end_time'], row['data_source']
-            ) for row in mapped_data]
-            
-            execute_values(cursor, insert_query, values)
-            conn.commit()
-            cursor.close()
-            
-            file_imported = len(mapped_data)
-            total_imported += file_imported
-            print(f"Imported {file_imported:,} records from {os.path.basename(file_path)}")
-            
-        except Exception as e:
-            print(f"Error importing {os.path.basename(file_path)}: {e}")
-            conn.rollback()
-            continue
+    run = PipelineRun("upload_snfn_master_log", source=excel_path_normalized)
+    pipeline = UploadPipeline(run, read_file, map_chunk, INSERT_SQL, chunk_rows=chunk_rows,
+                              mappers=mappers, queue_size=queue_size, log=print)
+    total_imported = pipeline.upload(conn, snfn_files)
     
     print(f"\nTotal snfn records imported: {total_imported:,}")
     conn.close()
+    run.finish()
 
 if __name__ == "__main__":
-    main() 
+    parser = argparse.ArgumentParser(description="Upload snfn Excel files into snfn_master_log")
+    parser.add_argument('--input-dir', help="Directory searched recursively for .xlsx files (default: input/snfnrecord.xlsx)")
+    parser.add_argument('--mappers', type=int, default=DEFAULT_MAPPERS, help=f"Row-mapping processes, 0 to map in a thread (default: {DEFAULT_MAPPERS})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help=f"Chunks buffered between stages (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help=f"Rows per chunk (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+    main(input_dir=args.input_dir, mappers=args.mappers, queue_size=args.queue_size, chunk_rows=args.chunk_rows) 
 
 
@@ -2,7 +2,14 @@ import psycopg2
 import pandas as pd
 import glob
 import os
-from psycopg2.extras import execute_values
+import argparse
+
+from dimensions import is_star
+from partitions import ensure_partitions
+from pipeline_metrics import PipelineRun
+from row_hash import ensure_row_hash_column, row_hashes
+from timestamps import normalize_timestamps, py_timestamp
+from upload_pipeline import DEFAULT_CHUNK_ROWS, DEFAULT_MAPPERS, DEFAULT_QUEUE_SIZE, UploadPipeline
 
 def connect_to_db():
     print("Attempting to connect to database...")
@@ -15,6 +22,9 @@ def connect_to_db():
     )
 
 def create_testboard_table(conn):
+    if is_star(conn, 'testboard_master_log'):
+        print("testboard_master_log is in star mode (see dimensions.py); nothing to create")
+        return
     print("Creating/verifying testboard table...")
     cursor = conn.cursor()
     cursor.execute("""
@@ -53,6 +63,8 @@ def create_testboard_table(conn):
     except Exception as e:
         print(f"Note: Unique constraint may already exist: {e}")
     
+    conn.commit()
+    ensure_row_hash_column(cursor, 'testboard_master_log')
     conn.commit()
     cursor.close()
 
@@ -62,18 +74,65 @@ def clean_column_name(col_name):
     return cleaned
 
 def convert_timestamp(value):
-    if pd.isna(value):
-        return None
-    if isinstance(value, pd.Timestamp):
-        return value.to_pydatetime()
-    return pd.to_datetime(value)
+    # read_file has already parsed the timestamp columns; this only unwraps them
+    return py_timestamp(value)
 
 def convert_empty_string(value):
     if isinstance(value, str) and value.strip() == '':
         return None
     return value
 
-def main():
+# Insert order of map_chunk's tuples
+INSERT_COLUMNS = (
+    "sn", "pn", "model", "work_station_process", "baseboard_sn", "baseboard_pn", "workstation_name",
+    "history_station_start_time", "history_station_end_time", "history_station_passing_status", "operator",
+    "failure_reasons", "failure_note", "failure_code", "diag_version", "fixture_no", "data_source", "row_hash",
+)
+INSERT_SQL = f"""
+INSERT INTO testboard_master_log ({', '.join(INSERT_COLUMNS)}) VALUES %s
+ON CONFLICT ON CONSTRAINT testboard_unique_constraint
+DO NOTHING
+"""
+
+def read_file(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    return normalize_timestamps(
+        df, ['history_station_start_time', 'history_station_end_time'],
+        required=('history_station_start_time', 'history_station_end_time'),
+    )
+
+def map_chunk(df):
+    mapped_data = []
+    for _, row in df.iterrows():
+        mapped_row = {
+            'sn': convert_empty_string(str(row.get('sn', ''))),
+            'pn': convert_empty_string(str(row.get('pn', ''))),
+            'model': convert_empty_string(str(row.get('model', ''))),
+            'work_station_process': convert_empty_string(str(row.get('work_station_process', ''))),
+            'baseboard_sn': convert_empty_string(str(row.get('baseboard_sn', ''))),
+            'baseboard_pn': convert_empty_string(str(row.get('baseboard_pn', ''))),
+            'workstation_name': convert_empty_string(str(row.get('workstation_name', ''))),
+            'history_station_start_time': convert_timestamp(row.get('history_station_start_time')),
+            'history_station_end_time': convert_timestamp(row.get('history_station_end_time')),
+            'history_station_passing_status': convert_empty_string(str(row.get('history_station_passing_status', ''))),
+            'operator': convert_empty_string(str(row.get('operator', ''))),
+            'failure_reasons': convert_empty_string(str(row.get('failure_reasons', ''))),
+            'failure_note': convert_empty_string(str(row.get('failure_note', ''))),
+            'failure_code': convert_empty_string(str(row.get('failure_code', ''))),
+            'diag_version': convert_empty_string(str(row.get('diag_version', ''))),
+            'fixture_no': convert_empty_string(str(row.get('fixture_no', ''))),
+            'data_source': 'testboard'
+        }
+        mapped_data.append(mapped_row)
+    hashes = row_hashes(mapped_data, 'testboard_master_log')
+    return [(
+        row['sn'], row['pn'], row['model'], row['work_station_process'], row['baseboard_sn'], row['baseboard_pn'], row['workstation_name'],
+        row['history_station_start_time'], row['history_station_end_time'], row['history_station_passing_status'], row['operator'],
+        row['failure_reasons'], row['failure_note'], row['failure_code'], row['diag_version'], row['fixture_no'], row['data_source'], int(row_hash)
+    ) for row, row_hash in zip(mapped_data, hashes)]
+
+def main(input_dir=None, mappers=DEFAULT_MAPPERS, queue_size=DEFAULT_QUEUE_SIZE, chunk_rows=DEFAULT_CHUNK_ROWS):
     print("Starting testboard data upload process...")
     
     try:
@@ -84,11 +143,12 @@ def main():
         return
         
     create_testboard_table(conn)
+    ensure_partitions(conn, 'testboard_master_log')
     
     script_dir = os.path.dirname(os.path.abspath(__file__))
     print(f"Script directory: {script_dir}")
     
-    excel_path = os.path.join(script_dir, "input", "data log", "testboardrecord_xlsx", "**", "*.xlsx")
+    excel_path = os.path.join(input_dir or os.path.join(script_dir, "input", "data log", "testboardrecord_xlsx"), "**", "*.xlsx")
     print(f"Looking for Excel files in: {excel_path}")
     excel_path_normalized = os.path.normpath(excel_path)
     print(f"Normalized path: {excel_path_normalized}")
@@ -112,74 +172,21 @@ def main():
             print(f"Directory does not exist: {check_path}")
         return
         
-    total_imported = 0
-    
-    for i, file_path in enumerate(testboard_files, 1):
-        print(f"\nProcessing file {i}/{len(testboard_files)}: {os.path.basename(file_path)}")
-        
-        try:
-            print(f"Reading file: {file_path}")
-            df = pd.read_excel(file_path)
-            print(f"Successfully read file with {len(df)} rows")
-            
-            df.columns = [clean_column_name(col) for col in df.columns]
-            
-            mapped_data = []
-            for _, row in df.iterrows():
-                mapped_row = {
-                    'sn': convert_empty_string(str(row.get('sn', ''))),
-                    'pn': convert_empty_string(str(row.get('pn', ''))),
-                    'model': convert_empty_string(str(row.get('model', ''))),
-                    'work_station_process': convert_empty_string(str(row.get('work_station_process', ''))),
-                    'baseboard_sn': convert_empty_string(str(row.get('baseboard_sn', ''))),
-                    'baseboard_pn': convert_empty_string(str(row.get('baseboard_pn', ''))),
-                    'workstation_name': convert_empty_string(str(row.get('workstation_name', ''))),
-                    'history_station_start_time': convert_timestamp(row.get('history_station_start_time')),
-                    'history_station_end_time': convert_timestamp(row.get('history_station_end_time')),
-                    'history_station_passing_status': convert_empty_string(str(row.get('history_station_passing_status', ''))),
-                    'operator': convert_empty_string(str(row.get('operator', ''))),
-                    'failure_reasons': convert_empty_string(str(row.get('failure_reasons', ''))),
-                    'failure_note': convert_empty_string(str(row.get('failure_note', ''))),
-                    'failure_code': convert_empty_string(str(row.get('failure_code', ''))),
-                    'diag_version': convert_empty_string(str(row.get('diag_version', ''))),
-                    'fixture_no': convert_empty_string(str(row.get('fixture_no', ''))),
-                    'data_source': 'testboard'
-                }
-                mapped_data.append(mapped_row)
-            
-            cursor = conn.cursor()
-            
-            insert_query = """
-            INSERT INTO testboard_master_log (
-                sn, pn, model, work_station_process, baseboard_sn, baseboard_pn, workstation_name,
-                history_station_start_time, history_station_end_time, history_station_passing_status, operator,
-                failure_reasons, failure_note, failure_code, diag_version, fixture_no, data_source
-            ) VALUES %s
-            ON CONFLICT ON CONSTRAINT testboard_unique_constraint
-            DO NOTHING
-            """
-            
-            values = [(
-                row['sn'], row['pn'], row['model'], row['work_station_process'], row['baseboard_sn'], row['baseboard_pn'], row['workstation_name'],
-                row['history_station_start_time'], row['history_station_end_time'], row['history_station_passing_status'], row['operator'],
-                row['failure_reasons'], row['failure_note'], row['failure_code'], row['diag_version'], row['fixture_no'], row['data_source']
-            ) for row in mapped_data]
-            
-            execute_values(cursor, insert_query, values)
-            conn.commit()
-            cursor.close()
-            
-            file_imported = len(mapped_data)
-            total_imported += file_imported
-            print(f" Imported {file_imported:,} records from {os.path.basename(file_path)}")
-            
-        except Exception as e:
-            print(f"  ❌ Error importing {os.path.basename(file_path)}: {e}")
-            conn.rollback()
-            continue
+    run = PipelineRun("upload_testboard_master_log", source=excel_path_normalized)
+    pipeline = UploadPipeline(run, read_file, map_chunk, INSERT_SQL, chunk_rows=chunk_rows,
+                              mappers=mappers, queue_size=queue_size, log=print,
+                              table='testboard_master_log', columns=INSERT_COLUMNS)
+    total_imported = pipeline.upload(conn, testboard_files)
     
     print(f"\n📊 Total testboard records imported: {total_imported:,}")
     conn.close()
+    run.finish()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Upload testboard Excel files into testboard_master_log")
+    parser.add_argument('--input-dir', help="Directory searched recursively for .xlsx files (default: input/data log/testboardrecord_xlsx)")
+    parser.add_argument('--mappers', type=int, default=DEFAULT_MAPPERS, help=f"Row-mapping processes, 0 to map in a thread (default: {DEFAULT_MAPPERS})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help=f"Chunks buffered between stages (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help=f"Rows per chunk (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+    main(input_dir=args.input_dir, mappers=args.mappers, queue_size=args.queue_size, chunk_rows=args.chunk_rows) 
\ No newline at end of file
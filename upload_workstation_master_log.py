@@ -6,11 +6,18 @@ import psycopg2
 import pandas as pd
 import glob
 import os
-from psycopg2.extras import execute_values
 import logging
 from datetime import datetime
 import argparse
 
+from dimensions import is_star
+from part_state import ensure_part_state
+from partitions import ensure_partitions
+from pipeline_metrics import PipelineRun
+from row_hash import ensure_row_hash_column, row_hashes
+from timestamps import normalize_timestamps, py_timestamp
+from upload_pipeline import DEFAULT_CHUNK_ROWS, DEFAULT_MAPPERS, DEFAULT_QUEUE_SIZE, UploadPipeline
+
 # Setup logging
 logging.basicConfig(
     filename='upload_workstation_master_log_debug.log',
@@ -30,6 +37,9 @@ def connect_to_db():
     )
 
 def create_workstation_table(conn):
+    if is_star(conn, 'workstation_master_log'):
+        logging.info("workstation_master_log is in star mode (see dimensions.py); nothing to create")
+        return
     cursor = conn.cursor()
     logging.info('Creating workstation_master_log table if not exists...')
     cursor.execute("""
@@ -67,6 +77,8 @@ def create_workstation_table(conn):
     except Exception as e:
         logging.info(f"Note: Unique constraint may already exist: {e}")
     
+    conn.commit()
+    ensure_row_hash_column(cursor, 'workstation_master_log')
     conn.commit()
     cursor.close()
     logging.info('Table check/creation complete.')
@@ -77,15 +89,8 @@ def clean_column_name(col_name):
     return cleaned
 
 def convert_timestamp(value):
-    if pd.isna(value):
-        logging.debug(f"convert_timestamp: value is NA: {value}")
-        return None
-    if isinstance(value, pd.Timestamp):
-        logging.debug(f"convert_timestamp: value is pd.Timestamp: {value} | tzinfo: {value.tzinfo}")
-        return value.to_pydatetime()
-    dt = pd.to_datetime(value)
-    logging.debug(f"convert_timestamp: value after pd.to_datetime: {dt} | tzinfo: {getattr(dt, 'tzinfo', None)}")
-    return dt
+    # read_file has already parsed the timestamp columns; this only unwraps them
+    return py_timestamp(value)
 
 def convert_empty_string(value):
     if isinstance(value, str) and value.strip() == '':
@@ -93,11 +98,64 @@ def convert_empty_string(value):
         return None
     return value
 
-def main():
+# Insert order of map_chunk's tuples
+INSERT_COLUMNS = (
+    "sn", "pn", "model", "workstation_name", "history_station_start_time", "history_station_end_time",
+    "history_station_passing_status", "operator", "customer_pn", "outbound_version", "hours",
+    "service_flow", "passing_station_method", "first_station_start_time", "data_source", "row_hash",
+)
+INSERT_SQL = f"""
+INSERT INTO workstation_master_log ({', '.join(INSERT_COLUMNS)}) VALUES %s
+ON CONFLICT ON CONSTRAINT workstation_unique_constraint
+DO NOTHING
+"""
+
+def read_file(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [clean_column_name(col) for col in df.columns]
+    # Whole-column parse; a missing start time falls back to the end time, as in import_workstation_file
+    return normalize_timestamps(
+        df, ['history_station_start_time', 'history_station_end_time', 'first_station_start_time'],
+        start_fallback=('history_station_start_time', 'history_station_end_time'),
+        required=('history_station_start_time', 'history_station_end_time'), log=logging.warning,
+    )
+
+def map_chunk(df):
+    mapped_data = []
+    for idx, row in df.iterrows():
+        logging.debug(f"Row {idx}: {row.to_dict()}")
+        mapped_row = {
+            'sn': convert_empty_string(str(row.get('sn', ''))),
+            'pn': convert_empty_string(str(row.get('pn', ''))),
+            'model': convert_empty_string(str(row.get('model', ''))),
+            'workstation_name': convert_empty_string(str(row.get('workstation_name', ''))),
+            'history_station_start_time': convert_timestamp(row.get('history_station_start_time')),
+            'history_station_end_time': convert_timestamp(row.get('history_station_end_time')),
+            'history_station_passing_status': convert_empty_string(str(row.get('history_station_passing_status', ''))),
+            'operator': convert_empty_string(str(row.get('operator', ''))),
+            'customer_pn': convert_empty_string(str(row.get('customer_pn', ''))),
+            'outbound_version': convert_empty_string(str(row.get('outbound_version', ''))),
+            'hours': convert_empty_string(str(row.get('hours', ''))),
+            'service_flow': convert_empty_string(str(row.get('service_flow', ''))),
+            'passing_station_method': convert_empty_string(str(row.get('passing_station_method', ''))),
+            'first_station_start_time': convert_timestamp(row.get('first_station_start_time')),
+            'data_source': 'workstation'
+        }
+        # Log all datetime fields for this row
+        logging.info(f"Row {idx} mapped: SN={mapped_row['sn']} | Workstation={mapped_row['workstation_name']} | Start={mapped_row['history_station_start_time']} | End={mapped_row['history_station_end_time']} | tzinfo End={getattr(mapped_row['history_station_end_time'], 'tzinfo', None)}")
+        mapped_data.append(mapped_row)
+    hashes = row_hashes(mapped_data, 'workstation_master_log')
+    return [(
+        row['sn'], row['pn'], row['model'], row['workstation_name'], row['history_station_start_time'], row['history_station_end_time'],
+        row['history_station_passing_status'], row['operator'], row['customer_pn'], row['outbound_version'], row['hours'],
+        row['service_flow'], row['passing_station_method'], row['first_station_start_time'], row['data_source'], int(row_hash)
+    ) for row, row_hash in zip(mapped_data, hashes)]
+
+def main(input_dir=None, mappers=DEFAULT_MAPPERS, queue_size=DEFAULT_QUEUE_SIZE, chunk_rows=DEFAULT_CHUNK_ROWS):
     logging.info("🚀 Uploading workstation data to workstation_master_log...")
 
     # Recursively find all .xlsx files in the data log/workstationreport_xlsx directory
-    base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input", "data log", "workstationreport_xlsx")
+    base_dir = input_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "input", "data log", "workstationreport_xlsx")
     logging.info(f"Looking for Excel files in: {base_dir}")
     workstation_files = []
     for root, dirs, files in os.walk(base_dir):
@@ -111,69 +169,25 @@ def main():
 
     conn = connect_to_db()
     create_workstation_table(conn)
+    ensure_partitions(conn, 'workstation_master_log')
+    ensure_part_state(conn)
     
-    total_imported = 0
+    run = PipelineRun("upload_workstation_master_log", source=base_dir)
+    pipeline = UploadPipeline(run, read_file, map_chunk, INSERT_SQL, chunk_rows=chunk_rows,
+                              mappers=mappers, queue_size=queue_size, log=logging.info,
+                              table='workstation_master_log', columns=INSERT_COLUMNS)
+    total_imported = pipeline.upload(conn, workstation_files)
     
-    for i, file_path in enumerate(workstation_files, 1):
-        logging.info(f"Processing file {i}/{len(workstation_files)}: {os.path.basename(file_path)}")
-        
-        try:
-            df = pd.read_excel(file_path)
-            logging.info(f"Read {len(df)} rows from {file_path}")
-            df.columns = [clean_column_name(col) for col in df.columns]
-            logging.debug(f"Cleaned columns: {df.columns.tolist()}")
-            mapped_data = []
-            for idx, row in df.iterrows():
-                logging.debug(f"Row {idx}: {row.to_dict()}")
-                mapped_row = {
-                    'sn': convert_empty_string(str(row.get('sn', ''))),
-                    'pn': convert_empty_string(str(row.get('pn', ''))),
-                    'model': convert_empty_string(str(row.get('model', ''))),
-                    'workstation_name': convert_empty_string(str(row.get('workstation_name', ''))),
-                    'history_station_start_time': convert_timestamp(row.get('history_station_start_time')),
-                    'history_station_end_time': convert_timestamp(row.get('history_station_end_time')),
-                    'history_station_passing_status': convert_empty_string(str(row.get('history_station_passing_status', ''))),
-                    'operator': convert_empty_string(str(row.get('operator', ''))),
-                    'customer_pn': convert_empty_string(str(row.get('customer_pn', ''))),
-                    'outbound_version': convert_empty_string(str(row.get('outbound_version', ''))),
-                    'hours': convert_empty_string(str(row.get('hours', ''))),
-                    'service_flow': convert_empty_string(str(row.get('service_flow', ''))),
-                    'passing_station_method': convert_empty_string(str(row.get('passing_station_method', ''))),
-                    'first_station_start_time': convert_timestamp(row.get('first_station_start_time')),
-                    'data_source': 'workstation'
-                }
-                # Log all datetime fields for this row
-                logging.info(f"Row {idx} mapped: SN={mapped_row['sn']} | Workstation={mapped_row['workstation_name']} | Start={mapped_row['history_station_start_time']} | End={mapped_row['history_station_end_time']} | tzinfo End={getattr(mapped_row['history_station_end_time'], 'tzinfo', None)}")
-                mapped_data.append(mapped_row)
-            cursor = conn.cursor()
-            insert_query = """
-            INSERT INTO workstation_master_log (
-                sn, pn, model, workstation_name, history_station_start_time, history_station_end_time,
-                history_station_passing_status, operator, customer_pn, outbound_version, hours,
-                service_flow, passing_station_method, first_station_start_time, data_source
-            ) VALUES %s
-            ON CONFLICT ON CONSTRAINT workstation_unique_constraint
-            DO NOTHING
-            """
-            values = [(
-                row['sn'], row['pn'], row['model'], row['workstation_name'], row['history_station_start_time'], row['history_station_end_time'],
-                row['history_station_passing_status'], row['operator'], row['customer_pn'], row['outbound_version'], row['hours'],
-                row['service_flow'], row['passing_station_method'], row['first_station_start_time'], row['data_source']
-            ) for row in mapped_data]
-            logging.info(f"Inserting {len(values)} rows into database...")
-            execute_values(cursor, insert_query, values)
-            conn.commit()
-            logging.info(f"Inserted {len(values)} rows from {os.path.basename(file_path)}")
-            cursor.close()
-            file_imported = len(mapped_data)
-            total_imported += file_imported
-        except Exception as e:
-            logging.error(f"Error importing {os.path.basename(file_path)}: {e}")
-            conn.rollback()
-            continue
     logging.info(f"\n📊 Total workstation records imported: {total_imported:,}")
     conn.close()
+    run.finish()
     logging.info('Script finished.')
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Upload workstation Excel files into workstation_master_log")
+    parser.add_argument('--input-dir', help="Directory searched recursively for .xlsx files (default: input/data log/workstationreport_xlsx)")
+    parser.add_argument('--mappers', type=int, default=DEFAULT_MAPPERS, help=f"Row-mapping processes, 0 to map in a thread (default: {DEFAULT_MAPPERS})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help=f"Chunks buffered between stages (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help=f"Rows per chunk (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+    main(input_dir=args.input_dir, mappers=args.mappers, queue_size=args.queue_size, chunk_rows=args.chunk_rows) 
\ No newline at end of file